@@ -0,0 +1,74 @@
+"""patient name search column and indexes
+
+Revision ID: 0007_patient_name_search
+Revises: 0006_provenance_links
+Create Date: 2026-10-19
+
+Adds som_patient.name_search, a generated column holding "family given" lower-cased, unaccented (when the
+unaccent extension is available) and whitespace-collapsed via som_normalize_name(). It is indexed with a
+pg_trgm GIN index when pg_trgm is available (serving word-prefix, contains and similarity lookups), else
+with a text_pattern_ops btree (prefix lookups only). Also adds a birth_date index used as a blocking key by
+Patient/$match, and drops ix_patient_name, which no search uses any more.
+
+Adding a stored generated column rewrites som_patient; on a large table run this in a maintenance window.
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "0007_patient_name_search"
+down_revision = "0006_provenance_links"
+branch_labels = None
+depends_on = None
+
+
+def _available(ext: str) -> bool:
+    bind = op.get_bind()
+    return bool(bind.execute(sa.text("SELECT 1 FROM pg_available_extensions WHERE name = :n"), {"n": ext}).first())
+
+
+def upgrade() -> None:
+    has_unaccent = _available("unaccent")
+    has_trgm = _available("pg_trgm")
+    if has_unaccent:
+        op.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+    if has_trgm:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # unaccent() is only STABLE (its dictionary could change); naming the dictionary explicitly is the usual
+    # way to use it from an IMMUTABLE function, which a generated column requires.
+    folded = "public.unaccent('public.unaccent'::regdictionary, lower(v))" if has_unaccent else "lower(v)"
+    op.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION som_normalize_name(v text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE
+        AS $$ SELECT btrim(regexp_replace({folded}, '\\s+', ' ', 'g')) $$
+        """
+    )
+    op.add_column(
+        "som_patient",
+        sa.Column(
+            "name_search",
+            sa.Text(),
+            sa.Computed("som_normalize_name(coalesce(name_family, '') || ' ' || coalesce(name_given, ''))", persisted=True),
+            nullable=True,
+        ),
+    )
+    if has_trgm:
+        op.execute("CREATE INDEX ix_patient_name_search_trgm ON som_patient USING gin (name_search gin_trgm_ops)")
+    else:
+        op.execute("CREATE INDEX ix_patient_name_search ON som_patient (name_search text_pattern_ops)")
+    op.create_index("ix_patient_birth_date", "som_patient", ["birth_date"], unique=False)
+    op.drop_index("ix_patient_name", table_name="som_patient")
+
+
+def downgrade() -> None:
+    op.create_index("ix_patient_name", "som_patient", ["name_family", "name_given"], unique=False)
+    op.drop_index("ix_patient_birth_date", table_name="som_patient")
+    op.execute("DROP INDEX IF EXISTS ix_patient_name_search_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_patient_name_search")
+    op.drop_column("som_patient", "name_search")
+    op.execute("DROP FUNCTION IF EXISTS som_normalize_name(text)")
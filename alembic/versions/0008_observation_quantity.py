@@ -0,0 +1,143 @@
+"""canonical observation quantities
+
+Revision ID: 0008_observation_quantity
+Revises: 0007_patient_name_search
+Create Date: 2026-10-19
+
+Adds som_observation.value_quantity_canonical / value_quantity_canonical_unit (see app.services.units),
+backfills them with one UPDATE per distinct (LOINC code, unit) pair, and indexes them for value-quantity
+range scans: (unit, value) for unit-only searches and (code, unit, value) for the usual code + threshold
+searches.
+
+The conversion table is a copy of app.services.units as of this revision, so the backfill stays the same
+when the application's table changes later.
+"""
+
+from __future__ import annotations
+
+from decimal import Decimal
+
+import sqlalchemy as sa
+from alembic import op
+
+_LOINC_SYSTEM = "http://loinc.org"
+
+# unit -> (canonical unit, scale, offset)
+_UNITS = {
+    "/min": ("/min", "1", "0"),
+    "{beats}/min": ("/min", "1", "0"),
+    "beats/min": ("/min", "1", "0"),
+    "bpm": ("/min", "1", "0"),
+    "{breaths}/min": ("/min", "1", "0"),
+    "/s": ("/min", "60", "0"),
+    "/h": ("/min", "0.016666666666666667", "0"),
+    "mm[Hg]": ("mm[Hg]", "1", "0"),
+    "mmHg": ("mm[Hg]", "1", "0"),
+    "kPa": ("mm[Hg]", "7.500615758456563", "0"),
+    "g/L": ("g/L", "1", "0"),
+    "g/dL": ("g/L", "10", "0"),
+    "mg/dL": ("g/L", "0.01", "0"),
+    "mg/L": ("g/L", "0.001", "0"),
+    "ug/mL": ("g/L", "0.001", "0"),
+    "ng/mL": ("g/L", "0.000001", "0"),
+    "mol/L": ("mmol/L", "1000", "0"),
+    "mmol/L": ("mmol/L", "1", "0"),
+    "umol/L": ("mmol/L", "0.001", "0"),
+    "nmol/L": ("mmol/L", "0.000001", "0"),
+    "kg": ("kg", "1", "0"),
+    "g": ("kg", "0.001", "0"),
+    "[lb_av]": ("kg", "0.45359237", "0"),
+    "lb": ("kg", "0.45359237", "0"),
+    "[oz_av]": ("kg", "0.028349523125", "0"),
+    "m": ("m", "1", "0"),
+    "cm": ("m", "0.01", "0"),
+    "mm": ("m", "0.001", "0"),
+    "[in_i]": ("m", "0.0254", "0"),
+    "in": ("m", "0.0254", "0"),
+    "Cel": ("Cel", "1", "0"),
+    "[degF]": ("Cel", "0.5555555555555556", "-17.77777777777778"),
+    "%": ("%", "1", "0"),
+    "1": ("1", "1", "0"),
+}
+
+# LOINC analyte -> molar mass (g/mol); mass concentrations of these are stored as mmol/L.
+_MOLAR_MASS = {
+    "2339-0": "180.156",
+    "2345-7": "180.156",
+    "41653-7": "180.156",
+    "2093-3": "386.654",
+    "2085-9": "386.654",
+    "13457-7": "386.654",
+    "2571-8": "885.7",
+    "2160-0": "113.12",
+    "3094-0": "60.06",
+}
+
+
+def _conversion(unit: str, analyte: str | None) -> tuple[Decimal, Decimal, str]:
+    """(scale, offset, canonical unit); units not in the table are kept as given."""
+    if unit not in _UNITS:
+        return Decimal(1), Decimal(0), unit
+    canonical_unit, scale, offset = _UNITS[unit]
+    molar_mass = _MOLAR_MASS.get(analyte or "")
+    if molar_mass is not None and canonical_unit == "g/L":
+        return Decimal(scale) * 1000 / Decimal(molar_mass), Decimal(0), "mmol/L"
+    return Decimal(scale), Decimal(offset), canonical_unit
+
+
+revision = "0008_observation_quantity"
+down_revision = "0007_patient_name_search"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("som_observation", sa.Column("value_quantity_canonical", sa.Numeric(), nullable=True))
+    op.add_column("som_observation", sa.Column("value_quantity_canonical_unit", sa.Text(), nullable=True))
+
+    bind = op.get_bind()
+    pairs = bind.execute(
+        sa.text(
+            """
+            SELECT DISTINCT o.code_concept_id, c.code, cs.system_uri, o.value_quantity_unit
+            FROM som_observation o
+            JOIN som_concept c ON c.id = o.code_concept_id
+            JOIN som_code_system cs ON cs.id = c.code_system_id
+            WHERE o.value_quantity_value IS NOT NULL AND o.value_quantity_unit IS NOT NULL
+            """
+        )
+    ).all()
+    for concept_id, code, system, unit in pairs:
+        scale, offset, canonical_unit = _conversion(unit, code if system == _LOINC_SYSTEM else None)
+        bind.execute(
+            sa.text(
+                """
+                UPDATE som_observation
+                SET value_quantity_canonical = value_quantity_value * :scale + :offset,
+                    value_quantity_canonical_unit = :canonical_unit
+                WHERE code_concept_id = :concept_id AND value_quantity_unit = :unit
+                  AND value_quantity_value IS NOT NULL
+                """
+            ),
+            {"scale": scale, "offset": offset, "canonical_unit": canonical_unit, "concept_id": concept_id, "unit": unit},
+        )
+
+    op.create_index(
+        "ix_observation_quantity_canonical",
+        "som_observation",
+        ["value_quantity_canonical_unit", "value_quantity_canonical"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_observation_code_quantity_canonical",
+        "som_observation",
+        ["code_concept_id", "value_quantity_canonical_unit", "value_quantity_canonical"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_observation_code_quantity_canonical", table_name="som_observation")
+    op.drop_index("ix_observation_quantity_canonical", table_name="som_observation")
+    op.drop_column("som_observation", "value_quantity_canonical_unit")
+    op.drop_column("som_observation", "value_quantity_canonical")
@@ -0,0 +1,51 @@
+"""concept is-a edges and closure table
+
+Revision ID: 0009_concept_closure
+Revises: 0008_observation_quantity
+Create Date: 2026-10-19
+
+som_concept_parent holds is-a edges; som_concept_closure their transitive, reflexive closure, so
+`code:below` / `code:above` and payer hierarchy checks are primary-key lookups. Existing concepts get their
+reflexive row.
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "0009_concept_closure"
+down_revision = "0008_observation_quantity"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "som_concept_parent",
+        sa.Column("concept_id", sa.UUID(), nullable=False),
+        sa.Column("parent_id", sa.UUID(), nullable=False),
+        sa.ForeignKeyConstraint(["concept_id"], ["som_concept.id"]),
+        sa.ForeignKeyConstraint(["parent_id"], ["som_concept.id"]),
+        sa.PrimaryKeyConstraint("concept_id", "parent_id"),
+    )
+    op.create_index("ix_concept_parent_parent", "som_concept_parent", ["parent_id"], unique=False)
+    op.create_table(
+        "som_concept_closure",
+        sa.Column("ancestor_id", sa.UUID(), nullable=False),
+        sa.Column("descendant_id", sa.UUID(), nullable=False),
+        sa.ForeignKeyConstraint(["ancestor_id"], ["som_concept.id"]),
+        sa.ForeignKeyConstraint(["descendant_id"], ["som_concept.id"]),
+        sa.PrimaryKeyConstraint("ancestor_id", "descendant_id"),
+    )
+    # :above walks from the descendant side.
+    op.create_index("ix_concept_closure_descendant", "som_concept_closure", ["descendant_id", "ancestor_id"], unique=False)
+    op.execute("INSERT INTO som_concept_closure (ancestor_id, descendant_id) SELECT id, id FROM som_concept")
+
+
+def downgrade() -> None:
+    op.drop_index("ix_concept_closure_descendant", table_name="som_concept_closure")
+    op.drop_table("som_concept_closure")
+    op.drop_index("ix_concept_parent_parent", table_name="som_concept_parent")
+    op.drop_table("som_concept_parent")
@@ -0,0 +1,158 @@
+"""generic resource history with delta storage
+
+Revision ID: 0010_resource_history
+Revises: 0009_concept_closure
+Create Date: 2026-10-19
+
+Adds som_resource_history and an AFTER UPDATE trigger on every SomBase table that records the outgoing
+version whenever `version` changes. A row stores only the old values of the columns that changed (a reverse
+delta against the next version); every 16th version stores the whole row as a checkpoint, so rebuilding any
+version reads at most 16 history rows. Writes through the ORM and set-based SQL are covered alike.
+
+Replaces som_observation_version: its rows for non-current versions are carried over as checkpoints (with
+NULL canonical quantities, which those copies never had), then the table is dropped. Downgrade recreates
+the empty table only.
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "0010_resource_history"
+down_revision = "0009_concept_closure"
+branch_labels = None
+depends_on = None
+
+CHECKPOINT_EVERY = 16
+
+# SomBase tables at this revision. New SomBase tables need the trigger in their own migration.
+TABLES = (
+    "som_code_system",
+    "som_concept",
+    "som_patient",
+    "som_practitioner",
+    "som_organization",
+    "som_encounter",
+    "som_condition",
+    "som_service_request",
+    "som_service_request_reason",
+    "som_observation",
+    "som_binary",
+    "som_document",
+    "som_payer_rule_set",
+    "som_preauth_request",
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "som_resource_history",
+        sa.Column("som_table", sa.Text(), nullable=False),
+        sa.Column("resource_id", sa.UUID(), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("recorded_time", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("provenance_id", sa.UUID(), nullable=True),
+        sa.Column("checkpoint", sa.Boolean(), nullable=False, server_default=sa.text("false")),
+        sa.Column("data", sa.dialects.postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.PrimaryKeyConstraint("som_table", "resource_id", "version"),
+    )
+    # Type-level _history?_since=
+    op.create_index("ix_resource_history_since", "som_resource_history", ["som_table", "recorded_time"], unique=False)
+
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION som_record_history() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            old_row jsonb := to_jsonb(OLD);
+            new_row jsonb := to_jsonb(NEW);
+            is_checkpoint boolean := OLD.version % TG_ARGV[0]::int = 0;
+        BEGIN
+            INSERT INTO som_resource_history (som_table, resource_id, version, recorded_time, provenance_id, checkpoint, data)
+            VALUES (
+                TG_TABLE_NAME,
+                OLD.id,
+                OLD.version,
+                OLD.updated_time,
+                coalesce(OLD.updated_provenance_id, OLD.created_provenance_id),
+                is_checkpoint,
+                CASE WHEN is_checkpoint THEN old_row ELSE (
+                    SELECT coalesce(jsonb_object_agg(o.key, o.value), '{}'::jsonb)
+                    FROM jsonb_each(old_row) o
+                    WHERE new_row -> o.key IS DISTINCT FROM o.value
+                ) END
+            )
+            ON CONFLICT DO NOTHING;
+            RETURN NULL;
+        END
+        $$
+        """
+    )
+    for table in TABLES:
+        op.execute(
+            f"""
+            CREATE TRIGGER {table}_history AFTER UPDATE ON {table}
+            FOR EACH ROW WHEN (OLD.version IS DISTINCT FROM NEW.version)
+            EXECUTE FUNCTION som_record_history('{CHECKPOINT_EVERY}')
+            """
+        )
+
+    op.execute(
+        """
+        INSERT INTO som_resource_history (som_table, resource_id, version, recorded_time, provenance_id, checkpoint, data)
+        SELECT 'som_observation', v.observation_id, v.version, v.recorded_time, v.provenance_id, true,
+               to_jsonb(o) || jsonb_build_object(
+                   'version', v.version,
+                   'updated_time', v.recorded_time,
+                   'updated_provenance_id', CASE WHEN v.version = 1 THEN NULL ELSE v.provenance_id END,
+                   'status', v.status,
+                   'category', v.category,
+                   'code_concept_id', v.code_concept_id,
+                   'effective_time', v.effective_time,
+                   'value_type', v.value_type,
+                   'value_quantity_value', v.value_quantity_value,
+                   'value_quantity_unit', v.value_quantity_unit,
+                   'value_quantity_canonical', NULL,
+                   'value_quantity_canonical_unit', NULL,
+                   'value_concept_id', v.value_concept_id,
+                   'extensions', v.extensions
+               )
+        FROM som_observation_version v
+        JOIN som_observation o ON o.id = v.observation_id
+        WHERE v.version < o.version
+        ON CONFLICT DO NOTHING
+        """
+    )
+    op.drop_table("som_observation_version")
+
+
+def downgrade() -> None:
+    op.create_table(
+        "som_observation_version",
+        sa.Column("id", sa.UUID(), primary_key=True, server_default=sa.text("gen_random_uuid()")),
+        sa.Column("observation_id", sa.UUID(), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("recorded_time", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("status", sa.Text(), nullable=False),
+        sa.Column("category", sa.Text(), nullable=True),
+        sa.Column("code_concept_id", sa.UUID(), nullable=False),
+        sa.Column("effective_time", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("value_type", sa.Text(), nullable=True),
+        sa.Column("value_quantity_value", sa.Numeric(), nullable=True),
+        sa.Column("value_quantity_unit", sa.Text(), nullable=True),
+        sa.Column("value_concept_id", sa.UUID(), nullable=True),
+        sa.Column("provenance_id", sa.UUID(), nullable=False),
+        sa.Column("extensions", sa.dialects.postgresql.JSONB(astext_type=sa.Text()), nullable=False, server_default=sa.text("'{}'::jsonb")),
+        sa.ForeignKeyConstraint(["observation_id"], ["som_observation.id"]),
+        sa.ForeignKeyConstraint(["code_concept_id"], ["som_concept.id"]),
+        sa.ForeignKeyConstraint(["value_concept_id"], ["som_concept.id"]),
+        sa.ForeignKeyConstraint(["provenance_id"], ["som_provenance.id"]),
+        sa.UniqueConstraint("observation_id", "version", name="uq_obs_version"),
+    )
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_history ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS som_record_history()")
+    op.drop_index("ix_resource_history_since", table_name="som_resource_history")
+    op.drop_table("som_resource_history")
@@ -0,0 +1,127 @@
+"""change feed outbox and subscriptions
+
+Revision ID: 0011_change_feed
+Revises: 0010_resource_history
+Create Date: 2026-10-19
+
+som_change_event is an outbox filled by an AFTER INSERT OR UPDATE trigger on the FHIR-exposed SOM tables:
+each create, and each update that bumps `version`, adds (type, id, version, operation, correlation id) in
+the writing transaction and NOTIFYs channel `som_change` with the resource type as payload. Postgres folds
+identical notifications within a transaction, so a bulk write wakes listeners once per type, and listeners
+read the outbox for the events themselves.
+
+Also adds som_subscription (FHIR Subscription), with the history trigger from 0010.
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "0011_change_feed"
+down_revision = "0010_resource_history"
+branch_labels = None
+depends_on = None
+
+RESOURCE_TYPES = {
+    "som_patient": "Patient",
+    "som_practitioner": "Practitioner",
+    "som_organization": "Organization",
+    "som_encounter": "Encounter",
+    "som_condition": "Condition",
+    "som_service_request": "ServiceRequest",
+    "som_observation": "Observation",
+    "som_binary": "Binary",
+    "som_document": "DocumentReference",
+}
+
+
+def upgrade() -> None:
+    op.create_table(
+        "som_change_event",
+        sa.Column("id", sa.BigInteger(), sa.Identity(), primary_key=True),
+        sa.Column("recorded_time", sa.DateTime(timezone=True), nullable=False, server_default=sa.text("now()")),
+        sa.Column("resource_type", sa.Text(), nullable=False),
+        sa.Column("resource_id", sa.UUID(), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("operation", sa.Text(), nullable=False),
+        sa.Column("correlation_id", sa.Text(), nullable=True),
+    )
+    # Retention deletes by age; BRIN suits an append-only, time-ordered table.
+    op.execute("CREATE INDEX ix_change_event_recorded ON som_change_event USING brin (recorded_time)")
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION som_emit_change() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' AND OLD.version IS NOT DISTINCT FROM NEW.version THEN
+                RETURN NULL;
+            END IF;
+            INSERT INTO som_change_event (resource_type, resource_id, version, operation, correlation_id)
+            VALUES (
+                TG_ARGV[0],
+                NEW.id,
+                NEW.version,
+                CASE TG_OP WHEN 'INSERT' THEN 'create' ELSE 'update' END,
+                (SELECT p.correlation_id FROM som_provenance p
+                 WHERE p.id = coalesce(NEW.updated_provenance_id, NEW.created_provenance_id))
+            );
+            PERFORM pg_notify('som_change', TG_ARGV[0]);
+            RETURN NULL;
+        END
+        $$
+        """
+    )
+    for table, resource_type in RESOURCE_TYPES.items():
+        op.execute(
+            f"""
+            CREATE TRIGGER {table}_change AFTER INSERT OR UPDATE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION som_emit_change('{resource_type}')
+            """
+        )
+
+    op.create_table(
+        "som_subscription",
+        sa.Column("id", sa.UUID(), primary_key=True, server_default=sa.text("gen_random_uuid()")),
+        sa.Column("created_time", sa.DateTime(timezone=True), nullable=False, server_default=sa.text("now()")),
+        sa.Column("updated_time", sa.DateTime(timezone=True), nullable=False, server_default=sa.text("now()")),
+        sa.Column("version", sa.Integer(), nullable=False, server_default=sa.text("1")),
+        sa.Column("created_provenance_id", sa.UUID(), nullable=False),
+        sa.Column("updated_provenance_id", sa.UUID(), nullable=True),
+        sa.Column("extensions", sa.dialects.postgresql.JSONB(astext_type=sa.Text()), nullable=False, server_default=sa.text("'{}'::jsonb")),
+        sa.Column("status", sa.Text(), nullable=False),
+        sa.Column("reason", sa.Text(), nullable=True),
+        sa.Column("criteria", sa.Text(), nullable=False),
+        sa.Column("criteria_resource_type", sa.Text(), nullable=False),
+        sa.Column("channel_type", sa.Text(), nullable=False),
+        sa.Column("endpoint", sa.Text(), nullable=True),
+        sa.Column("payload", sa.Text(), nullable=True),
+        sa.Column("headers", sa.dialects.postgresql.JSONB(astext_type=sa.Text()), nullable=False, server_default=sa.text("'[]'::jsonb")),
+        sa.Column("end_time", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("delivery_cursor", sa.BigInteger(), nullable=False, server_default=sa.text("0")),
+        sa.Column("failure_count", sa.Integer(), nullable=False, server_default=sa.text("0")),
+        sa.Column("next_attempt_time", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["created_provenance_id"], ["som_provenance.id"]),
+        sa.ForeignKeyConstraint(["updated_provenance_id"], ["som_provenance.id"]),
+    )
+    op.create_index("ix_subscription_status_channel", "som_subscription", ["status", "channel_type"], unique=False)
+    op.execute(
+        """
+        CREATE TRIGGER som_subscription_history AFTER UPDATE ON som_subscription
+        FOR EACH ROW WHEN (OLD.version IS DISTINCT FROM NEW.version)
+        EXECUTE FUNCTION som_record_history('16')
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS som_subscription_history ON som_subscription")
+    op.drop_index("ix_subscription_status_channel", table_name="som_subscription")
+    op.drop_table("som_subscription")
+    for table in RESOURCE_TYPES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_change ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS som_emit_change()")
+    op.execute("DROP INDEX IF EXISTS ix_change_event_recorded")
+    op.drop_table("som_change_event")
@@ -0,0 +1,47 @@
+"""unique patient identifier
+
+Revision ID: 0012_patient_identifier_unique
+Revises: 0011_change_feed
+Create Date: 2026-10-19
+
+Makes (identifier_system, identifier_value) unique on som_patient, replacing the plain index from 0001. It is
+what keeps conditional creates (`If-None-Exist: identifier=...`) from racing plain creates into duplicate MRNs.
+Patients without an identifier are unaffected (NULLs never collide). Fails with the offending identifiers if
+duplicates already exist; merge those patients first.
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "0012_patient_identifier_unique"
+down_revision = "0011_change_feed"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    duplicates = op.get_bind().execute(
+        sa.text(
+            """
+            SELECT identifier_system, identifier_value FROM som_patient
+            WHERE identifier_value IS NOT NULL
+            GROUP BY identifier_system, identifier_value HAVING count(*) > 1
+            LIMIT 10
+            """
+        )
+    ).all()
+    if duplicates:
+        listed = ", ".join(f"{s}|{v}" for s, v in duplicates)
+        raise RuntimeError(f"som_patient has duplicate identifiers, merge them before upgrading: {listed}")
+    op.create_index(
+        "ux_patient_identifier", "som_patient", ["identifier_system", "identifier_value"], unique=True
+    )
+    op.drop_index("ix_patient_identifier", table_name="som_patient")
+
+
+def downgrade() -> None:
+    op.create_index("ix_patient_identifier", "som_patient", ["identifier_system", "identifier_value"], unique=False)
+    op.drop_index("ux_patient_identifier", table_name="som_patient")
@@ -0,0 +1,33 @@
+"""pg_stat_statements
+
+Revision ID: 0013_pg_stat_statements
+Revises: 0012_patient_identifier_unique
+Create Date: 2026-10-19
+
+Creates the pg_stat_statements extension behind /internal/db/top-queries when the server ships it. The
+server must also preload it (`shared_preload_libraries=pg_stat_statements`, see docker-compose.yml). Servers
+without the extension are left alone and the endpoint answers 503.
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "0013_pg_stat_statements"
+down_revision = "0012_patient_identifier_unique"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    available = op.get_bind().execute(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_stat_statements'")
+    ).scalar()
+    if available:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_stat_statements")
+
+
+def downgrade() -> None:
+    op.execute("DROP EXTENSION IF EXISTS pg_stat_statements")
@@ -0,0 +1,31 @@
+"""job duration index
+
+Revision ID: 0014_job_duration
+Revises: 0013_pg_stat_statements
+Create Date: 2026-10-19
+
+Indexes the run time app.worker.instrumentation records in som_job.extensions (metrics.durationSeconds), for
+`GET /jobs?orderBy=duration` and the minDuration/maxDuration filters. The expression must stay identical to
+app.services.jobs.service.JOB_DURATION for the planner to use it.
+"""
+
+from __future__ import annotations
+
+from alembic import op
+
+
+revision = "0014_job_duration"
+down_revision = "0013_pg_stat_statements"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "CREATE INDEX ix_job_duration ON som_job "
+        "((CAST(extensions #>> '{metrics,durationSeconds}' AS FLOAT)) DESC NULLS LAST)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_job_duration", table_name="som_job")
@@ -0,0 +1,54 @@
+"""pre-auth review queue
+
+Revision ID: 0015_preauth_queue
+Revises: 0014_job_duration
+Create Date: 2026-10-19
+
+Adds som_preauth_queue_lease, the reviewers' leases on queued pre-auths (app.services.preauth.queue), kept out
+of som_preauth_request so claims and heartbeats neither bump its version nor reach the history and change-feed
+triggers. ix_preauth_queue is a partial index over the queued statuses in claim order (priority rank, then
+updated_time); claims and queue depth/age are read from it. Its predicate and expression must stay identical to
+QUEUE_STATUSES and PRIORITY_RANK in that module for the planner to use it.
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "0015_preauth_queue"
+down_revision = "0014_job_duration"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "som_preauth_queue_lease",
+        sa.Column(
+            "preauth_request_id",
+            sa.dialects.postgresql.UUID(as_uuid=True),
+            sa.ForeignKey("som_preauth_request.id"),
+            primary_key=True,
+        ),
+        sa.Column("lease_id", sa.dialects.postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("claimed_by", sa.Text(), nullable=False),
+        sa.Column("claimed_time", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("heartbeat_time", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("expires_time", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index("ix_som_preauth_queue_lease_lease_id", "som_preauth_queue_lease", ["lease_id"], unique=False)
+    op.execute(
+        """
+        CREATE INDEX ix_preauth_queue ON som_preauth_request
+        ((CASE priority WHEN 'stat' THEN 0 WHEN 'asap' THEN 1 WHEN 'urgent' THEN 2 ELSE 3 END), updated_time)
+        WHERE status IN ('submitted', 'resubmitted', 'in-review')
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_preauth_queue", table_name="som_preauth_request")
+    op.drop_index("ix_som_preauth_queue_lease_lease_id", table_name="som_preauth_queue_lease")
+    op.drop_table("som_preauth_queue_lease")
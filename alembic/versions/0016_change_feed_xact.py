@@ -0,0 +1,42 @@
+"""change feed transaction ids
+
+Revision ID: 0016_change_feed_xact
+Revises: 0015_preauth_queue
+Create Date: 2026-10-19
+
+Identity ids are handed out at insert time, not at commit time. A transaction holding a smaller id can
+therefore commit after a reader has already moved its cursor past a larger id, and an `id > cursor` reader
+never sees that event. This migration records the writing transaction (`pg_current_xact_id()`) on each event.
+Readers then order the feed by (xact_id, id) and only read transactions older than the oldest one still in
+flight (app.services.subscriptions.feed); no event can appear behind that point.
+
+Existing events get xact_id 0, and existing subscription cursors become (0, delivery_cursor). Both keep the
+order they had, so nothing is delivered twice or skipped across the upgrade.
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "0016_change_feed_xact"
+down_revision = "0015_preauth_queue"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Add with a constant default first so existing rows get 0, then switch the default for new rows.
+    op.add_column("som_change_event", sa.Column("xact_id", sa.BigInteger(), nullable=False, server_default="0"))
+    op.execute("ALTER TABLE som_change_event ALTER COLUMN xact_id SET DEFAULT pg_current_xact_id()::text::bigint")
+    op.create_index("ix_change_event_xact", "som_change_event", ["xact_id", "id"], unique=False)
+    op.add_column(
+        "som_subscription", sa.Column("delivery_cursor_xact", sa.BigInteger(), nullable=False, server_default="0")
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("som_subscription", "delivery_cursor_xact")
+    op.drop_index("ix_change_event_xact", table_name="som_change_event")
+    op.drop_column("som_change_event", "xact_id")
@@ -0,0 +1,61 @@
+"""concept generation
+
+Revision ID: 0017_concept_generation
+Revises: 0016_change_feed_xact
+Create Date: 2026-10-19
+
+Observation, Condition and ServiceRequest bodies embed som_concept.display, which can change (a write fills
+in a missing display, the bulk loader backfills displays) without bumping the version of any resource that
+uses the concept. som_concept_generation holds one counter, bumped in the same transaction by a
+statement-level trigger whenever an UPDATE changes a concept's system, code or display; the read cache tags
+bodies with it (app.services.mapping.read_cache).
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "0017_concept_generation"
+down_revision = "0016_change_feed_xact"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "som_concept_generation",
+        sa.Column("id", sa.SmallInteger(), primary_key=True),
+        sa.Column("generation", sa.BigInteger(), nullable=False),
+    )
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION som_bump_concept_generation() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM old_rows o JOIN new_rows n ON n.id = o.id
+                WHERE (n.code_system_id, n.code, n.display) IS DISTINCT FROM (o.code_system_id, o.code, o.display)
+            ) THEN
+                INSERT INTO som_concept_generation (id, generation) VALUES (1, 1)
+                ON CONFLICT (id) DO UPDATE SET generation = som_concept_generation.generation + 1;
+            END IF;
+            RETURN NULL;
+        END
+        $$
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER som_concept_generation AFTER UPDATE ON som_concept
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION som_bump_concept_generation()
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS som_concept_generation ON som_concept")
+    op.execute("DROP FUNCTION IF EXISTS som_bump_concept_generation()")
+    op.drop_table("som_concept_generation")
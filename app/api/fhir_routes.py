@@ -1,21 +1,88 @@
 from __future__ import annotations
 
+import asyncio
+import datetime as dt
+from email.utils import format_datetime
 from typing import Any
+from urllib.parse import parse_qsl
 
-from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from psycopg.errors import UniqueViolation
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
 
-from app.db.session import get_db
+from app.api.responses import FastJSONResponse, FastJSONRoute
+from app.db.session import get_db, get_read_db
 from app.services.mapping.fhir_dispatch import (
+    fhir_conditional_create,
+    fhir_conditional_update,
     fhir_create,
-    fhir_read,
+    fhir_patch,
+    fhir_read_cached,
+    fhir_read_projected,
     fhir_search,
     fhir_update,
     fhir_history,
+    fhir_history_type,
+    fhir_history_version,
+    fhir_patient_match,
 )
+from app.services.mapping.fhir_utils import PreconditionFailed, query_params
+from app.services.subscriptions.websocket import websocket_hub
 
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute, default_response_class=FastJSONResponse)
+
+
+@router.post("/Patient/$match")
+def patient_match(body: dict[str, Any], db: Session = Depends(get_read_db)):
+    try:
+        return fhir_patient_match(db, body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/{resource_type}/_history")
+def type_history(
+    resource_type: str,
+    _since: str | None = Query(default=None),
+    _count: int = Query(default=50, ge=1, le=200),
+    db: Session = Depends(get_read_db),
+):
+    # Declared before /{resource_type}/{id} so "_history" isn't taken for an id.
+    try:
+        return fhir_history_type(db, resource_type, since=_since, count=_count)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/{resource_type}/{id}/_history")
+def instance_history(
+    resource_type: str,
+    id: str,
+    _count: int = Query(default=50, ge=1, le=200),
+    db: Session = Depends(get_read_db),
+):
+    try:
+        out = fhir_history(db, resource_type, id, count=_count)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not out:
+        raise HTTPException(status_code=404, detail="Not found")
+    return out
+
+
+@router.get("/{resource_type}/{id}/_history/{vid}")
+def version_read(resource_type: str, id: str, vid: str, db: Session = Depends(get_read_db)):
+    try:
+        out = fhir_history_version(db, resource_type, id, vid)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not out:
+        raise HTTPException(status_code=404, detail="Not found")
+    return FastJSONResponse(out, headers={"ETag": f'W/"{out["meta"]["versionId"]}"'})
 
 
 @router.post("/{resource_type}")
@@ -23,22 +90,82 @@ def create_resource(
     resource_type: str,
     body: dict[str, Any],
     x_correlation_id: str | None = Header(default=None, alias="X-Correlation-Id"),
+    if_none_exist: str | None = Header(default=None, alias="If-None-Exist"),
     db: Session = Depends(get_db),
 ):
     if body.get("resourceType") and body.get("resourceType") != resource_type:
         raise HTTPException(status_code=400, detail="resourceType mismatch")
     try:
+        if if_none_exist:
+            criteria = query_params(parse_qsl(if_none_exist.removeprefix("?")))
+            out, created = fhir_conditional_create(db, resource_type, body, criteria, correlation_id=x_correlation_id)
+            return FastJSONResponse(out, status_code=201 if created else 200)
         return fhir_create(db, resource_type, body, correlation_id=x_correlation_id)
+    except PreconditionFailed as e:
+        raise HTTPException(status_code=412, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except IntegrityError as e:
+        raise _unique_conflict(e)
+
+
+def _unique_conflict(e: IntegrityError) -> Exception:
+    # Unique indexes (e.g. Patient identifier) turn duplicate writes into a conflict; other integrity errors are bugs.
+    if isinstance(e.orig, UniqueViolation):
+        return HTTPException(status_code=409, detail="Conflicts with an existing resource")
+    return e
+
+
+def _split_csv(value: str | None) -> list[str] | None:
+    return [x.strip() for x in value.split(",") if x.strip()] if value else None
+
+
+def _prefers(prefer: str | None, name: str, value: str) -> bool:
+    # Prefer: handling=lenient, return=minimal (RFC 7240); several preferences may be comma-separated.
+    if not prefer:
+        return False
+    return any(p.strip().replace(" ", "") == f"{name}={value}" for p in prefer.split(","))
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # Weak comparison (RFC 9110 13.1.2): W/"3" matches "3".
+    if if_none_match.strip() == "*":
+        return True
+    want = etag.removeprefix("W/")
+    return any(t.strip().removeprefix("W/") == want for t in if_none_match.split(","))
 
 
 @router.get("/{resource_type}/{id}")
-def read_resource(resource_type: str, id: str, db: Session = Depends(get_db)):
-    out = fhir_read(db, resource_type, id)
-    if not out:
+def read_resource(
+    resource_type: str,
+    id: str,
+    _summary: str | None = Query(default=None),
+    _elements: str | None = Query(default=None),
+    if_none_match: str | None = Header(default=None, alias="If-None-Match"),
+    db: Session = Depends(get_read_db),
+):
+    if _summary or _elements:
+        # Projections bypass the read cache, which only holds full resources.
+        try:
+            out = fhir_read_projected(db, resource_type, id, summary=_summary, elements=_split_csv(_elements))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if not out:
+            raise HTTPException(status_code=404, detail="Not found")
+        return out
+    try:
+        res = fhir_read_cached(db, resource_type, id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not res:
         raise HTTPException(status_code=404, detail="Not found")
-    return out
+    headers = {"ETag": f'W/"{res.version}"'}
+    if res.last_updated:
+        last_updated = dt.datetime.fromisoformat(res.last_updated.replace("Z", "+00:00"))
+        headers["Last-Modified"] = format_datetime(last_updated.astimezone(dt.timezone.utc), usegmt=True)
+    if if_none_match and _etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse(res.body, headers=headers)
 
 
 @router.put("/{resource_type}/{id}")
@@ -47,17 +174,84 @@ def update_resource(
     id: str,
     body: dict[str, Any],
     x_correlation_id: str | None = Header(default=None, alias="X-Correlation-Id"),
+    if_match: str | None = Header(default=None, alias="If-Match"),
     db: Session = Depends(get_db),
 ):
     if body.get("resourceType") and body.get("resourceType") != resource_type:
         raise HTTPException(status_code=400, detail="resourceType mismatch")
+    expected = _if_match_version(if_match)
     try:
-        out = fhir_update(db, resource_type, id, body, correlation_id=x_correlation_id)
+        out = fhir_update(db, resource_type, id, body, correlation_id=x_correlation_id, expected_version=expected)
+    except PreconditionFailed as e:
+        raise HTTPException(status_code=412, detail=str(e))
+    except StaleDataError:
+        raise HTTPException(status_code=412, detail="Resource was changed by another request")
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except IntegrityError as e:
+        raise _unique_conflict(e)
     if not out:
         raise HTTPException(status_code=404, detail="Not found")
-    return out
+    return FastJSONResponse(out, headers={"ETag": f'W/"{out["meta"]["versionId"]}"'})
+
+
+def _if_match_version(if_match: str | None) -> int | None:
+    # If-Match: W/"3" (or "3"): write only if the resource is still at version 3.
+    if if_match is None:
+        return None
+    tag = if_match.strip().removeprefix("W/").strip('"')
+    if not tag.isdigit():
+        raise HTTPException(status_code=400, detail='If-Match must be a version ETag like W/"3"')
+    return int(tag)
+
+
+@router.put("/{resource_type}")
+def conditional_update_resource(
+    resource_type: str,
+    request: Request,
+    body: dict[str, Any],
+    x_correlation_id: str | None = Header(default=None, alias="X-Correlation-Id"),
+    db: Session = Depends(get_db),
+):
+    # PUT /fhir/Patient?identifier=urn:mrn|123: update the single match, or create when nothing matches.
+    if body.get("resourceType") and body.get("resourceType") != resource_type:
+        raise HTTPException(status_code=400, detail="resourceType mismatch")
+    criteria = query_params(request.query_params.multi_items())
+    try:
+        out, created = fhir_conditional_update(db, resource_type, body, criteria, correlation_id=x_correlation_id)
+    except PreconditionFailed as e:
+        raise HTTPException(status_code=412, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except IntegrityError as e:
+        raise _unique_conflict(e)
+    return FastJSONResponse(out, status_code=201 if created else 200)
+
+
+@router.patch("/{resource_type}/{id}")
+def patch_resource(
+    resource_type: str,
+    id: str,
+    body: list[dict[str, Any]] | dict[str, Any],
+    x_correlation_id: str | None = Header(default=None, alias="X-Correlation-Id"),
+    if_match: str | None = Header(default=None, alias="If-Match"),
+    db: Session = Depends(get_db),
+):
+    # application/json-patch+json (a list of operations) or application/fhir+json (FHIRPath Patch Parameters).
+    expected = _if_match_version(if_match)
+    try:
+        out = fhir_patch(db, resource_type, id, body, correlation_id=x_correlation_id, expected_version=expected)
+    except PreconditionFailed as e:
+        raise HTTPException(status_code=412, detail=str(e))
+    except StaleDataError:
+        raise HTTPException(status_code=412, detail="Resource was changed by another request")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except IntegrityError as e:
+        raise _unique_conflict(e)
+    if not out:
+        raise HTTPException(status_code=404, detail="Not found")
+    return FastJSONResponse(out, headers={"ETag": f'W/"{out["meta"]["versionId"]}"'})
 
 
 @router.get("/{resource_type}")
@@ -66,11 +260,22 @@ def search_resource(
     request: Request,
     _count: int = Query(default=50, ge=1, le=200),
     _sort: str | None = Query(default=None),
-    db: Session = Depends(get_db),
+    _summary: str | None = Query(default=None),
+    _elements: str | None = Query(default=None),
+    prefer: str | None = Header(default=None, alias="Prefer"),
+    db: Session = Depends(get_read_db),
 ):
     params: dict[str, Any] = {}
+    include: list[str] = []
+    revinclude: list[str] = []
     for k, v in request.query_params.multi_items():
-        if k in {"_count", "_sort"}:
+        if k in {"_count", "_sort", "_summary", "_elements"}:
+            continue
+        if k == "_include":
+            include.extend(x for x in v.split(",") if x)
+            continue
+        if k == "_revinclude":
+            revinclude.extend(x for x in v.split(",") if x)
             continue
         if k not in params:
             params[k] = v
@@ -79,9 +284,40 @@ def search_resource(
                 params[k].append(v)
             else:
                 params[k] = [params[k], v]
-    return fhir_search(db, resource_type, params=params, count=_count, sort=_sort)
+    try:
+        return fhir_search(
+            db,
+            resource_type,
+            params=params,
+            count=_count,
+            sort=_sort,
+            include=include,
+            revinclude=revinclude,
+            summary=_summary,
+            elements=_split_csv(_elements),
+            # Unknown search params are an error unless the client asks for lenient handling.
+            strict=not _prefers(prefer, "handling", "lenient"),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
-@router.get("/Observation/{id}/_history")
-def observation_history(id: str, db: Session = Depends(get_db)):
-    return fhir_history(db, "Observation", id)
+@router.websocket("/$subscription-ws")
+async def subscription_websocket(websocket: WebSocket):
+    # FHIR R4 websocket channel: "bind <id>" -> "bound <id>", then "ping <id>" per matching batch of changes.
+    await websocket.accept()
+    conn = websocket_hub.connect(websocket)
+    pump = asyncio.create_task(conn.pump())
+    try:
+        while True:
+            command, _, arg = (await websocket.receive_text()).strip().partition(" ")
+            if command != "bind":
+                conn.offer(f"error unknown command {command!r}")
+                continue
+            error = await run_in_threadpool(websocket_hub.bind, conn, arg.strip())
+            conn.offer(f"error {error}" if error else f"bound {arg.strip()}")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        websocket_hub.disconnect(conn)
+        pump.cancel()
@@ -1,16 +1,22 @@
 from __future__ import annotations
 
 from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import FileResponse
+from psycopg.errors import UniqueViolation
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from app.db.session import get_db
+from app.api.responses import FastJSONResponse, FastJSONRoute
+from app.core import profiling
+from app.db.pool_metrics import pool_stats
+from app.db.session import get_db, get_read_db
 from app.services.audit import AuditService
 from app.services.admin.service import AdminService
 from app.services.internal import InternalService
 from app.services.scenarios.service import ScenarioService
 
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute, default_response_class=FastJSONResponse)
 
 
 @router.get("/mapping-trace")
@@ -18,13 +24,54 @@ def mapping_trace(
     correlation_id: str | None = Query(default=None, alias="correlationId"),
     resource_type: str | None = Query(default=None, alias="resourceType"),
     resource_id: str | None = Query(default=None, alias="resourceId"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     return AuditService(db).trace(correlation_id=correlation_id, resource_type=resource_type, resource_id=resource_id)
 
 
+@router.get("/db/pool")
+def db_pool():
+    return {"pools": pool_stats()}
+
+
+@router.get("/db/top-queries")
+def db_top_queries(
+    group_by: str = Query(default="route,action,task", alias="groupBy"),
+    order_by: str = Query(default="total", alias="orderBy"),
+    limit: int = Query(default=20, ge=1, le=200),
+    db: Session = Depends(get_read_db),
+):
+    try:
+        out = InternalService(db).top_queries(
+            group_by=[g.strip() for g in group_by.split(",") if g.strip()], order_by=order_by, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if out is None:
+        raise HTTPException(status_code=503, detail="pg_stat_statements is not available in this database")
+    return out
+
+
+@router.get("/profiles")
+def list_profiles(limit: int = Query(default=50, ge=1, le=500)):
+    return {"profiles": profiling.recent(limit)}
+
+
+@router.get("/profiles/{id}")
+def get_profile(id: str, format: str = Query(default="json", pattern="^(json|pstats)$")):
+    if format == "pstats":
+        path = profiling.path_for(id, raw=True)
+        if path is None:
+            raise HTTPException(status_code=404, detail="Not found")
+        return FileResponse(path, media_type="application/octet-stream", filename=f"{id}.prof")
+    out = profiling.load(id)
+    if out is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return out
+
+
 @router.get("/som/{resource_type}/{id}")
-def som_backing(resource_type: str, id: str, db: Session = Depends(get_db)):
+def som_backing(resource_type: str, id: str, db: Session = Depends(get_read_db)):
     out = InternalService(db).som_backing(resource_type, id)
     if not out:
         raise HTTPException(status_code=404, detail="Not found")
@@ -32,7 +79,7 @@ def som_backing(resource_type: str, id: str, db: Session = Depends(get_db)):
 
 
 @router.get("/observation/{id}/versions")
-def observation_versions(id: str, db: Session = Depends(get_db)):
+def observation_versions(id: str, db: Session = Depends(get_read_db)):
     out = InternalService(db).observation_versions(id)
     if not out:
         raise HTTPException(status_code=404, detail="Not found")
@@ -53,7 +100,7 @@ def reset_seed_data(
 
 
 @router.get("/scenarios/templates")
-def list_scenario_templates(db: Session = Depends(get_db)):
+def list_scenario_templates(db: Session = Depends(get_read_db)):
     return ScenarioService(db).list_templates()
 
 
@@ -67,3 +114,8 @@ def create_scenario(
         return ScenarioService(db).create_from_template(body, correlation_id=x_correlation_id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except IntegrityError as e:
+        # A reused patient.mrn hits the unique Patient identifier index.
+        if isinstance(e.orig, UniqueViolation):
+            raise HTTPException(status_code=409, detail="Conflicts with an existing resource (patient.mrn in use?)")
+        raise
@@ -5,11 +5,12 @@ from typing import Any
 from fastapi import APIRouter, Depends, Header, HTTPException, Query
 from sqlalchemy.orm import Session
 
-from app.db.session import get_db
+from app.api.responses import FastJSONResponse, FastJSONRoute
+from app.db.session import get_db, get_read_db
 from app.services.jobs.service import JobService
 
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute, default_response_class=FastJSONResponse)
 
 
 @router.post("")
@@ -26,7 +27,7 @@ def create_job(
 
 
 @router.get("/{job_id}")
-def get_job(job_id: str, db: Session = Depends(get_db)):
+def get_job(job_id: str, db: Session = Depends(get_read_db)):
     job = JobService(db).get(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Not found")
@@ -34,5 +35,16 @@ def get_job(job_id: str, db: Session = Depends(get_db)):
 
 
 @router.get("")
-def list_jobs(status: str | None = Query(default=None), db: Session = Depends(get_db)):
-    return JobService(db).list(status=status)
+def list_jobs(
+    status: str | None = Query(default=None),
+    min_duration: float | None = Query(default=None, alias="minDuration", ge=0),
+    max_duration: float | None = Query(default=None, alias="maxDuration", ge=0),
+    order_by: str = Query(default="created", alias="orderBy"),
+    db: Session = Depends(get_read_db),
+):
+    try:
+        return JobService(db).list(
+            status=status, min_duration=min_duration, max_duration=max_duration, order_by=order_by
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.metrics import HTTP_REQUEST_DB_QUERIES, HTTP_REQUEST_DB_SECONDS, HTTP_REQUEST_SECONDS
+from app.db import query_metrics
+from app.services.mapping.fhir_dispatch import SUPPORTED_TYPES
+
+
+class MetricsMiddleware:
+    """
+    Per-request latency and SQL counts, labelled by route template (`/fhir/{resource_type}/{id}`) and the
+    resource type path parameter, so label values stay bounded. Unmatched paths are recorded as "unmatched".
+    Plain ASGI rather than BaseHTTPMiddleware: no extra task or response wrapping per request.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        tally = query_metrics.QueryTally()
+        token = query_metrics.tally.set(tally)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            query_metrics.tally.reset(token)
+            # The router records the matched route in the (shared) scope.
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            resource_type = (scope.get("path_params") or {}).get("resource_type", "")
+            if resource_type and resource_type.lower() not in SUPPORTED_TYPES:
+                resource_type = "other"
+            method = scope["method"]
+            HTTP_REQUEST_SECONDS.observe(elapsed, method, template, resource_type, str(status))
+            HTTP_REQUEST_DB_QUERIES.observe(tally.count, method, template)
+            HTTP_REQUEST_DB_SECONDS.observe(tally.seconds, method, template)
@@ -5,15 +5,16 @@ from typing import Any
 from fastapi import APIRouter, Depends, Header, HTTPException, Query
 from sqlalchemy.orm import Session
 
-from app.db.session import get_db
+from app.api.responses import FastJSONResponse, FastJSONRoute
+from app.db.session import get_db, get_read_db
 from app.services.payer.rules import PayerRuleService
 
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute, default_response_class=FastJSONResponse)
 
 
 @router.get("/rules")
-def get_active_rules(payer: str = Query(...), db: Session = Depends(get_db)):
+def get_active_rules(payer: str = Query(...), db: Session = Depends(get_read_db)):
     rs = PayerRuleService(db).get_active(payer=payer)
     if not rs:
         raise HTTPException(status_code=404, detail="No active rule set for payer")
@@ -36,7 +37,7 @@ def put_active_rules(
 
 
 @router.get("/rule-sets")
-def list_rule_sets(payer: str | None = Query(default=None), db: Session = Depends(get_db)):
+def list_rule_sets(payer: str | None = Query(default=None), db: Session = Depends(get_read_db)):
     rows = PayerRuleService(db).list(payer=payer)
     return {"ruleSets": [PayerRuleService.to_dict(r) for r in rows]}
 
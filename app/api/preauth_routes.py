@@ -5,11 +5,13 @@ from typing import Any
 from fastapi import APIRouter, Depends, Header, HTTPException, Query
 from sqlalchemy.orm import Session
 
-from app.db.session import get_db
+from app.api.responses import FastJSONResponse, FastJSONRoute
+from app.db.session import get_db, get_read_db
+from app.services.preauth.queue import LeaseLost, PreAuthQueueService
 from app.services.preauth.service import PreAuthService
 
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute, default_response_class=FastJSONResponse)
 
 
 @router.post("")
@@ -25,8 +27,44 @@ def create_draft(
     return out
 
 
+@router.post("/queue/claim")
+def claim_queue_items(body: dict[str, Any], db: Session = Depends(get_db)):
+    try:
+        return PreAuthQueueService(db).claim(
+            reviewer=str(body.get("reviewer") or ""),
+            limit=int(body.get("limit", 1)),
+            lease_seconds=body.get("leaseSeconds"),
+            payer=body.get("payer"),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/queue/leases/{lease_id}/heartbeat")
+def heartbeat_queue_lease(lease_id: str, body: dict[str, Any] | None = None, db: Session = Depends(get_db)):
+    try:
+        return PreAuthQueueService(db).heartbeat(lease_id, lease_seconds=(body or {}).get("leaseSeconds"))
+    except LeaseLost as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/queue/leases/{lease_id}/release")
+def release_queue_lease(lease_id: str, body: dict[str, Any] | None = None, db: Session = Depends(get_db)):
+    try:
+        return PreAuthQueueService(db).release(lease_id, preauth_ids=(body or {}).get("preAuthIds"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/queue/stats")
+def queue_stats(payer: str | None = Query(default=None), db: Session = Depends(get_read_db)):
+    return PreAuthQueueService(db).stats(payer=payer)
+
+
 @router.get("/{preauth_id}")
-def get_preauth(preauth_id: str, db: Session = Depends(get_db)):
+def get_preauth(preauth_id: str, db: Session = Depends(get_read_db)):
     out = PreAuthService(db).get(preauth_id)
     if not out:
         raise HTTPException(status_code=404, detail="Not found")
@@ -83,12 +121,12 @@ def attach_document(
 
 
 @router.get("/{preauth_id}/status-history")
-def status_history(preauth_id: str, db: Session = Depends(get_db)):
+def status_history(preauth_id: str, db: Session = Depends(get_read_db)):
     return PreAuthService(db).status_history(preauth_id)
 
 
 @router.get("/{preauth_id}/latest-decision")
-def latest_decision(preauth_id: str, db: Session = Depends(get_db)):
+def latest_decision(preauth_id: str, db: Session = Depends(get_read_db)):
     out = PreAuthService(db).latest_decision(preauth_id)
     if not out:
         raise HTTPException(status_code=404, detail="Not found")
@@ -100,6 +138,6 @@ def search_preauth(
     patient: str | None = Query(default=None),
     status: str | None = Query(default=None),
     payer: str | None = Query(default=None),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     return PreAuthService(db).search(patient_id=patient, status=status, payer=payer)
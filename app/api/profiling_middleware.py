@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core import profiling
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests sent with `X-Profile: 1` (or sampled at settings.profile_sample_rate) when
+    settings.profiling_enabled. The response carries `X-Profile-Id`; fetch the report from
+    `/internal/profiles/{id}`. The endpoint itself runs under cProfile (FastJSONRoute enables it in the
+    thread that runs it); SQL is recorded for the whole request.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"x-profile"), None)
+        if not profiling.requested(header):
+            await self.app(scope, receive, send)
+            return
+        profile = profiling.begin("http", f"{scope['method']} {scope['path']}")
+        if profile is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_id(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message).append("X-Profile-Id", profile.id)
+            await send(message)
+
+        token = profiling.activate(profile)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiling.deactivate(token)
+            route = getattr(scope.get("route"), "path", None)
+            profiling.end(profile, route=route, path=scope["path"], status=status)
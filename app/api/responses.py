@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import functools
+import inspect
+from decimal import Decimal
+from typing import Any, Callable
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.core import profiling, tracing
+
+
+def _default(obj: Any) -> Any:
+    # orjson handles dict/list/str/int/float/bool/None, datetime/date/time, UUID, Enum and dataclasses natively.
+    if isinstance(obj, Decimal):
+        # Same rule as jsonable_encoder: integral decimals become ints.
+        return int(obj) if obj.as_tuple().exponent >= 0 else float(obj)
+    # Anything rarer (pydantic models, sets, ...) keeps FastAPI's encoding rules.
+    return jsonable_encoder(obj)
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson. `bytes` content is treated as already-serialized JSON and sent as is;
+    `orjson.Fragment` values anywhere in the content are spliced in verbatim.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+
+class FastJSONRoute(APIRoute):
+    """
+    Route that renders plain return values with FastJSONResponse directly, skipping FastAPI's
+    jsonable_encoder pass (a full recursive copy of the payload) for routes without a response_model.
+    Endpoints that return a Response, or declare a response_model, are handled by FastAPI as usual.
+
+    Requests are also run with the route template and X-Correlation-Id in the tracing context, which covers
+    dependencies too (the session's commit flushes in get_db), so their SQL is tagged (app.db.sqlcomment).
+    """
+
+    def get_route_handler(self) -> Callable:
+        if self.response_model is None and self.dependant.call is not None:
+            self.dependant.call = self._wrap(self.dependant.call)
+        handler = super().get_route_handler()
+        route = self.path
+
+        async def tagged_handler(request: Request) -> Response:
+            tags_token = tracing.set_tags(route=route)
+            cid_token = tracing.set_correlation_id(request.headers.get("x-correlation-id") or tracing.correlation_id())
+            try:
+                return await handler(request)
+            finally:
+                tracing.reset_correlation_id(cid_token)
+                tracing.reset_tags(tags_token)
+
+        return tagged_handler
+
+    def _wrap(self, call: Callable) -> Callable:
+        status_code = self.status_code or 200
+
+        def as_response(raw: Any) -> Any:
+            if isinstance(raw, Response):
+                return raw
+            return FastJSONResponse(raw, status_code=status_code)
+
+        if inspect.iscoroutinefunction(call):
+
+            @functools.wraps(call)
+            async def async_endpoint(**values: Any) -> Any:
+                profile = profiling.current()
+                if profile is None:
+                    return as_response(await call(**values))
+                with profiling.profiling(profile):
+                    return as_response(await call(**values))
+
+            return async_endpoint
+
+        @functools.wraps(call)
+        def endpoint(**values: Any) -> Any:
+            # Sync endpoints run in a worker thread: a profiled request's cProfile is enabled here, in it.
+            profile = profiling.current()
+            if profile is None:
+                return as_response(call(**values))
+            with profiling.profiling(profile):
+                return as_response(call(**values))
+
+        return endpoint
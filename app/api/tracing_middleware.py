@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core import tracing
+
+
+class TracingMiddleware:
+    """
+    Server span per HTTP request, joined to the caller's trace when it sends `traceparent`. The request's
+    X-Correlation-Id becomes the correlation id of every span started while handling it. The span is named
+    after the route template once routing has matched (`GET /fhir/{resource_type}/{id}`).
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not tracing.enabled():
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        cid_token = tracing.set_correlation_id(headers.get("x-correlation-id"))
+        span = tracing.start_span(
+            f"{scope['method']} {scope['path']}",
+            kind=tracing.SERVER,
+            attributes={"http.request.method": scope["method"], "url.path": scope["path"]},
+            remote_parent=tracing.parse_traceparent(headers.get("traceparent")),
+        )
+        token = tracing.attach(span)
+
+        async def send_with_status(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                span.set("http.response.status_code", message["status"])
+                if message["status"] >= 500:
+                    span.error = f"HTTP {message['status']}"
+            await send(message)
+
+        error: BaseException | None = None
+        try:
+            await self.app(scope, receive, send_with_status)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            tracing.detach(token)
+            tracing.reset_correlation_id(cid_token)
+            route = getattr(scope.get("route"), "path", None)
+            if route:
+                span.name = f"{scope['method']} {route}"
+                span.set("http.route", route)
+            resource_type = (scope.get("path_params") or {}).get("resource_type")
+            span.set("fhir.resource_type", resource_type)
+            tracing.finish(span, error)
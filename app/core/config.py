@@ -12,6 +12,74 @@ class Settings(BaseSettings):
     database_url: str
     redis_url: str
 
+    # Optional read replica for GET endpoints; unset (or equal to database_url) routes reads to the primary.
+    database_replica_url: str | None = None
+    replica_max_lag_seconds: float = 5.0
+    replica_lag_check_seconds: float = 1.0
+    read_your_writes_seconds: float = 30.0
+    read_your_writes_redis_retry_seconds: float = 30.0
+
+    # Connection pool (per process). API and Celery workers size their pools independently.
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout_seconds: float = 30.0
+    db_pool_recycle_seconds: int = 1800
+    db_pool_pre_ping: bool = True
+    worker_db_pool_size: int = 2
+    worker_db_max_overflow: int = 2
+    # PgBouncer transaction pooling: disable server-side prepared statements.
+    db_pgbouncer_mode: bool = False
+
+    # FHIR read cache: in-process LRU in front of Redis (REDIS_URL), keyed by resource version.
+    read_cache_enabled: bool = True
+    read_cache_local_entries: int = 4096
+    read_cache_ttl_seconds: int = 3600
+    read_cache_redis_retry_seconds: float = 30.0
+
+    # Responses at least this large are gzip-compressed when the client accepts it (0 disables).
+    response_gzip_min_bytes: int = 1024
+
+    # Subscriptions (app.services.subscriptions): change-feed delivery to rest-hook and websocket channels.
+    subscription_batch_size: int = 100
+    subscription_scan_limit: int = 5000
+    subscription_max_concurrency: int = 8
+    subscription_http_timeout_seconds: float = 5.0
+    subscription_max_failures: int = 10
+    subscription_retry_max_seconds: int = 300
+    subscription_poll_seconds: float = 5.0
+    subscription_websocket_enabled: bool = True
+    subscription_websocket_queue_size: int = 100
+    change_feed_retention_hours: int = 72
+
+    # Metrics (GET /metrics, Prometheus text format). Multi-process servers (uvicorn --workers, Celery prefork)
+    # share counters through per-process snapshot files in metrics_multiprocess_dir.
+    metrics_enabled: bool = True
+    metrics_multiprocess_dir: str | None = None
+    metrics_flush_seconds: float = 5.0
+
+    # Tracing (app.core.tracing): spans written as OTLP/JSON lines to tracing_file.
+    tracing_enabled: bool = False
+    tracing_file: str = "traces.otlp.jsonl"
+    tracing_service_name: str = "ehr"
+
+    # SQL comment tags (app.db.sqlcomment): route/action/task on every statement, for pg_stat_statements.
+    # The correlation id varies per request, which stops psycopg from preparing those statements.
+    sql_comments_enabled: bool = True
+    sql_comment_correlation_id: bool = False
+
+    # Profiling (app.core.profiling): requests sent with X-Profile: 1 (or a sampled share) and jobs with
+    # parameters.profile run under cProfile; reports are written to profile_dir.
+    profiling_enabled: bool = False
+    profile_sample_rate: float = 0.0
+    profile_dir: str = "profiles"
+    profile_keep: int = 200
+
+    # Job run metrics (app.worker.instrumentation): tasks whose Python allocations are traced with tracemalloc.
+    job_tracemalloc_tasks: str = "jobs.bulk_import_observations"
+
+    # Payer review queue (app.services.preauth.queue): how long a claim lasts without a heartbeat.
+    preauth_queue_lease_seconds: int = 300
+
     default_source_system: str = "sample-app"
     auto_migrate: bool = False
     auto_seed: bool = False
@@ -0,0 +1,320 @@
+"""
+In-process metrics, served in the Prometheus text format at `GET /metrics`.
+
+Counters, gauges and histograms are plain dicts of label values guarded by a lock (the same shape as
+app.db.pool_metrics), so recording one costs a dict lookup and an add. Labels are positional and must stay
+low-cardinality: route templates, resource types, table names -- never ids.
+
+Multi-process servers (`uvicorn --workers N`, Celery prefork) keep a registry per process. With
+`settings.metrics_multiprocess_dir` set, every process writes its snapshot to `<dir>/<host>-<pid>.json` every
+`metrics_flush_seconds` (and at exit), and /metrics merges them: counters and histograms are summed over
+every file, gauges only over processes that flushed recently. Clear the directory when the deployment starts.
+"""
+
+from __future__ import annotations
+
+import atexit
+import bisect
+import copy
+import json
+import math
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+from app.core.config import settings
+
+# Upper bounds (seconds) for latency histograms.
+LATENCY_BUCKETS: tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds for per-request query counts.
+COUNT_BUCKETS: tuple[float, ...] = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+# Upper bounds for memory sizes: 1 MiB to 1 GiB.
+BYTE_BUCKETS: tuple[float, ...] = tuple(float(2**n) for n in range(20, 31, 2))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values: dict[tuple[str, ...], Any] = {}
+
+    def samples(self) -> list[list[Any]]:
+        with self._lock:
+            return [[list(k), v] for k, v in self._values.items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def remove(self, *labels: str) -> None:
+        with self._lock:
+            self._values.pop(labels, None)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...], buckets: tuple[float, ...]):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels: str) -> None:
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                # Per-bucket (not cumulative) counts, then the sum.
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][idx] += 1
+            entry[1] += value
+
+    def samples(self) -> list[list[Any]]:
+        with self._lock:
+            return [[list(k), [list(v[0]), v[1]]] for k, v in self._values.items()]
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Callable[[], None]] = []
+        self._writer: threading.Thread | None = None
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labels != metric.labels:
+                    raise ValueError(f"Metric {metric.name} is already registered with another type or labels")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labels))
+
+    def histogram(
+        self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def on_collect(self, fn: Callable[[], None]) -> None:
+        """Run `fn` before every snapshot; for gauges read from live state (pool sizes, cache entries)."""
+        with self._lock:
+            self._collectors.append(fn)
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics.values())
+        for fn in collectors:
+            fn()
+        out: dict[str, Any] = {}
+        for m in metrics:
+            out[m.name] = {
+                "kind": m.kind,
+                "help": m.help,
+                "labels": list(m.labels),
+                "buckets": list(getattr(m, "buckets", ())),
+                "samples": m.samples(),
+            }
+        return out
+
+    # ---- multi-process ---------------------------------------------------------------------------------------
+
+    def start_multiprocess_writer(self) -> None:
+        """Start flushing this process's snapshot to settings.metrics_multiprocess_dir (no-op when unset)."""
+        if not settings.metrics_multiprocess_dir:
+            return
+        with self._lock:
+            if self._writer is not None and self._writer.is_alive():
+                return
+            self._writer = threading.Thread(target=self._flush_forever, name="metrics-writer", daemon=True)
+            self._writer.start()
+        atexit.register(self.flush)
+
+    def _flush_forever(self) -> None:
+        while True:
+            time.sleep(settings.metrics_flush_seconds)
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def flush(self) -> None:
+        directory = settings.metrics_multiprocess_dir
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, _snapshot_file())
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def _merged(self) -> dict[str, Any]:
+        merged = self.snapshot()
+        directory = settings.metrics_multiprocess_dir
+        if not directory or not os.path.isdir(directory):
+            return merged
+        own = _snapshot_file()
+        live_after = time.time() - 3 * settings.metrics_flush_seconds
+        for name in os.listdir(directory):
+            if not name.endswith(".json") or name == own:
+                continue
+            path = os.path.join(directory, name)
+            try:
+                live = os.path.getmtime(path) >= live_after
+                with open(path) as f:
+                    other = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for metric_name, metric in other.items():
+                if metric["kind"] == "gauge" and not live:
+                    continue
+                _merge_into(merged, metric_name, metric)
+        return merged
+
+    def render(self) -> str:
+        return render(self._merged())
+
+
+def _snapshot_file() -> str:
+    # Host name too: containers sharing the directory can reuse the same pids.
+    return f"{socket.gethostname()}-{os.getpid()}.json"
+
+
+def _merge_into(merged: dict[str, Any], name: str, metric: dict[str, Any]) -> None:
+    target = merged.setdefault(name, {**metric, "samples": []})
+    if target["kind"] != metric["kind"] or target["buckets"] != metric["buckets"]:
+        return
+    by_labels = {tuple(s[0]): s for s in target["samples"]}
+    for labels, value in metric["samples"]:
+        existing = by_labels.get(tuple(labels))
+        if existing is None:
+            sample = [labels, copy.deepcopy(value)]
+            target["samples"].append(sample)
+            by_labels[tuple(labels)] = sample
+        elif metric["kind"] == "histogram":
+            existing[1][0] = [a + b for a, b in zip(existing[1][0], value[0])]
+            existing[1][1] += value[1]
+        else:
+            existing[1] += value
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(names: list[str], values: list[str], extra: tuple[str, str] | None = None) -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render(snapshot: dict[str, Any]) -> str:
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines: list[str] = []
+    for name in sorted(snapshot):
+        m = snapshot[name]
+        lines.append(f"# HELP {name} {m['help']}")
+        lines.append(f"# TYPE {name} {m['kind']}")
+        for labels, value in sorted(m["samples"], key=lambda s: s[0]):
+            if m["kind"] != "histogram":
+                lines.append(f"{name}{_label_str(m['labels'], labels)} {_number(value)}")
+                continue
+            counts, total = value
+            cumulative = 0
+            for le, c in zip([*m["buckets"], math.inf], counts):
+                cumulative += c
+                lines.append(f"{name}_bucket{_label_str(m['labels'], labels, ('le', _number(le)))} {cumulative}")
+            lines.append(f"{name}_sum{_label_str(m['labels'], labels)} {_number(total)}")
+            lines.append(f"{name}_count{_label_str(m['labels'], labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# ---- metrics shared across modules ---------------------------------------------------------------------------
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ("method", "route", "resource_type", "status"),
+)
+HTTP_REQUEST_DB_QUERIES = registry.histogram(
+    "http_request_db_queries", "SQL statements executed per HTTP request.", ("method", "route"), COUNT_BUCKETS
+)
+HTTP_REQUEST_DB_SECONDS = registry.histogram(
+    "http_request_db_seconds", "Time spent executing SQL per HTTP request.", ("method", "route")
+)
+DB_QUERY_SECONDS = registry.histogram(
+    "db_query_duration_seconds", "SQL statement latency by statement kind and first table.", ("operation", "table")
+)
+MAPPER_SECONDS = registry.histogram(
+    "fhir_mapper_duration_seconds", "FHIR mapper call latency.", ("resource_type", "operation")
+)
+READ_CACHE_REQUESTS = registry.counter(
+    "read_cache_requests_total", "FHIR read cache lookups by outcome (local, redis, miss).", ("resource_type", "result")
+)
+CELERY_TASK_SECONDS = registry.histogram(
+    "celery_task_duration_seconds", "Celery task run time.", ("task", "state")
+)
+CELERY_QUEUE_WAIT_SECONDS = registry.histogram(
+    "celery_task_queue_wait_seconds", "Time between publishing a Celery task and a worker starting it.", ("task",)
+)
+JOB_PHASE_SECONDS = registry.histogram(
+    "job_phase_duration_seconds", "Time spent in each phase of a job task.", ("task", "phase")
+)
+JOB_DB_STATEMENTS = registry.histogram(
+    "job_db_statements", "SQL statements executed per job task run.", ("task",), COUNT_BUCKETS + (1000, 5000)
+)
+JOB_PEAK_RSS_BYTES = registry.gauge(
+    "job_worker_peak_rss_bytes",
+    "Peak resident set size of the worker process after its last run of a task.",
+    ("task",),
+)
+JOB_TRACEMALLOC_PEAK_BYTES = registry.histogram(
+    "job_tracemalloc_peak_bytes", "Peak Python allocations during a job task run (tracemalloc).", ("task",), BYTE_BUCKETS
+)
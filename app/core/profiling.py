@@ -0,0 +1,229 @@
+"""
+Opt-in profiling of single HTTP requests (`X-Profile: 1`, or a sampled share) and Celery jobs
+(`parameters.profile`).
+
+A profiled run executes under cProfile and records every SQL statement it issued with its duration. The
+report (wall time, top functions by cumulative and own time, SQL summary) is written as JSON to
+`<settings.profile_dir>/<id>.json` next to the raw pstats dump (`<id>.prof`, for pstats or snakeviz), where
+`/internal/profiles/{id}` serves it. Files rather than process memory, so any API process can serve a
+profile captured by another one or by a worker; only the newest `settings.profile_keep` are kept.
+
+cProfile can only run one profile at a time (from Python 3.12 its hook is process-wide), so profiled runs are
+serialized: a run that finds another one in progress is not profiled.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import datetime as dt
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+from app.core.config import settings
+
+_ID = re.compile(r"^[0-9a-f-]{8,64}$")
+TOP_FUNCTIONS = 40
+TOP_STATEMENTS = 20
+
+
+@dataclass
+class Profile:
+    id: str
+    kind: str
+    name: str
+    started_at: str
+    start: float
+    profiler: cProfile.Profile = field(default_factory=cProfile.Profile)
+    sql: list[tuple[str, float]] = field(default_factory=list)
+
+
+_active: ContextVar[Profile | None] = ContextVar("profile", default=None)
+_lock = threading.Lock()
+
+
+def requested(header: str | None) -> bool:
+    """Whether an HTTP request should be profiled: `X-Profile: 1`, or sampled at settings.profile_sample_rate."""
+    if not settings.profiling_enabled:
+        return False
+    if header is not None and header.strip().lower() in ("1", "true", "yes"):
+        return True
+    return settings.profile_sample_rate > 0 and random.random() < settings.profile_sample_rate
+
+
+def begin(kind: str, name: str, *, id: str | None = None) -> Profile | None:
+    """Start a profile, or None when another one is running. Every Profile must be passed to end()."""
+    if not _lock.acquire(blocking=False):
+        return None
+    return Profile(
+        id=id or uuid.uuid4().hex,
+        kind=kind,
+        name=name,
+        started_at=dt.datetime.now(dt.timezone.utc).isoformat(),
+        start=time.perf_counter(),
+    )
+
+
+def activate(p: Profile) -> Token:
+    """Make `p` the profile of this context (its SQL is recorded); undo with deactivate()."""
+    return _active.set(p)
+
+
+def deactivate(token: Token) -> None:
+    _active.reset(token)
+
+
+def current() -> Profile | None:
+    return _active.get()
+
+
+@contextmanager
+def profiling(p: Profile) -> Iterator[None]:
+    """Run the block under the profile's cProfile, in the calling thread."""
+    p.profiler.enable()
+    try:
+        yield
+    finally:
+        p.profiler.disable()
+
+
+def record_sql(statement: str, seconds: float) -> None:
+    p = _active.get()
+    if p is not None:
+        p.sql.append((statement, seconds))
+
+
+def end(p: Profile, **attributes: Any) -> dict[str, Any]:
+    """Finish `p`: store its report and pstats dump, and release the profiler for the next run."""
+    try:
+        wall = time.perf_counter() - p.start
+        stats = pstats.Stats(p.profiler)
+        report = {
+            "id": p.id,
+            "kind": p.kind,
+            "name": p.name,
+            "startedAt": p.started_at,
+            "wallMs": round(wall * 1000, 3),
+            **attributes,
+            "functions": _functions(stats),
+            "sql": _sql_summary(p.sql),
+        }
+        _save(p.id, report, stats)
+        return report
+    finally:
+        _lock.release()
+
+
+def _function_name(key: tuple[str, int, str]) -> str:
+    filename, line, name = key
+    if filename == "~":
+        return name  # built-in
+    i = filename.find("site-packages/")
+    if i >= 0:
+        filename = filename[i + len("site-packages/") :]
+    elif filename.startswith(os.getcwd()):
+        filename = os.path.relpath(filename)
+    return f"{filename}:{line}({name})"
+
+
+def _functions(stats: pstats.Stats) -> dict[str, list[dict[str, Any]]]:
+    rows = [
+        {
+            "function": _function_name(key),
+            "calls": nc,
+            "ownMs": round(tt * 1000, 3),
+            "cumulativeMs": round(ct * 1000, 3),
+        }
+        for key, (cc, nc, tt, ct, callers) in stats.stats.items()  # type: ignore[attr-defined]
+    ]
+    return {
+        "byCumulative": sorted(rows, key=lambda r: r["cumulativeMs"], reverse=True)[:TOP_FUNCTIONS],
+        "byOwn": sorted(rows, key=lambda r: r["ownMs"], reverse=True)[:TOP_FUNCTIONS],
+    }
+
+
+def _sql_summary(sql: list[tuple[str, float]]) -> dict[str, Any]:
+    by_statement: dict[str, list[float]] = {}
+    for statement, seconds in sql:
+        by_statement.setdefault(statement, []).append(seconds)
+    statements = [
+        {"statement": s[:1000], "calls": len(times), "totalMs": round(sum(times) * 1000, 3)}
+        for s, times in by_statement.items()
+    ]
+    statements.sort(key=lambda s: s["totalMs"], reverse=True)
+    return {
+        "count": len(sql),
+        "totalMs": round(sum(seconds for _, seconds in sql) * 1000, 3),
+        "statements": statements[:TOP_STATEMENTS],
+    }
+
+
+def _save(id: str, report: dict[str, Any], stats: pstats.Stats) -> None:
+    directory = settings.profile_dir
+    os.makedirs(directory, exist_ok=True)
+    stats.dump_stats(os.path.join(directory, f"{id}.prof"))
+    tmp = os.path.join(directory, f"{id}.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(report, f)
+    os.replace(tmp, os.path.join(directory, f"{id}.json"))
+    _prune(directory)
+
+
+def _prune(directory: str) -> None:
+    reports = sorted(
+        (os.path.join(directory, n) for n in os.listdir(directory) if n.endswith(".json")), key=os.path.getmtime
+    )
+    for path in reports[: max(len(reports) - settings.profile_keep, 0)]:
+        for p in (path, path[: -len(".json")] + ".prof"):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+
+
+def path_for(id: str, *, raw: bool = False) -> str | None:
+    """Path of a stored report (or its pstats dump when `raw`), None for unknown or malformed ids."""
+    if not _ID.match(id):
+        return None
+    path = os.path.join(settings.profile_dir, f"{id}.{'prof' if raw else 'json'}")
+    return path if os.path.exists(path) else None
+
+
+def load(id: str) -> dict[str, Any] | None:
+    path = path_for(id)
+    if path is None:
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def recent(limit: int = 50) -> list[dict[str, Any]]:
+    """Newest stored profiles first, without their function and statement lists."""
+    directory = settings.profile_dir
+    if not os.path.isdir(directory):
+        return []
+    paths = sorted(
+        (os.path.join(directory, n) for n in os.listdir(directory) if n.endswith(".json")),
+        key=os.path.getmtime,
+        reverse=True,
+    )
+    out = []
+    for path in paths[:limit]:
+        try:
+            with open(path) as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            continue
+        report.pop("functions", None)
+        report["sql"] = {k: v for k, v in report.get("sql", {}).items() if k != "statements"}
+        out.append(report)
+    return out
@@ -0,0 +1,283 @@
+"""
+Lightweight tracing: spans compatible with OpenTelemetry's data model, W3C `traceparent` propagation, and a
+file exporter writing OTLP/JSON (one `ExportTraceServiceRequest` per line, the OpenTelemetry Collector's
+file exporter format), so traces can be inspected offline or replayed into a collector with its
+`otlpjsonfile` receiver.
+
+The current span and correlation id live in context variables: worker threads started by FastAPI for sync
+handlers inherit them, and Celery carries them across Redis in task headers (`traceparent`,
+`x_correlation_id`, set in app.worker.celery_app). Every span started while a correlation id is known gets it
+as the `correlation.id` attribute. The same context carries a few low-cardinality tags (`route`, `action`,
+`task`) that app.db.sqlcomment appends to SQL statements.
+
+Disabled (the default), `span()` costs one settings lookup.
+"""
+
+from __future__ import annotations
+
+import atexit
+import functools
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, TypeVar
+
+from app.core.config import settings
+
+# OTLP SpanKind values.
+INTERNAL, SERVER, CLIENT, PRODUCER, CONSUMER = 1, 2, 3, 4, 5
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: str | None
+    kind: int = INTERNAL
+    attributes: dict[str, Any] = field(default_factory=dict)
+    start_ns: int = 0
+    end_ns: int = 0
+    error: str | None = None
+    # True when the parent lives in another process (or there is none): ending it flushes the buffer.
+    local_root: bool = True
+
+    def set(self, key: str, value: Any) -> None:
+        if value is not None:
+            self.attributes[key] = value
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> dict[str, Any]:
+        out: dict[str, Any] = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error is not None else {"code": 0},
+        }
+        if self.parent_span_id:
+            out["parentSpanId"] = self.parent_span_id
+        return out
+
+
+def _otlp_value(v: Any) -> dict[str, Any]:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+
+class FileExporter:
+    """Buffers finished spans and appends them to `settings.tracing_file` when a local root span ends."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pending: list[Span] = []
+        atexit.register(self.flush)
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self._pending.append(span)
+            if not span.local_root and len(self._pending) < 512:
+                return
+            batch, self._pending = self._pending, []
+            self._write(batch)
+
+    def flush(self) -> None:
+        with self._lock:
+            batch, self._pending = self._pending, []
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: list[Span]) -> None:
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {"key": "service.name", "value": {"stringValue": settings.tracing_service_name}},
+                            {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+                        ]
+                    },
+                    "scopeSpans": [{"scope": {"name": "app.core.tracing"}, "spans": [s.to_otlp() for s in batch]}],
+                }
+            ]
+        }
+        with open(settings.tracing_file, "a") as f:
+            f.write(json.dumps(payload, separators=(",", ":")) + "\n")
+
+
+exporter = FileExporter()
+
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+_correlation_id: ContextVar[str | None] = ContextVar("correlation_id", default=None)
+_tags: ContextVar[dict[str, str]] = ContextVar("tags", default={})
+
+
+def enabled() -> bool:
+    return settings.tracing_enabled
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+def correlation_id() -> str | None:
+    return _correlation_id.get()
+
+
+def parse_traceparent(value: str | None) -> tuple[str, str] | None:
+    """(trace id, parent span id) from a W3C traceparent header, or None when absent or malformed."""
+    m = _TRACEPARENT.match((value or "").strip().lower())
+    if not m or m.group(1) == "0" * 32 or m.group(2) == "0" * 16:
+        return None
+    return m.group(1), m.group(2)
+
+
+def start_span(
+    name: str,
+    *,
+    kind: int = INTERNAL,
+    attributes: dict[str, Any] | None = None,
+    remote_parent: tuple[str, str] | None = None,
+) -> Span:
+    """
+    Start a span under the current one, or under `remote_parent` (trace id, span id from another process)
+    when there is none. Pair with attach()/detach() and finish(); `span()` does all three.
+    """
+    parent = _current_span.get()
+    if parent is not None:
+        trace_id, parent_id, local_root = parent.trace_id, parent.span_id, False
+    else:
+        trace_id, parent_id = remote_parent or (f"{random.getrandbits(128):032x}", None)
+        local_root = True
+    s = Span(
+        name=name,
+        trace_id=trace_id,
+        span_id=f"{random.getrandbits(64):016x}",
+        parent_span_id=parent_id,
+        kind=kind,
+        start_ns=time.time_ns(),
+        local_root=local_root,
+    )
+    s.set("correlation.id", _correlation_id.get())
+    for k, v in (attributes or {}).items():
+        s.set(k, v)
+    return s
+
+
+def finish(s: Span, error: BaseException | None = None) -> None:
+    if error is not None:
+        s.error = f"{type(error).__name__}: {error}"
+    s.end_ns = time.time_ns()
+    exporter.export(s)
+
+
+def attach(s: Span) -> Token:
+    return _current_span.set(s)
+
+
+def detach(token: Token) -> None:
+    _current_span.reset(token)
+
+
+def set_correlation_id(correlation_id: str | None) -> Token:
+    """Correlation id for spans started in this context from now on; undo with reset_correlation_id()."""
+    return _correlation_id.set(correlation_id)
+
+
+def reset_correlation_id(token: Token) -> None:
+    _correlation_id.reset(token)
+
+
+def tags() -> dict[str, str]:
+    """What is running in this context: `route` (template), `action` (mapper/service method), `task`."""
+    return _tags.get()
+
+
+def set_tags(**tags: str | None) -> Token:
+    return _tags.set({**_tags.get(), **{k: v for k, v in tags.items() if v is not None}})
+
+
+def reset_tags(token: Token) -> None:
+    _tags.reset(token)
+
+
+@contextmanager
+def tagged(**tags: str | None) -> Iterator[None]:
+    token = set_tags(**tags)
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+@contextmanager
+def _span(name: str, kind: int, attributes: dict[str, Any] | None) -> Iterator[Span]:
+    s = start_span(name, kind=kind, attributes=attributes)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        finish(s, e)
+        raise
+    else:
+        finish(s)
+    finally:
+        _current_span.reset(token)
+
+
+def span(name: str, *, kind: int = INTERNAL, attributes: dict[str, Any] | None = None):
+    """Context manager for a child span of the current one; yields the Span (None when tracing is off)."""
+    if not settings.tracing_enabled:
+        return nullcontext()
+    return _span(name, kind, attributes)
+
+
+def traced(name: str) -> Callable[[F], F]:
+    """Decorator: run the function inside a span called `name`, tagged as action `name`."""
+
+    def wrap(fn: F) -> F:
+        @functools.wraps(fn)
+        def inner(*args: Any, **kwargs: Any) -> Any:
+            if not settings.tracing_enabled:
+                if not settings.sql_comments_enabled:
+                    return fn(*args, **kwargs)
+                with tagged(action=name):
+                    return fn(*args, **kwargs)
+            with tagged(action=name), _span(name, INTERNAL, None):
+                return fn(*args, **kwargs)
+
+        return inner  # type: ignore[return-value]
+
+    return wrap
+
+
+def inject(headers: dict[str, Any]) -> None:
+    """Add the current trace context and correlation id to outgoing message headers."""
+    s = _current_span.get()
+    if s is not None:
+        headers["traceparent"] = s.traceparent
+    cid = _correlation_id.get()
+    if cid:
+        # Not `correlation_id`: a worker overwrites that with the AMQP property of the same name (the task id).
+        headers.setdefault("x_correlation_id", cid)
@@ -4,9 +4,9 @@ import datetime as dt
 import uuid
 from typing import Any
 
-from sqlalchemy import Date, DateTime, ForeignKey, Integer, LargeBinary, Numeric, Text, UniqueConstraint, func
+from sqlalchemy import BigInteger, Boolean, Computed, Date, DateTime, ForeignKey, Integer, LargeBinary, Numeric, SmallInteger, Text, UniqueConstraint, func, text
 from sqlalchemy.dialects.postgresql import JSONB, UUID
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from sqlalchemy.orm import DeclarativeBase, Mapped, declared_attr, mapped_column, relationship
 
 
 class Base(DeclarativeBase):
@@ -30,6 +30,13 @@ class SomBase(Base):
     )
     extensions: Mapped[dict[str, Any]] = mapped_column(JSONB, default=dict)
 
+    @declared_attr.directive
+    def __mapper_args__(cls) -> dict[str, Any]:
+        # ORM updates are compare-and-swap on `version`: UPDATE ... WHERE id = :id AND version = <as loaded>,
+        # raising StaleDataError if another transaction got there first. Code bumps `version` itself
+        # (no generator), so writes that don't create a new version keep it unchanged.
+        return {"version_id_col": cls.__table__.c.version, "version_id_generator": False}
+
 
 class SomProvenance(Base):
     __tablename__ = "som_provenance"
@@ -92,6 +99,33 @@ class SomConcept(SomBase):
     code_system: Mapped[SomCodeSystem] = relationship()
 
 
+class SomConceptParent(Base):
+    """is-a edge: `concept_id` is-a `parent_id` (within one code system)."""
+
+    __tablename__ = "som_concept_parent"
+
+    concept_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("som_concept.id"), primary_key=True)
+    parent_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("som_concept.id"), primary_key=True)
+
+
+class SomConceptClosure(Base):
+    """Transitive, reflexive closure of som_concept_parent: one row per (ancestor, descendant-or-self)."""
+
+    __tablename__ = "som_concept_closure"
+
+    ancestor_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("som_concept.id"), primary_key=True)
+    descendant_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("som_concept.id"), primary_key=True)
+
+
+class SomConceptGeneration(Base):
+    """Single-row counter bumped by a trigger whenever an UPDATE changes a concept's system, code or display."""
+
+    __tablename__ = "som_concept_generation"
+
+    id: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    generation: Mapped[int] = mapped_column(BigInteger)
+
+
 class SomPatient(SomBase):
     __tablename__ = "som_patient"
 
@@ -100,6 +134,12 @@ class SomPatient(SomBase):
     name_family: Mapped[str | None] = mapped_column(Text, nullable=True)
     name_given: Mapped[str | None] = mapped_column(Text, nullable=True)
     birth_date: Mapped[dt.date | None] = mapped_column(Date, nullable=True)
+    # Generated: som_normalize_name(family || ' ' || given); see migration 0007.
+    name_search: Mapped[str | None] = mapped_column(
+        Text,
+        Computed("som_normalize_name(coalesce(name_family, '') || ' ' || coalesce(name_given, ''))", persisted=True),
+        nullable=True,
+    )
 
 
 class SomPractitioner(SomBase):
@@ -177,6 +217,9 @@ class SomObservation(SomBase):
     value_type: Mapped[str | None] = mapped_column(Text, nullable=True)
     value_quantity_value: Mapped[float | None] = mapped_column(Numeric, nullable=True)
     value_quantity_unit: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # value_quantity_value/unit converted to the canonical UCUM unit of its dimension (app.services.units).
+    value_quantity_canonical: Mapped[float | None] = mapped_column(Numeric, nullable=True)
+    value_quantity_canonical_unit: Mapped[str | None] = mapped_column(Text, nullable=True)
     value_concept_id: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), ForeignKey("som_concept.id"), nullable=True)
 
     patient: Mapped[SomPatient] = relationship()
@@ -185,25 +228,23 @@ class SomObservation(SomBase):
     value_concept: Mapped[SomConcept | None] = relationship(foreign_keys=[value_concept_id])
 
 
-class SomObservationVersion(Base):
-    __tablename__ = "som_observation_version"
-    __table_args__ = (UniqueConstraint("observation_id", "version", name="uq_obs_version"),)
+class SomResourceHistory(Base):
+    """
+    Prior versions of SomBase rows, written by the som_record_history() trigger (migration 0010) whenever an
+    UPDATE changes `version`. `data` holds the old values of the columns that differ from the next version,
+    or the whole row when `checkpoint` is set (every 16th version); app.services.history rebuilds versions.
+    """
 
-    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    observation_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("som_observation.id"))
-    version: Mapped[int] = mapped_column(Integer)
-    recorded_time: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), default=utcnow)
+    __tablename__ = "som_resource_history"
 
-    status: Mapped[str] = mapped_column(Text)
-    category: Mapped[str | None] = mapped_column(Text, nullable=True)
-    code_concept_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("som_concept.id"))
-    effective_time: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True))
-    value_type: Mapped[str | None] = mapped_column(Text, nullable=True)
-    value_quantity_value: Mapped[float | None] = mapped_column(Numeric, nullable=True)
-    value_quantity_unit: Mapped[str | None] = mapped_column(Text, nullable=True)
-    value_concept_id: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), ForeignKey("som_concept.id"), nullable=True)
-    provenance_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("som_provenance.id"))
-    extensions: Mapped[dict[str, Any]] = mapped_column(JSONB, default=dict)
+    som_table: Mapped[str] = mapped_column(Text, primary_key=True)
+    resource_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, primary_key=True)
+    # lastUpdated of this version (the row's updated_time while it was current).
+    recorded_time: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True))
+    provenance_id: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), nullable=True)
+    checkpoint: Mapped[bool] = mapped_column(Boolean, default=False)
+    data: Mapped[dict[str, Any]] = mapped_column(JSONB)
 
 
 class SomJob(Base):
@@ -251,6 +292,46 @@ class SomDocument(SomBase):
     binary: Mapped[SomBinary | None] = relationship()
 
 
+class SomChangeEvent(Base):
+    """
+    Change feed (outbox): one row per create/update of a FHIR-exposed SOM row, written by the som_emit_change()
+    trigger (migration 0011) in the writing transaction, which also NOTIFYs channel `som_change`.
+    """
+
+    __tablename__ = "som_change_event"
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    # Writing transaction (pg_current_xact_id(), migration 0016); the feed is read in (xact_id, id) order.
+    xact_id: Mapped[int] = mapped_column(BigInteger, server_default=text("pg_current_xact_id()::text::bigint"))
+    recorded_time: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), default=utcnow)
+    resource_type: Mapped[str] = mapped_column(Text)
+    resource_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True))
+    version: Mapped[int] = mapped_column(Integer)
+    operation: Mapped[str] = mapped_column(Text)  # create | update
+    correlation_id: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+
+class SomSubscription(SomBase):
+    __tablename__ = "som_subscription"
+
+    status: Mapped[str] = mapped_column(Text)  # requested | active | error | off
+    reason: Mapped[str | None] = mapped_column(Text, nullable=True)
+    criteria: Mapped[str] = mapped_column(Text)
+    criteria_resource_type: Mapped[str] = mapped_column(Text)
+    channel_type: Mapped[str] = mapped_column(Text)  # rest-hook | websocket
+    endpoint: Mapped[str | None] = mapped_column(Text, nullable=True)
+    payload: Mapped[str | None] = mapped_column(Text, nullable=True)
+    headers: Mapped[list[str]] = mapped_column(JSONB, default=list)
+    end_time: Mapped[dt.datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Delivery state (rest-hook), kept by the dispatcher without bumping `version`.
+    # Feed position (xact_id, id) of the last delivered event; see app.services.subscriptions.feed.
+    delivery_cursor_xact: Mapped[int] = mapped_column(BigInteger, default=0)
+    delivery_cursor: Mapped[int] = mapped_column(BigInteger, default=0)
+    failure_count: Mapped[int] = mapped_column(Integer, default=0)
+    next_attempt_time: Mapped[dt.datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
 class SomPreAuthSupportingDocument(Base):
     __tablename__ = "som_preauth_supporting_document"
     __table_args__ = (UniqueConstraint("preauth_request_id", "document_id", "role", name="uq_preauth_doc_unique"),)
@@ -312,6 +393,21 @@ class SomPreAuthPackageSnapshot(Base):
     extensions: Mapped[dict[str, Any]] = mapped_column(JSONB, default=dict)
 
 
+class SomPreAuthQueueLease(Base):
+    """A reviewer's claim on a queued pre-auth (app.services.preauth.queue); it lapses at expires_time."""
+
+    __tablename__ = "som_preauth_queue_lease"
+
+    preauth_request_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("som_preauth_request.id"), primary_key=True
+    )
+    lease_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), index=True)
+    claimed_by: Mapped[str] = mapped_column(Text)
+    claimed_time: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), default=utcnow)
+    heartbeat_time: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), default=utcnow)
+    expires_time: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True))
+
+
 class SomPreAuthDecision(Base):
     __tablename__ = "som_preauth_decision"
 
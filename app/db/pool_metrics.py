@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from typing import Any
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from app.core.metrics import registry
+
+# Upper bounds (seconds) for the checkout wait histogram.
+WAIT_BUCKETS: tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class PoolMetrics:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.wait_bucket_counts = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def observe_wait(self, seconds: float, *, timed_out: bool) -> None:
+        idx = bisect.bisect_left(WAIT_BUCKETS, seconds)
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_total += seconds
+            if seconds > self.wait_seconds_max:
+                self.wait_seconds_max = seconds
+            self.wait_bucket_counts[idx] += 1
+
+
+_registry: dict[str, PoolMetrics] = {}
+_pools: dict[str, QueuePool] = {}
+_registry_lock = threading.Lock()
+
+
+def metrics_for(name: str) -> PoolMetrics:
+    with _registry_lock:
+        m = _registry.get(name)
+        if m is None:
+            m = _registry[name] = PoolMetrics(name)
+        return m
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def __init__(self, *args: Any, **kw: Any):
+        super().__init__(*args, **kw)
+        self._metrics = metrics_for(self._orig_logging_name or "default")
+        with _registry_lock:
+            _pools[self._metrics.name] = self
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            self._metrics.observe_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        self._metrics.observe_wait(time.perf_counter() - start, timed_out=False)
+        return conn
+
+
+def unregister(pool: QueuePool) -> None:
+    """Stop reporting `pool`, e.g. the pool of an engine that was replaced (use_worker_pool)."""
+    name = pool._metrics.name
+    with _registry_lock:
+        if _pools.get(name) is not pool:
+            return
+        del _pools[name]
+        del _registry[name]
+    for state in ("in_use", "idle", "overflow"):
+        _POOL_CONNECTIONS.remove(name, state)
+
+
+def pool_stats() -> dict[str, Any]:
+    with _registry_lock:
+        pools = dict(_pools)
+    out: dict[str, Any] = {}
+    for name, pool in pools.items():
+        m = pool._metrics
+        overflow = max(pool.overflow(), 0)
+        out[name] = {
+            "size": pool.size(),
+            "inUse": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": overflow,
+            "maxOverflow": pool._max_overflow,
+            "checkouts": m.checkouts,
+            "timeouts": m.timeouts,
+            "waitSecondsTotal": round(m.wait_seconds_total, 6),
+            "waitSecondsMax": round(m.wait_seconds_max, 6),
+            "waitBuckets": [
+                {"le": le, "count": c}
+                for le, c in zip([*WAIT_BUCKETS, "+Inf"], m.wait_bucket_counts)
+            ],
+        }
+    return out
+
+
+_POOL_CONNECTIONS = registry.gauge("db_pool_connections", "Pooled connections by state.", ("pool", "state"))
+
+
+def _collect_pool_gauges() -> None:
+    with _registry_lock:
+        pools = dict(_pools)
+    for name, pool in pools.items():
+        _POOL_CONNECTIONS.set(pool.checkedout(), name, "in_use")
+        _POOL_CONNECTIONS.set(pool.checkedin(), name, "idle")
+        _POOL_CONNECTIONS.set(max(pool.overflow(), 0), name, "overflow")
+
+
+registry.on_collect(_collect_pool_gauges)
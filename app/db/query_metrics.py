@@ -0,0 +1,107 @@
+"""
+Engine-wide statement hooks: every statement is timed into `db_query_duration_seconds` and the current
+request's QueryTally and the running profile (app.core.profiling), and, with tracing on, recorded as a client
+span under the current span.
+"""
+
+from __future__ import annotations
+
+import re
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core import profiling, tracing
+from app.core.config import settings
+from app.core.metrics import DB_QUERY_SECONDS
+
+_VERB = re.compile(r"\b(SELECT|INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+\"?([A-Za-z_][A-Za-z0-9_]*)", re.IGNORECASE)
+
+
+class QueryTally:
+    """SQL statements and time spent on them within one HTTP request or job run (see `tally`)."""
+
+    __slots__ = ("count", "seconds")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.seconds = 0.0
+
+
+# Set by the HTTP metrics middleware and, for job tasks, by app.worker.instrumentation. Sync handlers run in a
+# worker thread with a copy of the request's context, which still holds this same object, so statements executed
+# there are counted against the request.
+tally: ContextVar[QueryTally | None] = ContextVar("query_tally", default=None)
+
+
+@lru_cache(maxsize=4096)
+def statement_labels(statement: str) -> tuple[str, str]:
+    """(operation, first table) of a statement; cached, since compiled statements are the same strings."""
+    verb = _VERB.search(statement)
+    if verb is None:
+        return statement.split(None, 1)[0].upper() if statement.strip() else "", ""
+    table = _TABLE.search(statement, verb.start())
+    return verb.group(1).upper(), table.group(1) if table else ""
+
+
+def _statement_span(statement: str) -> tracing.Span:
+    operation, table = statement_labels(statement)
+    return tracing.start_span(
+        f"{operation} {table}".strip(),
+        kind=tracing.CLIENT,
+        attributes={
+            "db.system": "postgresql",
+            "db.operation": operation,
+            "db.sql.table": table or None,
+            "db.statement": statement[:2000],
+        },
+    )
+
+
+def _compiled(statement: str, context) -> str:
+    # The statement before app.db.sqlcomment appended its comment: stable, so statement_labels stays cached.
+    return context.statement if context is not None else statement
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    span = _statement_span(_compiled(statement, context)) if settings.tracing_enabled else None
+    conn.info.setdefault("query_start", []).append((time.perf_counter(), span))
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    starts = conn.info.get("query_start")
+    if not starts:
+        return
+    start, span = starts.pop()
+    elapsed = time.perf_counter() - start
+    if span is not None:
+        tracing.finish(span)
+    compiled = _compiled(statement, context)
+    DB_QUERY_SECONDS.observe(elapsed, *statement_labels(compiled))
+    profiling.record_sql(compiled, elapsed)
+    current = tally.get()
+    if current is not None:
+        current.count += 1
+        current.seconds += elapsed
+
+
+def _handle_error(exception_context) -> None:
+    # A failed statement never reaches after_cursor_execute; drop its start time.
+    conn = exception_context.connection
+    if exception_context.statement is not None and conn is not None and conn.info.get("query_start"):
+        _, span = conn.info["query_start"].pop()
+        if span is not None:
+            tracing.finish(span, exception_context.original_exception)
+
+
+def install() -> None:
+    """Time every statement on every engine (idempotent)."""
+    if event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(Engine, "handle_error", _handle_error)
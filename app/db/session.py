@@ -1,15 +1,204 @@
 from __future__ import annotations
 
+import logging
+import threading
+import time
 from contextlib import contextmanager
+from typing import Any, Callable
 
-from sqlalchemy import create_engine
+import redis
+from fastapi import Header
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import Session, sessionmaker
 
 from app.core.config import settings
+from app.db import pool_metrics, query_metrics, sqlcomment
+from app.db.pool_metrics import InstrumentedQueuePool
 
-engine = create_engine(settings.database_url, pool_pre_ping=True)
+log = logging.getLogger(__name__)
+
+
+def make_engine(url: str, *, role: str, replica: bool = False) -> Engine:
+    """
+    Create an engine whose pool is sized for `role` ("api" or "worker"). The pool reports its metrics as
+    "<role>-primary" or "<role>-replica".
+    """
+    if role == "worker":
+        pool_size, max_overflow = settings.worker_db_pool_size, settings.worker_db_max_overflow
+    else:
+        pool_size, max_overflow = settings.db_pool_size, settings.db_max_overflow
+    connect_args = {}
+    if settings.db_pgbouncer_mode:
+        # Transaction pooling hands each transaction a different server connection, so prepared
+        # statements created on one are not visible on the next.
+        connect_args["prepare_threshold"] = None
+    return create_engine(
+        url,
+        poolclass=InstrumentedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.db_pool_timeout_seconds,
+        pool_recycle=settings.db_pool_recycle_seconds,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        pool_logging_name=f"{role}-{'replica' if replica else 'primary'}",
+        connect_args=connect_args,
+    )
+
+
+if settings.metrics_enabled or settings.tracing_enabled or settings.profiling_enabled:
+    query_metrics.install()
+if settings.sql_comments_enabled:
+    sqlcomment.install()
+
+engine = make_engine(settings.database_url, role="api")
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
+# Read-only routing: GET handlers run in a READ ONLY transaction, against the replica when one is configured.
+# With no replica URL (or the same URL as the primary) both factories point at the primary, so the routing
+# logic can be exercised locally against a single Postgres instance.
+replica_engine = (
+    make_engine(settings.database_replica_url, role="api", replica=True)
+    if settings.database_replica_url and settings.database_replica_url != settings.database_url
+    else engine
+)
+PrimaryReadSessionLocal = sessionmaker(
+    bind=engine.execution_options(postgresql_readonly=True), autocommit=False, autoflush=False
+)
+ReplicaReadSessionLocal = sessionmaker(
+    bind=replica_engine.execution_options(postgresql_readonly=True), autocommit=False, autoflush=False
+)
+
+
+class _RecentWrites:
+    """
+    Correlation ids that committed a write recently; their reads are pinned to the primary. Marks live in Redis
+    (`ehr:ryw:<correlation id>`, expiring after the TTL) so every API process sees them, whichever one took
+    the write. Each process also remembers its own marks, which covers the writes it took while Redis was
+    unreachable; after an error Redis is skipped for a retry interval, as the read cache does.
+    """
+
+    def __init__(self, ttl_seconds: float, *, redis_url: str, retry_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.retry_seconds = retry_seconds
+        self._client = redis.Redis.from_url(redis_url, socket_connect_timeout=0.25, socket_timeout=0.25)
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+        self._seen: dict[str, float] = {}
+
+    def mark(self, correlation_id: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._seen[correlation_id] = now + self.ttl_seconds
+            if len(self._seen) > 10_000:
+                self._seen = {k: exp for k, exp in self._seen.items() if exp > now}
+        self._redis(lambda: self._client.set(self._key(correlation_id), 1, px=int(self.ttl_seconds * 1000)))
+
+    def contains(self, correlation_id: str) -> bool:
+        with self._lock:
+            exp = self._seen.get(correlation_id)
+            if exp is not None:
+                if exp > time.monotonic():
+                    return True
+                self._seen.pop(correlation_id, None)
+        return bool(self._redis(lambda: self._client.exists(self._key(correlation_id))))
+
+    @staticmethod
+    def _key(correlation_id: str) -> str:
+        return f"ehr:ryw:{correlation_id}"
+
+    def _redis(self, fn: Callable[[], Any]) -> Any:
+        if time.monotonic() < self._down_until:
+            return None
+        try:
+            return fn()
+        except redis.RedisError as e:
+            log.warning("read-your-writes: redis unavailable (%s); retrying in %.0fs", e, self.retry_seconds)
+            self._down_until = time.monotonic() + self.retry_seconds
+            return None
+
+
+class _ReplicaLag:
+    """Caches the replica's replay lag so the staleness check costs one query per interval, not per request."""
+
+    def __init__(self, check_interval_seconds: float):
+        self.check_interval_seconds = check_interval_seconds
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._lag_seconds: float | None = None
+
+    def current(self) -> float | None:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at < self.check_interval_seconds:
+                return self._lag_seconds
+            self._checked_at = now
+        lag: float | None
+        try:
+            with replica_engine.connect() as conn:
+                lag = conn.execute(
+                    text(
+                        "SELECT CASE WHEN pg_is_in_recovery() "
+                        "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+                        "ELSE 0 END"
+                    )
+                ).scalar()
+                lag = float(lag) if lag is not None else None
+        except Exception:
+            lag = None
+        with self._lock:
+            self._lag_seconds = lag
+        return lag
+
+
+recent_writes = _RecentWrites(
+    settings.read_your_writes_seconds,
+    redis_url=settings.redis_url,
+    retry_seconds=settings.read_your_writes_redis_retry_seconds,
+)
+replica_lag = _ReplicaLag(settings.replica_lag_check_seconds)
+
+
+def read_session_factory(correlation_id: str | None = None) -> sessionmaker:
+    """
+    Pick the session factory for a read:
+    - primary when no replica is configured
+    - primary when this correlation id wrote recently (read-your-writes)
+    - primary when the replica is unreachable or lagging beyond settings.replica_max_lag_seconds
+    - replica otherwise
+    """
+    if replica_engine is engine:
+        return PrimaryReadSessionLocal
+    if correlation_id and recent_writes.contains(correlation_id):
+        return PrimaryReadSessionLocal
+    lag = replica_lag.current()
+    if lag is None or lag > settings.replica_max_lag_seconds:
+        return PrimaryReadSessionLocal
+    return ReplicaReadSessionLocal
+
+
+def use_worker_pool() -> None:
+    """
+    Rebind every session factory to worker-sized pools. Called once per Celery worker process; connections
+    inherited from the parent process are dropped without being closed so the parent's sockets stay intact,
+    and the replaced pools stop being reported. Without a separate replica, replica_engine stays the primary
+    engine, so read routing still sees that.
+    """
+    global engine, replica_engine
+    separate_replica = replica_engine is not engine
+    engine.dispose(close=False)
+    pool_metrics.unregister(engine.pool)
+    engine = make_engine(settings.database_url, role="worker")
+    if separate_replica:
+        replica_engine.dispose(close=False)
+        pool_metrics.unregister(replica_engine.pool)
+        replica_engine = make_engine(settings.database_replica_url, role="worker", replica=True)
+    else:
+        replica_engine = engine
+    SessionLocal.configure(bind=engine)
+    PrimaryReadSessionLocal.configure(bind=engine.execution_options(postgresql_readonly=True))
+    ReplicaReadSessionLocal.configure(bind=replica_engine.execution_options(postgresql_readonly=True))
+
 
 @contextmanager
 def session_scope() -> Session:
@@ -24,13 +213,24 @@ def session_scope() -> Session:
         db.close()
 
 
-def get_db():
+def get_db(x_correlation_id: str | None = Header(default=None, alias="X-Correlation-Id")):
     db = SessionLocal()
     try:
         yield db
         db.commit()
+        if x_correlation_id:
+            recent_writes.mark(x_correlation_id)
     except Exception:
         db.rollback()
         raise
     finally:
         db.close()
+
+
+def get_read_db(x_correlation_id: str | None = Header(default=None, alias="X-Correlation-Id")):
+    # READ ONLY transaction; nothing to commit, close() rolls back.
+    db = read_session_factory(x_correlation_id)()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,65 @@
+"""
+sqlcommenter-style tags on every SQL statement, so Postgres-side views (pg_stat_statements, pg_stat_activity,
+slow query logs) show which endpoint, mapper/service method or Celery task issued a statement:
+
+    SELECT ... FROM som_patient WHERE ... /*action='Patient.read',route='/fhir/{resource_type}/{id}'*/
+
+Tags come from app.core.tracing's context (`route`, `action`, `task`; see FastJSONRoute, fhir_dispatch,
+`traced` and the Celery signals). The comment is appended after SQLAlchemy's compiled-statement cache, so
+that cache is unaffected; with only these low-cardinality tags each statement also keeps a small, stable set
+of texts, so psycopg still prepares hot statements. `sql_comment_correlation_id` adds the correlation id (and
+the traceparent when tracing): useful in pg_stat_activity and logs, but the text then differs per request
+and psycopg no longer prepares those statements.
+
+Values are restricted to a safe character set (anything else becomes `_`) instead of URL-encoded, so a
+comment can never close early or contain `%` (a paramstyle character for psycopg).
+"""
+
+from __future__ import annotations
+
+import re
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core import tracing
+from app.core.config import settings
+
+_UNSAFE = re.compile(r"[^A-Za-z0-9_.:/{}\-]")
+_COMMENT = re.compile(r"/\*((?:\w+='[^']*',?)+)\*/\s*$")
+_PAIR = re.compile(r"(\w+)='([^']*)'")
+
+
+def _clean(value: str) -> str:
+    return _UNSAFE.sub("_", value[:120])
+
+
+def comment(tags: dict[str, str]) -> str:
+    if not tags:
+        return ""
+    return "/*" + ",".join(f"{k}='{_clean(str(v))}'" for k, v in sorted(tags.items())) + "*/"
+
+
+def parse_comment(statement: str) -> dict[str, str]:
+    """Tags of a statement's trailing sqlcommenter comment (empty when it has none)."""
+    m = _COMMENT.search(statement)
+    return dict(_PAIR.findall(m.group(1))) if m else {}
+
+
+def _add_comment(conn, cursor, statement, parameters, context, executemany):
+    tags = tracing.tags()
+    if settings.sql_comment_correlation_id:
+        extra = {"correlation_id": tracing.correlation_id()}
+        span = tracing.current_span()
+        if span is not None:
+            extra["traceparent"] = span.traceparent
+        tags = {**tags, **{k: v for k, v in extra.items() if v}}
+    if not tags:
+        return statement, parameters
+    return f"{statement} {comment(tags)}", parameters
+
+
+def install() -> None:
+    """Comment every statement on every engine (idempotent)."""
+    if not event.contains(Engine, "before_cursor_execute", _add_comment):
+        event.listen(Engine, "before_cursor_execute", _add_comment, retval=True)
@@ -1,16 +1,35 @@
 from __future__ import annotations
 
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response
 
 from app.api.fhir_routes import router as fhir_router
 from app.api.job_routes import router as job_router
 from app.api.payer_routes import router as payer_router
 from app.api.preauth_routes import router as preauth_router
 from app.api.internal_routes import router as internal_router
+from app.api.metrics_middleware import MetricsMiddleware
+from app.api.profiling_middleware import ProfilingMiddleware
+from app.api.tracing_middleware import TracingMiddleware
+from app.core.config import settings
+from app.core.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, registry as metrics_registry
+from app.services.subscriptions.websocket import websocket_hub
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.subscription_websocket_enabled:
+        websocket_hub.start()
+    if settings.metrics_enabled:
+        metrics_registry.start_multiprocess_writer()
+    yield
 
 
-app = FastAPI(title="SOM + FHIR Sample", version="0.1.0")
+app = FastAPI(title="SOM + FHIR Sample", version="0.1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,6 +38,13 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if settings.response_gzip_min_bytes > 0:
+    app.add_middleware(GZipMiddleware, minimum_size=settings.response_gzip_min_bytes)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(TracingMiddleware)
+if settings.metrics_enabled:
+    # Outermost, so latency includes compression.
+    app.add_middleware(MetricsMiddleware)
 
 
 @app.get("/health")
@@ -26,6 +52,13 @@ def health():
     return {"ok": True}
 
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not found")
+    return Response(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+
 app.include_router(fhir_router, prefix="/fhir", tags=["fhir"])
 app.include_router(job_router, prefix="/jobs", tags=["jobs"])
 app.include_router(payer_router, prefix="/payer", tags=["payer"])
@@ -24,6 +24,7 @@ from app.db.models import (
     SomServiceRequestReason,
 )
 from app.db.session import session_scope
+from app.services import units
 from app.services.preauth.service import PreAuthService
 from app.services.provenance import ProvenanceService
 from app.services.payer.rules import PayerRuleService
@@ -256,6 +257,11 @@ def seed(db: Session) -> dict[str, str]:
                 extensions={"corrected": i == 3},
             )
         )
+    analytes = {sys_bp.id: sys_bp.code, glu.id: glu.code}
+    for o in obs:
+        o.value_quantity_canonical, o.value_quantity_canonical_unit = units.canonical(
+            o.value_quantity_value, o.value_quantity_unit, analyte=analytes[o.code_concept_id]
+        )
     db.add_all(obs)
     db.flush()
 
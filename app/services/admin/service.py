@@ -8,6 +8,7 @@ from sqlalchemy.orm import Session
 from app.core.config import settings
 from app.seed import seed
 from app.services.audit import AuditService
+from app.services.mapping import read_cache
 from app.services.provenance import ProvenanceService
 
 
@@ -38,6 +39,7 @@ class AdminService:
             # CASCADE handles FK ordering; audit/provenance/history/etc are all truncated too.
             self.db.execute(text(f"truncate table {quoted} restart identity cascade"))
             self.db.commit()
+            read_cache.clear()
 
             seed_result = {"ok": "skipped"}
             if seed_data:
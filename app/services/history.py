@@ -0,0 +1,114 @@
+"""
+Version history of SomBase rows.
+
+Prior versions live in som_resource_history as reverse deltas (see migration 0010): the row for version v
+holds the old values of the columns that changed between v and v + 1, or the whole row at checkpoints.
+Version v is rebuilt by starting from the current row (or the nearest checkpoint at or above v) and laying
+the deltas over it, newest first. States are rows as Postgres' to_jsonb() renders them; mappers turn them
+back into resources with jsonb_populate_recordset (BaseMapper._render_states).
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import uuid
+from typing import Any, Iterable
+
+from sqlalchemy import and_, func, literal_column, or_, select, union_all
+from sqlalchemy.orm import Session
+
+from app.db.models import SomResourceHistory
+
+State = dict[str, Any]
+
+
+class HistoryService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def versions(self, model: Any, id: uuid.UUID, *, limit: int | None = None) -> list[State]:
+        """The newest `limit` (default all) versions of one row, newest first, current included; [] if missing."""
+        table = model.__table__
+        current = self._current(table, [id])
+        if id not in current:
+            return []
+        lowest = 1 if limit is None else max(1, current[id]["version"] - limit + 1)
+        states = self._walk(table, current, {id: lowest})
+        return sorted((s for s in states.values() if s["version"] >= lowest), key=lambda s: s["version"], reverse=True)
+
+    def version(self, model: Any, id: uuid.UUID, version: int) -> State | None:
+        table = model.__table__
+        current = self._current(table, [id])
+        if id not in current or not 1 <= version <= current[id]["version"]:
+            return None
+        if version == current[id]["version"]:
+            return current[id]
+        h = SomResourceHistory
+        # Only the deltas between `version` and the first checkpoint at or above it are needed.
+        checkpoint = (
+            select(func.min(h.version))
+            .where(h.som_table == table.name, h.resource_id == id, h.version >= version, h.checkpoint)
+            .scalar_subquery()
+        )
+        rows = self.db.execute(
+            select(h)
+            .where(h.som_table == table.name, h.resource_id == id, h.version >= version)
+            .where(or_(checkpoint.is_(None), h.version <= checkpoint))
+            .order_by(h.version.desc())
+        ).scalars()
+        for state in _fold(current[id], rows):
+            if state["version"] == version:
+                return state
+        return None
+
+    def since(self, model: Any, since: dt.datetime | None, *, limit: int) -> list[State]:
+        """The newest `limit` versions of any row of `model` last updated at or after `since`, newest first."""
+        table = model.__table__
+        h = SomResourceHistory
+        live = select(table.c.id.label("resource_id"), table.c.version, table.c.updated_time.label("at"))
+        past = select(h.resource_id, h.version, h.recorded_time.label("at")).where(h.som_table == table.name)
+        if since is not None:
+            live = live.where(table.c.updated_time >= since)
+            past = past.where(h.recorded_time >= since)
+        u = union_all(live, past).subquery()
+        wanted = self.db.execute(select(u.c.resource_id, u.c.version).order_by(u.c.at.desc()).limit(limit)).all()
+        if not wanted:
+            return []
+        lowest: dict[uuid.UUID, int] = {}
+        for rid, version in wanted:
+            lowest[rid] = min(version, lowest.get(rid, version))
+        states = self._walk(table, self._current(table, list(lowest)), lowest)
+        return [states[(rid, version)] for rid, version in wanted if (rid, version) in states]
+
+    def _current(self, table: Any, ids: list[uuid.UUID]) -> dict[uuid.UUID, State]:
+        rows = self.db.execute(select(table.c.id, func.to_jsonb(literal_column(table.name))).where(table.c.id.in_(ids)))
+        return {rid: state for rid, state in rows}
+
+    def _walk(self, table: Any, current: dict[uuid.UUID, State], lowest: dict[uuid.UUID, int]) -> dict[Any, State]:
+        """Every version from each row's current one down to lowest[id], keyed by (id, version)."""
+        h = SomResourceHistory
+        out: dict[Any, State] = {(rid, s["version"]): s for rid, s in current.items()}
+        pending = {rid: v for rid, v in lowest.items() if rid in current and v < current[rid]["version"]}
+        if not pending:
+            return out
+        rows = self.db.execute(
+            select(h)
+            .where(h.som_table == table.name)
+            .where(or_(*(and_(h.resource_id == rid, h.version >= v) for rid, v in pending.items())))
+            .order_by(h.resource_id, h.version.desc())
+        ).scalars()
+        by_resource: dict[uuid.UUID, list[SomResourceHistory]] = {}
+        for row in rows:
+            by_resource.setdefault(row.resource_id, []).append(row)
+        for rid, history in by_resource.items():
+            for state in _fold(current[rid], history):
+                out[(rid, state["version"])] = state
+        return out
+
+
+def _fold(current: State, rows: Iterable[SomResourceHistory]) -> Iterable[State]:
+    """Walk back from `current` through history rows (newest first), yielding each earlier version."""
+    state = current
+    for row in rows:
+        state = row.data if row.checkpoint else {**state, **row.data}
+        yield state
@@ -3,7 +3,8 @@ from __future__ import annotations
 import uuid
 from typing import Any
 
-from sqlalchemy import select
+from sqlalchemy import select, text
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import Session
 
 from app.db.models import (
@@ -13,11 +14,58 @@ from app.db.models import (
     SomDocument,
     SomEncounter,
     SomObservation,
-    SomObservationVersion,
     SomPatient,
     SomServiceRequest,
     SomServiceRequestReason,
 )
+from app.db.sqlcomment import parse_comment
+from app.services.history import HistoryService
+
+# sqlcomment tags /internal/db/top-queries can group by, and its sort keys.
+TOP_QUERY_TAGS = ("route", "action", "task")
+TOP_QUERY_ORDER = {"total": "totalMs", "mean": "meanMs", "calls": "calls"}
+# Returned with every top-queries answer, so the grouping isn't mistaken for a per-caller breakdown.
+TOP_QUERY_ATTRIBUTION = (
+    "pg_stat_statements ignores comments when it identifies a statement, so each statement's calls and time "
+    "from every route, action and task are counted under the tags of whichever caller ran it first since the "
+    "last pg_stat_statements_reset(). Groups show where statements were first seen, not what each caller cost."
+)
+
+
+_DIFFED_FIELDS = ("status", "category", "effectiveTime", "valueType", "valueQuantity", "valueConceptId")
+
+
+def observation_version_diffs(versions: list[dict[str, Any]]) -> dict[str, Any]:
+    """Simplified observation versions (oldest first, in to_jsonb form) and the fields each one changed."""
+
+    def to_simple(v: dict[str, Any]) -> dict[str, Any]:
+        return {
+            "version": v["version"],
+            "recordedTime": v["updated_time"],
+            "status": v["status"],
+            "category": v["category"],
+            "effectiveTime": v["effective_time"],
+            "valueType": v["value_type"],
+            "valueQuantity": {
+                "value": float(v["value_quantity_value"]) if v["value_quantity_value"] is not None else None,
+                "unit": v["value_quantity_unit"],
+            }
+            if v["value_type"] == "quantity"
+            else None,
+            "valueConceptId": v["value_concept_id"],
+        }
+
+    simple = [to_simple(v) for v in versions]
+    diffs: list[dict[str, Any]] = []
+    prev: dict[str, Any] | None = None
+    for cur in simple:
+        if prev is None:
+            diffs.append({"version": cur["version"], "changed": []})
+        else:
+            changed = [k for k in _DIFFED_FIELDS if prev.get(k) != cur.get(k)]
+            diffs.append({"version": cur["version"], "changed": changed})
+        prev = cur
+    return {"versions": simple, "diffs": diffs}
 
 
 class InternalService:
@@ -89,47 +137,63 @@ class InternalService:
 
     def observation_versions(self, id: str) -> dict[str, Any] | None:
         oid = uuid.UUID(id)
-        obs = self.db.get(SomObservation, oid)
-        if not obs:
+        # Every version, oldest first; states are rows in to_jsonb form (timestamps already ISO strings).
+        versions = list(reversed(HistoryService(self.db).versions(SomObservation, oid)))
+        if not versions:
             return None
-        versions = (
-            self.db.execute(
-                select(SomObservationVersion)
-                .where(SomObservationVersion.observation_id == obs.id)
-                .order_by(SomObservationVersion.version.asc())
-            )
-            .scalars()
-            .all()
-        )
+        return {"observationId": str(oid), **observation_version_diffs(versions)}
 
-        def to_simple(v: SomObservationVersion) -> dict[str, Any]:
-            return {
-                "version": v.version,
-                "recordedTime": v.recorded_time.isoformat(),
-                "status": v.status,
-                "category": v.category,
-                "effectiveTime": v.effective_time.isoformat(),
-                "valueType": v.value_type,
-                "valueQuantity": {
-                    "value": float(v.value_quantity_value) if v.value_quantity_value is not None else None,
-                    "unit": v.value_quantity_unit,
-                }
-                if v.value_type == "quantity"
-                else None,
-                "valueConceptId": str(v.value_concept_id) if v.value_concept_id else None,
-            }
+    def top_queries(self, *, group_by: list[str], order_by: str, limit: int) -> dict[str, Any] | None:
+        """
+        pg_stat_statements for this database, summed per combination of the statements' sqlcomment tags.
+        Tags are only those of each statement's first caller (TOP_QUERY_ATTRIBUTION). None when the extension
+        is not installed (or not preloaded).
+        """
+        unknown = [g for g in group_by if g not in TOP_QUERY_TAGS]
+        if unknown or not group_by:
+            raise ValueError(f"groupBy must be a comma-separated subset of {', '.join(TOP_QUERY_TAGS)}")
+        if order_by not in TOP_QUERY_ORDER:
+            raise ValueError(f"orderBy must be one of {', '.join(TOP_QUERY_ORDER)}")
+        if self.db.execute(text("SELECT to_regclass('pg_stat_statements')")).scalar() is None:
+            return None
+        try:
+            rows = self.db.execute(
+                text(
+                    """
+                    SELECT queryid, query, calls, total_exec_time, rows FROM pg_stat_statements
+                    WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+                    """
+                )
+            ).all()
+        except DBAPIError:
+            return None
 
-        simple = [to_simple(v) for v in versions]
-        diffs: list[dict[str, Any]] = []
-        prev: dict[str, Any] | None = None
-        for cur in simple:
-            if prev is None:
-                diffs.append({"version": cur["version"], "changed": []})
-            else:
-                changed = [k for k in ("status", "category", "effectiveTime", "valueType", "valueQuantity", "valueConceptId") if prev.get(k) != cur.get(k)]
-                diffs.append({"version": cur["version"], "changed": changed})
-            prev = cur
-        return {"observationId": str(obs.id), "versions": simple, "diffs": diffs}
+        groups: dict[tuple[str, ...], dict[str, Any]] = {}
+        for r in rows:
+            tags = parse_comment(r.query)
+            key = tuple(tags.get(g, "") for g in group_by)
+            g = groups.setdefault(
+                key, {"tags": dict(zip(group_by, key)), "calls": 0, "totalMs": 0.0, "rows": 0, "statements": []}
+            )
+            g["calls"] += r.calls
+            g["totalMs"] += r.total_exec_time
+            g["rows"] += r.rows
+            g["statements"].append(
+                {
+                    "queryId": str(r.queryid),
+                    "calls": r.calls,
+                    "totalMs": round(r.total_exec_time, 3),
+                    "query": r.query[:500],
+                }
+            )
+        out = []
+        for g in groups.values():
+            g["meanMs"] = round(g["totalMs"] / g["calls"], 3) if g["calls"] else 0.0
+            g["totalMs"] = round(g["totalMs"], 3)
+            g["statements"] = sorted(g["statements"], key=lambda st: st["totalMs"], reverse=True)[:5]
+            out.append(g)
+        out.sort(key=lambda g: g[TOP_QUERY_ORDER[order_by]], reverse=True)
+        return {"groupBy": group_by, "orderBy": order_by, "attribution": TOP_QUERY_ATTRIBUTION, "groups": out[:limit]}
 
     @staticmethod
     def _row(obj) -> dict[str, Any]:
@@ -1,9 +1,16 @@
 from __future__ import annotations
 
-from typing import Any
+import uuid
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator
 
 from sqlalchemy.orm import Session
 
+from app.core import tracing
+from app.core.metrics import MAPPER_SECONDS
+from app.services.mapping import includes, read_cache
+from app.services.mapping.fhir_utils import bundle
+from app.services.mapping.read_cache import CachedResource
 from app.services.mapping.resources.condition import ConditionMapper
 from app.services.mapping.resources.document_reference import DocumentReferenceMapper
 from app.services.mapping.resources.encounter import EncounterMapper
@@ -14,6 +21,25 @@ from app.services.mapping.resources.practitioner import PractitionerMapper
 from app.services.mapping.resources.provenance import ProvenanceMapper
 from app.services.mapping.resources.service_request import ServiceRequestMapper
 from app.services.mapping.resources.binary import BinaryMapper
+from app.services.mapping.resources.subscription import SubscriptionMapper
+
+
+# Lower-cased resource types _mapper dispatches.
+SUPPORTED_TYPES = frozenset(
+    {
+        "patient",
+        "encounter",
+        "observation",
+        "binary",
+        "practitioner",
+        "organization",
+        "condition",
+        "documentreference",
+        "servicerequest",
+        "provenance",
+        "subscription",
+    }
+)
 
 
 def _mapper(db: Session, resource_type: str):
@@ -38,26 +64,147 @@ def _mapper(db: Session, resource_type: str):
         return ServiceRequestMapper(db)
     if rt == "provenance":
         return ProvenanceMapper(db)
+    if rt == "subscription":
+        return SubscriptionMapper(db)
     raise ValueError(f"Unsupported resource type: {resource_type}")
 
 
+@contextmanager
+def _observed(mapper, operation: str) -> Iterator[None]:
+    """
+    Time a mapper call into fhir_mapper_duration_seconds, tag its SQL with the action and, with tracing on,
+    wrap it in a span.
+    """
+    action = f"{mapper.resource_type}.{operation}"
+    with MAPPER_SECONDS.time(mapper.resource_type, operation), tracing.tagged(action=action):
+        with tracing.span(action, attributes={"fhir.operation": operation}):
+            yield
+
+
 def fhir_create(db: Session, resource_type: str, body: dict[str, Any], correlation_id: str | None) -> dict[str, Any]:
-    return _mapper(db, resource_type).create(body, correlation_id=correlation_id)
+    mapper = _mapper(db, resource_type)
+    with _observed(mapper, "create"):
+        return mapper.create(body, correlation_id=correlation_id)
 
 
 def fhir_read(db: Session, resource_type: str, id: str) -> dict[str, Any] | None:
-    return _mapper(db, resource_type).read(id)
+    mapper = _mapper(db, resource_type)
+    with _observed(mapper, "read"):
+        return mapper.read(id)
+
+
+def fhir_read_projected(
+    db: Session, resource_type: str, id: str, *, summary: str | None, elements: list[str] | None
+) -> dict[str, Any] | None:
+    mapper = _mapper(db, resource_type)
+    with _observed(mapper, "read"):
+        return mapper.read_projected(id, summary=summary, elements=elements)
+
+
+def fhir_read_cached(db: Session, resource_type: str, id: str) -> CachedResource | None:
+    """Serialized read through the version-keyed read cache (see read_cache)."""
+    mapper = _mapper(db, resource_type)
+
+    def load() -> dict[str, Any] | None:
+        with _observed(mapper, "read"):
+            return mapper.read(id)
+
+    return read_cache.read(db, mapper.resource_type, id, load)
 
 
 def fhir_update(
-    db: Session, resource_type: str, id: str, body: dict[str, Any], correlation_id: str | None
+    db: Session,
+    resource_type: str,
+    id: str,
+    body: dict[str, Any],
+    correlation_id: str | None,
+    expected_version: int | None = None,
+) -> dict[str, Any] | None:
+    mapper = _mapper(db, resource_type)
+    with _observed(mapper, "update"):
+        return mapper.update(id, body, correlation_id=correlation_id, expected_version=expected_version)
+
+
+def fhir_conditional_create(
+    db: Session, resource_type: str, body: dict[str, Any], criteria: dict[str, Any], correlation_id: str | None
+) -> tuple[dict[str, Any], bool]:
+    mapper = _mapper(db, resource_type)
+    with _observed(mapper, "conditional_create"):
+        return mapper.conditional_create(body, criteria, correlation_id=correlation_id)
+
+
+def fhir_conditional_update(
+    db: Session, resource_type: str, body: dict[str, Any], criteria: dict[str, Any], correlation_id: str | None
+) -> tuple[dict[str, Any], bool]:
+    mapper = _mapper(db, resource_type)
+    with _observed(mapper, "conditional_update"):
+        return mapper.conditional_update(body, criteria, correlation_id=correlation_id)
+
+
+def fhir_patch(
+    db: Session,
+    resource_type: str,
+    id: str,
+    patch: Any,
+    correlation_id: str | None,
+    expected_version: int | None = None,
 ) -> dict[str, Any] | None:
-    return _mapper(db, resource_type).update(id, body, correlation_id=correlation_id)
+    mapper = _mapper(db, resource_type)
+    with _observed(mapper, "patch"):
+        return mapper.patch(id, patch, correlation_id=correlation_id, expected_version=expected_version)
+
+
+def fhir_search(
+    db: Session,
+    resource_type: str,
+    params: dict[str, Any],
+    count: int,
+    sort: str | None,
+    include: list[str] | None = None,
+    revinclude: list[str] | None = None,
+    summary: str | None = None,
+    elements: list[str] | None = None,
+    strict: bool = True,
+) -> dict[str, Any]:
+    mapper = _mapper(db, resource_type)
+    with _observed(mapper, "search"):
+        out = mapper.search(params=params, count=count, sort=sort, summary=summary, elements=elements, strict=strict)
+    if (not include and not revinclude) or summary == "count":
+        return out
+    matches = [e["resource"] for e in out["entry"]]
+    included = includes.resolve(
+        resource_type=mapper.resource_type,
+        matches=matches,
+        include=include or [],
+        revinclude=revinclude or [],
+        mapper_for=lambda rt: _mapper(db, rt),
+    )
+    return bundle(entries=matches, total=out["total"], included=included)
+
+
+def fhir_read_many(db: Session, resource_type: str, ids: Iterable[uuid.UUID]) -> list[dict[str, Any]]:
+    mapper = _mapper(db, resource_type)
+    with _observed(mapper, "read_many"):
+        return mapper.read_many(ids)
+
+
+def fhir_matching_ids(
+    db: Session, resource_type: str, params: dict[str, Any], ids: Iterable[uuid.UUID]
+) -> set[uuid.UUID]:
+    return _mapper(db, resource_type).matching_ids(params, ids)
+
+
+def fhir_patient_match(db: Session, body: dict[str, Any]) -> dict[str, Any]:
+    return PatientMapper(db).match(body)
+
+
+def fhir_history(db: Session, resource_type: str, id: str, count: int = 50) -> dict[str, Any] | None:
+    return _mapper(db, resource_type).history(id, count=count)
 
 
-def fhir_search(db: Session, resource_type: str, params: dict[str, Any], count: int, sort: str | None) -> dict[str, Any]:
-    return _mapper(db, resource_type).search(params=params, count=count, sort=sort)
+def fhir_history_version(db: Session, resource_type: str, id: str, vid: str) -> dict[str, Any] | None:
+    return _mapper(db, resource_type).history_version(id, vid)
 
 
-def fhir_history(db: Session, resource_type: str, id: str) -> dict[str, Any]:
-    return _mapper(db, resource_type).history(id)
+def fhir_history_type(db: Session, resource_type: str, since: str | None, count: int = 50) -> dict[str, Any]:
+    return _mapper(db, resource_type).history_type(since=since, count=count)
@@ -2,7 +2,13 @@ from __future__ import annotations
 
 import datetime as dt
 import uuid
-from typing import Any
+from typing import Any, Iterable
+
+import orjson
+
+
+class PreconditionFailed(ValueError):
+    """A conditional request's precondition doesn't hold (HTTP 412), e.g. criteria matching several resources."""
 
 
 def fhir_meta(*, version: int, last_updated: dt.datetime) -> dict[str, Any]:
@@ -19,6 +25,19 @@ def parse_reference(ref: str) -> tuple[str, str]:
     return parts[0], parts[1]
 
 
+def query_params(pairs: Iterable[tuple[str, str]]) -> dict[str, Any]:
+    """Query string pairs as search params: a repeated name becomes a list (AND-ed by the search compiler)."""
+    params: dict[str, Any] = {}
+    for k, v in pairs:
+        if k not in params:
+            params[k] = v
+        elif isinstance(params[k], list):
+            params[k].append(v)
+        else:
+            params[k] = [params[k], v]
+    return params
+
+
 def to_uuid(id_: str) -> uuid.UUID:
     try:
         return uuid.UUID(id_)
@@ -26,11 +45,64 @@ def to_uuid(id_: str) -> uuid.UUID:
         raise ValueError("Invalid id (expected UUID)")
 
 
-def bundle(*, entries: list[dict[str, Any]], total: int) -> dict[str, Any]:
+def bundle(
+    *,
+    entries: list[dict[str, Any] | bytes],
+    total: int,
+    included: list[dict[str, Any]] | None = None,
+) -> dict[str, Any]:
+    """
+    Searchset bundle. Entries may be resource dicts or already-serialized resource JSON (`bytes`); the latter
+    are wrapped as orjson fragments and spliced into the response body verbatim instead of being re-encoded.
+    When `included` is given (_include/_revinclude), entries are tagged search.mode=match and the included
+    resources are appended with search.mode=include; `total` counts matches only.
+    """
+    out = [{"resource": orjson.Fragment(e) if isinstance(e, bytes) else e} for e in entries]
+    if included is not None:
+        for e in out:
+            e["search"] = {"mode": "match"}
+        out.extend({"resource": r, "search": {"mode": "include"}} for r in included)
     return {
         "resourceType": "Bundle",
         "type": "searchset",
         "total": total,
-        "entry": [{"resource": e} for e in entries],
+        "entry": out,
     }
 
+
+def history_bundle(resources: list[dict[str, Any]]) -> dict[str, Any]:
+    """History bundle, newest version first; version 1 is reported as the create, later ones as updates."""
+    entries = []
+    for r in resources:
+        meta = r.get("meta") or {}
+        version = meta.get("versionId")
+        created = version == "1"
+        entries.append(
+            {
+                "resource": r,
+                "request": {"method": "POST" if created else "PUT", "url": r["resourceType"] if created else f"{r['resourceType']}/{r['id']}"},
+                "response": {
+                    "status": "201 Created" if created else "200 OK",
+                    "etag": f'W/"{version}"',
+                    "lastModified": meta.get("lastUpdated"),
+                },
+            }
+        )
+    return {
+        "resourceType": "Bundle",
+        "type": "history",
+        "total": len(entries),
+        "entry": entries,
+    }
+
+
+SUBSETTED = {"system": "http://terminology.hl7.org/CodeSystem/v3-ObservationValue", "code": "SUBSETTED"}
+
+
+def subset(resource: dict[str, Any], elements: set[str]) -> dict[str, Any]:
+    """Keep resourceType/id/meta plus the requested top-level elements, and tag meta as SUBSETTED."""
+    out = {k: v for k, v in resource.items() if k in elements or k in ("resourceType", "id")}
+    meta = dict(resource.get("meta") or {})
+    meta["tag"] = [*meta.get("tag", []), SUBSETTED]
+    out["meta"] = meta
+    return out
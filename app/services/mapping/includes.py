@@ -0,0 +1,113 @@
+"""
+_include / _revinclude for FHIR searches.
+
+References are followed from the already-serialized match entries, then loaded with one `id IN (...)`
+query per target type (all _include params pointing at the same type share that query). Each _revinclude
+is one query on the referencing type. Included resources are deduplicated and never repeat a match.
+"""
+
+from __future__ import annotations
+
+import uuid
+from collections import defaultdict
+from typing import Any, Callable
+
+from app.services.mapping.fhir_utils import parse_reference, to_uuid
+
+# (source type, search param) -> (reference element in the serialized resource, target type)
+REFERENCE_PARAMS: dict[tuple[str, str], tuple[str, str]] = {
+    ("Observation", "patient"): ("subject", "Patient"),
+    ("Observation", "subject"): ("subject", "Patient"),
+    ("Observation", "encounter"): ("encounter", "Encounter"),
+    ("Condition", "patient"): ("subject", "Patient"),
+    ("Condition", "subject"): ("subject", "Patient"),
+    ("Encounter", "patient"): ("subject", "Patient"),
+    ("Encounter", "subject"): ("subject", "Patient"),
+    ("ServiceRequest", "patient"): ("subject", "Patient"),
+    ("ServiceRequest", "subject"): ("subject", "Patient"),
+    ("ServiceRequest", "encounter"): ("encounter", "Encounter"),
+    ("ServiceRequest", "reason-reference"): ("reasonReference", "Condition"),
+    ("DocumentReference", "patient"): ("subject", "Patient"),
+    ("DocumentReference", "subject"): ("subject", "Patient"),
+    ("DocumentReference", "encounter"): ("context.encounter", "Encounter"),
+}
+
+# Upper bound on resources pulled in by a single _revinclude.
+REVINCLUDE_LIMIT = 1000
+
+
+def _parse_spec(spec: str, kind: str) -> tuple[str, str, str, str]:
+    parts = spec.split(":")
+    if len(parts) not in (2, 3):
+        raise ValueError(f"Invalid {kind} '{spec}' (expected Type:param)")
+    source, param = parts[0], parts[1]
+    ref = REFERENCE_PARAMS.get((source, param))
+    if ref is None:
+        raise ValueError(f"Unsupported {kind} '{spec}'")
+    path, target = ref
+    if len(parts) == 3 and parts[2] != target:
+        raise ValueError(f"Unsupported {kind} target '{parts[2]}' for {source}:{param}")
+    return source, param, path, target
+
+
+def _reference_ids(resource: dict[str, Any], path: str, target: str) -> list[uuid.UUID]:
+    values: list[Any] = [resource]
+    for key in path.split("."):
+        nxt: list[Any] = []
+        for v in values:
+            v = v.get(key) if isinstance(v, dict) else None
+            if isinstance(v, list):
+                nxt.extend(v)
+            elif v is not None:
+                nxt.append(v)
+        values = nxt
+    out = []
+    for v in values:
+        ref = v.get("reference") if isinstance(v, dict) else None
+        if not ref:
+            continue
+        rt, rid = parse_reference(ref)
+        if rt == target:
+            out.append(to_uuid(rid))
+    return out
+
+
+def resolve(
+    *,
+    resource_type: str,
+    matches: list[dict[str, Any]],
+    include: list[str],
+    revinclude: list[str],
+    mapper_for: Callable[[str], Any],
+) -> list[dict[str, Any]]:
+    """Resources to add to a searchset for the given _include/_revinclude values."""
+    seen = {(resource_type, m["id"]) for m in matches}
+    wanted: dict[str, dict[uuid.UUID, None]] = defaultdict(dict)  # ordered set per target type
+    for spec in include:
+        source, _, path, target = _parse_spec(spec, "_include")
+        if source != resource_type:
+            raise ValueError(f"_include '{spec}' does not apply to {resource_type}")
+        for m in matches:
+            for rid in _reference_ids(m, path, target):
+                if (target, str(rid)) not in seen:
+                    wanted[target][rid] = None
+
+    included: list[dict[str, Any]] = []
+
+    def _add(resources: list[dict[str, Any]]) -> None:
+        for r in resources:
+            key = (r["resourceType"], r["id"])
+            if key not in seen:
+                seen.add(key)
+                included.append(r)
+
+    for target, ids in wanted.items():
+        _add(mapper_for(target).read_many(ids))
+
+    match_ids = [to_uuid(m["id"]) for m in matches]
+    for spec in revinclude:
+        source, param, _, target = _parse_spec(spec, "_revinclude")
+        if target != resource_type:
+            raise ValueError(f"_revinclude '{spec}' does not reference {resource_type}")
+        _add(mapper_for(source).search_referencing(param, match_ids, limit=REVINCLUDE_LIMIT))
+    return included
@@ -0,0 +1,274 @@
+"""
+Resource patches for `PATCH /fhir/{type}/{id}`.
+
+- JSON Patch (RFC 6902): a list of add/remove/replace/move/copy/test operations on JSON pointers.
+- FHIRPath Patch: a Parameters resource with `operation` parameters (type add/insert/delete/replace/move).
+  Paths are the simple subset of FHIRPath the mappers' resources need: `Type.element.child`, with `[n]`
+  indexes (`Patient.name[0].family`). Functions and filters (`where()`, `first()`, ...) are rejected.
+  Complex values are given as nested `part`s, one per element, as in the FHIR spec's examples.
+
+Both return a patched deep copy; the input resource is never modified.
+"""
+
+from __future__ import annotations
+
+import copy
+import re
+from typing import Any
+
+_SEGMENT = re.compile(r"^([A-Za-z][A-Za-z0-9_]*)(?:\[(\d+)\])?$")
+# Without StructureDefinitions, FHIRPath Patch `add` of an absent element creates a list for the elements that
+# repeat in the resources exposed here.
+_REPEATING = frozenset({"identifier", "name", "given", "coding", "telecom", "address", "category", "note"})
+
+
+def apply_patch(resource: dict[str, Any], patch: Any) -> dict[str, Any]:
+    if isinstance(patch, list):
+        return apply_json_patch(resource, patch)
+    if isinstance(patch, dict) and patch.get("resourceType") == "Parameters":
+        return apply_fhirpath_patch(resource, patch)
+    raise ValueError("PATCH body must be a JSON Patch document (a list) or a FHIRPath Patch Parameters resource")
+
+
+# ---- JSON Patch ---------------------------------------------------------------------------------------------
+
+
+def apply_json_patch(resource: dict[str, Any], operations: list[Any]) -> dict[str, Any]:
+    doc = copy.deepcopy(resource)
+    for i, op in enumerate(operations):
+        if not isinstance(op, dict) or "op" not in op or "path" not in op:
+            raise ValueError(f"JSON Patch operation {i} needs 'op' and 'path'")
+        kind, path = op["op"], op["path"]
+        if kind == "add":
+            _pointer_add(doc, path, copy.deepcopy(_required(op, "value", i)))
+        elif kind == "remove":
+            _pointer_remove(doc, path)
+        elif kind == "replace":
+            _pointer_remove(doc, path)
+            _pointer_add(doc, path, copy.deepcopy(_required(op, "value", i)))
+        elif kind == "move":
+            source = _required(op, "from", i)
+            if path.startswith(source + "/"):
+                raise ValueError(f"JSON Patch operation {i}: cannot move {source} into itself")
+            _pointer_add(doc, path, _pointer_remove(doc, source))
+        elif kind == "copy":
+            _pointer_add(doc, path, copy.deepcopy(_pointer_get(doc, _required(op, "from", i))))
+        elif kind == "test":
+            if _pointer_get(doc, path) != _required(op, "value", i):
+                raise ValueError(f"JSON Patch test failed at {path}")
+        else:
+            raise ValueError(f"Unsupported JSON Patch op '{kind}'")
+    return doc
+
+
+def _required(op: dict[str, Any], key: str, i: int) -> Any:
+    if key not in op:
+        raise ValueError(f"JSON Patch operation {i} ({op['op']}) needs '{key}'")
+    return op[key]
+
+
+def _tokens(pointer: str) -> list[str]:
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise ValueError(f"Invalid JSON pointer '{pointer}'")
+    return [t.replace("~1", "/").replace("~0", "~") for t in pointer[1:].split("/")]
+
+
+def _index(container: list[Any], token: str, pointer: str, *, append: bool = False) -> int:
+    if append and token == "-":
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token.startswith("0")):
+        raise ValueError(f"Invalid array index in '{pointer}'")
+    i = int(token)
+    if i > len(container) or (i == len(container) and not append):
+        raise ValueError(f"Array index out of range in '{pointer}'")
+    return i
+
+
+def _parent(doc: Any, pointer: str) -> tuple[Any, str]:
+    tokens = _tokens(pointer)
+    if not tokens:
+        raise ValueError("JSON Patch cannot replace the whole resource; use PUT")
+    node = doc
+    for token in tokens[:-1]:
+        if isinstance(node, list):
+            node = node[_index(node, token, pointer)]
+        elif isinstance(node, dict) and token in node:
+            node = node[token]
+        else:
+            raise ValueError(f"Path not found: '{pointer}'")
+    return node, tokens[-1]
+
+
+def _pointer_get(doc: Any, pointer: str) -> Any:
+    node = doc
+    for token in _tokens(pointer):
+        if isinstance(node, list):
+            node = node[_index(node, token, pointer)]
+        elif isinstance(node, dict) and token in node:
+            node = node[token]
+        else:
+            raise ValueError(f"Path not found: '{pointer}'")
+    return node
+
+
+def _pointer_add(doc: Any, pointer: str, value: Any) -> None:
+    parent, token = _parent(doc, pointer)
+    if isinstance(parent, list):
+        parent.insert(_index(parent, token, pointer, append=True), value)
+    elif isinstance(parent, dict):
+        parent[token] = value
+    else:
+        raise ValueError(f"Path not found: '{pointer}'")
+
+
+def _pointer_remove(doc: Any, pointer: str) -> Any:
+    parent, token = _parent(doc, pointer)
+    if isinstance(parent, list):
+        return parent.pop(_index(parent, token, pointer))
+    if isinstance(parent, dict) and token in parent:
+        return parent.pop(token)
+    raise ValueError(f"Path not found: '{pointer}'")
+
+
+# ---- FHIRPath Patch -----------------------------------------------------------------------------------------
+
+
+def apply_fhirpath_patch(resource: dict[str, Any], parameters: dict[str, Any]) -> dict[str, Any]:
+    doc = copy.deepcopy(resource)
+    for param in parameters.get("parameter") or []:
+        if param.get("name") != "operation":
+            raise ValueError("FHIRPath Patch parameters must all be named 'operation'")
+        parts = {p.get("name"): p for p in param.get("part") or []}
+        kind = _part_value(parts.get("type"))
+        path = _part_value(parts.get("path"))
+        if not kind or not path:
+            raise ValueError("FHIRPath Patch operations need 'type' and 'path'")
+        if kind == "add":
+            target = _fhirpath_node(doc, path, resource["resourceType"])
+            name = _part_value(parts.get("name"))
+            if not isinstance(target, dict) or not name:
+                raise ValueError(f"FHIRPath Patch add needs an element at '{path}' and a 'name'")
+            value = _patch_value(parts.get("value"))
+            existing = target.get(name)
+            if isinstance(existing, list):
+                existing.append(value)
+            elif existing is not None:
+                raise ValueError(f"'{path}.{name}' already has a value; use replace")
+            else:
+                target[name] = [value] if name in _REPEATING else value
+        elif kind == "insert":
+            target = _fhirpath_node(doc, path, resource["resourceType"])
+            index = _part_value(parts.get("index"))
+            if not isinstance(target, list) or not isinstance(index, int) or not 0 <= index <= len(target):
+                raise ValueError(f"FHIRPath Patch insert needs a list at '{path}' and a valid 'index'")
+            target.insert(index, _patch_value(parts.get("value")))
+        elif kind == "delete":
+            parent, key = _fhirpath_parent(doc, path, resource["resourceType"])
+            if parent is not None:
+                _delete(parent, key)
+        elif kind == "replace":
+            parent, key = _fhirpath_parent(doc, path, resource["resourceType"])
+            if parent is None:
+                raise ValueError(f"FHIRPath Patch replace: nothing at '{path}'")
+            parent[key] = _patch_value(parts.get("value"))
+        elif kind == "move":
+            target = _fhirpath_node(doc, path, resource["resourceType"])
+            source, destination = _part_value(parts.get("source")), _part_value(parts.get("destination"))
+            positions = (source, destination)
+            if not isinstance(target, list) or not all(isinstance(i, int) and 0 <= i < len(target) for i in positions):
+                raise ValueError(f"FHIRPath Patch move needs a list at '{path}' and valid 'source'/'destination'")
+            target.insert(destination, target.pop(source))
+        else:
+            raise ValueError(f"Unsupported FHIRPath Patch type '{kind}'")
+    return doc
+
+
+def _part_value(part: dict[str, Any] | None) -> Any:
+    if not part:
+        return None
+    for k, v in part.items():
+        if k.startswith("value"):
+            return v
+    return None
+
+
+def _patch_value(part: dict[str, Any] | None) -> Any:
+    """A `value` part: value[x], or nested parts building a complex value (repeated names become lists)."""
+    if not part:
+        raise ValueError("FHIRPath Patch operation needs a 'value'")
+    if "part" not in part:
+        value = _part_value(part)
+        if value is None:
+            raise ValueError("FHIRPath Patch operation needs a 'value'")
+        return value
+    out: dict[str, Any] = {}
+    for p in part["part"]:
+        name, value = p.get("name"), _patch_value(p)
+        if name in out:
+            out[name] = [*out[name], value] if isinstance(out[name], list) else [out[name], value]
+        else:
+            out[name] = value
+    return out
+
+
+def _segments(path: str, resource_type: str) -> list[tuple[str, int | None]]:
+    head, _, rest = path.partition(".")
+    if head != resource_type:
+        raise ValueError(f"FHIRPath Patch path must start with '{resource_type}': '{path}'")
+    out = []
+    for seg in rest.split(".") if rest else []:
+        m = _SEGMENT.match(seg)
+        if not m:
+            raise ValueError(f"Unsupported FHIRPath expression '{path}' (only element paths and [n] indexes)")
+        out.append((m.group(1), int(m.group(2)) if m.group(2) is not None else None))
+    return out
+
+
+def _step(node: Any, name: str, index: int | None) -> Any:
+    if not isinstance(node, dict) or name not in node:
+        return None
+    value = node[name]
+    if index is None:
+        return value
+    if isinstance(value, list):
+        return value[index] if index < len(value) else None
+    return value if index == 0 else None
+
+
+def _fhirpath_node(doc: dict[str, Any], path: str, resource_type: str) -> Any:
+    node: Any = doc
+    for name, index in _segments(path, resource_type):
+        node = _step(node, name, index)
+        if node is None:
+            raise ValueError(f"FHIRPath Patch: nothing at '{path}'")
+    return node
+
+
+def _fhirpath_parent(doc: dict[str, Any], path: str, resource_type: str) -> tuple[Any, Any]:
+    """(container, key) holding the element at `path`, or (None, None) when it doesn't exist."""
+    segments = _segments(path, resource_type)
+    if not segments:
+        raise ValueError("FHIRPath Patch cannot target the whole resource")
+    node: Any = doc
+    for name, index in segments[:-1]:
+        node = _step(node, name, index)
+        if node is None:
+            return None, None
+    name, index = segments[-1]
+    if not isinstance(node, dict) or name not in node:
+        return None, None
+    if index is None:
+        return node, name
+    value = node[name]
+    if isinstance(value, list):
+        return (value, index) if index < len(value) else (None, None)
+    return (node, name) if index == 0 else (None, None)
+
+
+def _delete(container: Any, key: Any) -> None:
+    if isinstance(container, list):
+        container.pop(key)
+    else:
+        container.pop(key, None)
@@ -0,0 +1,373 @@
+"""
+Version-keyed read cache for `GET /fhir/{type}/{id}`.
+
+Two tiers:
+- an in-process LRU of serialized resources keyed by (type, id, version)
+- Redis, holding the same immutable (type, id, version) bodies plus a per-resource pointer to the current
+  version. The pointer only ever moves forward (a small Lua script compares before setting), so a slow
+  reader can't overwrite a newer version published by a writer.
+
+Writes don't talk to the cache directly: session hooks note every flushed row of a cached type and, after
+the transaction commits, bump the pointer to the row's new version. A flush that touched a row without
+bumping `version` drops the cached body for that version instead. With Redis up, a hot read is one pointer
+GET plus a local (or Redis) body lookup and never touches Postgres. With Redis unreachable the current
+version comes from a primary-key probe (`select version ... where id = ?`), so responses are still never
+older than the row.
+
+Observation, Condition and ServiceRequest bodies also embed concept displays, which change without bumping
+the resource's version. Their cached bodies carry the concept generation they were loaded under (a counter
+bumped in the writing transaction by a trigger on som_concept, migration 0017), and a body is only served
+while that is still the current generation. The generation is published to Redis after commit like a
+pointer, and probed from Postgres alongside `version` when Redis doesn't have it.
+
+Binary (payload-sized) and DocumentReference (its attachment contentType lives on the Binary row, which
+has its own version) are not cached.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import redis
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from app.api.responses import dumps
+from app.core.config import settings
+from app.core.metrics import READ_CACHE_REQUESTS
+from app.db.models import (
+    SomConcept,
+    SomConceptGeneration,
+    SomCondition,
+    SomEncounter,
+    SomObservation,
+    SomOrganization,
+    SomPatient,
+    SomPractitioner,
+    SomServiceRequest,
+)
+from app.db import session as db_session
+from app.db.session import SessionLocal
+from app.services.mapping.fhir_utils import to_uuid
+
+log = logging.getLogger(__name__)
+
+CACHED_TYPES: dict[str, type] = {
+    "Patient": SomPatient,
+    "Practitioner": SomPractitioner,
+    "Organization": SomOrganization,
+    "Encounter": SomEncounter,
+    "Condition": SomCondition,
+    "ServiceRequest": SomServiceRequest,
+    "Observation": SomObservation,
+}
+_TYPE_BY_MODEL = {model: rt for rt, model in CACHED_TYPES.items()}
+_CANONICAL_TYPE = {rt.lower(): rt for rt in CACHED_TYPES}
+# Types whose bodies embed som_concept displays.
+_CONCEPT_TYPES = frozenset({"Condition", "ServiceRequest", "Observation"})
+# The counter row is missing until the first concept update.
+_CONCEPT_GENERATION = select(func.coalesce(func.max(SomConceptGeneration.generation), 0)).scalar_subquery()
+
+_KEY_PREFIX = "ehr:fhir:"
+# Under `ptr:` so it is forgotten together with the pointers after lost writes.
+_GENERATION_KEY = f"{_KEY_PREFIX}ptr:concept-generation"
+
+# SET key ARGV[1] unless the stored version is already >= ARGV[1].
+_SET_IF_NEWER = """
+local cur = redis.call('GET', KEYS[1])
+if (not cur) or tonumber(cur) < tonumber(ARGV[1]) then
+  redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+  return 1
+end
+return 0
+"""
+
+
+@dataclass(frozen=True)
+class CachedResource:
+    version: int
+    last_updated: str
+    body: bytes
+    generation: int = 0
+
+
+class _LocalLRU:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._items: OrderedDict[tuple[str, str, int], CachedResource] = OrderedDict()
+
+    def get(self, key: tuple[str, str, int]) -> CachedResource | None:
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def put(self, key: tuple[str, str, int], item: CachedResource) -> None:
+        with self._lock:
+            self._items[key] = item
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def discard(self, key: tuple[str, str, int]) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+class _RedisTier:
+    """Redis access with a simple circuit breaker: after an error, Redis is skipped for a retry interval."""
+
+    def __init__(self, url: str, retry_seconds: float):
+        self.retry_seconds = retry_seconds
+        self._client = redis.Redis.from_url(url, socket_connect_timeout=0.25, socket_timeout=0.25)
+        self._set_if_newer = self._client.register_script(_SET_IF_NEWER)
+        self._down_until = 0.0
+        self._lost_writes = False
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def _call(self, fn: Callable[[], Any], *, write: bool = False) -> Any:
+        if not self.available:
+            # A skipped pointer write means Redis may now hold an outdated version for some resource.
+            self._lost_writes = self._lost_writes or write
+            return None
+        try:
+            if self._lost_writes:
+                self._drop_pointers()
+                self._lost_writes = False
+            return fn()
+        except redis.RedisError as e:
+            log.warning("read cache: redis unavailable (%s); retrying in %.0fs", e, self.retry_seconds)
+            self._down_until = time.monotonic() + self.retry_seconds
+            self._lost_writes = self._lost_writes or write
+            return None
+
+    def _drop_pointers(self) -> None:
+        # Bodies are immutable per version; only pointers can be wrong, so forget them all and let reads
+        # re-learn current versions from Postgres.
+        self._delete_matching(f"{_KEY_PREFIX}ptr:*")
+
+    def _delete_matching(self, pattern: str) -> None:
+        keys = list(self._client.scan_iter(match=pattern, count=1000))
+        for i in range(0, len(keys), 1000):
+            self._client.delete(*keys[i : i + 1000])
+
+    def current_version(self, rt: str, id: str) -> tuple[int | None, int | None]:
+        """(version, concept generation); generation is always 0 for types that don't embed concepts."""
+        if rt not in _CONCEPT_TYPES:
+            raw = self._call(lambda: self._client.get(f"{_KEY_PREFIX}ptr:{rt}:{id}"))
+            return (int(raw) if raw is not None else None), 0
+        raw = self._call(lambda: self._client.mget(f"{_KEY_PREFIX}ptr:{rt}:{id}", _GENERATION_KEY)) or (None, None)
+        return tuple(int(v) if v is not None else None for v in raw)
+
+    def publish_version(self, rt: str, id: str, version: int) -> None:
+        self._call(
+            lambda: self._set_if_newer(
+                keys=[f"{_KEY_PREFIX}ptr:{rt}:{id}"], args=[version, settings.read_cache_ttl_seconds]
+            ),
+            write=True,
+        )
+
+    def publish_generation(self, generation: int) -> None:
+        self._call(
+            lambda: self._set_if_newer(keys=[_GENERATION_KEY], args=[generation, settings.read_cache_ttl_seconds]),
+            write=True,
+        )
+
+    def get_body(self, rt: str, id: str, version: int) -> CachedResource | None:
+        raw = self._call(lambda: self._client.get(f"{_KEY_PREFIX}res:{rt}:{id}:{version}"))
+        if raw is None:
+            return None
+        generation, _, rest = raw.partition(b"\n")
+        if not generation.isdigit():
+            return None  # stored before bodies carried a generation
+        last_updated, _, body = rest.partition(b"\n")
+        return CachedResource(version=version, last_updated=last_updated.decode(), body=body, generation=int(generation))
+
+    def put_body(self, rt: str, id: str, item: CachedResource) -> None:
+        value = b"%d\n" % item.generation + item.last_updated.encode() + b"\n" + item.body
+        self._call(
+            lambda: self._client.set(
+                f"{_KEY_PREFIX}res:{rt}:{id}:{item.version}", value, ex=settings.read_cache_ttl_seconds
+            )
+        )
+
+    def drop(self, rt: str, id: str, version: int) -> None:
+        self._call(
+            lambda: self._client.delete(f"{_KEY_PREFIX}ptr:{rt}:{id}", f"{_KEY_PREFIX}res:{rt}:{id}:{version}"),
+            write=True,
+        )
+
+    def clear(self) -> None:
+        self._call(lambda: self._delete_matching(f"{_KEY_PREFIX}*"), write=True)
+
+
+local = _LocalLRU(settings.read_cache_local_entries)
+remote = _RedisTier(settings.redis_url, settings.read_cache_redis_retry_seconds)
+
+
+def cacheable(resource_type: str) -> str | None:
+    """Canonical resource type name if reads of this type are cached."""
+    if not settings.read_cache_enabled:
+        return None
+    return _CANONICAL_TYPE.get(resource_type.lower())
+
+
+def read(db: Session, resource_type: str, id: str, loader: Callable[[], dict[str, Any] | None]) -> CachedResource | None:
+    """
+    Serve a read from the cache, falling back to `loader` (the mapper's read) on a miss. Returns None when
+    the resource doesn't exist.
+    """
+    rt = cacheable(resource_type)
+    if rt is None:
+        return _serialize(loader())
+
+    # Keys use the canonical (lowercase, hyphenated) form that write hooks publish under.
+    id = str(to_uuid(id))
+    concepts = rt in _CONCEPT_TYPES
+    version, generation = remote.current_version(rt, id)
+    probed = version is None or generation is None
+    if probed:
+        model = CACHED_TYPES[rt]
+        row = db.execute(select(model.version, _CONCEPT_GENERATION).where(model.id == uuid.UUID(id))).one_or_none()
+        if row is None:
+            return None
+        version, generation = row[0], (row[1] if concepts else 0)
+        if _reads_primary(db):
+            remote.publish_version(rt, id, version)
+            if concepts:
+                remote.publish_generation(generation)
+
+    item = local.get((rt, id, version))
+    if item is not None and item.generation == generation:
+        READ_CACHE_REQUESTS.inc(rt, "local")
+        return item
+    item = remote.get_body(rt, id, version)
+    if item is not None and item.generation == generation:
+        READ_CACHE_REQUESTS.inc(rt, "redis")
+        local.put((rt, id, version), item)
+        return item
+
+    READ_CACHE_REQUESTS.inc(rt, "miss")
+    if concepts and not probed:
+        # Tag the body with the generation its own database shows: a lagging replica may not have the
+        # concept update that Redis already announced.
+        generation = db.execute(select(_CONCEPT_GENERATION)).scalar_one()
+    item = _serialize(loader(), generation)
+    if item is None:
+        return None
+    # Key by the version actually loaded: it may be newer than the pointer (a write committed in between)
+    # or older (a lagging replica); either way the body is correct for that version.
+    local.put((rt, id, item.version), item)
+    remote.put_body(rt, id, item)
+    if _reads_primary(db):
+        remote.publish_version(rt, id, item.version)
+    return item
+
+
+def clear() -> None:
+    local.clear()
+    remote.clear()
+
+
+def _reads_primary(db: Session) -> bool:
+    # Only the primary may advance the shared pointer; a lagging replica could re-publish an old version
+    # after the pointer expired.
+    return db.get_bind().url == db_session.engine.url
+
+
+def _serialize(out: dict[str, Any] | None, generation: int = 0) -> CachedResource | None:
+    if out is None:
+        return None
+    meta = out.get("meta") or {}
+    return CachedResource(
+        version=int(meta.get("versionId") or 0),
+        last_updated=meta.get("lastUpdated") or "",
+        body=dumps(out),
+        generation=generation,
+    )
+
+
+# ---- write-path hooks -------------------------------------------------------------------------------------
+
+
+def _note(session: Session, obj: Any, *, bumped: bool) -> None:
+    if type(obj) in _TYPE_BY_MODEL:
+        note_version(session, type(obj), obj.id, obj.version, bumped=bumped)
+
+
+def note_version(session: Session, model: type, id: Any, version: int | None, *, bumped: bool = True) -> None:
+    """Record a write of a cached type; also called directly by writes that bypass the ORM (Core UPDATE)."""
+    rt = _TYPE_BY_MODEL.get(model)
+    if rt is None:
+        return
+    touched: dict[tuple[str, str], tuple[int, bool]] = session.info.setdefault("read_cache_touched", {})
+    key = (rt, str(id))
+    _, was_bumped = touched.get(key, (0, False))
+    touched[key] = (version or 0, was_bumped or bumped)
+
+
+def note_concept_generation(session: Session) -> None:
+    """
+    Record the concept generation this transaction will commit, after a write that may have changed concept
+    displays (the som_concept trigger has already bumped it); also called by the bulk terminology loader.
+    """
+    session.info["read_cache_concept_generation"] = session.connection().execute(select(_CONCEPT_GENERATION)).scalar_one()
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _note_flushed_rows(session: Session, flush_context) -> None:
+    # Runs while new/dirty/deleted and attribute history still describe the flush that just happened.
+    for obj in session.new:
+        _note(session, obj, bumped=True)
+    concepts_changed = False
+    for obj in session.dirty:
+        if type(obj) in _TYPE_BY_MODEL and session.is_modified(obj, include_collections=False):
+            _note(session, obj, bumped=inspect(obj).attrs.version.history.has_changes())
+        elif type(obj) is SomConcept:
+            attrs = inspect(obj).attrs
+            concepts_changed = concepts_changed or any(
+                attrs[name].history.has_changes() for name in ("code_system_id", "code", "display")
+            )
+    for obj in session.deleted:
+        _note(session, obj, bumped=False)
+    if concepts_changed:
+        note_concept_generation(session)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _publish_committed_versions(session: Session) -> None:
+    generation = session.info.pop("read_cache_concept_generation", None)
+    if generation is not None:
+        remote.publish_generation(generation)
+    touched = session.info.pop("read_cache_touched", None)
+    if not touched:
+        return
+    for (rt, id), (version, bumped) in touched.items():
+        if not version:
+            continue
+        if bumped:
+            remote.publish_version(rt, id, version)
+        else:
+            local.discard((rt, id, version))
+            remote.drop(rt, id, version)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_rolled_back_rows(session: Session) -> None:
+    session.info.pop("read_cache_touched", None)
+    session.info.pop("read_cache_concept_generation", None)
@@ -1,12 +1,61 @@
 from __future__ import annotations
 
-from typing import Any
+import datetime as dt
+import uuid
+from typing import Any, Iterable
+from urllib.parse import urlencode
 
-from sqlalchemy.orm import Session
+from psycopg.errors import UniqueViolation
+from sqlalchemy import (
+    Column,
+    ColumnElement,
+    FromClause,
+    Select,
+    Table,
+    bindparam,
+    column,
+    exists,
+    func,
+    insert,
+    literal_column,
+    null,
+    select,
+    update,
+)
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import QueryableAttribute, Session
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy.sql.visitors import replacement_traverse
+
+from app.core.metrics import MAPPER_SECONDS
+from app.db.models import SomProvenance
+from app.services.history import HistoryService
+from app.services.mapping import read_cache  # also registers the cache's write-path session hooks
+from app.services.mapping.fhir_utils import PreconditionFailed, bundle, history_bundle, subset, to_uuid
+from app.services.mapping.patch import apply_patch
+from app.services.mapping.search_params import SearchParam, common_params, compile_params
+
+SUMMARY_MODES = {"true", "false", "data", "count"}
 
 
 class BaseMapper:
     resource_type: str
+    # SOM table behind the resource, and its reference search params (param -> column on `model`).
+    # Used by read_many/search_referencing to serve _include/_revinclude.
+    model: type | None = None
+    reference_columns: dict[str, str] = {}
+    # FHIR element -> result columns of _select_rows it is rendered from. Drives _elements/_summary pushdown:
+    # columns of elements that weren't asked for are selected as NULL, so row shapes stay the same.
+    element_columns: dict[str, tuple[str, ...]] = {}
+    # Elements returned for _summary=true; None means every element in element_columns.
+    summary_elements: frozenset[str] | None = None
+    # Elements never selected by a search unless named in _elements (payload-sized columns).
+    search_omits: frozenset[str] = frozenset()
+    # Search parameters this type supports (besides _id/_lastUpdated), compiled by search_params.
+    search_params: dict[str, SearchParam] = {}
+    # Set while patch() runs update(): _compare_and_swap then writes only the columns whose values change.
+    _changed_columns_only: bool = False
 
     def __init__(self, db: Session):
         self.db = db
@@ -17,12 +66,341 @@ class BaseMapper:
     def read(self, id: str) -> dict[str, Any] | None:
         raise NotImplementedError
 
-    def update(self, id: str, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any] | None:
+    def update(
+        self, id: str, body: dict[str, Any], *, correlation_id: str | None, expected_version: int | None = None
+    ) -> dict[str, Any] | None:
+        """
+        Replace the resource. With `expected_version` (If-Match) the write only happens if the stored version
+        still is that one; otherwise PreconditionFailed.
+        """
         raise NotImplementedError
 
-    def search(self, *, params: dict[str, Any], count: int, sort: str | None) -> dict[str, Any]:
-        raise NotImplementedError
+    def conditional_create(
+        self, body: dict[str, Any], criteria: dict[str, Any], *, correlation_id: str | None
+    ) -> tuple[dict[str, Any], bool]:
+        """
+        Create with If-None-Exist: returns (resource, created). One match is returned as is, several are a
+        PreconditionFailed.
+        """
+        found = self._resolve_conditional(criteria)
+        if found is not None:
+            return self.read(str(found)), False
+        try:
+            # A savepoint, so losing an insert race on a unique index leaves the transaction usable.
+            with self.db.begin_nested():
+                return self.create(body, correlation_id=correlation_id), True
+        except IntegrityError as e:
+            if not isinstance(e.orig, UniqueViolation):
+                raise
+        found = self._resolve_conditional(criteria)
+        if found is None:
+            raise PreconditionFailed(
+                f"{self.resource_type} conflicts with an existing resource that the criteria don't match"
+            )
+        return self.read(str(found)), False
+
+    def conditional_update(
+        self, body: dict[str, Any], criteria: dict[str, Any], *, correlation_id: str | None
+    ) -> tuple[dict[str, Any], bool]:
+        """PUT by search criteria: update the one match, or create when there is none. Returns (resource, created)."""
+        found = self._resolve_conditional(criteria)
+        if found is None:
+            if body.get("id"):
+                raise ValueError("No resource matches the criteria; omit 'id' to create one")
+            return self.create(body, correlation_id=correlation_id), True
+        if body.get("id") and body["id"] != str(found):
+            raise ValueError("Resource id does not match the resource found by the criteria")
+        return self.update(str(found), body, correlation_id=correlation_id), False
+
+    def patch(
+        self, id: str, patch: Any, *, correlation_id: str | None, expected_version: int | None = None
+    ) -> dict[str, Any] | None:
+        """
+        JSON Patch / FHIRPath Patch (see patch.py), applied to the current resource and written through
+        update() against the version it was applied to, so a concurrent write makes it fail (412) instead of
+        being overwritten. update() maps the patched resource to columns as usual, but only the columns whose
+        values differ from the stored row are written; a patch that changes nothing is not written and is not
+        a new version.
+        """
+        current = self.read(id)
+        if current is None:
+            return None
+        if "versionId" not in (current.get("meta") or {}):
+            raise ValueError(f"{self.resource_type} is not versioned and can't be patched")
+        version = int(current["meta"]["versionId"])
+        if expected_version is not None and version != expected_version:
+            raise PreconditionFailed(f"{self.resource_type}/{id} is at version {version}, not {expected_version}")
+        patched = apply_patch(current, patch)
+        if patched.get("resourceType") != self.resource_type or patched.get("id") != current["id"]:
+            raise ValueError("A patch may not change resourceType or id")
+        patched.pop("meta", None)
+        current_body = {k: v for k, v in current.items() if k != "meta"}
+        if patched == current_body:
+            return current
+        self._changed_columns_only = True
+        try:
+            return self.update(id, patched, correlation_id=correlation_id, expected_version=version)
+        finally:
+            self._changed_columns_only = False
+
+    def _resolve_conditional(self, criteria: dict[str, Any]) -> uuid.UUID | None:
+        """
+        The single resource matching `criteria`, None if none; PreconditionFailed if several. Conditional writes
+        with the same criteria are serialized by a transaction-scoped advisory lock, so two of them can't both
+        miss and create; unique indexes (e.g. Patient MRN) cover races with plain creates.
+        """
+        if not criteria:
+            raise ValueError("Conditional operations need search criteria")
+        if self.model is None:
+            raise ValueError(f"Conditional operations are not supported for {self.resource_type}")
+        key = f"{self.resource_type}?{urlencode(sorted(criteria.items()), doseq=True)}"
+        self.db.execute(select(func.pg_advisory_xact_lock(func.hashtextextended(key, 0))))
+        stmt = self._search_statement(criteria, None).with_only_columns(self.model.id).order_by(None).limit(2)
+        ids = self.db.execute(stmt).scalars().all()
+        if len(ids) > 1:
+            raise PreconditionFailed(f"Criteria match more than one {self.resource_type}")
+        return ids[0] if ids else None
+
+    def search(
+        self,
+        *,
+        params: dict[str, Any],
+        count: int,
+        sort: str | None,
+        summary: str | None = None,
+        elements: list[str] | None = None,
+        strict: bool = True,
+    ) -> dict[str, Any]:
+        stmt = self._search_statement(params, sort, strict=strict)
+        if summary == "count":
+            total = self.db.execute(stmt.with_only_columns(func.count()).order_by(None)).scalar_one()
+            return bundle(entries=[], total=total)
+        wanted = self._wanted_elements(summary, elements)
+        rows = self.db.execute(self._project(stmt, wanted, omit=self.search_omits).limit(count)).all()
+        with MAPPER_SECONDS.time(self.resource_type, "to_fhir"):
+            entries = [self._row_to_fhir(r) for r in rows]
+        if wanted is not None:
+            entries = [subset(e, wanted) for e in entries]
+        return bundle(entries=entries, total=len(entries))
+
+    def read_projected(self, id: str, *, summary: str | None, elements: list[str] | None) -> dict[str, Any] | None:
+        """Read with _summary/_elements applied; only the columns behind the wanted elements are selected."""
+        if summary == "count":
+            raise ValueError("_summary=count is only valid for searches")
+        wanted = self._wanted_elements(summary, elements)
+        if self.model is None:
+            out = self.read(id)
+        else:
+            stmt = self._project(self._select_rows(), wanted).where(self.model.id == to_uuid(id))
+            row = self.db.execute(stmt).first()
+            out = self._row_to_fhir(row) if row else None
+        if out is None or wanted is None:
+            return out
+        return subset(out, wanted)
+
+    def history(self, id: str, *, count: int = 50) -> dict[str, Any] | None:
+        """Instance _history: the newest `count` versions, newest first; None if the resource doesn't exist."""
+        states = HistoryService(self.db).versions(self._history_model(), to_uuid(id), limit=count)
+        return history_bundle(self._render_states(states)) if states else None
+
+    def history_version(self, id: str, vid: str) -> dict[str, Any] | None:
+        """_history/{vid}: the resource as it was at that version."""
+        if not vid.isdigit():
+            raise ValueError("Invalid version id (expected an integer)")
+        state = HistoryService(self.db).version(self._history_model(), to_uuid(id), int(vid))
+        return self._render_states([state])[0] if state else None
+
+    def history_type(self, *, since: str | None, count: int) -> dict[str, Any]:
+        """Type-level _history: versions of any resource of this type changed at or after `since`."""
+        since_dt = None
+        if since:
+            try:
+                since_dt = dt.datetime.fromisoformat(since.replace("Z", "+00:00"))
+            except ValueError:
+                raise ValueError("_since must be an instant (e.g. 2026-01-01T00:00:00Z)")
+            if since_dt.tzinfo is None:
+                since_dt = since_dt.replace(tzinfo=dt.timezone.utc)
+        states = HistoryService(self.db).since(self._history_model(), since_dt, limit=count)
+        return history_bundle(self._render_states(states))
+
+    def _history_model(self) -> type:
+        if self.model is None or "version" not in self.model.__table__.c:
+            raise ValueError("History not supported for this resource")
+        return self.model
+
+    def _render_states(self, states: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        Resources for row states (to_jsonb form, as kept by history), in order. _select_rows() runs with the
+        model's table swapped for jsonb_populate_recordset over the states, so joins and rendering are
+        exactly those of a read.
+        """
+        if not states:
+            return []
+        table = self.model.__table__
+        source = (
+            func.jsonb_populate_recordset(literal_column(f"NULL::{table.name}"), bindparam(None, states, type_=JSONB))
+            .table_valued(*(column(c.name, c.type) for c in table.columns))
+            .alias("state")
+        )
+
+        rows = self.db.execute(self._select_from(source)).all()
+        by_version = {(r.id, r.version): r for r in rows}
+        return [self._row_to_fhir(by_version[(uuid.UUID(s["id"]), s["version"])]) for s in states]
+
+    def _select_from(self, source: FromClause) -> Select:
+        """_select_rows() reading the model's columns from `source` (same column names) instead of its table."""
+        table = self.model.__table__
+
+        def swap(e):
+            if isinstance(e, Table) and e.name == table.name:
+                return source
+            if isinstance(e, Column) and isinstance(e.table, Table) and e.table.name == table.name:
+                return source.c[e.name]
+            return None
 
-    def history(self, id: str) -> dict[str, Any]:
-        raise ValueError("History not supported for this resource")
+        return replacement_traverse(self._select_rows(), {}, swap)
 
+    def _compare_and_swap(
+        self,
+        id: uuid.UUID,
+        values: dict[str, Any],
+        *,
+        expected_version: int | None,
+        provenance: dict[str, Any] | None = None,
+    ) -> dict[str, Any] | None:
+        """
+        Write `values` and bump the version in one statement:
+            WITH updated AS (UPDATE ... SET ..., version = version + 1 WHERE id = :id [AND version = :v] RETURNING *)
+            <_select_rows() over updated>
+        so the row is rendered as a read renders it without reading it first, and concurrent writers can't
+        overwrite each other: the row lock orders them and `version = :v` rejects the loser. Returns None if the
+        row doesn't exist; raises PreconditionFailed if it exists at another version.
+
+        `provenance` (ProvenanceService.values()) is inserted by the same statement, only if the row was
+        updated, and becomes its updated_provenance_id. Values may be column expressions (e.g. to keep the
+        stored value when the body omits an element). Like a search, the result leaves out `search_omits`.
+        Under patch(), values equal to the stored ones (and column expressions) are left out of the SET list.
+        """
+        table = self.model.__table__
+        if self._changed_columns_only:
+            values = self._changed_values(table, id, values)
+        if provenance is not None:
+            values = {**values, "updated_provenance_id": provenance["id"]}
+        stmt = update(table).where(table.c.id == id).values(**values, version=table.c.version + 1)
+        if expected_version is not None:
+            stmt = stmt.where(table.c.version == expected_version)
+        updated = stmt.returning(*table.columns).cte("updated")
+        query = self._project(self._select_from(updated), None, omit=self.search_omits)
+        if provenance is not None:
+            # The foreign key is checked at the end of the statement, after both rows are written.
+            prov_table = SomProvenance.__table__
+            inserted = insert(prov_table).from_select(
+                list(provenance),
+                select(*(bindparam(None, v, type_=prov_table.c[k].type) for k, v in provenance.items())).select_from(
+                    updated
+                ),
+            )
+            query = query.add_cte(inserted.cte("provenance"))
+        row = self.db.execute(query).first()
+        if row is None:
+            if expected_version is not None and self.db.execute(select(exists().where(table.c.id == id))).scalar():
+                raise PreconditionFailed(f"{self.resource_type}/{id} is no longer at version {expected_version}")
+            return None
+        loaded = self.db.identity_map.get(identity_key(self.model, id))
+        if loaded is not None:
+            # The session's copy predates the write.
+            self.db.expire(loaded)
+        read_cache.note_version(self.db, self.model, id, row.version)
+        return self._row_to_fhir(row)
+
+    def _changed_values(self, table: Table, id: uuid.UUID, values: dict[str, Any]) -> dict[str, Any]:
+        """
+        `values` without the entries that wouldn't change the stored row. The row read here can only differ
+        from the one updated if another write got in between, and then `version = :v` rejects the update.
+        """
+        written = {k: v for k, v in values.items() if not isinstance(v, (ColumnElement, QueryableAttribute))}
+        if not written:
+            return written
+        stored = self.db.execute(select(*(table.c[k] for k in written)).where(table.c.id == id)).first()
+        if stored is None:
+            return values
+        return {k: v for (k, v), old in zip(written.items(), stored) if v != old}
+
+    def _patient_id(self, id: uuid.UUID) -> uuid.UUID | None:
+        """
+        The stored patient of a patient-scoped row, None if there is no such row. It never changes after create,
+        so reference checks against it can run ahead of a _compare_and_swap.
+        """
+        return self.db.execute(select(self.model.patient_id).where(self.model.id == id)).scalar_one_or_none()
+
+    def read_many(self, ids: Iterable[uuid.UUID]) -> list[dict[str, Any]]:
+        """Read several resources with one `id IN (...)` query. Missing ids are skipped."""
+        ids = list(ids)
+        if not ids or self.model is None:
+            return []
+        rows = self.db.execute(self._select_rows().where(self.model.id.in_(ids))).all()
+        with MAPPER_SECONDS.time(self.resource_type, "to_fhir"):
+            return [self._row_to_fhir(r) for r in rows]
+
+    def search_referencing(self, param: str, ids: Iterable[uuid.UUID], *, limit: int) -> list[dict[str, Any]]:
+        """Resources of this type whose `param` reference points at any of `ids` (one query)."""
+        ids = list(ids)
+        if not ids:
+            return []
+        stmt = self._select_rows().where(self._reference_filter(param, ids)).limit(limit)
+        return [self._row_to_fhir(r) for r in self.db.execute(stmt).all()]
+
+    def matching_ids(self, params: dict[str, Any], ids: Iterable[uuid.UUID]) -> set[uuid.UUID]:
+        """Which of `ids` match the search `params`, in one query (Subscription criteria). Bad params raise."""
+        stmt = self._search_statement(params, None)
+        ids = list(ids)
+        if not ids or self.model is None:
+            return set()
+        stmt = stmt.where(self.model.id.in_(ids)).with_only_columns(self.model.id).order_by(None)
+        return set(self.db.execute(stmt).scalars())
+
+    def _reference_filter(self, param: str, ids: list[uuid.UUID]) -> ColumnElement[bool]:
+        column = self.reference_columns.get(param)
+        if column is None or self.model is None:
+            raise ValueError(f"{self.resource_type} has no reference search parameter '{param}'")
+        return getattr(self.model, column).in_(ids)
+
+    def _search_statement(self, params: dict[str, Any], sort: str | None, *, strict: bool = True) -> Select:
+        """_select_rows() with the search filters and ordering applied (no limit)."""
+        return self._select_rows().where(*self._search_filters(params, strict=strict))
+
+    def _search_filters(self, params: dict[str, Any], *, strict: bool) -> list[ColumnElement[bool]]:
+        registry = self.search_params
+        if self.model is not None:
+            registry = {**common_params(self.model), **registry}
+        return compile_params(self.resource_type, registry, params, strict=strict)
+
+    def _wanted_elements(self, summary: str | None, elements: list[str] | None) -> set[str] | None:
+        if summary is not None and summary not in SUMMARY_MODES:
+            raise ValueError(f"Unsupported _summary '{summary}'")
+        if elements:
+            return set(elements)
+        if summary == "true":
+            return set(self.summary_elements if self.summary_elements is not None else self.element_columns)
+        return None
+
+    def _project(self, stmt: Select, wanted: set[str] | None, *, omit: frozenset[str] = frozenset()) -> Select:
+        if not self.element_columns:
+            return stmt
+        if wanted is None:
+            if not omit:
+                return stmt
+            wanted = set(self.element_columns) - omit
+        keep = {"id", "version", "updated_time"}
+        for element in wanted:
+            keep.update(self.element_columns.get(element, ()))
+        known = {c for cols in self.element_columns.values() for c in cols}
+        cols = [c if c.name in keep or c.name not in known else null().label(c.name) for c in stmt.selected_columns]
+        return stmt.with_only_columns(*cols)
+
+    def _select_rows(self) -> Select:
+        """Columnar select whose rows _row_to_fhir understands."""
+        raise NotImplementedError
+
+    def _row_to_fhir(self, r) -> dict[str, Any]:
+        raise NotImplementedError
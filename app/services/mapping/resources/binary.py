@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 import base64
-import datetime as dt
 import hashlib
 from typing import Any
 
@@ -9,13 +8,31 @@ from sqlalchemy import select
 
 from app.db.models import SomBinary
 from app.services.audit import AuditService
-from app.services.mapping.fhir_utils import bundle, fhir_meta, to_uuid
+from app.services.mapping.fhir_utils import fhir_meta, to_uuid
 from app.services.mapping.resources.base import BaseMapper
+from app.services.mapping.search_params import SearchParam
 from app.services.provenance import ProvenanceService
 
 
+# Everything but the payload; `data` is added by _select_rows and only selected when asked for.
+_COLUMNS = (
+    SomBinary.id,
+    SomBinary.version,
+    SomBinary.updated_time,
+    SomBinary.content_type,
+)
+
+
 class BinaryMapper(BaseMapper):
     resource_type = "Binary"
+    model = SomBinary
+    search_params = {"sha256": SearchParam("token", (SomBinary.sha256_hex,))}
+    element_columns = {
+        "contentType": ("content_type",),
+        "data": ("data",),
+    }
+    summary_elements = frozenset({"contentType"})
+    search_omits = frozenset({"data"})
 
     def create(self, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any]:
         content_type = body.get("contentType") or body.get("content-type")
@@ -80,55 +97,51 @@ class BinaryMapper(BaseMapper):
         b = self.db.get(SomBinary, to_uuid(id))
         return self._to_fhir(b, include_data=True) if b else None
 
-    def update(self, id: str, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any] | None:
-        b = self.db.get(SomBinary, to_uuid(id))
-        if not b:
-            return None
-        content_type = body.get("contentType") or b.content_type
+    def update(
+        self, id: str, body: dict[str, Any], *, correlation_id: str | None, expected_version: int | None = None
+    ) -> dict[str, Any] | None:
+        bid = to_uuid(id)
+        content_type = body.get("contentType")
+        values: dict[str, Any] = {"content_type": str(content_type) if content_type else SomBinary.content_type}
         data_b64 = body.get("data")
         if data_b64:
             try:
                 data = base64.b64decode(data_b64)
             except Exception:
                 raise ValueError("Binary.data must be base64")
-            b.data = data
-            b.size_bytes = len(data)
-            b.sha256_hex = hashlib.sha256(data).hexdigest()
-        b.content_type = str(content_type)
-        prov = ProvenanceService(self.db).create(
+            values.update(data=data, size_bytes=len(data), sha256_hex=hashlib.sha256(data).hexdigest())
+        prov = ProvenanceService.values(
             activity="update",
             author=None,
             correlation_id=correlation_id,
             target_resource_type=self.resource_type,
-            target_resource_id=str(b.id),
+            target_resource_id=str(bid),
             target_som_table="som_binary",
-            target_som_id=str(b.id),
+            target_som_id=str(bid),
         )
-        b.version += 1
-        b.updated_provenance_id = prov.id
-        out = self._to_fhir(b, include_data=False)
+        out = self._compare_and_swap(bid, values, expected_version=expected_version, provenance=prov)
+        if out is None:
+            return None
         AuditService(self.db).emit(
             actor="system",
             operation="update",
             correlation_id=correlation_id,
-            provenance_id=prov.id,
+            provenance_id=prov["id"],
             resource_type=self.resource_type,
-            resource_id=b.id,
+            resource_id=bid,
             som_table="som_binary",
-            som_id=b.id,
-            request_payload={"contentType": content_type, "hasData": bool(data_b64)},
+            som_id=bid,
+            request_payload={"contentType": out["contentType"], "hasData": bool(data_b64)},
             result_payload=out,
         )
         return out
 
-    def search(self, *, params: dict[str, Any], count: int, sort: str | None) -> dict[str, Any]:
-        sha = params.get("sha256")
-        stmt = select(SomBinary)
-        if sha:
-            stmt = stmt.where(SomBinary.sha256_hex == sha)
-        stmt = stmt.limit(count)
-        items = self.db.execute(stmt).scalars().all()
-        return bundle(entries=[self._to_fhir(i, include_data=False) for i in items], total=len(items))
+    def _select_rows(self):
+        return select(*_COLUMNS, SomBinary.data)
+
+    def _row_to_fhir(self, r) -> dict[str, Any]:
+        # `data` is NULL in the row unless the projection asked for it.
+        return self._to_fhir(r, include_data=r.data is not None)
 
     def _to_fhir(self, b: SomBinary, *, include_data: bool) -> dict[str, Any]:
         out: dict[str, Any] = {
@@ -4,17 +4,60 @@ import datetime as dt
 from typing import Any
 
 from sqlalchemy import select
+from sqlalchemy.orm import aliased
 
-from app.db.models import SomCondition, SomPatient
+from app.db.models import SomCodeSystem, SomConcept, SomCondition, SomPatient
 from app.services.audit import AuditService
-from app.services.mapping.fhir_utils import bundle, fhir_meta, parse_reference, to_uuid
+from app.services.mapping.fhir_utils import fhir_meta, parse_reference, to_uuid
 from app.services.mapping.resources.base import BaseMapper
+from app.services.mapping.search_params import SearchParam
 from app.services.provenance import ProvenanceService
 from app.services.terminology import TerminologyService
 
 
+# Aliased so the code-filter subqueries in search() don't correlate against the join.
+_CODE = aliased(SomConcept, name="code_concept")
+_CODE_SYSTEM = aliased(SomCodeSystem, name="code_system")
+
+
+def _row_select():
+    """Condition columns plus the code concept, joined in SQL so a search is a single query."""
+    c = SomCondition
+    return (
+        select(
+            c.id,
+            c.version,
+            c.updated_time,
+            c.patient_id,
+            c.clinical_status,
+            c.onset_date,
+            _CODE_SYSTEM.system_uri.label("concept_system"),
+            _CODE.code.label("concept_code"),
+            _CODE.display.label("concept_display"),
+        )
+        .select_from(c)
+        .join(_CODE, _CODE.id == c.code_concept_id)
+        .join(_CODE_SYSTEM, _CODE_SYSTEM.id == _CODE.code_system_id)
+    )
+
+
 class ConditionMapper(BaseMapper):
     resource_type = "Condition"
+    model = SomCondition
+    reference_columns = {"patient": "patient_id", "subject": "patient_id"}
+    search_params = {
+        "patient": SearchParam("reference", (SomCondition.patient_id,)),
+        "subject": SearchParam("reference", (SomCondition.patient_id,)),
+        "clinical-status": SearchParam("token", (SomCondition.clinical_status,)),
+        "code": SearchParam("token", (SomCondition.code_concept_id,), concept=True),
+        "onset-date": SearchParam("date", (SomCondition.onset_date,)),
+    }
+    element_columns = {
+        "subject": ("patient_id",),
+        "code": ("concept_system", "concept_code", "concept_display"),
+        "clinicalStatus": ("clinical_status",),
+        "onsetDate": ("onset_date",),
+    }
 
     def create(self, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any]:
         if correlation_id:
@@ -84,16 +127,13 @@ class ConditionMapper(BaseMapper):
         return out
 
     def read(self, id: str) -> dict[str, Any] | None:
-        c = self.db.get(SomCondition, to_uuid(id))
-        if not c:
-            return None
-        concept = c.code_concept
-        return self._to_fhir(c, concept_system=concept.code_system.system_uri, concept_code=concept.code, concept_display=concept.display)
+        row = self.db.execute(_row_select().where(SomCondition.id == to_uuid(id))).first()
+        return self._row_to_fhir(row) if row else None
 
-    def update(self, id: str, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any] | None:
-        c = self.db.get(SomCondition, to_uuid(id))
-        if not c:
-            return None
+    def update(
+        self, id: str, body: dict[str, Any], *, correlation_id: str | None, expected_version: int | None = None
+    ) -> dict[str, Any] | None:
+        cid = to_uuid(id)
         code_cc = body.get("code") or {}
         coding = TerminologyService.pick_coding(code_cc)
         concept = TerminologyService(self.db).normalize_concept(
@@ -108,68 +148,47 @@ class ConditionMapper(BaseMapper):
             clinical_status = body["clinicalStatus"]["coding"][0].get("code")
         onset = body.get("onsetDateTime") or body.get("onsetDate")
         onset_date = dt.date.fromisoformat(onset[:10]) if onset else None
-        prov = ProvenanceService(self.db).create(
+        prov = ProvenanceService.values(
             activity="update",
             author=None,
             correlation_id=correlation_id,
             target_resource_type=self.resource_type,
-            target_resource_id=str(c.id),
+            target_resource_id=str(cid),
             target_som_table="som_condition",
-            target_som_id=str(c.id),
+            target_som_id=str(cid),
         )
-        c.code_concept_id = concept.id
-        c.clinical_status = clinical_status
-        c.onset_date = onset_date
-        c.version += 1
-        c.updated_provenance_id = prov.id
-        c.extensions = c.extensions or {}
-        out = self._to_fhir(c, concept_system=concept.code_system.system_uri, concept_code=concept.code, concept_display=concept.display)
+        out = self._compare_and_swap(
+            cid,
+            {
+                "code_concept_id": concept.id,
+                "clinical_status": clinical_status,
+                "onset_date": onset_date,
+            },
+            expected_version=expected_version,
+            provenance=prov,
+        )
+        if out is None:
+            return None
         AuditService(self.db).emit(
             actor="system",
             operation="update",
             correlation_id=correlation_id,
-            provenance_id=prov.id,
+            provenance_id=prov["id"],
             resource_type=self.resource_type,
-            resource_id=c.id,
+            resource_id=cid,
             som_table="som_condition",
-            som_id=c.id,
+            som_id=cid,
             request_payload=body,
             result_payload=out,
         )
         return out
 
-    def search(self, *, params: dict[str, Any], count: int, sort: str | None) -> dict[str, Any]:
-        stmt = select(SomCondition)
-        patient = params.get("patient")
-        if patient:
-            pid = patient.split("/")[-1]
-            stmt = stmt.where(SomCondition.patient_id == to_uuid(pid))
-        clinical_status = params.get("clinical-status")
-        if clinical_status:
-            stmt = stmt.where(SomCondition.clinical_status == clinical_status)
-        code = params.get("code")
-        if code:
-            # system|code or code
-            if "|" in code:
-                system, c = code.split("|", 1)
-                # join concept/code system is expensive; keep simple: filter by concept id matching these via subquery
-                from app.db.models import SomCodeSystem, SomConcept
-
-                sub = (
-                    select(SomConcept.id)
-                    .join(SomCodeSystem, SomConcept.code_system_id == SomCodeSystem.id)
-                    .where(SomCodeSystem.system_uri == system)
-                    .where(SomConcept.code == c)
-                )
-                stmt = stmt.where(SomCondition.code_concept_id.in_(sub))
-            else:
-                from app.db.models import SomConcept
-
-                sub = select(SomConcept.id).where(SomConcept.code == code)
-                stmt = stmt.where(SomCondition.code_concept_id.in_(sub))
-        stmt = stmt.limit(count)
-        items = self.db.execute(stmt).scalars().all()
-        return bundle(entries=[self.read(str(i.id)) for i in items if self.read(str(i.id))], total=len(items))
+    def _select_rows(self):
+        return _row_select()
+
+    def _row_to_fhir(self, r) -> dict[str, Any]:
+        # `r` is a flat row from _row_select; it carries the same attributes _to_fhir reads from SomCondition.
+        return self._to_fhir(r, concept_system=r.concept_system, concept_code=r.concept_code, concept_display=r.concept_display)
 
     def _to_fhir(self, c: SomCondition, *, concept_system: str, concept_code: str, concept_display: str | None) -> dict[str, Any]:
         out: dict[str, Any] = {
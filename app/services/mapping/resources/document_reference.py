@@ -3,12 +3,14 @@ from __future__ import annotations
 import datetime as dt
 from typing import Any
 
-from sqlalchemy import desc, select
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
 
-from app.db.models import SomBinary, SomDocument, SomEncounter, SomPatient
+from app.db.models import SomBinary, SomCodeSystem, SomConcept, SomDocument, SomEncounter, SomPatient
 from app.services.audit import AuditService
-from app.services.mapping.fhir_utils import bundle, fhir_meta, parse_reference, to_uuid
+from app.services.mapping.fhir_utils import fhir_meta, parse_reference, to_uuid
 from app.services.mapping.resources.base import BaseMapper
+from app.services.mapping.search_params import SearchParam
 from app.services.provenance import ProvenanceService
 from app.services.terminology import TerminologyService
 
@@ -17,8 +19,61 @@ def _parse_dt(s: str) -> dt.datetime:
     return dt.datetime.fromisoformat(s.replace("Z", "+00:00"))
 
 
+# Aliased so the type-filter subquery in search() doesn't correlate against the join.
+_TYPE = aliased(SomConcept, name="type_concept")
+_TYPE_SYSTEM = aliased(SomCodeSystem, name="type_system")
+
+
+def _row_select():
+    """
+    Document columns plus the type concept and the attachment's content type. Only Binary.content_type is
+    selected; the payload itself is never read on this path.
+    """
+    d = SomDocument
+    return (
+        select(
+            d.id,
+            d.version,
+            d.updated_time,
+            d.patient_id,
+            d.encounter_id,
+            d.status,
+            d.date_time,
+            d.description,
+            d.binary_id,
+            _TYPE_SYSTEM.system_uri.label("type_system"),
+            _TYPE.code.label("type_code"),
+            _TYPE.display.label("type_display"),
+            SomBinary.content_type.label("binary_content_type"),
+        )
+        .select_from(d)
+        .join(_TYPE, _TYPE.id == d.type_concept_id)
+        .join(_TYPE_SYSTEM, _TYPE_SYSTEM.id == _TYPE.code_system_id)
+        .outerjoin(SomBinary, SomBinary.id == d.binary_id)
+    )
+
+
 class DocumentReferenceMapper(BaseMapper):
     resource_type = "DocumentReference"
+    model = SomDocument
+    reference_columns = {"patient": "patient_id", "subject": "patient_id", "encounter": "encounter_id"}
+    search_params = {
+        "patient": SearchParam("reference", (SomDocument.patient_id,)),
+        "subject": SearchParam("reference", (SomDocument.patient_id,)),
+        "encounter": SearchParam("reference", (SomDocument.encounter_id,)),
+        "status": SearchParam("token", (SomDocument.status,)),
+        "type": SearchParam("token", (SomDocument.type_concept_id,), concept=True),
+        "date": SearchParam("date", (SomDocument.date_time,)),
+    }
+    element_columns = {
+        "status": ("status",),
+        "subject": ("patient_id",),
+        "type": ("type_system", "type_code", "type_display"),
+        "context": ("encounter_id",),
+        "date": ("date_time",),
+        "description": ("description",),
+        "content": ("binary_id", "binary_content_type"),
+    }
 
     def _parse_encounter_id(self, body: dict[str, Any]):
         ctx = body.get("context") or {}
@@ -79,10 +134,12 @@ class DocumentReferenceMapper(BaseMapper):
         content = (body.get("content") or [{}])[0]
         attachment = content.get("attachment") or {}
         binary_id = None
+        binary_content_type = None
         url = attachment.get("url")
         if url and isinstance(url, str) and url.startswith("Binary/"):
             binary_id = to_uuid(url.split("/", 1)[1])
-            if not self.db.get(SomBinary, binary_id):
+            binary_content_type = self._binary_content_type(binary_id)
+            if binary_content_type is None:
                 raise ValueError("Binary not found for attachment.url")
 
         prov = ProvenanceService(self.db).create(activity="create", author=None, correlation_id=correlation_id)
@@ -109,7 +166,13 @@ class DocumentReferenceMapper(BaseMapper):
             target_som_id=str(doc.id),
         )
 
-        out = self._to_fhir(doc)
+        out = self._to_fhir(
+            doc,
+            type_system=type_concept.code_system.system_uri,
+            type_code=type_concept.code,
+            type_display=type_concept.display,
+            binary_content_type=binary_content_type,
+        )
         AuditService(self.db).emit(
             actor="system",
             operation="create",
@@ -125,15 +188,13 @@ class DocumentReferenceMapper(BaseMapper):
         return out
 
     def read(self, id: str) -> dict[str, Any] | None:
-        doc = self.db.get(SomDocument, to_uuid(id))
-        return self._to_fhir(doc) if doc else None
+        row = self.db.execute(_row_select().where(SomDocument.id == to_uuid(id))).first()
+        return self._row_to_fhir(row) if row else None
 
-    def update(self, id: str, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any] | None:
-        doc = self.db.get(SomDocument, to_uuid(id))
-        if not doc:
-            return None
-
-        status = body.get("status") or doc.status
+    def update(
+        self, id: str, body: dict[str, Any], *, correlation_id: str | None, expected_version: int | None = None
+    ) -> dict[str, Any] | None:
+        did = to_uuid(id)
         type_cc = body.get("type") or {}
         coding = TerminologyService.pick_coding(type_cc)
         type_concept = TerminologyService(self.db).normalize_concept(
@@ -145,113 +206,101 @@ class DocumentReferenceMapper(BaseMapper):
         )
 
         date_time = body.get("date")
-        doc_dt = _parse_dt(date_time) if date_time else doc.date_time
-        title = body.get("description") or body.get("title") or doc.title
+        values: dict[str, Any] = {
+            # Elements the body leaves out keep their stored values.
+            "status": body.get("status") or SomDocument.status,
+            "type_concept_id": type_concept.id,
+            "date_time": _parse_dt(date_time) if date_time else SomDocument.date_time,
+            "title": body.get("description") or body.get("title") or SomDocument.title,
+            "description": body.get("description") or SomDocument.description,
+        }
 
-        encounter_id = doc.encounter_id
         if body.get("context") is not None:
             encounter_id = self._parse_encounter_id(body)
             if encounter_id:
                 enc = self.db.get(SomEncounter, encounter_id)
                 if not enc:
                     raise ValueError("Encounter not found")
-                if enc.patient_id != doc.patient_id:
+                patient_id = self._patient_id(did)
+                if patient_id is None:
+                    return None
+                if enc.patient_id != patient_id:
                     raise ValueError("Encounter.patient must match DocumentReference.patient")
+            values["encounter_id"] = encounter_id
 
         content = (body.get("content") or [{}])[0]
         attachment = content.get("attachment") or {}
         url = attachment.get("url")
         if url and isinstance(url, str) and url.startswith("Binary/"):
             bid = to_uuid(url.split("/", 1)[1])
-            if not self.db.get(SomBinary, bid):
+            if self._binary_content_type(bid) is None:
                 raise ValueError("Binary not found for attachment.url")
-            doc.binary_id = bid
+            values["binary_id"] = bid
 
-        prov = ProvenanceService(self.db).create(
+        prov = ProvenanceService.values(
             activity="update",
             author=None,
             correlation_id=correlation_id,
             target_resource_type=self.resource_type,
-            target_resource_id=str(doc.id),
+            target_resource_id=str(did),
             target_som_table="som_document",
-            target_som_id=str(doc.id),
+            target_som_id=str(did),
         )
-        doc.status = status
-        doc.type_concept_id = type_concept.id
-        doc.date_time = doc_dt
-        doc.title = title
-        doc.description = body.get("description") or doc.description
-        doc.encounter_id = encounter_id
-        doc.version += 1
-        doc.updated_provenance_id = prov.id
-
-        out = self._to_fhir(doc)
+        out = self._compare_and_swap(did, values, expected_version=expected_version, provenance=prov)
+        if out is None:
+            return None
         AuditService(self.db).emit(
             actor="system",
             operation="update",
             correlation_id=correlation_id,
-            provenance_id=prov.id,
+            provenance_id=prov["id"],
             resource_type=self.resource_type,
-            resource_id=doc.id,
+            resource_id=did,
             som_table="som_document",
-            som_id=doc.id,
+            som_id=did,
             request_payload=body,
             result_payload=out,
         )
         return out
 
-    def search(self, *, params: dict[str, Any], count: int, sort: str | None) -> dict[str, Any]:
-        stmt = select(SomDocument)
-        patient = params.get("patient")
-        if patient:
-            pid = patient.split("/")[-1]
-            stmt = stmt.where(SomDocument.patient_id == to_uuid(pid))
-        encounter = params.get("encounter")
-        if encounter:
-            eid = encounter.split("/")[-1]
-            stmt = stmt.where(SomDocument.encounter_id == to_uuid(eid))
-        date_param = params.get("date")
-        if date_param:
-            parts = date_param if isinstance(date_param, list) else [date_param]
-            for p in parts:
-                if p.startswith("ge"):
-                    stmt = stmt.where(SomDocument.date_time >= _parse_dt(p[2:]))
-                if p.startswith("le"):
-                    stmt = stmt.where(SomDocument.date_time <= _parse_dt(p[2:]))
-        type_param = params.get("type")
-        if type_param:
-            if "|" in type_param:
-                system, code = type_param.split("|", 1)
-                from app.db.models import SomCodeSystem, SomConcept
-
-                sub = (
-                    select(SomConcept.id)
-                    .join(SomCodeSystem, SomConcept.code_system_id == SomCodeSystem.id)
-                    .where(SomCodeSystem.system_uri == system)
-                    .where(SomConcept.code == code)
-                )
-                stmt = stmt.where(SomDocument.type_concept_id.in_(sub))
+    def _search_statement(self, params: dict[str, Any], sort: str | None, *, strict: bool = True):
+        stmt = super()._search_statement(params, sort, strict=strict)
         # Postgres expects: "date_time DESC NULLS LAST" (not "date_time NULLS LAST DESC").
-        stmt = stmt.order_by(SomDocument.date_time.desc().nullslast(), SomDocument.updated_time.desc()).limit(count)
-        items = self.db.execute(stmt).scalars().all()
-        return bundle(entries=[self._to_fhir(d) for d in items], total=len(items))
+        return stmt.order_by(SomDocument.date_time.desc().nullslast(), SomDocument.updated_time.desc())
+
+    def _binary_content_type(self, binary_id) -> str | None:
+        # Existence check that doesn't pull the payload into the session.
+        return self.db.execute(select(SomBinary.content_type).where(SomBinary.id == binary_id)).scalar_one_or_none()
+
+    def _select_rows(self):
+        return _row_select()
+
+    def _row_to_fhir(self, r) -> dict[str, Any]:
+        # `r` is a flat row from _row_select; it carries the same attributes _to_fhir reads from SomDocument.
+        return self._to_fhir(
+            r,
+            type_system=r.type_system,
+            type_code=r.type_code,
+            type_display=r.type_display,
+            binary_content_type=r.binary_content_type,
+        )
 
-    def _to_fhir(self, doc: SomDocument) -> dict[str, Any]:
+    def _to_fhir(
+        self,
+        doc: SomDocument,
+        *,
+        type_system: str,
+        type_code: str,
+        type_display: str | None,
+        binary_content_type: str | None,
+    ) -> dict[str, Any]:
         out: dict[str, Any] = {
             "resourceType": self.resource_type,
             "id": str(doc.id),
             "meta": fhir_meta(version=doc.version, last_updated=doc.updated_time),
             "status": doc.status,
             "subject": {"reference": f"Patient/{doc.patient_id}"},
-            "type": {
-                "coding": [
-                    {
-                        "system": doc.type_concept.code_system.system_uri,
-                        "code": doc.type_concept.code,
-                        "display": doc.type_concept.display,
-                    }
-                ]
-            },
+            "type": {"coding": [{"system": type_system, "code": type_code, "display": type_display}]},
         }
         if doc.encounter_id:
             out["context"] = {"encounter": [{"reference": f"Encounter/{doc.encounter_id}"}]}
@@ -260,5 +309,5 @@ class DocumentReferenceMapper(BaseMapper):
         if doc.description:
             out["description"] = doc.description
         if doc.binary_id:
-            out["content"] = [{"attachment": {"url": f"Binary/{doc.binary_id}", "contentType": doc.binary.content_type if doc.binary else None}}]
+            out["content"] = [{"attachment": {"url": f"Binary/{doc.binary_id}", "contentType": binary_content_type}}]
         return out
@@ -7,13 +7,39 @@ from sqlalchemy import select
 
 from app.db.models import SomEncounter, SomPatient
 from app.services.audit import AuditService
-from app.services.mapping.fhir_utils import bundle, fhir_meta, parse_reference, to_uuid
+from app.services.mapping.fhir_utils import fhir_meta, parse_reference, to_uuid
 from app.services.mapping.resources.base import BaseMapper
+from app.services.mapping.search_params import SearchParam
 from app.services.provenance import ProvenanceService
 
 
+# Columns read by _to_fhir; used by search() instead of loading SomEncounter entities.
+_COLUMNS = (
+    SomEncounter.id,
+    SomEncounter.version,
+    SomEncounter.updated_time,
+    SomEncounter.patient_id,
+    SomEncounter.status,
+    SomEncounter.start_time,
+    SomEncounter.end_time,
+)
+
+
 class EncounterMapper(BaseMapper):
     resource_type = "Encounter"
+    model = SomEncounter
+    reference_columns = {"patient": "patient_id", "subject": "patient_id"}
+    search_params = {
+        "patient": SearchParam("reference", (SomEncounter.patient_id,)),
+        "subject": SearchParam("reference", (SomEncounter.patient_id,)),
+        "status": SearchParam("token", (SomEncounter.status,)),
+        "date": SearchParam("date", (SomEncounter.start_time,)),
+    }
+    element_columns = {
+        "subject": ("patient_id",),
+        "status": ("status",),
+        "period": ("start_time", "end_time"),
+    }
 
     def create(self, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any]:
         if correlation_id:
@@ -76,69 +102,52 @@ class EncounterMapper(BaseMapper):
         enc = self.db.get(SomEncounter, to_uuid(id))
         return self._to_fhir(enc) if enc else None
 
-    def update(self, id: str, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any] | None:
-        enc = self.db.get(SomEncounter, to_uuid(id))
-        if not enc:
-            return None
+    def update(
+        self, id: str, body: dict[str, Any], *, correlation_id: str | None, expected_version: int | None = None
+    ) -> dict[str, Any] | None:
+        eid = to_uuid(id)
         period = body.get("period") or {}
         start = period.get("start")
         end = period.get("end")
         start_dt = dt.datetime.fromisoformat(start.replace("Z", "+00:00")) if start else None
         end_dt = dt.datetime.fromisoformat(end.replace("Z", "+00:00")) if end else None
 
-        prov = ProvenanceService(self.db).create(
+        prov = ProvenanceService.values(
             activity="update",
             author=None,
             correlation_id=correlation_id,
             target_resource_type=self.resource_type,
-            target_resource_id=str(enc.id),
+            target_resource_id=str(eid),
             target_som_table="som_encounter",
-            target_som_id=str(enc.id),
+            target_som_id=str(eid),
         )
-        enc.status = body.get("status")
-        enc.start_time = start_dt
-        enc.end_time = end_dt
-        enc.version += 1
-        enc.updated_provenance_id = prov.id
-        enc.extensions = enc.extensions or {}
-        out = self._to_fhir(enc)
+        out = self._compare_and_swap(
+            eid,
+            {"status": body.get("status"), "start_time": start_dt, "end_time": end_dt},
+            expected_version=expected_version,
+            provenance=prov,
+        )
+        if out is None:
+            return None
         AuditService(self.db).emit(
             actor="system",
             operation="update",
             correlation_id=correlation_id,
-            provenance_id=prov.id,
+            provenance_id=prov["id"],
             resource_type=self.resource_type,
-            resource_id=enc.id,
+            resource_id=eid,
             som_table="som_encounter",
-            som_id=enc.id,
+            som_id=eid,
             request_payload=body,
             result_payload=out,
         )
         return out
 
-    def search(self, *, params: dict[str, Any], count: int, sort: str | None) -> dict[str, Any]:
-        stmt = select(SomEncounter)
-        patient = params.get("patient")
-        if patient:
-            pid = patient.split("/")[-1]
-            stmt = stmt.where(SomEncounter.patient_id == to_uuid(pid))
-        status = params.get("status")
-        if status:
-            stmt = stmt.where(SomEncounter.status == status)
-        # date range: date=ge... and/or date=le...
-        date_param = params.get("date")
-        if date_param:
-            parts = date_param if isinstance(date_param, list) else [date_param]
-            for p in parts:
-                if p.startswith("ge"):
-                    d = dt.datetime.fromisoformat(p[2:].replace("Z", "+00:00"))
-                    stmt = stmt.where(SomEncounter.start_time >= d)
-                if p.startswith("le"):
-                    d = dt.datetime.fromisoformat(p[2:].replace("Z", "+00:00"))
-                    stmt = stmt.where(SomEncounter.start_time <= d)
-        stmt = stmt.limit(count)
-        items = self.db.execute(stmt).scalars().all()
-        return bundle(entries=[self._to_fhir(i) for i in items], total=len(items))
+    def _select_rows(self):
+        return select(*_COLUMNS)
+
+    def _row_to_fhir(self, r) -> dict[str, Any]:
+        return self._to_fhir(r)
 
     def _to_fhir(self, e: SomEncounter) -> dict[str, Any]:
         out: dict[str, Any] = {
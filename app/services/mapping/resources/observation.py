@@ -6,11 +6,14 @@ from decimal import Decimal
 from typing import Any
 
 from sqlalchemy import desc, select
+from sqlalchemy.orm import aliased
 
-from app.db.models import SomConcept, SomEncounter, SomObservation, SomObservationVersion, SomPatient
+from app.db.models import SomCodeSystem, SomConcept, SomEncounter, SomObservation, SomPatient
 from app.services.audit import AuditService
-from app.services.mapping.fhir_utils import bundle, fhir_meta, parse_reference, to_uuid
+from app.services.mapping.fhir_utils import fhir_meta, parse_reference, to_uuid
 from app.services.mapping.resources.base import BaseMapper
+from app.services.mapping.search_params import SearchParam
+from app.services import units
 from app.services.provenance import ProvenanceService
 from app.services.terminology import TerminologyService
 
@@ -18,6 +21,37 @@ from app.services.terminology import TerminologyService
 _UNIT_RE = re.compile(r"^[A-Za-z/%][A-Za-z0-9/%]*$")
 
 
+def _quantity_from_fhir(vq: dict[str, Any], coding: dict[str, Any]) -> tuple[float | None, str, Decimal | None, str]:
+    """(value, unit, canonical value, canonical unit) for a valueQuantity; raises ValueError on a bad unit."""
+    if vq.get("unit") is None and vq.get("code") is None:
+        raise ValueError("Quantity unit required")
+    unit = str(vq.get("unit") if vq.get("unit") is not None else vq.get("code"))
+    # A UCUM `code` is authoritative for conversion; `unit` is the display form.
+    ucum = str(vq["code"]) if vq.get("code") and vq.get("system") in (None, units.UCUM_SYSTEM) else unit
+    if ucum not in units.KNOWN_UNITS and not _UNIT_RE.match(ucum):
+        raise ValueError("Quantity unit must match UCUM-like rule")
+    value = float(vq.get("value")) if vq.get("value") is not None else None
+    analyte = coding["code"] if coding.get("system") == units.LOINC_SYSTEM else None
+    canonical_value, canonical_unit = units.canonical(vq.get("value"), ucum, analyte=analyte)
+    return value, unit, canonical_value, canonical_unit
+
+
+def _value_quantity_conversions(system: str | None, unit: str) -> list[tuple[Any, units.Conversion]]:
+    if system and system != units.UCUM_SYSTEM:
+        return [(None, units.Conversion(unit, Decimal(1)))]
+    out = []
+    for analytes, conv in units.search_conversions(unit):
+        restrict = None
+        if analytes:
+            restrict = SomObservation.code_concept_id.in_(
+                select(SomConcept.id)
+                .join(SomCodeSystem, SomConcept.code_system_id == SomCodeSystem.id)
+                .where(SomCodeSystem.system_uri == units.LOINC_SYSTEM, SomConcept.code.in_(analytes))
+            )
+        out.append((restrict, conv))
+    return out
+
+
 def _parse_dt(s: str) -> dt.datetime:
     return dt.datetime.fromisoformat(s.replace("Z", "+00:00"))
 
@@ -32,8 +66,75 @@ def _category_from_fhir(body: dict[str, Any]) -> str | None:
     return None
 
 
+_CODE = aliased(SomConcept, name="code_concept")
+_CODE_SYSTEM = aliased(SomCodeSystem, name="code_system")
+_VALUE = aliased(SomConcept, name="value_concept")
+_VALUE_SYSTEM = aliased(SomCodeSystem, name="value_system")
+
+
+def _row_select():
+    """Observation columns plus code/value concept columns, joined in SQL so serialization never lazy-loads."""
+    o = SomObservation
+    return (
+        select(
+            o.id,
+            o.version,
+            o.updated_time,
+            o.patient_id,
+            o.encounter_id,
+            o.status,
+            o.category,
+            o.effective_time,
+            o.value_type,
+            o.value_quantity_value,
+            o.value_quantity_unit,
+            _CODE_SYSTEM.system_uri.label("code_system"),
+            _CODE.code.label("code_code"),
+            _CODE.display.label("code_display"),
+            _VALUE_SYSTEM.system_uri.label("value_system"),
+            _VALUE.code.label("value_code"),
+            _VALUE.display.label("value_display"),
+        )
+        .select_from(o)
+        .join(_CODE, _CODE.id == o.code_concept_id)
+        .join(_CODE_SYSTEM, _CODE_SYSTEM.id == _CODE.code_system_id)
+        .outerjoin(_VALUE, _VALUE.id == o.value_concept_id)
+        .outerjoin(_VALUE_SYSTEM, _VALUE_SYSTEM.id == _VALUE.code_system_id)
+    )
+
+
 class ObservationMapper(BaseMapper):
     resource_type = "Observation"
+    model = SomObservation
+    reference_columns = {"patient": "patient_id", "subject": "patient_id", "encounter": "encounter_id"}
+    search_params = {
+        "patient": SearchParam("reference", (SomObservation.patient_id,)),
+        "subject": SearchParam("reference", (SomObservation.patient_id,)),
+        "encounter": SearchParam("reference", (SomObservation.encounter_id,)),
+        "status": SearchParam("token", (SomObservation.status,)),
+        "category": SearchParam(
+            "token", (SomObservation.category,), value_map={"laboratory": "lab", "vital-signs": "vital"}
+        ),
+        "code": SearchParam("token", (SomObservation.code_concept_id,), concept=True),
+        "date": SearchParam("date", (SomObservation.effective_time,)),
+        "value-quantity": SearchParam(
+            "quantity",
+            (SomObservation.value_quantity_canonical,),
+            unit_column=SomObservation.value_quantity_canonical_unit,
+            unit_conversions=_value_quantity_conversions,
+            raw_column=SomObservation.value_quantity_value,
+        ),
+    }
+    element_columns = {
+        "status": ("status",),
+        "subject": ("patient_id",),
+        "encounter": ("encounter_id",),
+        "effectiveDateTime": ("effective_time",),
+        "code": ("code_system", "code_code", "code_display"),
+        "category": ("category",),
+        "valueQuantity": ("value_type", "value_quantity_value", "value_quantity_unit"),
+        "valueCodeableConcept": ("value_type", "value_system", "value_code", "value_display"),
+    }
 
     def create(self, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any]:
         if correlation_id:
@@ -86,18 +187,14 @@ class ObservationMapper(BaseMapper):
         value_type = None
         vq_value = None
         vq_unit = None
+        vq_canonical = None
+        vq_canonical_unit = None
         vc_id = None
+        vc = None
 
         if "valueQuantity" in body:
-            vq = body["valueQuantity"]
-            if vq.get("unit") is None:
-                raise ValueError("Quantity unit required")
-            unit = str(vq.get("unit"))
-            if unit not in {"%", "mg/dL", "mmol/L", "mmHg", "bpm"} and not _UNIT_RE.match(unit):
-                raise ValueError("Quantity unit must match UCUM-like rule")
             value_type = "quantity"
-            vq_value = float(vq.get("value")) if vq.get("value") is not None else None
-            vq_unit = unit
+            vq_value, vq_unit, vq_canonical, vq_canonical_unit = _quantity_from_fhir(body["valueQuantity"], coding)
         elif "valueCodeableConcept" in body:
             cc = body["valueCodeableConcept"]
             c = TerminologyService.pick_coding(cc)
@@ -122,6 +219,8 @@ class ObservationMapper(BaseMapper):
             value_type=value_type,
             value_quantity_value=vq_value,
             value_quantity_unit=vq_unit,
+            value_quantity_canonical=vq_canonical,
+            value_quantity_canonical_unit=vq_canonical_unit,
             value_concept_id=vc_id,
             created_provenance_id=prov.id,
             updated_provenance_id=None,
@@ -136,8 +235,7 @@ class ObservationMapper(BaseMapper):
             target_som_table="som_observation",
             target_som_id=str(obs.id),
         )
-        self._write_version(obs, provenance_id=prov.id)
-        out = self._to_fhir(obs)
+        out = self._to_fhir_orm(obs, code_concept=code_concept, value_concept=vc)
         AuditService(self.db).emit(
             actor="system",
             operation="create",
@@ -153,19 +251,21 @@ class ObservationMapper(BaseMapper):
         return out
 
     def read(self, id: str) -> dict[str, Any] | None:
-        obs = self.db.get(SomObservation, to_uuid(id))
-        return self._to_fhir(obs) if obs else None
-
-    def update(self, id: str, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any] | None:
-        obs = self.db.get(SomObservation, to_uuid(id))
-        if not obs:
-            return None
+        row = self.db.execute(_row_select().where(SomObservation.id == to_uuid(id))).first()
+        return self._row_to_fhir(row) if row else None
 
-        status = body.get("status") or obs.status
+    def update(
+        self, id: str, body: dict[str, Any], *, correlation_id: str | None, expected_version: int | None = None
+    ) -> dict[str, Any] | None:
+        oid = to_uuid(id)
         effective = body.get("effectiveDateTime")
-        effective_dt = _parse_dt(effective) if effective else obs.effective_time
 
-        encounter_id = obs.encounter_id
+        values: dict[str, Any] = {
+            # Elements the body leaves out keep their stored values.
+            "status": body.get("status") or SomObservation.status,
+            "category": _category_from_fhir(body) or SomObservation.category,
+            "effective_time": _parse_dt(effective) if effective else SomObservation.effective_time,
+        }
         if body.get("encounter", {}).get("reference"):
             rt, rid = parse_reference(body["encounter"]["reference"])
             if rt != "Encounter":
@@ -174,8 +274,12 @@ class ObservationMapper(BaseMapper):
             enc = self.db.get(SomEncounter, encounter_id)
             if not enc:
                 raise ValueError("Encounter not found")
-            if enc.patient_id != obs.patient_id:
+            patient_id = self._patient_id(oid)
+            if patient_id is None:
+                return None
+            if enc.patient_id != patient_id:
                 raise ValueError("Encounter.patient must match Observation.patient")
+            values["encounter_id"] = encounter_id
 
         code_cc = body.get("code") or {}
         coding = TerminologyService.pick_coding(code_cc)
@@ -186,22 +290,18 @@ class ObservationMapper(BaseMapper):
             version=coding.get("version"),
             correlation_id=correlation_id,
         )
+        values["code_concept_id"] = code_concept.id
 
         value_type = None
         vq_value = None
         vq_unit = None
+        vq_canonical = None
+        vq_canonical_unit = None
         vc_id = None
 
         if "valueQuantity" in body:
-            vq = body["valueQuantity"]
-            if vq.get("unit") is None:
-                raise ValueError("Quantity unit required")
-            unit = str(vq.get("unit"))
-            if unit not in {"%", "mg/dL", "mmol/L", "mmHg", "bpm"} and not _UNIT_RE.match(unit):
-                raise ValueError("Quantity unit must match UCUM-like rule")
             value_type = "quantity"
-            vq_value = float(vq.get("value")) if vq.get("value") is not None else None
-            vq_unit = unit
+            vq_value, vq_unit, vq_canonical, vq_canonical_unit = _quantity_from_fhir(body["valueQuantity"], coding)
         elif "valueCodeableConcept" in body:
             cc = body["valueCodeableConcept"]
             c = TerminologyService.pick_coding(cc)
@@ -214,160 +314,95 @@ class ObservationMapper(BaseMapper):
             )
             value_type = "codeable_concept"
             vc_id = vc.id
+        values.update(
+            value_type=value_type,
+            value_quantity_value=vq_value,
+            value_quantity_unit=vq_unit,
+            value_quantity_canonical=vq_canonical,
+            value_quantity_canonical_unit=vq_canonical_unit,
+            value_concept_id=vc_id,
+        )
 
-        prov = ProvenanceService(self.db).create(
+        prov = ProvenanceService.values(
             activity="update",
             author=None,
             correlation_id=correlation_id,
             target_resource_type=self.resource_type,
-            target_resource_id=str(obs.id),
+            target_resource_id=str(oid),
             target_som_table="som_observation",
-            target_som_id=str(obs.id),
+            target_som_id=str(oid),
         )
-        obs.status = status
-        obs.category = _category_from_fhir(body) or obs.category
-        obs.code_concept_id = code_concept.id
-        obs.effective_time = effective_dt
-        obs.encounter_id = encounter_id
-        obs.value_type = value_type
-        obs.value_quantity_value = vq_value
-        obs.value_quantity_unit = vq_unit
-        obs.value_concept_id = vc_id
-        obs.version += 1
-        obs.updated_provenance_id = prov.id
-        obs.extensions = obs.extensions or {}
-
-        self._write_version(obs, provenance_id=prov.id)
-        out = self._to_fhir(obs)
+        out = self._compare_and_swap(oid, values, expected_version=expected_version, provenance=prov)
+        if out is None:
+            return None
         AuditService(self.db).emit(
             actor="system",
             operation="update",
             correlation_id=correlation_id,
-            provenance_id=prov.id,
+            provenance_id=prov["id"],
             resource_type=self.resource_type,
-            resource_id=obs.id,
+            resource_id=oid,
             som_table="som_observation",
-            som_id=obs.id,
+            som_id=oid,
             request_payload=body,
             result_payload=out,
         )
         return out
 
-    def search(self, *, params: dict[str, Any], count: int, sort: str | None) -> dict[str, Any]:
-        stmt = select(SomObservation)
-        patient = params.get("patient")
-        if patient:
-            pid = patient.split("/")[-1]
-            stmt = stmt.where(SomObservation.patient_id == to_uuid(pid))
-
-        encounter = params.get("encounter")
-        if encounter:
-            enc_id = encounter.split("/")[-1]
-            stmt = stmt.where(SomObservation.encounter_id == to_uuid(enc_id))
-
-        code = params.get("code")
-        if code:
-            from app.db.models import SomCodeSystem, SomConcept
-
-            if "|" in code:
-                system, c = code.split("|", 1)
-                sub = (
-                    select(SomConcept.id)
-                    .join(SomCodeSystem, SomConcept.code_system_id == SomCodeSystem.id)
-                    .where(SomCodeSystem.system_uri == system)
-                    .where(SomConcept.code == c)
-                )
-            else:
-                sub = select(SomConcept.id).where(SomConcept.code == code)
-            stmt = stmt.where(SomObservation.code_concept_id.in_(sub))
-
-        category = params.get("category")
-        if category:
-            if category in ("lab", "laboratory"):
-                stmt = stmt.where(SomObservation.category == "lab")
-            if category in ("vital", "vital-signs"):
-                stmt = stmt.where(SomObservation.category == "vital")
-
-        date_param = params.get("date")
-        if date_param:
-            parts = date_param if isinstance(date_param, list) else [date_param]
-            for p in parts:
-                if p.startswith("ge"):
-                    d = _parse_dt(p[2:])
-                    stmt = stmt.where(SomObservation.effective_time >= d)
-                if p.startswith("le"):
-                    d = _parse_dt(p[2:])
-                    stmt = stmt.where(SomObservation.effective_time <= d)
-
-        status = params.get("status")
-        if not status:
+    def _search_statement(self, params: dict[str, Any], sort: str | None, *, strict: bool = True):
+        stmt = super()._search_statement(params, sort, strict=strict)
+        if not any(k.partition(":")[0] == "status" for k in params):
             stmt = stmt.where(SomObservation.status != "entered-in-error")
-
-        if sort == "-date" or sort == "_lastUpdated" or sort == "-_lastUpdated":
-            stmt = stmt.order_by(desc(SomObservation.effective_time))
-        else:
-            stmt = stmt.order_by(desc(SomObservation.effective_time))
-
-        stmt = stmt.limit(count)
-        items = self.db.execute(stmt).scalars().all()
-        return bundle(entries=[self._to_fhir(i) for i in items], total=len(items))
-
-    def history(self, id: str) -> dict[str, Any]:
-        obs = self.db.get(SomObservation, to_uuid(id))
-        if not obs:
-            raise ValueError("Not found")
-        versions = (
-            self.db.execute(
-                select(SomObservationVersion)
-                .where(SomObservationVersion.observation_id == obs.id)
-                .order_by(SomObservationVersion.version.asc())
-            )
-            .scalars()
-            .all()
+        return stmt.order_by(desc(SomObservation.effective_time))
+
+    def _to_fhir_orm(self, o: SomObservation, *, code_concept: SomConcept, value_concept: SomConcept | None) -> dict[str, Any]:
+        # Write path: the concepts were just normalized, so their code systems are already in the session.
+        return self._to_fhir(
+            o,
+            code_system=code_concept.code_system.system_uri,
+            code_code=code_concept.code,
+            code_display=code_concept.display,
+            value_system=value_concept.code_system.system_uri if value_concept else None,
+            value_code=value_concept.code if value_concept else None,
+            value_display=value_concept.display if value_concept else None,
         )
-        entries = [self._to_fhir_from_version(obs=obs, v=v) for v in versions]
-        return {
-            "resourceType": "Bundle",
-            "type": "history",
-            "total": len(entries),
-            "entry": [{"resource": e} for e in entries],
-        }
 
-    def _write_version(self, obs: SomObservation, *, provenance_id) -> None:
-        v = SomObservationVersion(
-            observation_id=obs.id,
-            version=obs.version,
-            status=obs.status,
-            category=obs.category,
-            code_concept_id=obs.code_concept_id,
-            effective_time=obs.effective_time,
-            value_type=obs.value_type,
-            value_quantity_value=obs.value_quantity_value,
-            value_quantity_unit=obs.value_quantity_unit,
-            value_concept_id=obs.value_concept_id,
-            provenance_id=provenance_id,
-            extensions=obs.extensions,
+    def _select_rows(self):
+        return _row_select()
+
+    def _row_to_fhir(self, r) -> dict[str, Any]:
+        # Read/search path: `r` is a flat row from _row_select.
+        return self._to_fhir(
+            r,
+            code_system=r.code_system,
+            code_code=r.code_code,
+            code_display=r.code_display,
+            value_system=r.value_system,
+            value_code=r.value_code,
+            value_display=r.value_display,
         )
-        self.db.add(v)
 
-    def _to_fhir(self, o: SomObservation) -> dict[str, Any]:
+    def _to_fhir(
+        self,
+        o,
+        *,
+        code_system: str,
+        code_code: str,
+        code_display: str | None,
+        value_system: str | None = None,
+        value_code: str | None = None,
+        value_display: str | None = None,
+    ) -> dict[str, Any]:
         out: dict[str, Any] = {
             "resourceType": self.resource_type,
             "id": str(o.id),
             "meta": fhir_meta(version=o.version, last_updated=o.updated_time),
             "status": o.status,
             "subject": {"reference": f"Patient/{o.patient_id}"},
-            "effectiveDateTime": o.effective_time.isoformat().replace("+00:00", "Z"),
-            "code": {
-                "coding": [
-                    {
-                        "system": o.code_concept.code_system.system_uri,
-                        "code": o.code_concept.code,
-                        "display": o.code_concept.display,
-                    }
-                ]
-            },
+            "code": {"coding": [{"system": code_system, "code": code_code, "display": code_display}]},
         }
+        if o.effective_time:
+            out["effectiveDateTime"] = o.effective_time.isoformat().replace("+00:00", "Z")
         if o.encounter_id:
             out["encounter"] = {"reference": f"Encounter/{o.encounter_id}"}
         if o.category:
@@ -375,53 +410,6 @@ class ObservationMapper(BaseMapper):
             out["category"] = [{"coding": [{"code": code}]}]
         if o.value_type == "quantity":
             out["valueQuantity"] = {"value": float(o.value_quantity_value) if o.value_quantity_value is not None else None, "unit": o.value_quantity_unit}
-        if o.value_type == "codeable_concept" and o.value_concept:
-            out["valueCodeableConcept"] = {
-                "coding": [
-                    {
-                        "system": o.value_concept.code_system.system_uri,
-                        "code": o.value_concept.code,
-                        "display": o.value_concept.display,
-                    }
-                ]
-            }
-        return out
-
-    def _to_fhir_from_version(self, *, obs: SomObservation, v: SomObservationVersion) -> dict[str, Any]:
-        code = self.db.get(SomConcept, v.code_concept_id)
-        value_concept = self.db.get(SomConcept, v.value_concept_id) if v.value_concept_id else None
-        out: dict[str, Any] = {
-            "resourceType": self.resource_type,
-            "id": str(obs.id),
-            "meta": {"versionId": str(v.version), "lastUpdated": v.recorded_time.isoformat().replace("+00:00", "Z")},
-            "status": v.status,
-            "subject": {"reference": f"Patient/{obs.patient_id}"},
-            "effectiveDateTime": v.effective_time.isoformat().replace("+00:00", "Z"),
-            "code": {
-                "coding": [
-                    {
-                        "system": code.code_system.system_uri if code else None,
-                        "code": code.code if code else None,
-                        "display": code.display if code else None,
-                    }
-                ]
-            },
-        }
-        if v.category:
-            out["category"] = [{"coding": [{"code": "laboratory" if v.category == "lab" else "vital-signs" if v.category == "vital" else v.category}]}]
-        if v.value_type == "quantity":
-            out["valueQuantity"] = {
-                "value": float(v.value_quantity_value) if v.value_quantity_value is not None else None,
-                "unit": v.value_quantity_unit,
-            }
-        if v.value_type == "codeable_concept" and value_concept:
-            out["valueCodeableConcept"] = {
-                "coding": [
-                    {
-                        "system": value_concept.code_system.system_uri,
-                        "code": value_concept.code,
-                        "display": value_concept.display,
-                    }
-                ]
-            }
+        if o.value_type == "codeable_concept" and value_code is not None:
+            out["valueCodeableConcept"] = {"coding": [{"system": value_system, "code": value_code, "display": value_display}]}
         return out
@@ -6,13 +6,28 @@ from sqlalchemy import select
 
 from app.db.models import SomOrganization
 from app.services.audit import AuditService
-from app.services.mapping.fhir_utils import bundle, fhir_meta, to_uuid
+from app.services.mapping.fhir_utils import fhir_meta, to_uuid
 from app.services.mapping.resources.base import BaseMapper
+from app.services.mapping.search_params import SearchParam
 from app.services.provenance import ProvenanceService
 
 
+# Columns read by _to_fhir (search path).
+_COLUMNS = (
+    SomOrganization.id,
+    SomOrganization.version,
+    SomOrganization.updated_time,
+    SomOrganization.name,
+)
+
+
 class OrganizationMapper(BaseMapper):
     resource_type = "Organization"
+    model = SomOrganization
+    search_params = {"name": SearchParam("string", (SomOrganization.name,))}
+    element_columns = {
+        "name": ("name",),
+    }
 
     def create(self, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any]:
         if correlation_id:
@@ -59,42 +74,43 @@ class OrganizationMapper(BaseMapper):
         org = self.db.get(SomOrganization, to_uuid(id))
         return self._to_fhir(org) if org else None
 
-    def update(self, id: str, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any] | None:
-        org = self.db.get(SomOrganization, to_uuid(id))
-        if not org:
-            return None
-        prov = ProvenanceService(self.db).create(
+    def update(
+        self, id: str, body: dict[str, Any], *, correlation_id: str | None, expected_version: int | None = None
+    ) -> dict[str, Any] | None:
+        oid = to_uuid(id)
+        prov = ProvenanceService.values(
             activity="update",
             author=None,
             correlation_id=correlation_id,
             target_resource_type=self.resource_type,
-            target_resource_id=str(org.id),
+            target_resource_id=str(oid),
             target_som_table="som_organization",
-            target_som_id=str(org.id),
+            target_som_id=str(oid),
         )
-        org.name = body.get("name")
-        org.version += 1
-        org.updated_provenance_id = prov.id
-        org.extensions = org.extensions or {}
-        out = self._to_fhir(org)
+        out = self._compare_and_swap(
+            oid, {"name": body.get("name")}, expected_version=expected_version, provenance=prov
+        )
+        if out is None:
+            return None
         AuditService(self.db).emit(
             actor="system",
             operation="update",
             correlation_id=correlation_id,
-            provenance_id=prov.id,
+            provenance_id=prov["id"],
             resource_type=self.resource_type,
-            resource_id=org.id,
+            resource_id=oid,
             som_table="som_organization",
-            som_id=org.id,
+            som_id=oid,
             request_payload=body,
             result_payload=out,
         )
         return out
 
-    def search(self, *, params: dict[str, Any], count: int, sort: str | None) -> dict[str, Any]:
-        stmt = select(SomOrganization).limit(count)
-        items = self.db.execute(stmt).scalars().all()
-        return bundle(entries=[self._to_fhir(o) for o in items], total=len(items))
+    def _select_rows(self):
+        return select(*_COLUMNS)
+
+    def _row_to_fhir(self, r) -> dict[str, Any]:
+        return self._to_fhir(r)
 
     def _to_fhir(self, o: SomOrganization) -> dict[str, Any]:
         return {
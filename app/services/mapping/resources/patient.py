@@ -1,19 +1,91 @@
 from __future__ import annotations
 
 import datetime as dt
+import unicodedata
 from typing import Any
 
-from sqlalchemy import or_, select
+from sqlalchemy import func, select, text, union
+from sqlalchemy.orm import Session
 
 from app.db.models import SomPatient
 from app.services.audit import AuditService
 from app.services.mapping.fhir_utils import bundle, fhir_meta, to_uuid
 from app.services.mapping.resources.base import BaseMapper
+from app.services.mapping.search_params import SearchParam
 from app.services.provenance import ProvenanceService
 
 
+# Search selects just what _to_fhir reads; rows come back as plain tuples, not tracked instances.
+_COLUMNS = (
+    SomPatient.id,
+    SomPatient.version,
+    SomPatient.updated_time,
+    SomPatient.identifier_system,
+    SomPatient.identifier_value,
+    SomPatient.name_family,
+    SomPatient.name_given,
+    SomPatient.birth_date,
+)
+
+# $match: candidates come from index-backed blocks (identifier, birth date, name), each capped, so the
+# work per request doesn't grow with the table. Scores are computed in Python over that small set.
+MATCH_BLOCK_LIMIT = 200
+MATCH_GRADES = (("certain", 0.95), ("probable", 0.8), ("possible", 0.6))
+MATCH_GRADE_URL = "http://hl7.org/fhir/StructureDefinition/match-grade"
+
+_trgm_by_url: dict[str, bool] = {}
+
+
+def _normalize(v: str | None) -> str:
+    # Same folding as som_normalize_name() (migration 0007), used for scoring.
+    v = unicodedata.normalize("NFKD", (v or "").lower())
+    return " ".join("".join(ch for ch in v if not unicodedata.combining(ch)).split())
+
+
+def _trigrams(v: str) -> set[str]:
+    # pg_trgm's scheme: each word padded with two leading spaces and one trailing space.
+    out: set[str] = set()
+    for word in v.split():
+        w = f"  {word} "
+        out.update(w[i : i + 3] for i in range(len(w) - 2))
+    return out
+
+
+def name_similarity(a: str, b: str) -> float:
+    ta, tb = _trigrams(a), _trigrams(b)
+    if not ta or not tb:
+        return 0.0
+    return len(ta & tb) / len(ta | tb)
+
+
+def _has_trgm(db: Session) -> bool:
+    url = str(db.get_bind().url)
+    if url not in _trgm_by_url:
+        found = db.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first()
+        _trgm_by_url[url] = found is not None
+    return _trgm_by_url[url]
+
+
 class PatientMapper(BaseMapper):
     resource_type = "Patient"
+    model = SomPatient
+    search_params = {
+        "identifier": SearchParam("token", (SomPatient.identifier_value,), system_column=SomPatient.identifier_system),
+        "name": SearchParam(
+            "string",
+            (SomPatient.name_family, SomPatient.name_given),
+            search_column=SomPatient.name_search,
+            normalizer=func.som_normalize_name,
+        ),
+        "family": SearchParam("string", (SomPatient.name_family,)),
+        "given": SearchParam("string", (SomPatient.name_given,)),
+        "birthdate": SearchParam("date", (SomPatient.birth_date,)),
+    }
+    element_columns = {
+        "identifier": ("identifier_system", "identifier_value"),
+        "name": ("name_family", "name_given"),
+        "birthDate": ("birth_date",),
+    }
 
     def create(self, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any]:
         if correlation_id:
@@ -71,7 +143,9 @@ class PatientMapper(BaseMapper):
         patient = self.db.get(SomPatient, to_uuid(id))
         return self._to_fhir(patient) if patient else None
 
-    def update(self, id: str, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any] | None:
+    def update(
+        self, id: str, body: dict[str, Any], *, correlation_id: str | None, expected_version: int | None = None
+    ) -> dict[str, Any] | None:
         if correlation_id:
             prior = AuditService(self.db).find_idempotent_result(
                 correlation_id=correlation_id,
@@ -82,71 +156,139 @@ class PatientMapper(BaseMapper):
             if prior and prior.get("id") == id:
                 return prior
 
-        patient = self.db.get(SomPatient, to_uuid(id))
-        if not patient:
-            return None
-
+        pid = to_uuid(id)
         identifier = (body.get("identifier") or [{}])[0]
         name = (body.get("name") or [{}])[0]
         birth_date = body.get("birthDate")
         bd = dt.date.fromisoformat(birth_date) if birth_date else None
 
-        prov = ProvenanceService(self.db).create(
+        prov = ProvenanceService.values(
             activity="update",
             author=None,
             correlation_id=correlation_id,
             target_resource_type=self.resource_type,
-            target_resource_id=str(patient.id),
+            target_resource_id=str(pid),
             target_som_table="som_patient",
-            target_som_id=str(patient.id),
+            target_som_id=str(pid),
+        )
+        out = self._compare_and_swap(
+            pid,
+            {
+                "identifier_system": identifier.get("system"),
+                "identifier_value": identifier.get("value"),
+                "name_family": name.get("family"),
+                "name_given": (name.get("given") or [None])[0],
+                "birth_date": bd,
+            },
+            expected_version=expected_version,
+            provenance=prov,
         )
-        patient.identifier_system = identifier.get("system")
-        patient.identifier_value = identifier.get("value")
-        patient.name_family = name.get("family")
-        patient.name_given = (name.get("given") or [None])[0]
-        patient.birth_date = bd
-        patient.version += 1
-        patient.updated_provenance_id = prov.id
-        patient.extensions = patient.extensions or {}
+        if out is None:
+            return None
 
-        out = self._to_fhir(patient)
         AuditService(self.db).emit(
             actor="system",
             operation="update",
             correlation_id=correlation_id,
-            provenance_id=prov.id,
+            provenance_id=prov["id"],
             resource_type=self.resource_type,
-            resource_id=patient.id,
+            resource_id=pid,
             som_table="som_patient",
-            som_id=patient.id,
+            som_id=pid,
             request_payload=body,
             result_payload=out,
         )
         return out
 
-    def search(self, *, params: dict[str, Any], count: int, sort: str | None) -> dict[str, Any]:
-        stmt = select(SomPatient)
-
-        identifier = params.get("identifier")
-        if identifier:
-            if "|" in identifier:
-                system, value = identifier.split("|", 1)
-                stmt = stmt.where(SomPatient.identifier_system == system).where(SomPatient.identifier_value == value)
-            else:
-                stmt = stmt.where(SomPatient.identifier_value == identifier)
-
-        name = params.get("name")
-        if name:
-            like = f"%{name}%"
-            stmt = stmt.where(or_(SomPatient.name_family.ilike(like), SomPatient.name_given.ilike(like)))
-
-        birthdate = params.get("birthdate")
-        if birthdate:
-            stmt = stmt.where(SomPatient.birth_date == dt.date.fromisoformat(birthdate))
-
-        stmt = stmt.limit(count)
-        patients = self.db.execute(stmt).scalars().all()
-        return bundle(entries=[self._to_fhir(p) for p in patients], total=len(patients))
+    def match(self, body: dict[str, Any]) -> dict[str, Any]:
+        """
+        Patient/$match. `body` is a Parameters resource with a `resource` (Patient) part and optional `count`
+        and `onlyCertainMatches`. Returns a searchset ordered by score, graded with the match-grade extension.
+        """
+        if body.get("resourceType") != "Parameters":
+            raise ValueError("$match expects a Parameters resource")
+        parts = {p.get("name"): p for p in body.get("parameter") or []}
+        query = (parts.get("resource") or {}).get("resource") or {}
+        if query.get("resourceType") != "Patient":
+            raise ValueError("$match requires a 'resource' parameter holding a Patient")
+        count = int((parts.get("count") or {}).get("valueInteger") or 10)
+        only_certain = bool((parts.get("onlyCertainMatches") or {}).get("valueBoolean"))
+
+        identifier = (query.get("identifier") or [{}])[0]
+        name = (query.get("name") or [{}])[0]
+        family = name.get("family")
+        given = " ".join(name.get("given") or [])
+        birth_date = dt.date.fromisoformat(query["birthDate"]) if query.get("birthDate") else None
+        query_name = _normalize(f"{family or ''} {given}")
+
+        blocks = []
+        if identifier.get("value"):
+            blocks.append(
+                select(SomPatient.id)
+                .where(SomPatient.identifier_value == identifier["value"])
+                .where(SomPatient.identifier_system == identifier.get("system"))
+                .limit(MATCH_BLOCK_LIMIT)
+            )
+        if birth_date:
+            blocks.append(select(SomPatient.id).where(SomPatient.birth_date == birth_date).limit(MATCH_BLOCK_LIMIT))
+        if query_name and _has_trgm(self.db):
+            # `%` is pg_trgm's similarity operator; the GIN index on name_search serves it.
+            blocks.append(
+                select(SomPatient.id)
+                .where(SomPatient.name_search.op("%")(func.som_normalize_name(query_name)))
+                .limit(MATCH_BLOCK_LIMIT)
+            )
+        elif family:
+            blocks.append(
+                select(SomPatient.id)
+                .where(SomPatient.name_search.like(func.som_normalize_name(family).concat("%")))
+                .limit(MATCH_BLOCK_LIMIT)
+            )
+        if not blocks:
+            raise ValueError("$match needs at least an identifier, a name or a birthDate")
+
+        candidate_ids = union(*(b.subquery().select() for b in blocks))
+        rows = self.db.execute(select(*_COLUMNS).where(SomPatient.id.in_(candidate_ids))).all()
+
+        scored = []
+        for r in rows:
+            score = self._match_score(r, identifier=identifier, query_name=query_name, birth_date=birth_date)
+            grade = next((g for g, threshold in MATCH_GRADES if score >= threshold), None)
+            if grade is None or (only_certain and grade != "certain"):
+                continue
+            scored.append((score, grade, r))
+        scored.sort(key=lambda t: t[0], reverse=True)
+        scored = scored[:count]
+
+        out = bundle(entries=[self._row_to_fhir(r) for _, _, r in scored], total=len(scored))
+        for entry, (score, grade, _) in zip(out["entry"], scored):
+            entry["search"] = {
+                "mode": "match",
+                "score": round(score, 4),
+                "extension": [{"url": MATCH_GRADE_URL, "valueCode": grade}],
+            }
+        return out
+
+    @staticmethod
+    def _match_score(r, *, identifier: dict[str, Any], query_name: str, birth_date: dt.date | None) -> float:
+        if identifier.get("value") and (r.identifier_system, r.identifier_value) == (
+            identifier.get("system"),
+            identifier["value"],
+        ):
+            return 1.0
+        name_score = name_similarity(query_name, _normalize(f"{r.name_family or ''} {r.name_given or ''}"))
+        if birth_date is None or r.birth_date is None:
+            return 0.7 * name_score
+        if r.birth_date != birth_date:
+            # A different birth date rules out anything better than "possible".
+            return min(0.6 * name_score + 0.1, 0.79)
+        return 0.6 * name_score + 0.4
+
+    def _select_rows(self):
+        return select(*_COLUMNS)
+
+    def _row_to_fhir(self, r) -> dict[str, Any]:
+        return self._to_fhir(r)
 
     def _to_fhir(self, p: SomPatient) -> dict[str, Any]:
         out: dict[str, Any] = {
@@ -6,13 +6,28 @@ from sqlalchemy import select
 
 from app.db.models import SomPractitioner
 from app.services.audit import AuditService
-from app.services.mapping.fhir_utils import bundle, fhir_meta, to_uuid
+from app.services.mapping.fhir_utils import fhir_meta, to_uuid
 from app.services.mapping.resources.base import BaseMapper
+from app.services.mapping.search_params import SearchParam
 from app.services.provenance import ProvenanceService
 
 
+# Columns read by _to_fhir (search path).
+_COLUMNS = (
+    SomPractitioner.id,
+    SomPractitioner.version,
+    SomPractitioner.updated_time,
+    SomPractitioner.name,
+)
+
+
 class PractitionerMapper(BaseMapper):
     resource_type = "Practitioner"
+    model = SomPractitioner
+    search_params = {"name": SearchParam("string", (SomPractitioner.name,))}
+    element_columns = {
+        "name": ("name",),
+    }
 
     def create(self, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any]:
         if correlation_id:
@@ -58,44 +73,45 @@ class PractitionerMapper(BaseMapper):
         pr = self.db.get(SomPractitioner, to_uuid(id))
         return self._to_fhir(pr) if pr else None
 
-    def update(self, id: str, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any] | None:
-        pr = self.db.get(SomPractitioner, to_uuid(id))
-        if not pr:
-            return None
-        prov = ProvenanceService(self.db).create(
+    def update(
+        self, id: str, body: dict[str, Any], *, correlation_id: str | None, expected_version: int | None = None
+    ) -> dict[str, Any] | None:
+        pid = to_uuid(id)
+        name = (body.get("name") or [{}])[0]
+        display = name.get("text") or " ".join((name.get("given") or []) + ([name.get("family")] if name.get("family") else []))
+        prov = ProvenanceService.values(
             activity="update",
             author=None,
             correlation_id=correlation_id,
             target_resource_type=self.resource_type,
-            target_resource_id=str(pr.id),
+            target_resource_id=str(pid),
             target_som_table="som_practitioner",
-            target_som_id=str(pr.id),
+            target_som_id=str(pid),
         )
-        name = (body.get("name") or [{}])[0]
-        display = name.get("text") or " ".join((name.get("given") or []) + ([name.get("family")] if name.get("family") else []))
-        pr.name = display
-        pr.version += 1
-        pr.updated_provenance_id = prov.id
-        pr.extensions = pr.extensions or {}
-        out = self._to_fhir(pr)
+        out = self._compare_and_swap(
+            pid, {"name": display}, expected_version=expected_version, provenance=prov
+        )
+        if out is None:
+            return None
         AuditService(self.db).emit(
             actor="system",
             operation="update",
             correlation_id=correlation_id,
-            provenance_id=prov.id,
+            provenance_id=prov["id"],
             resource_type=self.resource_type,
-            resource_id=pr.id,
+            resource_id=pid,
             som_table="som_practitioner",
-            som_id=pr.id,
+            som_id=pid,
             request_payload=body,
             result_payload=out,
         )
         return out
 
-    def search(self, *, params: dict[str, Any], count: int, sort: str | None) -> dict[str, Any]:
-        stmt = select(SomPractitioner).limit(count)
-        items = self.db.execute(stmt).scalars().all()
-        return bundle(entries=[self._to_fhir(p) for p in items], total=len(items))
+    def _select_rows(self):
+        return select(*_COLUMNS)
+
+    def _row_to_fhir(self, r) -> dict[str, Any]:
+        return self._to_fhir(r)
 
     def _to_fhir(self, p: SomPractitioner) -> dict[str, Any]:
         return {
@@ -5,12 +5,19 @@ from typing import Any
 from sqlalchemy import select
 
 from app.db.models import SomProvenance
-from app.services.mapping.fhir_utils import bundle, to_uuid
+from app.services.mapping.fhir_utils import to_uuid
 from app.services.mapping.resources.base import BaseMapper
+from app.services.mapping.search_params import SearchParam
 
 
 class ProvenanceMapper(BaseMapper):
     resource_type = "Provenance"
+    model = SomProvenance
+    search_params = {
+        "correlationId": SearchParam("token", (SomProvenance.correlation_id,)),
+        "correlation-id": SearchParam("token", (SomProvenance.correlation_id,)),
+        "recorded": SearchParam("date", (SomProvenance.recorded_time,)),
+    }
 
     def create(self, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any]:
         raise ValueError("Provenance creation is system-managed in this sample")
@@ -19,17 +26,21 @@ class ProvenanceMapper(BaseMapper):
         p = self.db.get(SomProvenance, to_uuid(id))
         return self._to_fhir(p) if p else None
 
-    def update(self, id: str, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any] | None:
+    def update(
+        self, id: str, body: dict[str, Any], *, correlation_id: str | None, expected_version: int | None = None
+    ) -> dict[str, Any] | None:
         raise ValueError("Provenance update not supported")
 
-    def search(self, *, params: dict[str, Any], count: int, sort: str | None) -> dict[str, Any]:
-        stmt = select(SomProvenance)
-        cid = params.get("correlationId") or params.get("correlation-id")
-        if cid:
-            stmt = stmt.where(SomProvenance.correlation_id == cid)
-        stmt = stmt.limit(count)
-        items = self.db.execute(stmt).scalars().all()
-        return bundle(entries=[self._to_fhir(i) for i in items], total=len(items))
+    def patch(
+        self, id: str, patch: Any, *, correlation_id: str | None, expected_version: int | None = None
+    ) -> dict[str, Any] | None:
+        raise ValueError("Provenance update not supported")
+
+    def _select_rows(self):
+        return select(*SomProvenance.__table__.columns)
+
+    def _row_to_fhir(self, r) -> dict[str, Any]:
+        return self._to_fhir(r)
 
     def _to_fhir(self, p: SomProvenance) -> dict[str, Any]:
         out: dict[str, Any] = {
@@ -1,20 +1,92 @@
 from __future__ import annotations
 
 import datetime as dt
+import uuid
 from typing import Any
 
-from sqlalchemy import delete, select
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm import aliased
 
-from app.db.models import SomCondition, SomEncounter, SomPatient, SomServiceRequest, SomServiceRequestReason
+from app.db.models import (
+    SomCodeSystem,
+    SomConcept,
+    SomCondition,
+    SomEncounter,
+    SomPatient,
+    SomServiceRequest,
+    SomServiceRequestReason,
+)
 from app.services.audit import AuditService
-from app.services.mapping.fhir_utils import bundle, fhir_meta, parse_reference, to_uuid
+from app.services.mapping.fhir_utils import fhir_meta, parse_reference, to_uuid
 from app.services.mapping.resources.base import BaseMapper
+from app.services.mapping.search_params import SearchParam
 from app.services.provenance import ProvenanceService
 from app.services.terminology import TerminologyService
 
 
+# Aliased so the code-filter subqueries in search() don't correlate against the join.
+_CODE = aliased(SomConcept, name="code_concept")
+_CODE_SYSTEM = aliased(SomCodeSystem, name="code_system")
+
+
+def _row_select():
+    """
+    ServiceRequest columns plus the code concept and the ranked reason condition ids (as an array), so a search
+    is a single query instead of one reasons lookup per entry.
+    """
+    sr = SomServiceRequest
+    reasons = (
+        select(func.array_agg(aggregate_order_by(SomServiceRequestReason.condition_id, SomServiceRequestReason.rank.asc())))
+        .where(SomServiceRequestReason.service_request_id == sr.id)
+        .scalar_subquery()
+    )
+    return (
+        select(
+            sr.id,
+            sr.version,
+            sr.updated_time,
+            sr.patient_id,
+            sr.encounter_id,
+            sr.status,
+            sr.intent,
+            sr.priority,
+            sr.authored_on,
+            _CODE_SYSTEM.system_uri.label("concept_system"),
+            _CODE.code.label("concept_code"),
+            _CODE.display.label("concept_display"),
+            reasons.label("reason_condition_ids"),
+        )
+        .select_from(sr)
+        .join(_CODE, _CODE.id == sr.code_concept_id)
+        .join(_CODE_SYSTEM, _CODE_SYSTEM.id == _CODE.code_system_id)
+    )
+
+
 class ServiceRequestMapper(BaseMapper):
     resource_type = "ServiceRequest"
+    model = SomServiceRequest
+    reference_columns = {"patient": "patient_id", "subject": "patient_id", "encounter": "encounter_id"}
+    search_params = {
+        "patient": SearchParam("reference", (SomServiceRequest.patient_id,)),
+        "subject": SearchParam("reference", (SomServiceRequest.patient_id,)),
+        "encounter": SearchParam("reference", (SomServiceRequest.encounter_id,)),
+        "status": SearchParam("token", (SomServiceRequest.status,)),
+        "intent": SearchParam("token", (SomServiceRequest.intent,)),
+        "priority": SearchParam("token", (SomServiceRequest.priority,)),
+        "code": SearchParam("token", (SomServiceRequest.code_concept_id,), concept=True),
+        "authored": SearchParam("date", (SomServiceRequest.authored_on,)),
+    }
+    element_columns = {
+        "subject": ("patient_id",),
+        "code": ("concept_system", "concept_code", "concept_display"),
+        "status": ("status",),
+        "intent": ("intent",),
+        "priority": ("priority",),
+        "authoredOn": ("authored_on",),
+        "encounter": ("encounter_id",),
+        "reasonReference": ("reason_condition_ids",),
+    }
 
     def create(self, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any]:
         if correlation_id:
@@ -81,8 +153,14 @@ class ServiceRequestMapper(BaseMapper):
             target_som_id=str(sr.id),
         )
 
-        self._sync_reasons(sr, body, provenance_id=prov.id)
-        out = self._to_fhir(sr, concept_system=concept.code_system.system_uri, concept_code=concept.code, concept_display=concept.display)
+        reason_ids = self._sync_reasons(sr.id, sr.patient_id, body, provenance_id=prov.id)
+        out = self._to_fhir(
+            sr,
+            concept_system=concept.code_system.system_uri,
+            concept_code=concept.code,
+            concept_display=concept.display,
+            reason_condition_ids=reason_ids,
+        )
         AuditService(self.db).emit(
             actor="system",
             operation="create",
@@ -98,16 +176,13 @@ class ServiceRequestMapper(BaseMapper):
         return out
 
     def read(self, id: str) -> dict[str, Any] | None:
-        sr = self.db.get(SomServiceRequest, to_uuid(id))
-        if not sr:
-            return None
-        concept = sr.code_concept
-        return self._to_fhir(sr, concept_system=concept.code_system.system_uri, concept_code=concept.code, concept_display=concept.display)
+        row = self.db.execute(_row_select().where(SomServiceRequest.id == to_uuid(id))).first()
+        return self._row_to_fhir(row) if row else None
 
-    def update(self, id: str, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any] | None:
-        sr = self.db.get(SomServiceRequest, to_uuid(id))
-        if not sr:
-            return None
+    def update(
+        self, id: str, body: dict[str, Any], *, correlation_id: str | None, expected_version: int | None = None
+    ) -> dict[str, Any] | None:
+        sid = to_uuid(id)
         code_cc = body.get("code") or {}
         coding = TerminologyService.pick_coding(code_cc)
         concept = TerminologyService(self.db).normalize_concept(
@@ -118,8 +193,13 @@ class ServiceRequestMapper(BaseMapper):
             correlation_id=correlation_id,
         )
         authored_on = body.get("authoredOn")
-        authored_dt = dt.datetime.fromisoformat(authored_on.replace("Z", "+00:00")) if authored_on else None
-        encounter_id = sr.encounter_id
+        values: dict[str, Any] = {
+            "code_concept_id": concept.id,
+            "status": body.get("status"),
+            "intent": body.get("intent"),
+            "priority": body.get("priority"),
+            "authored_on": dt.datetime.fromisoformat(authored_on.replace("Z", "+00:00")) if authored_on else None,
+        }
         if body.get("encounter", {}).get("reference"):
             rt, rid = parse_reference(body["encounter"]["reference"])
             if rt != "Encounter":
@@ -128,81 +208,72 @@ class ServiceRequestMapper(BaseMapper):
             enc = self.db.get(SomEncounter, encounter_id)
             if not enc:
                 raise ValueError("Encounter not found")
-            if enc.patient_id != sr.patient_id:
+            patient_id = self._patient_id(sid)
+            if patient_id is None:
+                return None
+            if enc.patient_id != patient_id:
                 raise ValueError("Encounter.patient must match ServiceRequest.patient")
-        prov = ProvenanceService(self.db).create(
+            values["encounter_id"] = encounter_id
+        prov = ProvenanceService.values(
             activity="update",
             author=None,
             correlation_id=correlation_id,
             target_resource_type=self.resource_type,
-            target_resource_id=str(sr.id),
+            target_resource_id=str(sid),
             target_som_table="som_service_request",
-            target_som_id=str(sr.id),
+            target_som_id=str(sid),
         )
-        sr.code_concept_id = concept.id
-        sr.status = body.get("status")
-        sr.intent = body.get("intent")
-        sr.priority = body.get("priority")
-        sr.authored_on = authored_dt
-        sr.encounter_id = encounter_id
-        sr.version += 1
-        sr.updated_provenance_id = prov.id
-        sr.extensions = sr.extensions or {}
-        self._sync_reasons(sr, body, provenance_id=prov.id)
-        out = self._to_fhir(sr, concept_system=concept.code_system.system_uri, concept_code=concept.code, concept_display=concept.display)
+        out = self._compare_and_swap(sid, values, expected_version=expected_version, provenance=prov)
+        if out is None:
+            return None
+        # Reason links reference the update's provenance, so they are replaced once the row has been written.
+        patient_id = to_uuid(parse_reference(out["subject"]["reference"])[1])
+        reason_ids = self._sync_reasons(sid, patient_id, body, provenance_id=prov["id"])
+        out.pop("reasonReference", None)
+        if reason_ids:
+            out["reasonReference"] = [{"reference": f"Condition/{cid}"} for cid in reason_ids]
         AuditService(self.db).emit(
             actor="system",
             operation="update",
             correlation_id=correlation_id,
-            provenance_id=prov.id,
+            provenance_id=prov["id"],
             resource_type=self.resource_type,
-            resource_id=sr.id,
+            resource_id=sid,
             som_table="som_service_request",
-            som_id=sr.id,
+            som_id=sid,
             request_payload=body,
             result_payload=out,
         )
         return out
 
-    def search(self, *, params: dict[str, Any], count: int, sort: str | None) -> dict[str, Any]:
-        stmt = select(SomServiceRequest)
-        patient = params.get("patient")
-        if patient:
-            pid = patient.split("/")[-1]
-            stmt = stmt.where(SomServiceRequest.patient_id == to_uuid(pid))
-        status = params.get("status")
-        if status:
-            stmt = stmt.where(SomServiceRequest.status == status)
-        code = params.get("code")
-        if code:
-            from app.db.models import SomCodeSystem, SomConcept
+    def _select_rows(self):
+        return _row_select()
 
-            if "|" in code:
-                system, c = code.split("|", 1)
-                sub = (
-                    select(SomConcept.id)
-                    .join(SomCodeSystem, SomConcept.code_system_id == SomCodeSystem.id)
-                    .where(SomCodeSystem.system_uri == system)
-                    .where(SomConcept.code == c)
-                )
-            else:
-                sub = select(SomConcept.id).where(SomConcept.code == code)
-            stmt = stmt.where(SomServiceRequest.code_concept_id.in_(sub))
-        authored = params.get("authored")
-        if authored:
-            parts = authored if isinstance(authored, list) else [authored]
-            for p in parts:
-                if p.startswith("ge"):
-                    d = dt.datetime.fromisoformat(p[2:].replace("Z", "+00:00"))
-                    stmt = stmt.where(SomServiceRequest.authored_on >= d)
-                if p.startswith("le"):
-                    d = dt.datetime.fromisoformat(p[2:].replace("Z", "+00:00"))
-                    stmt = stmt.where(SomServiceRequest.authored_on <= d)
-        stmt = stmt.limit(count)
-        items = self.db.execute(stmt).scalars().all()
-        return bundle(entries=[self.read(str(i.id)) for i in items if self.read(str(i.id))], total=len(items))
+    def _reference_filter(self, param: str, ids: list):
+        if param == "reason-reference":
+            linked = select(SomServiceRequestReason.service_request_id).where(SomServiceRequestReason.condition_id.in_(ids))
+            return SomServiceRequest.id.in_(linked)
+        return super()._reference_filter(param, ids)
 
-    def _to_fhir(self, sr: SomServiceRequest, *, concept_system: str, concept_code: str, concept_display: str | None) -> dict[str, Any]:
+    def _row_to_fhir(self, r) -> dict[str, Any]:
+        # `r` is a flat row from _row_select; it carries the same attributes _to_fhir reads from SomServiceRequest.
+        return self._to_fhir(
+            r,
+            concept_system=r.concept_system,
+            concept_code=r.concept_code,
+            concept_display=r.concept_display,
+            reason_condition_ids=r.reason_condition_ids or [],
+        )
+
+    def _to_fhir(
+        self,
+        sr: SomServiceRequest,
+        *,
+        concept_system: str,
+        concept_code: str,
+        concept_display: str | None,
+        reason_condition_ids: list,
+    ) -> dict[str, Any]:
         out: dict[str, Any] = {
             "resourceType": self.resource_type,
             "id": str(sr.id),
@@ -220,21 +291,12 @@ class ServiceRequestMapper(BaseMapper):
             out["authoredOn"] = sr.authored_on.isoformat().replace("+00:00", "Z")
         if sr.encounter_id:
             out["encounter"] = {"reference": f"Encounter/{sr.encounter_id}"}
-
-        reasons = (
-            self.db.execute(
-                select(SomServiceRequestReason)
-                .where(SomServiceRequestReason.service_request_id == sr.id)
-                .order_by(SomServiceRequestReason.rank.asc())
-            )
-            .scalars()
-            .all()
-        )
-        if reasons:
-            out["reasonReference"] = [{"reference": f"Condition/{r.condition_id}"} for r in reasons]
+        if reason_condition_ids:
+            out["reasonReference"] = [{"reference": f"Condition/{cid}"} for cid in reason_condition_ids]
         return out
 
-    def _sync_reasons(self, sr: SomServiceRequest, body: dict[str, Any], *, provenance_id) -> None:
+    def _sync_reasons(self, sr_id: uuid.UUID, patient_id: uuid.UUID, body: dict[str, Any], *, provenance_id) -> list:
+        """Replace the reason links from body.reasonReference; returns the linked condition ids in rank order."""
         refs = body.get("reasonReference") or []
         condition_ids: list[str] = []
         for r in refs:
@@ -247,17 +309,18 @@ class ServiceRequestMapper(BaseMapper):
             condition_ids.append(rid)
 
         # Replace existing reasons.
-        self.db.execute(delete(SomServiceRequestReason).where(SomServiceRequestReason.service_request_id == sr.id))
+        self.db.execute(delete(SomServiceRequestReason).where(SomServiceRequestReason.service_request_id == sr_id))
 
+        linked = []
         rank = 1
         for cid in condition_ids:
             cond = self.db.get(SomCondition, to_uuid(cid))
             if not cond:
                 raise ValueError("Condition not found for reasonReference")
-            if cond.patient_id != sr.patient_id:
+            if cond.patient_id != patient_id:
                 raise ValueError("Condition.patient must match ServiceRequest.patient")
             link = SomServiceRequestReason(
-                service_request_id=sr.id,
+                service_request_id=sr_id,
                 condition_id=cond.id,
                 role="reason",
                 rank=rank,
@@ -266,4 +329,6 @@ class ServiceRequestMapper(BaseMapper):
                 extensions={},
             )
             self.db.add(link)
+            linked.append(cond.id)
             rank += 1
+        return linked
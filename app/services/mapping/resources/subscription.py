@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import datetime as dt
+from typing import Any
+from urllib.parse import parse_qsl
+
+from sqlalchemy import select
+
+from app.db.models import SomSubscription
+from app.services.audit import AuditService
+from app.services.mapping.fhir_utils import fhir_meta, query_params, to_uuid
+from app.services.mapping.resources.base import BaseMapper
+from app.services.mapping.search_params import SearchParam
+from app.services.provenance import ProvenanceService
+from app.services.subscriptions.feed import head_cursor
+
+CHANNEL_TYPES = ("rest-hook", "websocket")
+PAYLOAD_TYPES = ("application/fhir+json", "application/json")
+
+_COLUMNS = (
+    SomSubscription.id,
+    SomSubscription.version,
+    SomSubscription.updated_time,
+    SomSubscription.status,
+    SomSubscription.reason,
+    SomSubscription.criteria,
+    SomSubscription.channel_type,
+    SomSubscription.endpoint,
+    SomSubscription.payload,
+    SomSubscription.headers,
+    SomSubscription.end_time,
+    SomSubscription.error,
+)
+
+
+def parse_criteria(criteria: str) -> tuple[str, dict[str, Any]]:
+    """`Observation?code=x&patient=y` -> ("Observation", params), params shaped like the search route's."""
+    resource_type, _, query = (criteria or "").partition("?")
+    if not resource_type or "/" in resource_type:
+        raise ValueError("Subscription.criteria must look like 'Type?param=value'")
+    return resource_type, query_params(parse_qsl(query))
+
+
+class SubscriptionMapper(BaseMapper):
+    """
+    FHIR R4 Subscription over the change feed (som_change_event). Delivery is done by
+    app.services.subscriptions; this mapper only stores and validates subscriptions.
+    """
+
+    resource_type = "Subscription"
+    model = SomSubscription
+    search_params = {
+        "status": SearchParam("token", (SomSubscription.status,)),
+        "type": SearchParam("token", (SomSubscription.channel_type,)),
+        "url": SearchParam("string", (SomSubscription.endpoint,)),
+    }
+
+    def create(self, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any]:
+        if correlation_id:
+            prior = AuditService(self.db).find_idempotent_result(
+                correlation_id=correlation_id,
+                operation="create",
+                resource_type=self.resource_type,
+                request_payload=body,
+            )
+            if prior:
+                return prior
+
+        fields = self._fields(body)
+        prov = ProvenanceService(self.db).create(activity="create", author=None, correlation_id=correlation_id)
+        head = head_cursor(self.db)
+        sub = SomSubscription(
+            **fields,
+            # Only changes committed from now on are delivered.
+            delivery_cursor_xact=head[0],
+            delivery_cursor=head[1],
+            failure_count=0,
+            created_provenance_id=prov.id,
+            updated_provenance_id=None,
+            extensions={},
+        )
+        self.db.add(sub)
+        self.db.flush()
+        ProvenanceService(self.db).set_target(
+            prov,
+            target_resource_type=self.resource_type,
+            target_resource_id=str(sub.id),
+            target_som_table="som_subscription",
+            target_som_id=str(sub.id),
+        )
+        out = self._to_fhir(sub)
+        AuditService(self.db).emit(
+            actor="system",
+            operation="create",
+            correlation_id=correlation_id,
+            provenance_id=prov.id,
+            resource_type=self.resource_type,
+            resource_id=sub.id,
+            som_table="som_subscription",
+            som_id=sub.id,
+            request_payload=body,
+            result_payload=out,
+        )
+        return out
+
+    def read(self, id: str) -> dict[str, Any] | None:
+        sub = self.db.get(SomSubscription, to_uuid(id))
+        return self._to_fhir(sub) if sub else None
+
+    def update(
+        self, id: str, body: dict[str, Any], *, correlation_id: str | None, expected_version: int | None = None
+    ) -> dict[str, Any] | None:
+        sid = to_uuid(id)
+        fields = self._fields(body)
+        prov = ProvenanceService.values(
+            activity="update",
+            author=None,
+            correlation_id=correlation_id,
+            target_resource_type=self.resource_type,
+            target_resource_id=str(sid),
+            target_som_table="som_subscription",
+            target_som_id=str(sid),
+        )
+        out = self._compare_and_swap(
+            sid,
+            # A client re-activating a subscription in error gets a fresh retry budget.
+            {**fields, "failure_count": 0, "next_attempt_time": None},
+            expected_version=expected_version,
+            provenance=prov,
+        )
+        if out is None:
+            return None
+        AuditService(self.db).emit(
+            actor="system",
+            operation="update",
+            correlation_id=correlation_id,
+            provenance_id=prov["id"],
+            resource_type=self.resource_type,
+            resource_id=sid,
+            som_table="som_subscription",
+            som_id=sid,
+            request_payload=body,
+            result_payload=out,
+        )
+        return out
+
+    def _fields(self, body: dict[str, Any]) -> dict[str, Any]:
+        criteria = body.get("criteria") or ""
+        criteria_type, params = parse_criteria(criteria)
+        # Compiling the criteria as a search rejects unknown types and parameters up front. Imported here
+        # because fhir_dispatch imports this module.
+        from app.services.mapping.fhir_dispatch import fhir_matching_ids
+
+        fhir_matching_ids(self.db, criteria_type, params, [])
+
+        channel = body.get("channel") or {}
+        channel_type = channel.get("type")
+        if channel_type not in CHANNEL_TYPES:
+            raise ValueError(f"Subscription.channel.type must be one of {', '.join(CHANNEL_TYPES)}")
+        endpoint = channel.get("endpoint")
+        if channel_type == "rest-hook" and not (endpoint or "").startswith(("http://", "https://")):
+            raise ValueError("rest-hook subscriptions need an http(s) channel.endpoint")
+        payload = channel.get("payload") or None
+        if payload is not None and payload not in PAYLOAD_TYPES:
+            raise ValueError(f"Subscription.channel.payload must be one of {', '.join(PAYLOAD_TYPES)}")
+        headers = channel.get("header") or []
+        if not all(isinstance(h, str) and ":" in h for h in headers):
+            raise ValueError("Subscription.channel.header entries must be 'Name: value' strings")
+
+        status = body.get("status") or "requested"
+        if status not in ("requested", "active", "off"):
+            raise ValueError("Subscription.status must be requested, active or off")
+        end = body.get("end")
+        return {
+            # Criteria and channel were accepted, so the subscription is live right away.
+            "status": "off" if status == "off" else "active",
+            "reason": body.get("reason"),
+            "criteria": criteria,
+            "criteria_resource_type": criteria_type,
+            "channel_type": channel_type,
+            "endpoint": endpoint,
+            "payload": payload,
+            "headers": headers,
+            "end_time": dt.datetime.fromisoformat(end.replace("Z", "+00:00")) if end else None,
+            "error": None,
+        }
+
+    def _select_rows(self):
+        return select(*_COLUMNS)
+
+    def _row_to_fhir(self, r) -> dict[str, Any]:
+        return self._to_fhir(r)
+
+    def _to_fhir(self, s: SomSubscription) -> dict[str, Any]:
+        channel: dict[str, Any] = {"type": s.channel_type}
+        if s.endpoint:
+            channel["endpoint"] = s.endpoint
+        if s.payload:
+            channel["payload"] = s.payload
+        if s.headers:
+            channel["header"] = list(s.headers)
+        out: dict[str, Any] = {
+            "resourceType": self.resource_type,
+            "id": str(s.id),
+            "meta": fhir_meta(version=s.version, last_updated=s.updated_time),
+            "status": s.status,
+            "criteria": s.criteria,
+            "channel": channel,
+        }
+        if s.reason:
+            out["reason"] = s.reason
+        if s.end_time:
+            out["end"] = s.end_time.isoformat().replace("+00:00", "Z")
+        if s.error:
+            out["error"] = s.error
+        return out
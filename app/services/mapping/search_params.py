@@ -0,0 +1,357 @@
+"""
+Declarative FHIR search parameters compiled to SQLAlchemy predicates.
+
+Each mapper declares `search_params: dict[str, SearchParam]`. `compile_params` turns a request's params
+into WHERE clauses:
+
+- token: `code`, `system|code`, `system|`, `|code`; plain columns, system+value column pairs, or concepts
+  (matched through som_concept/som_code_system, filtering the indexed *_concept_id column); concept params
+  also take `:below` / `:above` (subsumption through the som_concept_closure table)
+- date: prefixes eq/ne/gt/lt/ge/le/sa/eb, with the value's precision (YYYY, YYYY-MM, YYYY-MM-DD, dateTime)
+  defining the range it stands for
+- reference: `Type/id` or `id`
+- quantity: `[prefix]number[|system|code]`; eq/ne use the value's implied precision
+- string: starts-with (case-insensitive) by default, `:exact`, `:contains`
+
+Every type supports `:missing=true|false`. Comma-separated values are OR-ed; repeated params are AND-ed.
+Predicates compare the bare column against bound values (`= ANY(:array)` for OR lists), so they stay
+sargable and statements of the same shape share SQLAlchemy's compiled-SQL cache and the driver's
+prepared statements. Value parsing is memoized with lru_cache.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import uuid
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Any, Callable
+
+from sqlalchemy import ColumnElement, Date, and_, any_, bindparam, false, literal, or_, select
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from app.db.models import SomCodeSystem, SomConcept, SomConceptClosure
+
+PREFIXES = ("eq", "ne", "gt", "lt", "ge", "le", "sa", "eb", "ap")
+DATE_PREFIXES = frozenset({"eq", "ne", "gt", "lt", "ge", "le", "sa", "eb"})
+MODIFIERS = {
+    "token": {"missing", "below", "above"},
+    "date": {"missing"},
+    "reference": {"missing"},
+    "quantity": {"missing"},
+    "string": {"missing", "exact", "contains"},
+}
+
+# Params every resource type understands, on top of its own search_params.
+RESULT_PARAMS = frozenset({"_count", "_sort", "_summary", "_elements", "_include", "_revinclude", "_format"})
+
+
+@dataclass(frozen=True)
+class SearchParam:
+    """
+    One search parameter.
+
+    type: token | date | reference | quantity | string
+    columns: the column(s) searched. token: one value column, or (system, value) columns when
+        `system_column` is set; string: any of the columns may match.
+    concept: token only; `columns[0]` is a *_concept_id column matched through the concept tables.
+    value_map: token only; maps accepted codes to stored values (e.g. laboratory -> lab).
+    unit_column: quantity only; compared with the unit code when one is given.
+    unit_conversions: quantity only; (system, unit) -> [(extra filter or None, conversion)], mapping the
+        search value onto canonical columns (see app.services.units). The filters are OR-ed.
+    raw_column: quantity only; the value as recorded, searched instead of `columns` when no unit is given
+        (a unitless number means the recorded value, whatever its unit).
+    search_column/normalizer: string only; when set, default and :contains searches match the normalized
+        value (`normalizer` is a SQL function applied to it) against `search_column` instead of `columns`,
+        and the default search matches the start of any word. :exact and :missing still use `columns`.
+    """
+
+    type: str
+    columns: tuple[Any, ...]
+    system_column: Any = None
+    concept: bool = False
+    value_map: dict[str, str] = field(default_factory=dict)
+    unit_column: Any = None
+    unit_conversions: Callable[[str | None, str], list[tuple[Any, Any]]] | None = None
+    raw_column: Any = None
+    search_column: Any = None
+    normalizer: Callable[[Any], Any] | None = None
+
+
+# ---- value parsing (memoized) ------------------------------------------------------------------------------
+
+
+def _split_prefix(value: str, allowed: frozenset[str] | tuple[str, ...]) -> tuple[str, str]:
+    if len(value) > 2 and value[:2] in allowed and not value[2].isalpha():
+        return value[:2], value[2:]
+    return "eq", value
+
+
+@lru_cache(maxsize=4096)
+def _parse_date(value: str) -> tuple[str, dt.datetime, dt.datetime]:
+    """(prefix, range start, range end exclusive) in UTC."""
+    prefix, v = _split_prefix(value, DATE_PREFIXES)
+    try:
+        if len(v) == 4:
+            lo = dt.datetime(int(v), 1, 1, tzinfo=dt.timezone.utc)
+            hi = lo.replace(year=lo.year + 1)
+        elif len(v) == 7:
+            lo = dt.datetime(int(v[:4]), int(v[5:7]), 1, tzinfo=dt.timezone.utc)
+            hi = lo.replace(year=lo.year + 1, month=1) if lo.month == 12 else lo.replace(month=lo.month + 1)
+        elif len(v) == 10:
+            lo = dt.datetime.fromisoformat(v).replace(tzinfo=dt.timezone.utc)
+            hi = lo + dt.timedelta(days=1)
+        else:
+            lo = dt.datetime.fromisoformat(v.replace("Z", "+00:00"))
+            if lo.tzinfo is None:
+                lo = lo.replace(tzinfo=dt.timezone.utc)
+            hi = lo + (dt.timedelta(microseconds=1) if lo.microsecond else dt.timedelta(seconds=1))
+    except ValueError:
+        raise ValueError(f"Invalid date search value '{value}'")
+    return prefix, lo, hi
+
+
+@lru_cache(maxsize=4096)
+def _parse_quantity(value: str) -> tuple[str, Decimal, Decimal, Decimal, str | None, str | None]:
+    """(prefix, value, low, high, system, code); low/high is the range implied by the value's precision."""
+    number, _, rest = value.partition("|")
+    system, _, code = rest.partition("|") if rest else ("", "", "")
+    prefix, number = _split_prefix(number, PREFIXES)
+    try:
+        d = Decimal(number)
+    except InvalidOperation:
+        raise ValueError(f"Invalid quantity search value '{value}'")
+    half = Decimal(1).scaleb(d.as_tuple().exponent) / 2
+    return prefix, d, d - half, d + half, system or None, code or None
+
+
+@lru_cache(maxsize=4096)
+def _parse_token(value: str) -> tuple[str | None, str | None]:
+    """(system, code); system None means "any system", "" means "no system"."""
+    if "|" not in value:
+        return None, value
+    system, code = value.split("|", 1)
+    return system, code or None
+
+
+@lru_cache(maxsize=4096)
+def _parse_reference(value: str) -> uuid.UUID:
+    rid = value.rsplit("/", 1)[-1]
+    try:
+        return uuid.UUID(rid)
+    except ValueError:
+        raise ValueError(f"Invalid reference search value '{value}'")
+
+
+# ---- predicate builders ------------------------------------------------------------------------------------
+
+
+def _eq_any(column: Any, values: list[Any]) -> ColumnElement[bool]:
+    if len(values) == 1:
+        return column == values[0]
+    return column == any_(bindparam(None, values, type_=ARRAY(column.type)))
+
+
+def _date_clause(column: Any, value: str) -> ColumnElement[bool]:
+    prefix, lo, hi = _parse_date(value)
+    if isinstance(column.type, Date):
+        lo_v: Any = lo.date()
+        hi_v: Any = hi.date() if hi.time() == dt.time(0) else hi.date() + dt.timedelta(days=1)
+    else:
+        lo_v, hi_v = lo, hi
+    if prefix == "eq":
+        return and_(column >= lo_v, column < hi_v)
+    if prefix == "ne":
+        return or_(column < lo_v, column >= hi_v)
+    if prefix in ("gt", "sa"):
+        return column >= hi_v
+    if prefix in ("lt", "eb"):
+        return column < lo_v
+    if prefix == "ge":
+        return column >= lo_v
+    return column < hi_v  # le
+
+
+def _quantity_range(column: Any, prefix: str, d: Decimal, lo: Decimal, hi: Decimal) -> ColumnElement[bool]:
+    if prefix == "eq":
+        return and_(column >= lo, column < hi)
+    if prefix == "ne":
+        return or_(column < lo, column >= hi)
+    if prefix in ("gt", "sa"):
+        return column > d
+    if prefix in ("lt", "eb"):
+        return column < d
+    if prefix == "ge":
+        return column >= d
+    if prefix == "le":
+        return column <= d
+    # ap: within 10%
+    delta = abs(d) / 10
+    return and_(column >= d - delta, column <= d + delta)
+
+
+def _quantity_clause(p: SearchParam, value: str) -> ColumnElement[bool]:
+    prefix, d, lo, hi, system, code = _parse_quantity(value)
+    column = p.columns[0]
+    if not code and p.raw_column is not None:
+        return _quantity_range(p.raw_column, prefix, d, lo, hi)
+    if not code or p.unit_column is None:
+        return _quantity_range(column, prefix, d, lo, hi)
+    if p.unit_conversions is None:
+        return and_(_quantity_range(column, prefix, d, lo, hi), p.unit_column == code)
+    clauses = []
+    # Conversions scale by a positive factor, so prefixes and precision ranges carry over unchanged.
+    for restrict, conv in p.unit_conversions(system, code):
+        clause = and_(
+            _quantity_range(column, prefix, conv.apply(d), conv.apply(lo), conv.apply(hi)),
+            p.unit_column == conv.unit,
+        )
+        clauses.append(clause if restrict is None else and_(clause, restrict))
+    return or_(*clauses)
+
+
+def _concept_subquery(values: list[str]):
+    codes_any_system: list[str] = []
+    pairs: list[ColumnElement[bool]] = []
+    for v in values:
+        system, code = _parse_token(v)
+        if system is None:
+            codes_any_system.append(code)
+        elif code is None:
+            pairs.append(SomCodeSystem.system_uri == system)
+        elif system == "":
+            # No system: this model always has one, so `|code` matches nothing.
+            pairs.append(false())
+        else:
+            pairs.append(and_(SomCodeSystem.system_uri == system, SomConcept.code == code))
+    conds: list[ColumnElement[bool]] = list(pairs)
+    if codes_any_system:
+        conds.append(_eq_any(SomConcept.code, codes_any_system))
+    return (
+        select(SomConcept.id)
+        .join(SomCodeSystem, SomConcept.code_system_id == SomCodeSystem.id)
+        .where(or_(*conds))
+    )
+
+
+def _token_clause(p: SearchParam, values: list[str], modifier: str | None) -> ColumnElement[bool]:
+    if p.concept:
+        concepts = _concept_subquery(values)
+        if modifier == "below":
+            concepts = select(SomConceptClosure.descendant_id).where(SomConceptClosure.ancestor_id.in_(concepts))
+        elif modifier == "above":
+            concepts = select(SomConceptClosure.ancestor_id).where(SomConceptClosure.descendant_id.in_(concepts))
+        return p.columns[0].in_(concepts)
+    if modifier:
+        raise ValueError(f":{modifier} is only supported on coded (terminology-backed) parameters")
+    column = p.columns[0]
+    if p.system_column is None:
+        codes = [p.value_map.get(_parse_token(v)[1], _parse_token(v)[1]) for v in values]
+        return _eq_any(column, codes)
+    clauses = []
+    plain: list[str] = []
+    for v in values:
+        system, code = _parse_token(v)
+        if system is None:
+            plain.append(code)
+        elif code is None:
+            clauses.append(p.system_column == system)
+        elif system == "":
+            clauses.append(and_(p.system_column.is_(None), column == code))
+        else:
+            clauses.append(and_(p.system_column == system, column == code))
+    if plain:
+        clauses.append(_eq_any(column, plain))
+    return or_(*clauses)
+
+
+def _like_escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _string_clause(p: SearchParam, values: list[str], modifier: str | None) -> ColumnElement[bool]:
+    if p.search_column is not None and modifier != "exact":
+        return _normalized_string_clause(p, values, contains=modifier == "contains")
+    clauses = []
+    for column in p.columns:
+        if modifier == "exact":
+            clauses.append(_eq_any(column, values))
+        elif modifier == "contains":
+            clauses.extend(column.ilike(f"%{_like_escape(v)}%", escape="\\") for v in values)
+        else:
+            clauses.extend(column.ilike(f"{_like_escape(v)}%", escape="\\") for v in values)
+    return or_(*clauses)
+
+
+def _normalized_string_clause(p: SearchParam, values: list[str], *, contains: bool) -> ColumnElement[bool]:
+    column = p.search_column
+    clauses = []
+    for v in values:
+        # Escaping first is safe: normalizing only folds case/accents and whitespace.
+        escaped = _like_escape(v)
+        norm = p.normalizer(escaped) if p.normalizer is not None else literal(escaped)
+        if contains:
+            clauses.append(column.like(literal("%").concat(norm).concat("%"), escape="\\"))
+        else:
+            clauses.append(column.like(norm.concat("%"), escape="\\"))
+            clauses.append(column.like(literal("% ").concat(norm).concat("%"), escape="\\"))
+    return or_(*clauses)
+
+
+def _missing_clause(p: SearchParam, value: str) -> ColumnElement[bool]:
+    if value not in ("true", "false"):
+        raise ValueError(":missing expects true or false")
+    missing = value == "true"
+    per_column = [c.is_(None) if missing else c.is_not(None) for c in p.columns]
+    return and_(*per_column) if missing else or_(*per_column)
+
+
+_BUILDERS: dict[str, Callable[[SearchParam, list[str], str | None], ColumnElement[bool]]] = {
+    "token": _token_clause,
+    "date": lambda p, values, _m: or_(*(_date_clause(p.columns[0], v) for v in values)),
+    "reference": lambda p, values, _m: _eq_any(p.columns[0], [_parse_reference(v) for v in values]),
+    "quantity": lambda p, values, _m: or_(*(_quantity_clause(p, v) for v in values)),
+    "string": _string_clause,
+}
+
+
+def compile_params(
+    resource_type: str,
+    registry: dict[str, SearchParam],
+    params: dict[str, Any],
+    *,
+    strict: bool = True,
+) -> list[ColumnElement[bool]]:
+    """
+    WHERE clauses for `params` (name[:modifier] -> value or list of values). Unknown params and modifiers
+    raise ValueError unless strict is False (Prefer: handling=lenient), in which case they're ignored.
+    """
+    clauses: list[ColumnElement[bool]] = []
+    for key, raw in params.items():
+        name, _, modifier = key.partition(":")
+        p = registry.get(name)
+        if p is None:
+            if name in RESULT_PARAMS or not strict:
+                continue
+            raise ValueError(f"Unknown search parameter '{name}' for {resource_type}")
+        if modifier and modifier not in MODIFIERS[p.type]:
+            if not strict:
+                continue
+            raise ValueError(f"Unsupported modifier ':{modifier}' for {resource_type} search parameter '{name}'")
+        for value in raw if isinstance(raw, list) else [raw]:
+            if modifier == "missing":
+                clauses.append(_missing_clause(p, value))
+                continue
+            values = [v for v in value.split(",") if v]
+            if values:
+                clauses.append(_BUILDERS[p.type](p, values, modifier or None))
+    return clauses
+
+
+def common_params(model: Any) -> dict[str, SearchParam]:
+    """`_id`, and `_lastUpdated` for SomBase-backed resources."""
+    out = {"_id": SearchParam("reference", (model.id,))}
+    if hasattr(model, "updated_time"):
+        out["_lastUpdated"] = SearchParam("date", (model.updated_time,))
+    return out
@@ -1,13 +1,16 @@
 from __future__ import annotations
 
 import datetime as dt
-from typing import Any
+from typing import Any, Callable
+
+from app.core.tracing import traced
 
 
 def _contains(text: str, needle: str) -> bool:
     return needle.lower() in (text or "").lower()
 
 
+@traced("payer.evaluate_rules")
 def evaluate_rules(
     *,
     rules: dict[str, Any],
@@ -21,12 +24,15 @@ def evaluate_rules(
     diagnosis_text: str | None,
     preauth_priority: str | None,
     supporting_documents: list[dict[str, Any]],
+    is_descendant: Callable[[str, str, str], bool] | None = None,
 ) -> dict[str, Any]:
     """
     Minimal payer rules engine (POC):
     - rule match: service CPT in list AND diagnosis keyword match
     - requirements: requiredDocuments list, each has code and maxAgeDays
     - outcomes: if missing docs -> pending-info with requestedAdditionalInfo, else approve/deny per rule
+    - diagnosis codes with `"below": true` also match their descendants, via
+      is_descendant(system, ancestor_code, code) (TerminologyService.subsumes)
     """
     schema = str(rules.get("schemaVersion") or "1")
     if schema != "1":
@@ -72,9 +78,15 @@ def evaluate_rules(
             for c in diag_codes:
                 if not isinstance(c, dict):
                     continue
-                if (c.get("system") or "") == (diagnosis_system or "") and (c.get("code") or "") == (diagnosis_code or ""):
+                if (c.get("system") or "") != (diagnosis_system or ""):
+                    continue
+                if (c.get("code") or "") == (diagnosis_code or ""):
                     ok = True
                     break
+                if c.get("below") and is_descendant and diagnosis_system and diagnosis_code and c.get("code"):
+                    if is_descendant(diagnosis_system, c["code"], diagnosis_code):
+                        ok = True
+                        break
             if not ok:
                 continue
         diag_any = diagnosis.get("anyContains") or []
@@ -0,0 +1,68 @@
+"""
+The pre-auth package as the payer decision pipeline sees it: built from the immutable package snapshot taken at
+submit (schemaVersion 2 carries the concept codes and displays inline), so a decision is made on exactly the
+data that was submitted and the worker needs no further lookups to assemble it.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any
+
+SNAPSHOT_SCHEMA_VERSION = "2"
+
+
+@dataclass(frozen=True)
+class Coding:
+    system: str | None
+    code: str | None
+    display: str | None
+
+    @classmethod
+    def from_json(cls, obj: dict[str, Any] | None) -> Coding | None:
+        if not obj:
+            return None
+        return cls(system=obj.get("system"), code=obj.get("code"), display=obj.get("display"))
+
+
+@dataclass(frozen=True)
+class PreAuthPackage:
+    preauth_id: str
+    snapshot_id: str | None
+    priority: str | None
+    payer: str | None
+    diagnosis: Coding | None
+    service: Coding | None
+    service_priority: str | None
+    # Shaped for evaluate_rules(supporting_documents=...): id, code, display, dateTime, title, role.
+    documents: list[dict[str, Any]]
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict[str, Any], *, snapshot_id: str | None) -> PreAuthPackage:
+        if str(snapshot.get("schemaVersion")) != SNAPSHOT_SCHEMA_VERSION:
+            raise ValueError(f"Unsupported package snapshot schemaVersion {snapshot.get('schemaVersion')}")
+        pr = snapshot["preAuthRequest"]
+        service_request = snapshot.get("serviceRequest") or {}
+        documents = []
+        for d in snapshot.get("supportingDocuments") or []:
+            code = d.get("code") or {}
+            documents.append(
+                {
+                    "id": d["id"],
+                    "code": code.get("code"),
+                    "display": code.get("display"),
+                    "dateTime": d.get("dateTime"),
+                    "title": d.get("title"),
+                    "role": d.get("role"),
+                }
+            )
+        return cls(
+            preauth_id=pr["id"],
+            snapshot_id=snapshot_id,
+            priority=pr.get("priority"),
+            payer=pr.get("payer"),
+            diagnosis=Coding.from_json((snapshot.get("diagnosisCondition") or {}).get("code")),
+            service=Coding.from_json(service_request.get("code")),
+            service_priority=service_request.get("priority"),
+            documents=documents,
+        )
@@ -0,0 +1,197 @@
+"""
+The payer review queue: pre-auths awaiting a payer decision, handed out to reviewers (people in the payer
+console, or automated review workers) under a lease so that no two of them work the same item.
+
+`claim` takes the next N queued pre-auths by priority, then age, locking the candidate rows with
+`FOR UPDATE SKIP LOCKED`, so concurrent claims skip each other's rows instead of waiting on them. Each claim
+writes a lease (som_preauth_queue_lease) that lapses after `lease_seconds` unless renewed by `heartbeat`;
+`release` gives items back. An item leaves the queue when its status moves on (decided, pending-info...), and
+an expired or released lease makes it claimable again. Claim order, depth and age all read the partial
+ix_preauth_queue index (migration 0015).
+"""
+
+from __future__ import annotations
+
+import uuid
+from typing import Any
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.tracing import traced
+
+# Statuses of pre-auths waiting on the payer; the predicate of ix_preauth_queue.
+QUEUE_STATUSES = ("submitted", "resubmitted", "in-review")
+PRIORITIES = ("stat", "asap", "urgent", "routine")
+# Claim order; the same expression as ix_preauth_queue. Unknown priorities rank with routine.
+PRIORITY_RANK = "CASE pr.priority WHEN 'stat' THEN 0 WHEN 'asap' THEN 1 WHEN 'urgent' THEN 2 ELSE 3 END"
+_QUEUED = f"pr.status IN ({', '.join(repr(status) for status in QUEUE_STATUSES)})"
+_LEASED = (
+    "EXISTS (SELECT 1 FROM som_preauth_queue_lease l WHERE l.preauth_request_id = pr.id AND l.expires_time > now())"
+)
+MAX_CLAIM = 50
+
+
+class LeaseLost(ValueError):
+    """The lease expired (and may have been claimed by someone else) or was released (HTTP 409)."""
+
+
+class PreAuthQueueService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    @traced("PreAuthQueueService.claim")
+    def claim(
+        self, *, reviewer: str, limit: int = 1, lease_seconds: int | None = None, payer: str | None = None
+    ) -> dict[str, Any]:
+        if not reviewer:
+            raise ValueError("reviewer required")
+        if not 1 <= limit <= MAX_CLAIM:
+            raise ValueError(f"limit must be between 1 and {MAX_CLAIM}")
+        lease_seconds = int(lease_seconds or settings.preauth_queue_lease_seconds)
+        if lease_seconds <= 0:
+            raise ValueError("leaseSeconds must be positive")
+        lease_id = uuid.uuid4()
+        # Rows locked by a concurrent claim are skipped. A claim that committed after this statement's snapshot
+        # was taken is invisible to the NOT EXISTS, so the insert re-checks: it only takes over expired leases.
+        rows = self.db.execute(
+            text(
+                f"""
+                WITH candidates AS (
+                    SELECT pr.id FROM som_preauth_request pr
+                    WHERE {_QUEUED} {"AND pr.payer = :payer" if payer else ""} AND NOT {_LEASED}
+                    ORDER BY {PRIORITY_RANK}, pr.updated_time
+                    LIMIT :limit
+                    FOR UPDATE OF pr SKIP LOCKED
+                )
+                INSERT INTO som_preauth_queue_lease
+                    (preauth_request_id, lease_id, claimed_by, claimed_time, heartbeat_time, expires_time)
+                SELECT id, :lease_id, :reviewer, now(), now(), now() + make_interval(secs => :lease_seconds)
+                FROM candidates
+                ON CONFLICT (preauth_request_id) DO UPDATE SET
+                    lease_id = EXCLUDED.lease_id,
+                    claimed_by = EXCLUDED.claimed_by,
+                    claimed_time = EXCLUDED.claimed_time,
+                    heartbeat_time = EXCLUDED.heartbeat_time,
+                    expires_time = EXCLUDED.expires_time
+                WHERE som_preauth_queue_lease.expires_time <= now()
+                RETURNING preauth_request_id, expires_time
+                """
+            ),
+            {
+                "payer": payer,
+                "limit": limit,
+                "lease_id": lease_id,
+                "reviewer": reviewer,
+                "lease_seconds": lease_seconds,
+            },
+        ).all()
+        expires = rows[0].expires_time.isoformat() if rows else None
+        return {
+            "leaseId": str(lease_id) if rows else None,
+            "claimedBy": reviewer,
+            "expiresTime": expires,
+            "items": self._items([r.preauth_request_id for r in rows]),
+        }
+
+    @traced("PreAuthQueueService.heartbeat")
+    def heartbeat(self, lease_id: str, *, lease_seconds: int | None = None) -> dict[str, Any]:
+        """Extend every live item of the lease by lease_seconds from now."""
+        lease_seconds = int(lease_seconds or settings.preauth_queue_lease_seconds)
+        if lease_seconds <= 0:
+            raise ValueError("leaseSeconds must be positive")
+        rows = self.db.execute(
+            text(
+                """
+                UPDATE som_preauth_queue_lease
+                SET heartbeat_time = now(), expires_time = now() + make_interval(secs => :lease_seconds)
+                WHERE lease_id = :lease_id AND expires_time > now()
+                RETURNING preauth_request_id, expires_time
+                """
+            ),
+            {"lease_id": uuid.UUID(lease_id), "lease_seconds": lease_seconds},
+        ).all()
+        if not rows:
+            raise LeaseLost(f"Lease {lease_id} has expired or was released")
+        return {
+            "leaseId": lease_id,
+            "expiresTime": rows[0].expires_time.isoformat(),
+            "preAuthIds": sorted(str(r.preauth_request_id) for r in rows),
+        }
+
+    @traced("PreAuthQueueService.release")
+    def release(self, lease_id: str, *, preauth_ids: list[str] | None = None) -> dict[str, Any]:
+        """Give back the lease's items (or just `preauth_ids`), making any still queued claimable again."""
+        params: dict[str, Any] = {"lease_id": uuid.UUID(lease_id)}
+        only = ""
+        if preauth_ids is not None:
+            only = "AND preauth_request_id = ANY(:ids)"
+            params["ids"] = [uuid.UUID(i) for i in preauth_ids]
+        rows = self.db.execute(
+            text(f"DELETE FROM som_preauth_queue_lease WHERE lease_id = :lease_id {only} RETURNING preauth_request_id"),
+            params,
+        ).all()
+        return {"leaseId": lease_id, "released": sorted(str(r.preauth_request_id) for r in rows)}
+
+    def stats(self, *, payer: str | None = None) -> dict[str, Any]:
+        """Queue depth (claimed and available), the age of the oldest item, and depth by priority."""
+        rows = self.db.execute(
+            text(
+                f"""
+                SELECT {PRIORITY_RANK} AS rank,
+                       count(*) AS depth,
+                       count(*) FILTER (WHERE {_LEASED}) AS claimed,
+                       EXTRACT(EPOCH FROM now() - min(pr.updated_time)) AS oldest
+                FROM som_preauth_request pr
+                WHERE {_QUEUED} {"AND pr.payer = :payer" if payer else ""}
+                GROUP BY 1
+                """
+            ),
+            {"payer": payer},
+        ).all()
+        depth = sum(r.depth for r in rows)
+        claimed = sum(r.claimed for r in rows)
+        oldest = max((float(r.oldest) for r in rows), default=None)
+        by_priority = {p: 0 for p in PRIORITIES}
+        for r in rows:
+            by_priority[PRIORITIES[r.rank]] += r.depth
+        return {
+            "payer": payer,
+            "depth": depth,
+            "claimed": claimed,
+            "available": depth - claimed,
+            "oldestAgeSeconds": round(oldest, 3) if oldest is not None else None,
+            "byPriority": by_priority,
+        }
+
+    def _items(self, ids: list[uuid.UUID]) -> list[dict[str, Any]]:
+        # One query for every claimed item, in claim order.
+        if not ids:
+            return []
+        rows = self.db.execute(
+            text(
+                f"""
+                SELECT pr.id, pr.status, pr.priority, pr.payer, pr.patient_id, pr.service_request_id,
+                       pr.diagnosis_condition_id, pr.version, pr.updated_time
+                FROM som_preauth_request pr
+                WHERE pr.id = ANY(:ids)
+                ORDER BY {PRIORITY_RANK}, pr.updated_time
+                """
+            ),
+            {"ids": ids},
+        ).all()
+        return [
+            {
+                "id": str(r.id),
+                "status": r.status,
+                "priority": r.priority,
+                "payer": r.payer,
+                "patientId": str(r.patient_id),
+                "serviceRequestId": str(r.service_request_id),
+                "diagnosisConditionId": str(r.diagnosis_condition_id),
+                "version": r.version,
+                "updatedTime": r.updated_time.isoformat(),
+            }
+            for r in rows
+        ]
@@ -4,13 +4,16 @@ import datetime as dt
 import hashlib
 import json
 import uuid
-from typing import Any
+from typing import Any, Iterator
 
 from sqlalchemy import desc, select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
+from app.core.tracing import traced
 from app.db.models import (
+    SomCodeSystem,
+    SomConcept,
     SomCondition,
     SomDocument,
     SomEncounter,
@@ -26,13 +29,58 @@ from app.db.models import (
 )
 from app.services.audit import AuditService
 from app.services.jobs.service import JobService
+from app.services.preauth.package import SNAPSHOT_SCHEMA_VERSION, PreAuthPackage
 from app.services.provenance import ProvenanceService
 
 
+# Columns rendering a joined SomConcept/SomCodeSystem pair as a coding (see _coding).
+_CODING = (SomCodeSystem.system_uri, SomConcept.code, SomConcept.display)
+
+
+def _coding(row: Any) -> dict[str, Any]:
+    return {"system": row.system_uri, "code": row.code, "display": row.display}
+
+
+def _canonical(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"))
+
+
+def _canonical_chunks(snapshot: dict[str, Any], batch: int = 256) -> Iterator[str]:
+    # Top-level keys one by one and long lists `batch` elements at a time: memory stays flat as the package
+    # grows while the C encoder still does the work. The concatenation is exactly _canonical(snapshot).
+    if not any(isinstance(v, list) and len(v) > batch for v in snapshot.values()):
+        yield _canonical(snapshot)
+        return
+    yield "{"
+    for i, key in enumerate(sorted(snapshot)):
+        value = snapshot[key]
+        yield f"{',' if i else ''}{_canonical(key)}:"
+        if isinstance(value, list) and len(value) > batch:
+            yield "["
+            for start in range(0, len(value), batch):
+                yield f"{',' if start else ''}{_canonical(value[start:start + batch])[1:-1]}"
+            yield "]"
+        else:
+            yield _canonical(value)
+    yield "}"
+
+
+def snapshot_checksum(snapshot: dict[str, Any]) -> str:
+    """
+    sha256 of the snapshot's canonical JSON (sorted keys, no whitespace), hashed as it is encoded rather than
+    from one string of the whole package.
+    """
+    digest = hashlib.sha256()
+    for chunk in _canonical_chunks(snapshot):
+        digest.update(chunk.encode("utf-8"))
+    return digest.hexdigest()
+
+
 class PreAuthService:
     def __init__(self, db: Session):
         self.db = db
 
+    @traced("PreAuthService.create_draft")
     def create_draft(self, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any]:
         if correlation_id:
             prior = AuditService(self.db).find_idempotent_result(
@@ -111,14 +159,17 @@ class PreAuthService:
         )
         return out
 
+    @traced("PreAuthService.submit")
     def submit(self, preauth_id: str, *, correlation_id: str | None) -> dict[str, Any]:
         # Draft -> submitted
         return self._submit_like(preauth_id, correlation_id=correlation_id, mode="submit")
 
+    @traced("PreAuthService.resubmit")
     def resubmit(self, preauth_id: str, *, correlation_id: str | None) -> dict[str, Any]:
         # Pending-info -> resubmitted (requires requested docs satisfied)
         return self._submit_like(preauth_id, correlation_id=correlation_id, mode="resubmit")
 
+    @traced("PreAuthService.enqueue_review")
     def enqueue_review(self, preauth_id: str, *, correlation_id: str | None) -> dict[str, Any]:
         """
         Recovery endpoint: if a PreAuth is in-flight (submitted/resubmitted/in-review) but no job is running
@@ -180,6 +231,7 @@ class PreAuthService:
         )
         return out
 
+    @traced("PreAuthService._submit_like")
     def _submit_like(self, preauth_id: str, *, correlation_id: str | None, mode: str) -> dict[str, Any]:
         op = "submit" if mode == "submit" else "resubmit"
         req = {"preAuthId": preauth_id, "mode": mode}
@@ -308,6 +360,7 @@ class PreAuthService:
         if missing_codes:
             raise ValueError(f"Missing required documents for resubmission: {', '.join(sorted(set(missing_codes)))}")
 
+    @traced("PreAuthService.attach_document")
     def attach_document(self, preauth_id: str, body: dict[str, Any], *, correlation_id: str | None) -> dict[str, Any]:
         doc_id = body.get("documentId")
         if not doc_id:
@@ -509,57 +562,27 @@ class PreAuthService:
         )
         self.db.add(row)
 
+    @traced("PreAuthService._create_snapshot")
     def _create_snapshot(self, pr: SomPreAuthRequest, *, correlation_id: str | None) -> SomPreAuthPackageSnapshot:
+        snapshot_obj = self._build_snapshot(pr)
+        checksum = snapshot_checksum(snapshot_obj)
+        # Snapshots are immutable, so an identical package (same checksum) reuses the one already taken.
+        existing = self.db.execute(
+            select(SomPreAuthPackageSnapshot)
+            .where(SomPreAuthPackageSnapshot.preauth_request_id == pr.id)
+            .where(SomPreAuthPackageSnapshot.checksum == checksum)
+            .order_by(desc(SomPreAuthPackageSnapshot.created_time))
+            .limit(1)
+        ).scalar_one_or_none()
+        if existing:
+            return existing
         prov = ProvenanceService(self.db).create(activity="snapshot", author=None, correlation_id=correlation_id)
-        obs_ids = pr.extensions.get("supportingObservationIds") or []
-        observations: list[dict[str, Any]] = []
-        for oid in obs_ids:
-            o = self.db.get(SomObservation, uuid.UUID(oid))
-            if o:
-                observations.append({"id": str(o.id), "codeConceptId": str(o.code_concept_id), "effectiveTime": o.effective_time.isoformat(), "status": o.status})
-        doc_links = (
-            self.db.execute(
-                select(SomPreAuthSupportingDocument)
-                .where(SomPreAuthSupportingDocument.preauth_request_id == pr.id)
-                .order_by(SomPreAuthSupportingDocument.added_time.asc())
-            )
-            .scalars()
-            .all()
-        )
-        documents: list[dict[str, Any]] = []
-        for link in doc_links:
-            d = self.db.get(SomDocument, link.document_id)
-            if d:
-                documents.append(
-                    {
-                        "id": str(d.id),
-                        "typeConceptId": str(d.type_concept_id),
-                        "dateTime": d.date_time.isoformat() if d.date_time else None,
-                        "title": d.title,
-                        "binaryId": str(d.binary_id) if d.binary_id else None,
-                        "role": link.role,
-                    }
-                )
-        snapshot_obj = {
-            "schemaVersion": "1",
-            "preAuthRequest": {"id": str(pr.id), "status": pr.status, "priority": pr.priority, "payer": pr.payer},
-            "patient": {"id": str(pr.patient_id)},
-            "encounter": {"id": str(pr.encounter_id)} if pr.encounter_id else None,
-            "practitioner": {"id": str(pr.practitioner_id)},
-            "organization": {"id": str(pr.organization_id)} if pr.organization_id else None,
-            "diagnosisCondition": {"id": str(pr.diagnosis_condition_id)},
-            "serviceRequest": {"id": str(pr.service_request_id)},
-            "supportingObservations": observations,
-            "supportingDocuments": documents,
-        }
-        canonical = json.dumps(snapshot_obj, sort_keys=True, separators=(",", ":")).encode("utf-8")
-        checksum = hashlib.sha256(canonical).hexdigest()
         snap = SomPreAuthPackageSnapshot(
             preauth_request_id=pr.id,
             created_time=dt.datetime.now(dt.timezone.utc),
             correlation_id=correlation_id,
             provenance_id=prov.id,
-            schema_version="1",
+            schema_version=SNAPSHOT_SCHEMA_VERSION,
             checksum=checksum,
             snapshot=snapshot_obj,
             extensions={},
@@ -587,6 +610,119 @@ class PreAuthService:
         )
         return snap
 
+    def _build_snapshot(self, pr: SomPreAuthRequest) -> dict[str, Any]:
+        """The package as submitted, with concept codes inline; four queries whatever the package size."""
+        obs_ids = [uuid.UUID(oid) for oid in pr.extensions.get("supportingObservationIds") or []]
+        found: dict[uuid.UUID, dict[str, Any]] = {}
+        if obs_ids:
+            rows = self.db.execute(
+                select(
+                    SomObservation.id,
+                    SomObservation.code_concept_id,
+                    SomObservation.effective_time,
+                    SomObservation.status,
+                    *_CODING,
+                )
+                .join(SomConcept, SomConcept.id == SomObservation.code_concept_id)
+                .join(SomCodeSystem, SomCodeSystem.id == SomConcept.code_system_id)
+                .where(SomObservation.id.in_(set(obs_ids)))
+            ).all()
+            found = {
+                r.id: {
+                    "id": str(r.id),
+                    "codeConceptId": str(r.code_concept_id),
+                    "code": _coding(r),
+                    "effectiveTime": r.effective_time.isoformat(),
+                    "status": r.status,
+                }
+                for r in rows
+            }
+        # In the order they were picked; ids that no longer resolve are left out.
+        observations = [found[oid] for oid in obs_ids if oid in found]
+
+        doc_rows = self.db.execute(
+            select(
+                SomDocument.id,
+                SomDocument.type_concept_id,
+                SomDocument.date_time,
+                SomDocument.created_time,
+                SomDocument.title,
+                SomDocument.binary_id,
+                SomPreAuthSupportingDocument.role,
+                *_CODING,
+            )
+            .select_from(SomPreAuthSupportingDocument)
+            .join(SomDocument, SomDocument.id == SomPreAuthSupportingDocument.document_id)
+            .join(SomConcept, SomConcept.id == SomDocument.type_concept_id)
+            .join(SomCodeSystem, SomCodeSystem.id == SomConcept.code_system_id)
+            .where(SomPreAuthSupportingDocument.preauth_request_id == pr.id)
+            .order_by(SomPreAuthSupportingDocument.added_time.asc())
+        ).all()
+        documents = [
+            {
+                "id": str(d.id),
+                "typeConceptId": str(d.type_concept_id),
+                "code": _coding(d),
+                # Undated documents count from when they were recorded, as the payer review does.
+                "dateTime": (d.date_time or d.created_time).isoformat(),
+                "title": d.title,
+                "binaryId": str(d.binary_id) if d.binary_id else None,
+                "role": d.role,
+            }
+            for d in doc_rows
+        ]
+
+        sr = self.db.execute(
+            select(SomServiceRequest.priority, *_CODING)
+            .join(SomConcept, SomConcept.id == SomServiceRequest.code_concept_id)
+            .join(SomCodeSystem, SomCodeSystem.id == SomConcept.code_system_id)
+            .where(SomServiceRequest.id == pr.service_request_id)
+        ).first()
+        diagnosis = self.db.execute(
+            select(*_CODING)
+            .select_from(SomCondition)
+            .join(SomConcept, SomConcept.id == SomCondition.code_concept_id)
+            .join(SomCodeSystem, SomCodeSystem.id == SomConcept.code_system_id)
+            .where(SomCondition.id == pr.diagnosis_condition_id)
+        ).first()
+        return {
+            "schemaVersion": SNAPSHOT_SCHEMA_VERSION,
+            "preAuthRequest": {"id": str(pr.id), "status": pr.status, "priority": pr.priority, "payer": pr.payer},
+            "patient": {"id": str(pr.patient_id)},
+            "encounter": {"id": str(pr.encounter_id)} if pr.encounter_id else None,
+            "practitioner": {"id": str(pr.practitioner_id)},
+            "organization": {"id": str(pr.organization_id)} if pr.organization_id else None,
+            "diagnosisCondition": {
+                "id": str(pr.diagnosis_condition_id),
+                "code": _coding(diagnosis) if diagnosis else None,
+            },
+            "serviceRequest": {
+                "id": str(pr.service_request_id),
+                "priority": sr.priority if sr else None,
+                "code": _coding(sr) if sr else None,
+            },
+            "supportingObservations": observations,
+            "supportingDocuments": documents,
+        }
+
+    def package(self, pr: SomPreAuthRequest, *, snapshot_id: str | None) -> PreAuthPackage:
+        """
+        The package a payer decision is made on: the submitted snapshot (the job's snapshotId, else the latest),
+        in one query. Snapshots taken before schemaVersion 2 lack the concept codes; for those the package is
+        rebuilt from the pre-auth as it is now.
+        """
+        stmt = select(SomPreAuthPackageSnapshot.id, SomPreAuthPackageSnapshot.snapshot).where(
+            SomPreAuthPackageSnapshot.preauth_request_id == pr.id
+        )
+        if snapshot_id:
+            stmt = stmt.where(SomPreAuthPackageSnapshot.id == uuid.UUID(snapshot_id))
+        else:
+            stmt = stmt.order_by(desc(SomPreAuthPackageSnapshot.created_time)).limit(1)
+        row = self.db.execute(stmt).first()
+        if row and str(row.snapshot.get("schemaVersion")) == SNAPSHOT_SCHEMA_VERSION:
+            return PreAuthPackage.from_snapshot(row.snapshot, snapshot_id=str(row.id))
+        return PreAuthPackage.from_snapshot(self._build_snapshot(pr), snapshot_id=str(row.id) if row else None)
+
     @staticmethod
     def _snapshot_dict(s: SomPreAuthPackageSnapshot) -> dict[str, Any]:
         return {
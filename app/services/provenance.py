@@ -14,8 +14,14 @@ class ProvenanceService:
     def __init__(self, db: Session):
         self.db = db
 
-    def create(
-        self,
+    def create(self, **fields: Any) -> SomProvenance:
+        prov = SomProvenance(**self.values(**fields))
+        self.db.add(prov)
+        self.db.flush()
+        return prov
+
+    @staticmethod
+    def values(
         *,
         activity: str,
         author: str | None,
@@ -31,13 +37,16 @@ class ProvenanceService:
         target_som_table: str | None = None,
         target_som_id: str | None = None,
         extensions: dict[str, Any] | None = None,
-    ) -> SomProvenance:
+    ) -> dict[str, Any]:
+        """Column values of a new som_provenance row, id included (for writes that insert it themselves)."""
+
         def _uuid(v: str | None) -> uuid.UUID | None:
             if not v:
                 return None
             return uuid.UUID(str(v))
 
-        prov = SomProvenance(
+        return dict(
+            id=uuid.uuid4(),
             source_system=source_system or settings.default_source_system,
             recorded_time=dt.datetime.now(dt.timezone.utc),
             activity=activity,
@@ -54,9 +63,6 @@ class ProvenanceService:
             target_som_id=_uuid(target_som_id),
             extensions=extensions or {},
         )
-        self.db.add(prov)
-        self.db.flush()
-        return prov
 
     def set_target(
         self,
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import datetime as dt
+import uuid
 from typing import Any
 
 from sqlalchemy.orm import Session
@@ -46,7 +47,8 @@ class ScenarioService:
         family = patient_in.get("family") or "Test"
         given = patient_in.get("given") or "Patient"
         birth_date = patient_in.get("birthDate") or "1980-01-01"
-        mrn = patient_in.get("mrn") or f"MRN-{dt.datetime.now(dt.timezone.utc).strftime('%H%M%S')}"
+        # Generated MRNs must not collide: the Patient identifier is unique.
+        mrn = patient_in.get("mrn") or f"MRN-{uuid.uuid4().hex[:12].upper()}"
 
         now = dt.datetime.now(dt.timezone.utc)
 
@@ -0,0 +1,225 @@
+"""
+Subscription delivery from the change feed (som_change_event, see migration 0011).
+
+Events are read from the outbox after a cursor (in commit-safe order, see app.services.subscriptions.feed) and
+matched against each subscription's criteria with the
+search compiler (one `id IN (...)` query per subscription and batch), so criteria mean exactly what the same
+search means.
+
+rest-hook: RestHookDispatcher keeps a cursor per subscription in som_subscription. Each round sends every due
+subscriber at most one batch (up to SUBSCRIPTION_BATCH_SIZE resources) as a single POST: a history Bundle of
+the changed resources, or an empty body when the subscription has no payload. Sends run concurrently and
+outside any transaction. A failing endpoint backs off exponentially and is set to `error` after
+SUBSCRIPTION_MAX_FAILURES attempts; it never holds up the other subscribers.
+
+websocket: see app.services.subscriptions.websocket.
+
+`python -m app.subscription_dispatcher` runs the rest-hook loop: it LISTENs on `som_change` and also polls,
+so a missed notification only delays delivery.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import httpx
+import psycopg
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import SomSubscription
+from app.db.session import SessionLocal
+from app.services.mapping.fhir_dispatch import fhir_matching_ids, fhir_read_many
+from app.services.mapping.fhir_utils import history_bundle
+from app.services.mapping.resources.subscription import parse_criteria
+from app.services.subscriptions.feed import ChangeEvent, Cursor, prune_events, read_events
+
+log = logging.getLogger(__name__)
+
+CHANNEL = "som_change"
+
+
+def match_events(db: Session, criteria: str, events: list[ChangeEvent]) -> list[ChangeEvent]:
+    """The events whose resource currently matches `criteria`, in feed order."""
+    resource_type, params = parse_criteria(criteria)
+    candidates = [e for e in events if e.resource_type == resource_type]
+    if not candidates:
+        return []
+    ids = fhir_matching_ids(db, resource_type, params, {e.resource_id for e in candidates})
+    return [e for e in candidates if e.resource_id in ids]
+
+
+@dataclass
+class _Delivery:
+    subscription_id: uuid.UUID
+    endpoint: str
+    headers: list[str]
+    cursor_after: Cursor
+    body: dict[str, Any] | None = None
+    events: int = 0
+    error: str | None = None
+    # Errors that retrying won't fix (e.g. criteria that no longer compile) stop the subscription at once.
+    fatal: bool = False
+
+
+class RestHookDispatcher:
+    def __init__(
+        self,
+        *,
+        session_factory: Callable[[], Session] = SessionLocal,
+        client: httpx.Client | None = None,
+    ):
+        self.session_factory = session_factory
+        self.client = client or httpx.Client(timeout=settings.subscription_http_timeout_seconds)
+
+    def dispatch_once(self) -> dict[str, int]:
+        """One round over the due rest-hook subscriptions. Returns counts of delivered events and failed sends."""
+        with self.session_factory() as db:
+            plans = self._plan(db)
+            db.commit()
+        sends = [p for p in plans if p.events]
+        if sends:
+            with ThreadPoolExecutor(max_workers=min(len(sends), settings.subscription_max_concurrency)) as pool:
+                list(pool.map(self._send, sends))
+        with self.session_factory() as db:
+            for p in plans:
+                self._record(db, p)
+            db.commit()
+        return {
+            "delivered": sum(p.events for p in sends if p.error is None),
+            "failed": sum(1 for p in sends if p.error is not None),
+        }
+
+    def _plan(self, db: Session) -> list[_Delivery]:
+        now = dt.datetime.now(dt.timezone.utc)
+        db.execute(
+            update(SomSubscription)
+            .where(SomSubscription.status == "active", SomSubscription.end_time < now)
+            .values(status="off", updated_time=SomSubscription.updated_time)
+        )
+        subs = db.execute(
+            select(SomSubscription)
+            .where(SomSubscription.status == "active", SomSubscription.channel_type == "rest-hook")
+            .where(or_(SomSubscription.next_attempt_time.is_(None), SomSubscription.next_attempt_time <= now))
+        ).scalars().all()
+        if not subs:
+            return []
+        cursors = {s.id: (s.delivery_cursor_xact, s.delivery_cursor) for s in subs}
+        events = read_events(db, after=min(cursors.values()), limit=settings.subscription_scan_limit)
+        if not events:
+            return []
+        window_end = events[-1].cursor
+
+        plans = []
+        for sub in subs:
+            cursor = cursors[sub.id]
+            pending = [e for e in events if e.cursor > cursor]
+            plan = _Delivery(sub.id, sub.endpoint or "", list(sub.headers or []), max(cursor, window_end))
+            try:
+                matched = match_events(db, sub.criteria, pending)
+            except ValueError as e:
+                plan.error, plan.fatal = f"criteria no longer valid: {e}", True
+                plans.append(plan)
+                continue
+            if len(matched) > settings.subscription_batch_size:
+                # Backpressure: one batch per subscriber per round; the rest waits for the next round.
+                matched = matched[: settings.subscription_batch_size]
+                plan.cursor_after = matched[-1].cursor
+            plan.events = len(matched)
+            if matched:
+                plan.body = self._body(db, sub, matched)
+            plans.append(plan)
+        return plans
+
+    @staticmethod
+    def _body(db: Session, sub: SomSubscription, events: list[ChangeEvent]) -> dict[str, Any] | None:
+        if not sub.payload:
+            return None
+        ids = list(dict.fromkeys(e.resource_id for e in events))
+        resources = {r["id"]: r for r in fhir_read_many(db, sub.criteria_resource_type, ids)}
+        return history_bundle([resources[str(i)] for i in ids if str(i) in resources])
+
+    def _send(self, plan: _Delivery) -> None:
+        headers = {"Content-Type": "application/fhir+json"}
+        for h in plan.headers:
+            name, _, value = h.partition(":")
+            headers[name.strip()] = value.strip()
+        try:
+            r = self.client.post(plan.endpoint, json=plan.body, headers=headers)
+            if r.status_code >= 300:
+                plan.error = f"HTTP {r.status_code} from {plan.endpoint}"
+        except httpx.HTTPError as e:
+            plan.error = f"{type(e).__name__}: {e}"
+
+    def _record(self, db: Session, plan: _Delivery) -> None:
+        # Delivery bookkeeping is not a new version of the Subscription: no version bump, updated_time kept.
+        keep_updated_time = {"updated_time": SomSubscription.updated_time}
+        if plan.error is None:
+            db.execute(
+                update(SomSubscription)
+                .where(SomSubscription.id == plan.subscription_id)
+                .values(
+                    delivery_cursor_xact=plan.cursor_after[0],
+                    delivery_cursor=plan.cursor_after[1],
+                    failure_count=0,
+                    next_attempt_time=None,
+                    error=None,
+                    **keep_updated_time,
+                )
+            )
+            return
+        sub = db.get(SomSubscription, plan.subscription_id)
+        if sub is None:
+            return
+        failures = sub.failure_count + 1
+        delay = min(2**failures, settings.subscription_retry_max_seconds)
+        log.warning("subscription %s delivery failed (%s): %s", sub.id, failures, plan.error)
+        db.execute(
+            update(SomSubscription)
+            .where(SomSubscription.id == plan.subscription_id)
+            .values(
+                failure_count=failures,
+                next_attempt_time=dt.datetime.now(dt.timezone.utc) + dt.timedelta(seconds=delay),
+                error=plan.error,
+                status="error" if plan.fatal or failures >= settings.subscription_max_failures else sub.status,
+                **keep_updated_time,
+            )
+        )
+
+
+def listen_dsn() -> str:
+    # psycopg wants a libpq URL, without SQLAlchemy's driver suffix.
+    return settings.database_url.replace("postgresql+psycopg://", "postgresql://")
+
+
+def wait_for_changes(conn: psycopg.Connection, timeout: float) -> None:
+    """Block until a `som_change` notification arrives (draining any queued ones) or `timeout` passes."""
+    for _ in conn.notifies(timeout=timeout, stop_after=1):
+        pass
+
+
+def run_forever() -> None:
+    dispatcher = RestHookDispatcher()
+    last_prune = 0.0
+    with psycopg.connect(listen_dsn(), autocommit=True) as conn:
+        conn.execute(f"LISTEN {CHANNEL}")
+        while True:
+            try:
+                stats = dispatcher.dispatch_once()
+                if stats["delivered"] or stats["failed"]:
+                    log.info("subscriptions: %s", stats)
+                now = dt.datetime.now().timestamp()
+                if now - last_prune > 600:
+                    with SessionLocal() as db:
+                        prune_events(db, older_than_hours=settings.change_feed_retention_hours)
+                        db.commit()
+                    last_prune = now
+            except Exception:
+                log.exception("subscription dispatch round failed")
+            wait_for_changes(conn, settings.subscription_poll_seconds)
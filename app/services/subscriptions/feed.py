@@ -0,0 +1,68 @@
+"""
+Reading the change feed (som_change_event, migrations 0011 and 0016) in commit-safe order.
+
+Event ids are assigned at insert time, so a transaction holding a smaller id can commit after a larger id has
+been read. The feed is therefore read in (xact_id, id) order, and only for transactions older than the oldest
+one still in flight (`pg_snapshot_xmin`). Every such transaction has committed or rolled back, so nothing new
+can appear before that point, and a cursor that moves past it loses nothing. The cost is that a long-running
+writing transaction holds back delivery of everything after it until it ends.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import uuid
+from dataclasses import dataclass
+
+from sqlalchemy import BigInteger, Text, delete, func, select, tuple_
+from sqlalchemy.orm import Session
+
+from app.db.models import SomChangeEvent
+
+# A position in the feed: (xact_id, id) of the last event read.
+Cursor = tuple[int, int]
+
+# Transactions below this are finished; the same snapshot as the statement it is used in.
+_HORIZON = func.pg_snapshot_xmin(func.pg_current_snapshot()).cast(Text).cast(BigInteger)
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    id: int
+    xact_id: int
+    resource_type: str
+    resource_id: uuid.UUID
+    version: int
+    operation: str
+    correlation_id: str | None
+
+    @property
+    def cursor(self) -> Cursor:
+        return (self.xact_id, self.id)
+
+
+def read_events(db: Session, *, after: Cursor, limit: int) -> list[ChangeEvent]:
+    rows = db.execute(
+        select(SomChangeEvent)
+        .where(tuple_(SomChangeEvent.xact_id, SomChangeEvent.id) > tuple_(*after))
+        .where(SomChangeEvent.xact_id < _HORIZON)
+        .order_by(SomChangeEvent.xact_id, SomChangeEvent.id)
+        .limit(limit)
+    ).scalars()
+    return [
+        ChangeEvent(r.id, r.xact_id, r.resource_type, r.resource_id, r.version, r.operation, r.correlation_id)
+        for r in rows
+    ]
+
+
+def head_cursor(db: Session) -> Cursor:
+    """
+    A cursor after every finished transaction. Events from transactions still in flight, or committed since
+    the horizon, come after it.
+    """
+    return (db.execute(select(_HORIZON)).scalar_one(), 0)
+
+
+def prune_events(db: Session, *, older_than_hours: int) -> int:
+    cutoff = dt.datetime.now(dt.timezone.utc) - dt.timedelta(hours=older_than_hours)
+    return db.execute(delete(SomChangeEvent).where(SomChangeEvent.recorded_time < cutoff)).rowcount
@@ -0,0 +1,143 @@
+"""
+websocket channel for FHIR R4 Subscriptions (`/fhir/$subscription-ws`).
+
+A client connects, sends `bind <subscription id>` and gets `bound <id>` back; after that the hub sends
+`ping <id>` whenever a batch of changes matches the subscription, and the client searches for what changed.
+Every API process runs one hub: a daemon thread LISTENs on `som_change`, reads the outbox after an in-memory
+cursor and matches it against the subscriptions bound to this process (one ping per subscription per batch).
+
+Each connection has a bounded outgoing queue (SUBSCRIPTION_WEBSOCKET_QUEUE_SIZE). A client that stops reading
+fills it and further messages are dropped rather than buffered: pings carry no data, so a missed one costs the
+client nothing once it catches up and searches again.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+import uuid
+
+import psycopg
+from fastapi import WebSocket
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.models import SomSubscription
+from app.db.session import SessionLocal
+from app.services.subscriptions.dispatcher import CHANNEL, listen_dsn, match_events, wait_for_changes
+from app.services.subscriptions.feed import Cursor, head_cursor, read_events
+
+log = logging.getLogger(__name__)
+
+
+class Connection:
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def offer(self, message: str) -> None:
+        """Queue a message without waiting; must run on the connection's event loop."""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def pump(self) -> None:
+        while True:
+            await self.websocket.send_text(await self.queue.get())
+
+
+class WebSocketHub:
+    def __init__(self, *, queue_size: int):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        # subscription id -> (criteria, bound connections)
+        self._bound: dict[uuid.UUID, tuple[str, set[Connection]]] = {}
+        self._cursor: Cursor | None = None
+        self._thread: threading.Thread | None = None
+
+    def connect(self, websocket: WebSocket) -> Connection:
+        return Connection(websocket, self.queue_size)
+
+    def bind(self, conn: Connection, subscription_id: str) -> str | None:
+        """Bind `conn` to a websocket subscription; returns an error message, or None once bound."""
+        try:
+            sid = uuid.UUID(subscription_id)
+        except ValueError:
+            return f"invalid subscription id {subscription_id!r}"
+        with SessionLocal() as db:
+            sub = db.get(SomSubscription, sid)
+            if sub is None or sub.channel_type != "websocket":
+                return f"no websocket Subscription {subscription_id}"
+            if sub.status != "active":
+                return f"Subscription {subscription_id} is {sub.status}"
+            with self._lock:
+                if self._cursor is None:
+                    self._cursor = head_cursor(db)
+                _, conns = self._bound.setdefault(sid, (sub.criteria, set()))
+                conns.add(conn)
+        return None
+
+    def disconnect(self, conn: Connection) -> None:
+        with self._lock:
+            for sid, (_, conns) in list(self._bound.items()):
+                conns.discard(conn)
+                if not conns:
+                    del self._bound[sid]
+            if not self._bound:
+                # Nobody listening: the next bind starts from the head of the feed again.
+                self._cursor = None
+
+    def poll(self, db: Session) -> int:
+        """Ping connections whose subscriptions match changes since the last poll. Returns pings offered."""
+        with self._lock:
+            if self._cursor is None:
+                return 0
+            after = self._cursor
+            bound = {sid: (criteria, set(conns)) for sid, (criteria, conns) in self._bound.items()}
+        events = read_events(db, after=after, limit=settings.subscription_scan_limit)
+        if not events:
+            return 0
+        sent = 0
+        for sid, (criteria, conns) in bound.items():
+            try:
+                matched = match_events(db, criteria, events)
+            except ValueError:
+                log.warning("websocket subscription %s has invalid criteria %r", sid, criteria)
+                continue
+            if not matched:
+                continue
+            for conn in conns:
+                conn.loop.call_soon_threadsafe(conn.offer, f"ping {sid}")
+                sent += 1
+        with self._lock:
+            if self._cursor is not None:
+                self._cursor = max(self._cursor, events[-1].cursor)
+        return sent
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._listen, name="subscription-ws", daemon=True)
+        self._thread.start()
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                with psycopg.connect(listen_dsn(), autocommit=True) as conn:
+                    conn.execute(f"LISTEN {CHANNEL}")
+                    while True:
+                        if self._bound:
+                            with SessionLocal() as db:
+                                self.poll(db)
+                        wait_for_changes(conn, settings.subscription_poll_seconds)
+            except Exception:
+                log.exception("subscription websocket listener failed; reconnecting")
+                time.sleep(settings.subscription_poll_seconds)
+
+
+websocket_hub = WebSocketHub(queue_size=settings.subscription_websocket_queue_size)
@@ -0,0 +1,560 @@
+"""
+Synthetic patient population for load testing and benchmarks.
+
+Rows are generated in Python and written with COPY, one transaction per chunk of patients, so a population of
+millions of rows loads in minutes. Generation is reproducible: a chunk's rows (ids included) depend only on the
+seed, the chunk size, the chunk number and `as_of`, and a chunk that is already present is skipped, so an
+interrupted load can simply be re-run with the same arguments.
+
+Per patient, roughly (the distributions are skewed like real utilization: most patients have a few encounters,
+some have dozens):
+
+- birth date from an adult-heavy age distribution
+- chronic conditions by age-dependent prevalence (hypertension, type 2 diabetes, hyperlipidemia, ...)
+- encounters over the last three years (lognormal count, median 3)
+- a vital-signs panel on most encounters and a lab panel on about a third, with values shifted by the
+  patient's conditions (e.g. higher glucose and HbA1c with diabetes)
+- a clinical document (with a small text Binary) on about a quarter of encounters
+- for some patients with a condition, an imaging/procedure ServiceRequest for it and usually a pre-auth in a
+  realistic status mix, with status history, package snapshot and payer decision rows consistent with it
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import hashlib
+import json
+import math
+import random
+import uuid
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Iterable
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.db.models import SomOrganization, SomPatient, SomPractitioner
+from app.services import units
+from app.services.preauth.service import snapshot_checksum
+from app.services.provenance import ProvenanceService
+from app.services.terminology import TerminologyService
+
+SNOMED = "http://snomed.info/sct"
+LOINC = "http://loinc.org"
+CPT = "http://www.ama-assn.org/go/cpt"
+DOC_TYPES = "urn:sample-app:doc-type"
+IDENTIFIER_SYSTEM = "urn:synthetic:mrn"
+
+# (code, display, prevalence, minimum age)
+CONDITIONS = [
+    ("38341003", "Hypertension", 0.30, 25),
+    ("55822004", "Hyperlipidemia", 0.25, 30),
+    ("44054006", "Diabetes mellitus type 2", 0.11, 25),
+    ("396275006", "Osteoarthritis", 0.15, 45),
+    ("279039007", "Low back pain", 0.10, 18),
+    ("195967001", "Asthma", 0.08, 0),
+    ("35489007", "Depressive disorder", 0.08, 12),
+    ("263204007", "Acute knee injury", 0.03, 10),
+]
+
+# (code, display, category, unit, mean, sd, decimals)
+VITALS = [
+    ("8480-6", "Systolic blood pressure", "vital", "mm[Hg]", 122, 14, 0),
+    ("8462-4", "Diastolic blood pressure", "vital", "mm[Hg]", 78, 9, 0),
+    ("8867-4", "Heart rate", "vital", "/min", 74, 11, 0),
+    ("29463-7", "Body weight", "vital", "kg", 80, 17, 1),
+    ("8310-5", "Body temperature", "vital", "Cel", 36.8, 0.35, 1),
+]
+LABS = [
+    ("2345-7", "Glucose [Mass/volume] in Serum or Plasma", "lab", "mg/dL", 97, 14, 0),
+    ("4548-4", "Hemoglobin A1c/Hemoglobin.total in Blood", "lab", "%", 5.5, 0.5, 1),
+    ("2093-3", "Cholesterol [Mass/volume] in Serum or Plasma", "lab", "mg/dL", 190, 32, 0),
+    ("2160-0", "Creatinine [Mass/volume] in Serum or Plasma", "lab", "mg/dL", 0.95, 0.22, 2),
+    ("718-7", "Hemoglobin [Mass/volume] in Blood", "lab", "g/dL", 14, 1.4, 1),
+]
+# condition code -> {observation code: mean shift}
+EFFECTS = {
+    "38341003": {"8480-6": 18, "8462-4": 9},
+    "44054006": {"2345-7": 45, "4548-4": 1.8, "29463-7": 9},
+    "55822004": {"2093-3": 45},
+}
+
+# (code, display, indicating condition codes)
+SERVICES = [
+    ("73721", "MRI knee wo contrast", {"396275006", "263204007"}),
+    ("27447", "Total knee arthroplasty", {"396275006"}),
+    ("72148", "MRI lumbar spine wo contrast", {"279039007"}),
+    ("93306", "Echocardiography complete", {"38341003"}),
+    ("95251", "Continuous glucose monitoring", {"44054006"}),
+    ("94010", "Spirometry", {"195967001"}),
+]
+
+DOCUMENTS = [
+    ("progress-note", "Progress note"),
+    ("lab-report", "Lab report"),
+    ("knee-xray-report", "Knee X-ray report"),
+    ("discharge-summary", "Discharge summary"),
+]
+
+PREAUTH_STATUSES = [
+    ("draft", 30),
+    ("submitted", 10),
+    ("in-review", 5),
+    ("pending-info", 15),
+    ("approved", 30),
+    ("denied", 10),
+]
+PAYERS = [("Acme Payer", 70), ("Globex Health", 30)]
+
+FAMILY_NAMES = (
+    "Smith Johnson Williams Brown Jones Garcia Miller Davis Rodriguez Martinez Hernandez Lopez Gonzalez Wilson "
+    "Anderson Thomas Taylor Moore Jackson Martin Lee Perez Thompson White Harris Sanchez Clark Ramirez Lewis "
+    "Robinson Walker Young Allen King Wright Scott Torres Nguyen Hill Flores"
+).split()
+GIVEN_NAMES = (
+    "James Mary Robert Patricia John Jennifer Michael Linda David Elizabeth William Barbara Richard Susan Joseph "
+    "Jessica Thomas Sarah Charles Karen Daniel Lisa Matthew Nancy Anthony Betty Mark Sandra Paul Ashley Steven "
+    "Emily Andrew Donna Kenneth Michelle Joshua Carol Kevin Amanda"
+).split()
+# (min age, max age, weight): adult-heavy, like a health plan's membership.
+AGE_BANDS = [(0, 17, 18), (18, 34, 21), (35, 49, 19), (50, 64, 20), (65, 79, 15), (80, 99, 7)]
+
+_BASE = ("id", "created_time", "updated_time", "version", "created_provenance_id", "extensions")
+
+# Tables in load order (foreign keys first), with their COPY columns.
+COLUMNS: dict[str, tuple[str, ...]] = {
+    "som_patient": _BASE + ("identifier_system", "identifier_value", "name_family", "name_given", "birth_date"),
+    "som_encounter": _BASE + ("patient_id", "status", "start_time", "end_time"),
+    "som_condition": _BASE + ("patient_id", "code_concept_id", "clinical_status", "onset_date"),
+    "som_observation": _BASE
+    + (
+        "patient_id",
+        "encounter_id",
+        "status",
+        "category",
+        "code_concept_id",
+        "effective_time",
+        "value_type",
+        "value_quantity_value",
+        "value_quantity_unit",
+        "value_quantity_canonical",
+        "value_quantity_canonical_unit",
+    ),
+    "som_binary": _BASE + ("content_type", "data", "size_bytes", "sha256_hex"),
+    "som_document": _BASE
+    + ("patient_id", "encounter_id", "status", "type_concept_id", "date_time", "title", "description", "binary_id"),
+    "som_service_request": _BASE
+    + ("patient_id", "encounter_id", "code_concept_id", "status", "intent", "priority", "authored_on"),
+    "som_service_request_reason": _BASE + ("service_request_id", "condition_id", "role", "rank"),
+    "som_preauth_request": _BASE
+    + (
+        "patient_id",
+        "encounter_id",
+        "practitioner_id",
+        "organization_id",
+        "diagnosis_condition_id",
+        "service_request_id",
+        "status",
+        "priority",
+        "payer",
+        "policy_id",
+        "notes",
+    ),
+    "som_preauth_supporting_document": (
+        "id",
+        "preauth_request_id",
+        "document_id",
+        "role",
+        "added_time",
+        "correlation_id",
+        "provenance_id",
+        "extensions",
+    ),
+    "som_preauth_status_history": (
+        "id",
+        "preauth_request_id",
+        "from_status",
+        "to_status",
+        "changed_time",
+        "changed_by",
+        "correlation_id",
+        "provenance_id",
+        "extensions",
+    ),
+    "som_preauth_package_snapshot": (
+        "id",
+        "preauth_request_id",
+        "created_time",
+        "correlation_id",
+        "provenance_id",
+        "schema_version",
+        "checksum",
+        "snapshot",
+        "extensions",
+    ),
+    "som_preauth_decision": (
+        "id",
+        "preauth_request_id",
+        "decided_time",
+        "outcome",
+        "reason_codes",
+        "rationale",
+        "requested_additional_info",
+        "raw_payer_response",
+        "provenance_id",
+        "extensions",
+    ),
+}
+
+CORRELATION_ID = "synthetic-population"
+
+
+@dataclass
+class References:
+    """Ids shared by every chunk (resolved once by SyntheticPopulation.prepare)."""
+
+    provenance_id: uuid.UUID
+    concepts: dict[tuple[str, str], uuid.UUID]
+    practitioner_ids: list[uuid.UUID]
+    organization_ids: list[uuid.UUID]
+
+
+@dataclass
+class ChunkResult:
+    chunk: int
+    skipped: bool = False
+    rows: dict[str, int] = field(default_factory=dict)
+
+
+def _weighted(rng: random.Random, options: list[tuple[Any, int]]) -> Any:
+    return rng.choices([o for o, _ in options], weights=[w for _, w in options])[0]
+
+
+def _json(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"))
+
+
+def _iso(t: dt.datetime | None) -> str | None:
+    return t.isoformat() if t else None
+
+
+class SyntheticPopulation:
+    def __init__(self, db: Session, *, seed: int, as_of: dt.date | None = None):
+        self.db = db
+        self.seed = seed
+        self.as_of = as_of or dt.date.today()
+        self._now = dt.datetime.combine(self.as_of, dt.time(), tzinfo=dt.timezone.utc)
+
+    # --- reference data ---
+
+    def prepare(self, patients: int) -> References:
+        """Provenance, concepts, practitioners and organizations for a population of `patients` (idempotent)."""
+        rng = random.Random(f"{self.seed}:reference")
+        prov = ProvenanceService(self.db).create(
+            activity="synthetic-population", author=None, correlation_id=CORRELATION_ID
+        )
+        terminology = TerminologyService(self.db)
+        vocabulary = (
+            [(SNOMED, code, display) for code, display, _, _ in CONDITIONS]
+            + [(LOINC, o[0], o[1]) for o in VITALS + LABS]
+            + [(CPT, code, display) for code, display, _ in SERVICES]
+            + [(DOC_TYPES, code, display) for code, display in DOCUMENTS]
+        )
+        concepts = {
+            (system, code): terminology.normalize_concept(
+                system=system, code=code, display=display, version=None, correlation_id=CORRELATION_ID
+            ).id
+            for system, code, display in vocabulary
+        }
+
+        practitioners = [self._uuid(rng) for _ in range(max(1, patients // 250))]
+        organizations = [self._uuid(rng) for _ in range(max(1, patients // 2000))]
+        names = {
+            SomPractitioner: [(i, f"Dr. {rng.choice(GIVEN_NAMES)} {rng.choice(FAMILY_NAMES)}") for i in practitioners],
+            SomOrganization: [(i, f"{rng.choice(FAMILY_NAMES)} Clinic {n + 1}") for n, i in enumerate(organizations)],
+        }
+        for model, named in names.items():
+            values = [{"id": i, "name": name, "created_provenance_id": prov.id, "extensions": {}} for i, name in named]
+            self.db.execute(insert(model).values(values).on_conflict_do_nothing(index_elements=["id"]))
+        self.db.flush()
+        return References(
+            provenance_id=prov.id,
+            concepts=concepts,
+            practitioner_ids=practitioners,
+            organization_ids=organizations,
+        )
+
+    # --- generation ---
+
+    @staticmethod
+    def _uuid(rng: random.Random) -> uuid.UUID:
+        return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+    def identifier(self, index: int) -> str:
+        return f"SYN{self.seed}-{index:09d}"
+
+    def generate(self, refs: References, chunk: int, size: int, patients: int) -> dict[str, list[tuple]]:
+        """Rows of the chunk's patients (chunk * size up to `patients`), per table, in COLUMNS order."""
+        rng = random.Random(f"{self.seed}:{chunk}")
+        rows: dict[str, list[tuple]] = {table: [] for table in COLUMNS}
+        for index in range(chunk * size, min((chunk + 1) * size, patients)):
+            self._patient(rng, refs, index, rows)
+        return rows
+
+    def _base(self, rng: random.Random, refs: References, t: dt.datetime, extensions: str = "{}") -> tuple:
+        return (self._uuid(rng), t, t, 1, refs.provenance_id, extensions)
+
+    def _patient(self, rng: random.Random, refs: References, index: int, rows: dict[str, list[tuple]]) -> None:
+        low, high = _weighted(rng, [((lo, hi), w) for lo, hi, w in AGE_BANDS])
+        age = rng.randint(low, high)
+        birth = self.as_of - dt.timedelta(days=age * 365 + rng.randrange(365))
+        registered = self._now - dt.timedelta(days=rng.randrange(3 * 365, 6 * 365))
+        patient = self._base(rng, refs, registered)
+        patient_id = patient[0]
+        name = (rng.choice(FAMILY_NAMES), rng.choice(GIVEN_NAMES))
+        rows["som_patient"].append(patient + (IDENTIFIER_SYSTEM, self.identifier(index), *name, birth))
+
+        conditions: list[tuple[str, uuid.UUID]] = []
+        for code, _, prevalence, min_age in CONDITIONS:
+            if age >= min_age and rng.random() < prevalence * (1.5 if age >= 65 else 1.0):
+                onset = birth + dt.timedelta(days=rng.randint(min_age * 365, max(min_age, age) * 365))
+                condition = self._base(rng, refs, registered)
+                rows["som_condition"].append(
+                    condition + (patient_id, refs.concepts[(SNOMED, code)], "active", min(onset, self.as_of))
+                )
+                conditions.append((code, condition[0]))
+        effects: dict[str, float] = {}
+        for code, _ in conditions:
+            for obs_code, shift in EFFECTS.get(code, {}).items():
+                effects[obs_code] = effects.get(obs_code, 0) + shift
+
+        n_encounters = min(int(rng.lognormvariate(1.1, 0.8)), 60)
+        starts = sorted(self._now - dt.timedelta(minutes=rng.randrange(3 * 365 * 24 * 60)) for _ in range(n_encounters))
+        encounters: list[tuple[uuid.UUID, dt.datetime]] = []
+        observation_ids: list[uuid.UUID] = []
+        document_ids: list[uuid.UUID] = []
+        for n, start in enumerate(starts):
+            in_progress = n == n_encounters - 1 and self._now - start < dt.timedelta(days=2)
+            end = None if in_progress else start + dt.timedelta(minutes=rng.choice((15, 20, 30, 45, 60)))
+            encounter = self._base(rng, refs, start)
+            rows["som_encounter"].append(
+                encounter + (patient_id, "in-progress" if in_progress else "finished", start, end)
+            )
+            encounters.append((encounter[0], start))
+
+            panel = [v for v in VITALS if rng.random() < 0.9]
+            if rng.random() < 0.35:
+                panel += rng.sample(LABS, rng.randint(2, len(LABS)))
+            for code, _, category, unit, mean, sd, decimals in panel:
+                value = round(max(rng.gauss(mean + effects.get(code, 0), sd), 0), decimals)
+                quantity = Decimal(str(value))
+                canonical, canonical_unit = units.canonical(quantity, unit, analyte=code)
+                effective = start + dt.timedelta(minutes=rng.randrange(15))
+                observation = self._base(rng, refs, effective)
+                rows["som_observation"].append(
+                    observation
+                    + (
+                        patient_id,
+                        encounter[0],
+                        "final",
+                        category,
+                        refs.concepts[(LOINC, code)],
+                        effective,
+                        "quantity",
+                        quantity,
+                        unit,
+                        canonical,
+                        canonical_unit,
+                    )
+                )
+                observation_ids.append(observation[0])
+
+            if rng.random() < 0.25:
+                document_ids.append(self._document(rng, refs, patient_id, encounter[0], start, rows))
+
+        if conditions and encounters and rng.random() < 0.15:
+            self._preauth(rng, refs, patient_id, conditions, encounters, observation_ids, document_ids, rows)
+
+    def _document(
+        self,
+        rng: random.Random,
+        refs: References,
+        patient_id: uuid.UUID,
+        encounter_id: uuid.UUID,
+        start: dt.datetime,
+        rows: dict[str, list[tuple]],
+    ) -> uuid.UUID:
+        code, display = rng.choice(DOCUMENTS)
+        body = "\n".join(
+            [f"{display} (synthetic)", f"Date: {start.date().isoformat()}"]
+            + [f"Finding {i + 1}: {rng.choice(FAMILY_NAMES)} {rng.randrange(10**6)}" for i in range(rng.randint(8, 40))]
+        ).encode("utf-8")
+        binary = self._base(rng, refs, start)
+        rows["som_binary"].append(binary + ("text/plain", body, len(body), hashlib.sha256(body).hexdigest()))
+        document = self._base(rng, refs, start)
+        rows["som_document"].append(
+            document
+            + (
+                patient_id,
+                encounter_id,
+                "current",
+                refs.concepts[(DOC_TYPES, code)],
+                start,
+                f"{display} {start.date().isoformat()}",
+                display,
+                binary[0],
+            )
+        )
+        return document[0]
+
+    def _preauth(
+        self,
+        rng: random.Random,
+        refs: References,
+        patient_id: uuid.UUID,
+        conditions: list[tuple[str, uuid.UUID]],
+        encounters: list[tuple[uuid.UUID, dt.datetime]],
+        observation_ids: list[uuid.UUID],
+        document_ids: list[uuid.UUID],
+        rows: dict[str, list[tuple]],
+    ) -> None:
+        condition_code, condition_id = rng.choice(conditions)
+        service = next((s for s in SERVICES if condition_code in s[2]), rng.choice(SERVICES))
+        encounter_id, authored = encounters[-1]
+        priority = "urgent" if rng.random() < 0.15 else "routine"
+        sr = self._base(rng, refs, authored)
+        rows["som_service_request"].append(
+            sr + (patient_id, encounter_id, refs.concepts[(CPT, service[0])], "active", "order", priority, authored)
+        )
+        reason = self._base(rng, refs, authored)
+        rows["som_service_request_reason"].append(reason + (sr[0], condition_id, "reason", 1))
+        if rng.random() >= 0.7:
+            return
+
+        status = _weighted(rng, PREAUTH_STATUSES)
+        supporting = rng.sample(observation_ids, min(len(observation_ids), rng.randint(1, 5)))
+        practitioner_id = rng.choice(refs.practitioner_ids)
+        organization_id = rng.choice(refs.organization_ids)
+        payer = _weighted(rng, PAYERS)
+        flow = ["draft", "submitted", "in-review"]
+        path = flow[: flow.index(status) + 1] if status in flow else flow + [status]
+        times = [authored + dt.timedelta(hours=4 * i + rng.random()) for i in range(len(path))]
+        extensions = _json({"supportingObservationIds": [str(o) for o in supporting]})
+        pr_id = self._uuid(rng)
+        rows["som_preauth_request"].append(
+            (pr_id, authored, times[-1], 1, refs.provenance_id, extensions)
+            + (
+                patient_id,
+                encounter_id,
+                practitioner_id,
+                organization_id,
+                condition_id,
+                sr[0],
+                status,
+                priority,
+                payer,
+                f"POL-{rng.randrange(1, 100)}",
+                None,
+            )
+        )
+        links = rng.sample(document_ids, min(len(document_ids), rng.randint(0, 2)))
+        for document_id in links:
+            rows["som_preauth_supporting_document"].append(
+                (self._uuid(rng), pr_id, document_id, "supporting", authored, CORRELATION_ID, refs.provenance_id, "{}")
+            )
+        for previous, current, t in zip([None] + path, path, times):
+            rows["som_preauth_status_history"].append(
+                (self._uuid(rng), pr_id, previous, current, t, "system", CORRELATION_ID, refs.provenance_id, "{}")
+            )
+        if status == "draft":
+            return
+
+        # Same shape as PreAuthService._create_snapshot.
+        snapshot = {
+            "schemaVersion": "1",
+            "preAuthRequest": {"id": str(pr_id), "status": "submitted", "priority": priority, "payer": payer},
+            "patient": {"id": str(patient_id)},
+            "encounter": {"id": str(encounter_id)},
+            "practitioner": {"id": str(practitioner_id)},
+            "organization": {"id": str(organization_id)},
+            "diagnosisCondition": {"id": str(condition_id)},
+            "serviceRequest": {"id": str(sr[0])},
+            "supportingObservations": [{"id": str(o)} for o in supporting],
+            "supportingDocuments": [{"id": str(d), "role": "supporting"} for d in links],
+        }
+        rows["som_preauth_package_snapshot"].append(
+            (
+                self._uuid(rng),
+                pr_id,
+                times[1],
+                CORRELATION_ID,
+                refs.provenance_id,
+                "1",
+                snapshot_checksum(snapshot),
+                _json(snapshot),
+                "{}",
+            )
+        )
+        if status in ("pending-info", "approved", "denied"):
+            reasons = {
+                "approved": [],
+                "denied": [{"code": "not-medically-necessary", "display": "Criteria not met"}],
+                "pending-info": [{"code": "need-documentation", "display": "Additional documentation required"}],
+            }[status]
+            info = [{"type": "document", "display": "Supporting clinical notes"}] if status == "pending-info" else []
+            rows["som_preauth_decision"].append(
+                (
+                    self._uuid(rng),
+                    pr_id,
+                    times[-1],
+                    status,
+                    _json(reasons),
+                    f"Synthetic {status} decision",
+                    _json(info),
+                    _json({"outcome": status}),
+                    refs.provenance_id,
+                    "{}",
+                )
+            )
+
+    # --- loading ---
+
+    def exists(self, chunk: int, size: int) -> bool:
+        return (
+            self.db.execute(
+                select(SomPatient.id).where(
+                    SomPatient.identifier_system == IDENTIFIER_SYSTEM,
+                    SomPatient.identifier_value == self.identifier(chunk * size),
+                )
+            ).first()
+            is not None
+        )
+
+    def load_chunk(
+        self, refs: References, chunk: int, size: int, patients: int, *, change_feed: bool = True
+    ) -> ChunkResult:
+        """Generate and COPY one chunk in the current transaction; a chunk that is already loaded is skipped."""
+        if self.exists(chunk, size):
+            return ChunkResult(chunk=chunk, skipped=True)
+        if not change_feed:
+            # Skips the change-feed triggers (and FK checks, which the generator satisfies); needs superuser.
+            self.db.execute(text("SET LOCAL session_replication_role = replica"))
+        result = ChunkResult(chunk=chunk)
+        for table, table_rows in self.generate(refs, chunk, size, patients).items():
+            result.rows[table] = self._copy(table, table_rows)
+        return result
+
+    def _copy(self, table: str, rows: Iterable[tuple]) -> int:
+        n = 0
+        raw = self.db.connection().connection.driver_connection
+        with raw.cursor() as cur, cur.copy(f"COPY {table} ({', '.join(COLUMNS[table])}) FROM STDIN") as copy:
+            for row in rows:
+                copy.write_row(row)
+                n += 1
+        return n
+
+
+def chunks(patients: int, size: int) -> int:
+    return math.ceil(patients / size)
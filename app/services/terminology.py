@@ -3,9 +3,9 @@ from __future__ import annotations
 from typing import Any
 
 from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, aliased
 
-from app.db.models import SomCodeSystem, SomConcept
+from app.db.models import SomCodeSystem, SomConcept, SomConceptClosure
 from app.services.provenance import ProvenanceService
 
 
@@ -65,6 +65,8 @@ class TerminologyService:
             )
             self.db.add(concept)
             self.db.flush()
+            # Every concept subsumes itself; hierarchy rows come from the bulk loader.
+            self.db.add(SomConceptClosure(ancestor_id=concept.id, descendant_id=concept.id))
         else:
             if display and not concept.display:
                 concept.display = display
@@ -72,6 +74,25 @@ class TerminologyService:
                 concept.updated_provenance_id = prov.id
         return concept
 
+    def subsumes(self, system: str, ancestor_code: str, code: str) -> bool:
+        """True if `code` is `ancestor_code` or one of its descendants (is-a) in `system`."""
+        if ancestor_code == code:
+            return True
+        ancestor = aliased(SomConcept)
+        descendant = aliased(SomConcept)
+        stmt = (
+            select(SomConceptClosure.ancestor_id)
+            .join(ancestor, ancestor.id == SomConceptClosure.ancestor_id)
+            .join(descendant, descendant.id == SomConceptClosure.descendant_id)
+            .join(SomCodeSystem, SomCodeSystem.id == ancestor.code_system_id)
+            .where(SomCodeSystem.system_uri == system)
+            .where(ancestor.code == ancestor_code)
+            .where(descendant.code_system_id == ancestor.code_system_id)
+            .where(descendant.code == code)
+            .limit(1)
+        )
+        return self.db.execute(stmt).first() is not None
+
     @staticmethod
     def pick_coding(codeable_concept: dict[str, Any]) -> dict[str, Any]:
         codings = codeable_concept.get("coding") or []
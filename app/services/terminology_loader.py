@@ -0,0 +1,251 @@
+"""
+Bulk code-system loader.
+
+Release files are streamed (never held in memory) into temp tables with COPY, then merged into som_concept
+and som_concept_parent with set-based INSERT ... SELECT, and the code system's closure is rebuilt with one
+recursive query. Supported inputs:
+
+- loinc: Loinc.csv (LOINC_NUM, LONG_COMMON_NAME), plus optionally MultiAxialHierarchy.csv for is-a edges
+  (its LP part codes are loaded as concepts too)
+- snomed: an RF2 Snapshot directory (active FSNs from sct2_Description_*, active is-a rows from
+  sct2_Relationship_*)
+- csv: any code system as CSV with `code,display[,parent]` columns (e.g. a CPT export); several parents
+  may be given separated by `|`
+
+Loading is idempotent: existing concepts keep their ids (displays are filled in if missing) and existing
+edges are kept.
+"""
+
+from __future__ import annotations
+
+import csv
+import glob
+import os
+import uuid
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from app.db.models import SomCodeSystem
+from app.services.mapping import read_cache
+from app.services.provenance import ProvenanceService
+
+SYSTEMS = {
+    "loinc": "http://loinc.org",
+    "snomed": "http://snomed.info/sct",
+    "cpt": "http://www.ama-assn.org/go/cpt",
+}
+
+_SNOMED_FSN = "900000000000003001"
+_SNOMED_IS_A = "116680003"
+
+
+@dataclass
+class LoadResult:
+    system: str
+    concepts_read: int = 0
+    concepts_inserted: int = 0
+    edges_inserted: int = 0
+    closure_rows: int = 0
+
+
+def _csv_rows(path: str, *, delimiter: str = ",") -> Iterator[dict[str, str]]:
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        yield from csv.DictReader(f, delimiter=delimiter)
+
+
+def loinc_files(loinc_csv: str, hierarchy_csv: str | None) -> tuple[Iterable[tuple[str, str]], Iterable[tuple[str, str]]]:
+    def concepts() -> Iterator[tuple[str, str]]:
+        for r in _csv_rows(loinc_csv):
+            yield r["LOINC_NUM"], r.get("LONG_COMMON_NAME") or r.get("COMPONENT") or ""
+        if hierarchy_csv:
+            for r in _csv_rows(hierarchy_csv):
+                if r["CODE"].startswith("LP"):
+                    yield r["CODE"], r.get("CODE_TEXT") or ""
+
+    def edges() -> Iterator[tuple[str, str]]:
+        if hierarchy_csv:
+            for r in _csv_rows(hierarchy_csv):
+                if r.get("IMMEDIATE_PARENT"):
+                    yield r["CODE"], r["IMMEDIATE_PARENT"]
+
+    return concepts(), edges()
+
+
+def snomed_rf2(directory: str) -> tuple[Iterable[tuple[str, str]], Iterable[tuple[str, str]]]:
+    def one(pattern: str) -> str:
+        found = sorted(glob.glob(os.path.join(directory, "**", pattern), recursive=True))
+        if not found:
+            raise ValueError(f"No {pattern} under {directory}")
+        return found[0]
+
+    description_file = one("sct2_Description_Snapshot*.txt")
+    relationship_file = one("sct2_Relationship_Snapshot*.txt")
+
+    def concepts() -> Iterator[tuple[str, str]]:
+        # Active concepts are exactly those with an active FSN; strip the "(disorder)"-style semantic tag.
+        for r in _csv_rows(description_file, delimiter="\t"):
+            if r["active"] == "1" and r["typeId"] == _SNOMED_FSN:
+                term = r["term"]
+                if term.endswith(")") and " (" in term:
+                    term = term[: term.rindex(" (")]
+                yield r["conceptId"], term
+
+    def edges() -> Iterator[tuple[str, str]]:
+        for r in _csv_rows(relationship_file, delimiter="\t"):
+            if r["active"] == "1" and r["typeId"] == _SNOMED_IS_A:
+                yield r["sourceId"], r["destinationId"]
+
+    return concepts(), edges()
+
+
+def simple_csv(path: str) -> tuple[Iterable[tuple[str, str]], Iterable[tuple[str, str]]]:
+    def concepts() -> Iterator[tuple[str, str]]:
+        for r in _csv_rows(path):
+            yield r["code"], r.get("display") or ""
+
+    def edges() -> Iterator[tuple[str, str]]:
+        for r in _csv_rows(path):
+            for parent in (r.get("parent") or "").split("|"):
+                if parent.strip():
+                    yield r["code"], parent.strip()
+
+    return concepts(), edges()
+
+
+class TerminologyLoader:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def load(
+        self,
+        *,
+        system_uri: str,
+        concepts: Iterable[tuple[str, str]],
+        edges: Iterable[tuple[str, str]],
+        version: str | None = None,
+        correlation_id: str | None = None,
+    ) -> LoadResult:
+        """Merge (code, display) concepts and (child code, parent code) is-a edges into `system_uri`."""
+        result = LoadResult(system=system_uri)
+        prov = ProvenanceService(self.db).create(activity="terminology-load", author=None, correlation_id=correlation_id)
+        cs_id = self._code_system(system_uri, version, prov.id)
+
+        self.db.execute(text("CREATE TEMP TABLE stage_concept (code text, display text) ON COMMIT DROP"))
+        self.db.execute(text("CREATE TEMP TABLE stage_edge (child text, parent text) ON COMMIT DROP"))
+        result.concepts_read = self._copy("COPY stage_concept (code, display) FROM STDIN", concepts)
+        self._copy("COPY stage_edge (child, parent) FROM STDIN", edges)
+        self.db.execute(text("ANALYZE stage_concept"))
+        self.db.execute(text("ANALYZE stage_edge"))
+
+        params = {"cs": cs_id, "prov": prov.id}
+        result.concepts_inserted = self.db.execute(
+            text(
+                """
+                INSERT INTO som_concept
+                    (id, code_system_id, code, display, version_string, created_time, updated_time, version,
+                     created_provenance_id, extensions)
+                SELECT gen_random_uuid(), :cs, s.code, min(s.display), NULL, now(), now(), 1, :prov, '{}'::jsonb
+                FROM stage_concept s
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM som_concept c
+                    WHERE c.code_system_id = :cs AND c.code = s.code AND c.version_string IS NULL
+                )
+                GROUP BY s.code
+                """
+            ),
+            params,
+        ).rowcount
+        displays_filled = self.db.execute(
+            text(
+                """
+                UPDATE som_concept c
+                SET display = s.display, version = c.version + 1, updated_provenance_id = :prov, updated_time = now()
+                FROM stage_concept s
+                WHERE c.code_system_id = :cs AND c.code = s.code AND c.display IS NULL AND s.display <> ''
+                """
+            ),
+            params,
+        ).rowcount
+        if displays_filled:
+            # Cached Observation/Condition/ServiceRequest bodies embed these displays.
+            read_cache.note_concept_generation(self.db)
+        # Writes may have created concepts for this system with a version_string; edges and the closure
+        # cover every row with the code.
+        result.edges_inserted = self.db.execute(
+            text(
+                """
+                INSERT INTO som_concept_parent (concept_id, parent_id)
+                SELECT DISTINCT child.id, parent.id
+                FROM stage_edge e
+                JOIN som_concept child ON child.code_system_id = :cs AND child.code = e.child
+                JOIN som_concept parent ON parent.code_system_id = :cs AND parent.code = e.parent
+                ON CONFLICT DO NOTHING
+                """
+            ),
+            params,
+        ).rowcount
+        result.closure_rows = rebuild_closure(self.db, cs_id)
+        return result
+
+    def _code_system(self, system_uri: str, version: str | None, provenance_id: uuid.UUID) -> uuid.UUID:
+        cs = self.db.execute(select(SomCodeSystem).where(SomCodeSystem.system_uri == system_uri)).scalar_one_or_none()
+        if cs is None:
+            cs = SomCodeSystem(
+                system_uri=system_uri,
+                name=None,
+                default_version=version,
+                created_provenance_id=provenance_id,
+                updated_provenance_id=None,
+                extensions={},
+            )
+            self.db.add(cs)
+            self.db.flush()
+        elif version and cs.default_version != version:
+            cs.default_version = version
+            cs.version += 1
+            cs.updated_provenance_id = provenance_id
+            self.db.flush()
+        return cs.id
+
+    def _copy(self, sql: str, rows: Iterable[tuple[str, str]]) -> int:
+        n = 0
+        raw = self.db.connection().connection.driver_connection
+        with raw.cursor() as cur, cur.copy(sql) as copy:
+            for row in rows:
+                copy.write_row(row)
+                n += 1
+        return n
+
+
+def rebuild_closure(db: Session, code_system_id: uuid.UUID) -> int:
+    """Recompute the closure rows of one code system's concepts from som_concept_parent."""
+    db.execute(
+        text(
+            """
+            DELETE FROM som_concept_closure cl
+            USING som_concept c
+            WHERE c.id = cl.descendant_id AND c.code_system_id = :cs
+            """
+        ),
+        {"cs": code_system_id},
+    )
+    # UNION (not UNION ALL) dedups (ancestor, descendant) pairs as it goes, so polyhierarchies like SNOMED
+    # stay bounded by the closure size rather than the number of paths.
+    return db.execute(
+        text(
+            """
+            INSERT INTO som_concept_closure (ancestor_id, descendant_id)
+            WITH RECURSIVE walk(ancestor_id, descendant_id) AS (
+                SELECT id, id FROM som_concept WHERE code_system_id = :cs
+                UNION
+                SELECT p.parent_id, w.descendant_id
+                FROM walk w JOIN som_concept_parent p ON p.concept_id = w.ancestor_id
+            )
+            SELECT ancestor_id, descendant_id FROM walk
+            """
+        ),
+        {"cs": code_system_id},
+    ).rowcount
@@ -0,0 +1,140 @@
+"""
+UCUM unit canonicalization for quantity values.
+
+Every known unit maps to the canonical unit of its dimension through `canonical = value * scale + offset`
+(offset is only non-zero for temperatures). Mass concentrations of analytes with a known molar mass
+(glucose, cholesterol, ...) are converted to molar concentrations, so 126 mg/dL and 7.0 mmol/L of glucose
+land on the same canonical scale. Units not in the table are kept as given: their canonical unit is the
+unit itself.
+
+Observations store the canonical value and unit next to the raw ones (value-quantity searches run on the
+canonical columns); search values go through the same conversions (`search_conversions`).
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from decimal import Context, Decimal
+
+UCUM_SYSTEM = "http://unitsofmeasure.org"
+LOINC_SYSTEM = "http://loinc.org"
+
+
+@dataclass(frozen=True)
+class Conversion:
+    unit: str  # canonical unit
+    scale: Decimal
+    offset: Decimal = Decimal(0)
+
+    def apply(self, value: Decimal) -> Decimal:
+        return value * self.scale + self.offset
+
+
+def _c(unit: str, scale: str, offset: str = "0") -> Conversion:
+    return Conversion(unit, Decimal(scale), Decimal(offset))
+
+
+# UCUM code (or a common alias) -> conversion to the canonical unit of its dimension.
+_UNITS: dict[str, Conversion] = {
+    # rates: /min
+    "/min": _c("/min", "1"),
+    "{beats}/min": _c("/min", "1"),
+    "beats/min": _c("/min", "1"),
+    "bpm": _c("/min", "1"),
+    "{breaths}/min": _c("/min", "1"),
+    "/s": _c("/min", "60"),
+    "/h": _c("/min", "0.016666666666666667"),
+    # pressure: mm[Hg]
+    "mm[Hg]": _c("mm[Hg]", "1"),
+    "mmHg": _c("mm[Hg]", "1"),
+    "kPa": _c("mm[Hg]", "7.500615758456563"),
+    # mass concentration: g/L
+    "g/L": _c("g/L", "1"),
+    "g/dL": _c("g/L", "10"),
+    "mg/dL": _c("g/L", "0.01"),
+    "mg/L": _c("g/L", "0.001"),
+    "ug/mL": _c("g/L", "0.001"),
+    "ng/mL": _c("g/L", "0.000001"),
+    # substance concentration: mmol/L
+    "mol/L": _c("mmol/L", "1000"),
+    "mmol/L": _c("mmol/L", "1"),
+    "umol/L": _c("mmol/L", "0.001"),
+    "nmol/L": _c("mmol/L", "0.000001"),
+    # mass: kg
+    "kg": _c("kg", "1"),
+    "g": _c("kg", "0.001"),
+    "[lb_av]": _c("kg", "0.45359237"),
+    "lb": _c("kg", "0.45359237"),
+    "[oz_av]": _c("kg", "0.028349523125"),
+    # length: m
+    "m": _c("m", "1"),
+    "cm": _c("m", "0.01"),
+    "mm": _c("m", "0.001"),
+    "[in_i]": _c("m", "0.0254"),
+    "in": _c("m", "0.0254"),
+    # temperature: Cel
+    "Cel": _c("Cel", "1"),
+    "[degF]": _c("Cel", "0.5555555555555556", "-17.77777777777778"),
+    # dimensionless
+    "%": _c("%", "1"),
+    "1": _c("1", "1"),
+}
+
+# LOINC analyte -> molar mass (g/mol), for mass -> substance concentration.
+_MOLAR_MASS: dict[str, Decimal] = {
+    "2339-0": Decimal("180.156"),  # Glucose [Mass/volume] in Blood
+    "2345-7": Decimal("180.156"),  # Glucose [Mass/volume] in Serum or Plasma
+    "41653-7": Decimal("180.156"),  # Glucose [Mass/volume] in Capillary blood
+    "2093-3": Decimal("386.654"),  # Cholesterol [Mass/volume] in Serum or Plasma
+    "2085-9": Decimal("386.654"),  # HDL Cholesterol
+    "13457-7": Decimal("386.654"),  # LDL Cholesterol (calculated)
+    "2571-8": Decimal("885.7"),  # Triglyceride
+    "2160-0": Decimal("113.12"),  # Creatinine [Mass/volume] in Serum or Plasma
+    "3094-0": Decimal("60.06"),  # Urea nitrogen [Mass/volume] in Serum or Plasma (as urea)
+}
+
+KNOWN_UNITS = frozenset(_UNITS)
+
+# Canonical values are rounded to this many significant digits (well beyond any lab's precision).
+_PRECISION = Context(prec=12)
+
+
+def conversion(unit: str, *, analyte: str | None = None) -> Conversion | None:
+    """Conversion of `unit` to canonical for the analyte (a LOINC code), or None for units not in the table."""
+    c = _UNITS.get(unit)
+    if c is None:
+        return None
+    molar_mass = _MOLAR_MASS.get(analyte or "")
+    if molar_mass is not None and c.unit == "g/L":
+        # g/L -> mol/L is / molar mass; -> mmol/L is * 1000.
+        return Conversion("mmol/L", c.scale * 1000 / molar_mass)
+    return c
+
+
+def canonical(value: float | Decimal | None, unit: str | None, *, analyte: str | None = None) -> tuple[Decimal | None, str | None]:
+    """(canonical value, canonical unit); unknown units are returned unchanged."""
+    if value is None or unit is None:
+        return (Decimal(str(value)) if value is not None else None), unit
+    d = value if isinstance(value, Decimal) else Decimal(str(value))
+    c = conversion(unit, analyte=analyte)
+    if c is None:
+        return d, unit
+    return _PRECISION.plus(c.apply(d)), c.unit
+
+
+def search_conversions(unit: str) -> list[tuple[tuple[str, ...] | None, Conversion]]:
+    """
+    Ways a search value in `unit` maps onto stored canonical values, as (analytes, conversion) pairs where
+    analytes None means "any observation". A mass concentration is stored as g/L when no molar mass is
+    known, else as mmol/L, so it yields one extra entry per distinct molar mass.
+    """
+    c = _UNITS.get(unit)
+    if c is None:
+        return [(None, Conversion(unit, Decimal(1)))]
+    out: list[tuple[tuple[str, ...] | None, Conversion]] = [(None, c)]
+    if c.unit == "g/L":
+        by_mass: dict[Decimal, list[str]] = {}
+        for analyte, mm in _MOLAR_MASS.items():
+            by_mass.setdefault(mm, []).append(analyte)
+        out.extend((tuple(analytes), conversion(unit, analyte=analytes[0])) for analytes in by_mass.values())
+    return out
@@ -0,0 +1,23 @@
+"""
+Deliver rest-hook Subscriptions from the change feed.
+
+    python -m app.subscription_dispatcher
+
+Runs until stopped. Run a single instance: delivery cursors live in som_subscription and are not claimed, so
+two dispatchers would send the same batches twice.
+"""
+
+from __future__ import annotations
+
+import logging
+
+from app.services.subscriptions.dispatcher import run_forever
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    run_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Bulk-load a code system release into som_concept / som_concept_parent / som_concept_closure.
+
+    python -m app.terminology_load loinc --file Loinc.csv [--hierarchy MultiAxialHierarchy.csv] [--version 2.77]
+    python -m app.terminology_load snomed --rf2-dir SnomedCT_InternationalRF2/Snapshot [--version 20250101]
+    python -m app.terminology_load csv --system http://www.ama-assn.org/go/cpt --file cpt.csv
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+
+from app.db.session import session_scope
+from app.services.terminology_loader import SYSTEMS, TerminologyLoader, loinc_files, simple_csv, snomed_rf2
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("format", choices=["loinc", "snomed", "csv"])
+    parser.add_argument("--file", help="Loinc.csv, or the CSV for format=csv")
+    parser.add_argument("--hierarchy", help="LOINC MultiAxialHierarchy.csv")
+    parser.add_argument("--rf2-dir", help="SNOMED CT RF2 Snapshot directory")
+    parser.add_argument("--system", help="code system URI (format=csv; defaults per format otherwise)")
+    parser.add_argument("--version", help="release version recorded on the code system")
+    args = parser.parse_args()
+
+    if args.format == "loinc":
+        if not args.file:
+            parser.error("loinc needs --file")
+        concepts, edges = loinc_files(args.file, args.hierarchy)
+    elif args.format == "snomed":
+        if not args.rf2_dir:
+            parser.error("snomed needs --rf2-dir")
+        concepts, edges = snomed_rf2(args.rf2_dir)
+    else:
+        if not args.file or not args.system:
+            parser.error("csv needs --file and --system")
+        concepts, edges = simple_csv(args.file)
+    system = args.system or SYSTEMS[args.format]
+
+    started = time.perf_counter()
+    with session_scope() as db:
+        result = TerminologyLoader(db).load(
+            system_uri=system, concepts=concepts, edges=edges, version=args.version, correlation_id="terminology-load"
+        )
+    print(json.dumps({**result.__dict__, "seconds": round(time.perf_counter() - started, 1)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,21 @@
 from __future__ import annotations
 
 import os
+import time
 
 from celery import Celery
+from celery.signals import (
+    after_task_publish,
+    before_task_publish,
+    task_postrun,
+    task_prerun,
+    worker_process_init,
+)
 
+from app.core import profiling, tracing
 from app.core.config import settings
+from app.core.metrics import CELERY_QUEUE_WAIT_SECONDS, CELERY_TASK_SECONDS, registry
+from app.worker import instrumentation
 
 
 celery_app = Celery(
@@ -19,3 +30,116 @@ celery_app.conf.worker_send_task_events = True
 celery_app.conf.task_send_sent_event = True
 celery_app.conf.task_always_eager = os.environ.get("CELERY_TASK_ALWAYS_EAGER") == "1"
 celery_app.conf.task_eager_propagates = True
+
+
+@worker_process_init.connect
+def _use_worker_db_pool(**_kwargs) -> None:
+    from app.db.session import use_worker_pool
+
+    use_worker_pool()
+    registry.start_multiprocess_writer()
+
+
+# Producer spans between before_task_publish and after_task_publish, by task id.
+_publish_spans: dict[str, tracing.Span] = {}
+
+
+@before_task_publish.connect
+def _before_publish(sender=None, headers=None, **_kwargs) -> None:
+    if headers is None:
+        return
+    # Wall clock: the publisher and the worker are different processes (or hosts).
+    headers.setdefault("published_at", time.time())
+    if not tracing.enabled():
+        # The correlation id still travels: SQL comments and job logs use it too.
+        tracing.inject(headers)
+        return
+    span = tracing.start_span(
+        f"publish {sender}",
+        kind=tracing.PRODUCER,
+        attributes={
+            "messaging.system": "celery",
+            "messaging.destination.name": sender,
+            "celery.task_id": headers.get("id"),
+        },
+    )
+    token = tracing.attach(span)
+    try:
+        tracing.inject(headers)
+    finally:
+        tracing.detach(token)
+    _publish_spans[headers.get("id")] = span
+
+
+@after_task_publish.connect
+def _after_publish(headers=None, **_kwargs) -> None:
+    span = _publish_spans.pop((headers or {}).get("id"), None)
+    if span is not None:
+        tracing.finish(span)
+
+
+@task_prerun.connect
+def _task_started(task=None, task_id=None, **_kwargs) -> None:
+    published_at = getattr(task.request, "published_at", None)
+    queue_wait = None
+    if published_at is not None:
+        queue_wait = max(time.time() - float(published_at), 0.0)
+        CELERY_QUEUE_WAIT_SECONDS.observe(queue_wait, task.name)
+    # Eagerly run tasks have no headers and simply nest under the caller's context.
+    task.request.trace_tags_token = tracing.set_tags(task=task.name)
+    task.request.trace_correlation_token = tracing.set_correlation_id(
+        getattr(task.request, "x_correlation_id", None) or tracing.correlation_id()
+    )
+    if tracing.enabled():
+        span = tracing.start_span(
+            f"run {task.name}",
+            kind=tracing.CONSUMER,
+            attributes={"messaging.system": "celery", "celery.task_id": task_id},
+            remote_parent=tracing.parse_traceparent(getattr(task.request, "traceparent", None)),
+        )
+        task.request.trace_span = span
+        task.request.trace_token = tracing.attach(span)
+    if _profile_requested(task.request):
+        profile = profiling.begin("celery", task.name, id=task_id)
+        if profile is not None:
+            task.request.profile_run = profile
+            task.request.profile_token = profiling.activate(profile)
+            profile.profiler.enable()
+    task.request.metrics_started = time.perf_counter()
+    if task.name.startswith("jobs."):
+        task.request.job_run = instrumentation.begin(task.name, queue_wait=0.0 if task.request.is_eager else queue_wait)
+
+
+def _profile_requested(request) -> bool:
+    if not settings.profiling_enabled:
+        return False
+    headers = getattr(request, "headers", None) or {}
+    return bool(getattr(request, "profile", None) or headers.get("profile"))
+
+
+@task_postrun.connect
+def _task_finished(task=None, state=None, retval=None, args=None, **_kwargs) -> None:
+    started = getattr(task.request, "metrics_started", None)
+    if started is not None:
+        CELERY_TASK_SECONDS.observe(time.perf_counter() - started, task.name, state or "UNKNOWN")
+    job_run = getattr(task.request, "job_run", None)
+    if job_run is not None:
+        # Every jobs.* task takes the SomJob id as its first argument.
+        instrumentation.end(job_run, state=state, job_id=args[0] if args else None)
+        task.request.job_run = None
+    profile = getattr(task.request, "profile_run", None)
+    if profile is not None:
+        profile.profiler.disable()
+        profiling.deactivate(task.request.profile_token)
+        profiling.end(profile, state=state)
+        task.request.profile_run = None
+    span = getattr(task.request, "trace_span", None)
+    if span is not None:
+        tracing.detach(task.request.trace_token)
+        span.set("celery.state", state)
+        tracing.finish(span, retval if isinstance(retval, BaseException) else None)
+        task.request.trace_span = None
+    if getattr(task.request, "trace_tags_token", None) is not None:
+        tracing.reset_correlation_id(task.request.trace_correlation_token)
+        tracing.reset_tags(task.request.trace_tags_token)
+        task.request.trace_tags_token = None
@@ -0,0 +1,151 @@
+"""
+Per-run measurements of job tasks, stored on the job as `SomJob.extensions["metrics"]` and exported as metrics.
+
+app.worker.celery_app opens a JobRun before a task starts and closes it after the task returns. A run records
+
+- queue wait: from publishing the task to the worker starting it (wall clock; 0 for eager tasks);
+- duration, and the SQL statements (count and time) the task issued;
+- phases: a task calls `phase(name)` when it moves on to the next step; each phase gets its wall time and
+  statements. Re-entering a phase adds to it;
+- memory: peak RSS of the worker process at the end of the run and how far the run raised it, and, for tasks in
+  `settings.job_tracemalloc_tasks`, the Python allocations (tracemalloc) still held and peaking during the run.
+
+tracemalloc slows allocation-heavy code down noticeably, so it only runs for the tasks listed there.
+"""
+
+from __future__ import annotations
+
+import resource
+import sys
+import time
+import tracemalloc
+import uuid
+from contextvars import ContextVar, Token
+from typing import Any
+
+from app.core.config import settings
+from app.core.metrics import (
+    JOB_DB_STATEMENTS,
+    JOB_PEAK_RSS_BYTES,
+    JOB_PHASE_SECONDS,
+    JOB_TRACEMALLOC_PEAK_BYTES,
+)
+from app.db import query_metrics
+
+# ru_maxrss is in kilobytes on Linux and bytes on macOS.
+_RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+def peak_rss_bytes() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * _RSS_UNIT
+
+
+class JobRun:
+    def __init__(self, task: str, *, queue_wait: float | None) -> None:
+        self.task = task
+        self.queue_wait = queue_wait
+        self.start = time.perf_counter()
+        self.tally = query_metrics.QueryTally()
+        self.phases: dict[str, dict[str, float]] = {}
+        self._phase: tuple[str, float, int, float] | None = None
+        self.rss_start = peak_rss_bytes()
+        self._tracemalloc = task in _tracemalloc_tasks()
+        self._started_tracemalloc = False
+        self._traced_start = 0
+        if self._tracemalloc:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            tracemalloc.reset_peak()
+            self._traced_start = tracemalloc.get_traced_memory()[0]
+
+    def phase(self, name: str) -> None:
+        self._close_phase()
+        self._phase = (name, time.perf_counter(), self.tally.count, self.tally.seconds)
+
+    def _close_phase(self) -> None:
+        if self._phase is None:
+            return
+        name, start, count, seconds = self._phase
+        entry = self.phases.setdefault(name, {"seconds": 0.0, "dbStatements": 0, "dbSeconds": 0.0})
+        entry["seconds"] += time.perf_counter() - start
+        entry["dbStatements"] += self.tally.count - count
+        entry["dbSeconds"] += self.tally.seconds - seconds
+        self._phase = None
+
+    def finish(self, state: str | None) -> dict[str, Any]:
+        """Close the run, observe its metrics and return the summary stored on the job."""
+        self._close_phase()
+        duration = time.perf_counter() - self.start
+        rss = peak_rss_bytes()
+        memory: dict[str, Any] = {"peakRssBytes": rss, "peakRssGrowthBytes": rss - self.rss_start}
+        if self._tracemalloc and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            memory["tracemallocDeltaBytes"] = current - self._traced_start
+            memory["tracemallocPeakBytes"] = peak - self._traced_start
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            JOB_TRACEMALLOC_PEAK_BYTES.observe(memory["tracemallocPeakBytes"], self.task)
+
+        for name, entry in self.phases.items():
+            JOB_PHASE_SECONDS.observe(entry["seconds"], self.task, name)
+        JOB_DB_STATEMENTS.observe(self.tally.count, self.task)
+        JOB_PEAK_RSS_BYTES.set(rss, self.task)
+
+        return {
+            "task": self.task,
+            "state": state,
+            "queueWaitSeconds": round(self.queue_wait, 6) if self.queue_wait is not None else None,
+            "durationSeconds": round(duration, 6),
+            "dbStatements": self.tally.count,
+            "dbSeconds": round(self.tally.seconds, 6),
+            "phases": {
+                name: {**entry, "seconds": round(entry["seconds"], 6), "dbSeconds": round(entry["dbSeconds"], 6)}
+                for name, entry in self.phases.items()
+            },
+            "memory": memory,
+        }
+
+
+def _tracemalloc_tasks() -> set[str]:
+    return {t.strip() for t in settings.job_tracemalloc_tasks.split(",") if t.strip()}
+
+
+_current: ContextVar[JobRun | None] = ContextVar("job_run", default=None)
+
+
+def begin(task: str, *, queue_wait: float | None) -> tuple[JobRun, Token, Token]:
+    """Start a run and count this context's SQL against it; pass the result to end()."""
+    run = JobRun(task, queue_wait=queue_wait)
+    return run, _current.set(run), query_metrics.tally.set(run.tally)
+
+
+def end(started: tuple[JobRun, Token, Token], *, state: str | None, job_id: Any) -> dict[str, Any]:
+    run, run_token, tally_token = started
+    query_metrics.tally.reset(tally_token)
+    _current.reset(run_token)
+    summary = run.finish(state)
+    if job_id is not None:
+        _store(job_id, summary)
+    return summary
+
+
+def phase(name: str) -> None:
+    """Start the named phase of the running job (ending the previous one); a no-op outside a job run."""
+    run = _current.get()
+    if run is not None:
+        run.phase(name)
+
+
+def _store(job_id: Any, summary: dict[str, Any]) -> None:
+    from app.db.models import SomJob
+    from app.db.session import session_scope
+
+    try:
+        jid = uuid.UUID(str(job_id))
+    except ValueError:
+        return
+    with session_scope() as db:
+        job = db.get(SomJob, jid)
+        if job is not None:
+            job.extensions = {**(job.extensions or {}), "metrics": summary}
@@ -6,16 +6,16 @@ import uuid
 from typing import Any
 
 from app.worker.celery_app import celery_app
-from sqlalchemy import select
-
-from app.db.models import SomCondition, SomConcept, SomJob, SomPreAuthDecision, SomPreAuthRequest
+from app.db.models import SomJob, SomPreAuthDecision, SomPreAuthRequest
 from app.db.session import session_scope
+from app.services import units
 from app.services.audit import AuditService
 from app.services.payer.evaluator import evaluate_rules
 from app.services.payer.rules import PayerRuleService
 from app.services.provenance import ProvenanceService
 from app.services.preauth.service import PreAuthService
 from app.services.terminology import TerminologyService
+from app.worker.instrumentation import phase
 
 
 def _update_job(job_id: uuid.UUID, **fields: Any) -> None:
@@ -31,9 +31,10 @@ def _update_job(job_id: uuid.UUID, **fields: Any) -> None:
 @celery_app.task(name="jobs.bulk_import_observations")
 def bulk_import_observations(job_id: str) -> dict[str, Any]:
     jid = uuid.UUID(job_id)
+    phase("prepare")
     _update_job(jid, status="running", message="starting", progress=0)
 
-    from app.db.models import SomObservation, SomObservationVersion, SomPatient
+    from app.db.models import SomObservation, SomPatient
 
     created = 0
     with session_scope() as db:
@@ -56,6 +57,7 @@ def bulk_import_observations(job_id: str) -> dict[str, Any]:
         )
         prov = ProvenanceService(db).create(activity="bulk-import", author="worker", correlation_id=job.correlation_id)
 
+        phase("import")
         batch_size = 10
         start = dt.datetime.now(dt.timezone.utc) - dt.timedelta(minutes=count)
         for i in range(0, count, batch_size):
@@ -63,6 +65,8 @@ def bulk_import_observations(job_id: str) -> dict[str, Any]:
             batch = min(batch_size, count - i)
             for j in range(batch):
                 effective = start + dt.timedelta(minutes=i + j)
+                value = 60 + ((i + j) % 30)
+                canonical, canonical_unit = units.canonical(value, "bpm")
                 o = SomObservation(
                     patient_id=patient.id,
                     encounter_id=None,
@@ -71,36 +75,21 @@ def bulk_import_observations(job_id: str) -> dict[str, Any]:
                     code_concept_id=hr.id,
                     effective_time=effective,
                     value_type="quantity",
-                    value_quantity_value=60 + ((i + j) % 30),
+                    value_quantity_value=value,
                     value_quantity_unit="bpm",
+                    value_quantity_canonical=canonical,
+                    value_quantity_canonical_unit=canonical_unit,
                     value_concept_id=None,
                     created_provenance_id=prov.id,
                     updated_provenance_id=None,
                     extensions={"source": "bulk-import"},
                 )
                 db.add(o)
-                db.flush()
-                db.add(
-                    SomObservationVersion(
-                        observation_id=o.id,
-                        version=1,
-                        recorded_time=dt.datetime.now(dt.timezone.utc),
-                        status=o.status,
-                        category=o.category,
-                        code_concept_id=o.code_concept_id,
-                        effective_time=o.effective_time,
-                        value_type=o.value_type,
-                        value_quantity_value=o.value_quantity_value,
-                        value_quantity_unit=o.value_quantity_unit,
-                        value_concept_id=None,
-                        provenance_id=prov.id,
-                        extensions=o.extensions,
-                    )
-                )
                 created += 1
 
             _update_job(jid, progress=int(created * 100 / max(count, 1)), message=f"imported {created}/{count}")
 
+        phase("persist")
         job.outputs = {"imported": created, "patientId": str(patient.id)}
         AuditService(db).emit(
             actor="worker",
@@ -122,6 +111,7 @@ def bulk_import_observations(job_id: str) -> dict[str, Any]:
 @celery_app.task(name="jobs.submit_preauth")
 def submit_preauth(job_id: str) -> dict[str, Any]:
     jid = uuid.UUID(job_id)
+    phase("assemble")
     _update_job(jid, status="running", message="assembling package", progress=10)
     time.sleep(0.5)
 
@@ -137,8 +127,11 @@ def submit_preauth(job_id: str) -> dict[str, Any]:
         if not pr:
             _update_job(jid, status="failed", error="PreAuth not found", message="failed")
             return {"ok": False}
+        # The decision is made on the package as submitted, not on the records as they are now.
+        package = PreAuthService(db).package(pr, snapshot_id=job.parameters.get("snapshotId"))
 
         # Status: submitted -> in-review
+        phase("persist")
         from_status = pr.status
         pr.status = "in-review"
         pr.version += 1
@@ -173,45 +166,12 @@ def submit_preauth(job_id: str) -> dict[str, Any]:
             result_payload={"status": "in-review"},
         )
 
+        phase("payer_review")
         _update_job(jid, message="payer reviewing", progress=40)
         time.sleep(1.0)
 
-        diagnosis = db.get(SomCondition, pr.diagnosis_condition_id)
-        diag_concept = diagnosis.code_concept if diagnosis else None
-        sr_concept = pr.service_request.code_concept if pr.service_request else None
-
-        diag_text = (diag_concept.display or "") if diag_concept else ""
-        sr_text = (sr_concept.display or "") if sr_concept else ""
-        sr_code = (sr_concept.code or "") if sr_concept else ""
-        sr_system = sr_concept.code_system.system_uri if sr_concept else ""
-        sr_priority = pr.service_request.priority if pr.service_request else None
-
-        # Supporting documents attached to the preauth.
-        from app.db.models import SomDocument, SomPreAuthSupportingDocument
-
-        links = (
-            db.execute(select(SomPreAuthSupportingDocument).where(SomPreAuthSupportingDocument.preauth_request_id == pr.id))
-            .scalars()
-            .all()
-        )
-        docs: list[dict[str, Any]] = []
-        for link in links:
-            doc = db.get(SomDocument, link.document_id)
-            if not doc:
-                continue
-            docs.append(
-                {
-                    "id": str(doc.id),
-                    "code": doc.type_concept.code,
-                    "display": doc.type_concept.display,
-                    "dateTime": (doc.date_time or doc.created_time).isoformat(),
-                    "title": doc.title,
-                    "role": link.role,
-                }
-            )
-
         now = dt.datetime.now(dt.timezone.utc)
-        payer = pr.payer or "Acme Payer"
+        payer = package.payer or "Acme Payer"
         ruleset = PayerRuleService(db).get_active(payer=payer)
         if not ruleset:
             # Fallback to a built-in default if no payer rule set exists.
@@ -255,15 +215,16 @@ def submit_preauth(job_id: str) -> dict[str, Any]:
         eval_out = evaluate_rules(
             rules=rules,
             now=now,
-            service_system=sr_system or None,
-            service_code=sr_code or None,
-            service_text=sr_text or None,
-            service_priority=sr_priority,
-            diagnosis_system=diag_concept.code_system.system_uri if diag_concept else None,
-            diagnosis_code=diag_concept.code if diag_concept else None,
-            diagnosis_text=diag_text or None,
-            preauth_priority=pr.priority,
-            supporting_documents=docs,
+            service_system=package.service.system if package.service else None,
+            service_code=package.service.code if package.service else None,
+            service_text=package.service.display if package.service else None,
+            service_priority=package.service_priority,
+            diagnosis_system=package.diagnosis.system if package.diagnosis else None,
+            diagnosis_code=package.diagnosis.code if package.diagnosis else None,
+            diagnosis_text=package.diagnosis.display if package.diagnosis else None,
+            preauth_priority=package.priority,
+            supporting_documents=package.documents,
+            is_descendant=TerminologyService(db).subsumes,
         )
 
         outcome = eval_out["outcome"]
@@ -271,6 +232,7 @@ def submit_preauth(job_id: str) -> dict[str, Any]:
         rationale = eval_out["rationale"]
         requested = eval_out.get("requestedAdditionalInfo") or []
 
+        phase("persist")
         prov = ProvenanceService(db).create(
             activity="payer-determination",
             author="payer-sim",
@@ -0,0 +1,114 @@
+"""
+Serialization benchmark for 200-entry searchset bundles.
+
+Compares FastAPI's default path (jsonable_encoder + stdlib json via JSONResponse) with FastJSONResponse
+(orjson) and with splicing pre-serialized entries, both as raw render cost and end to end through a
+TestClient request. No database is needed.
+
+    PYTHONPATH=. python benchmarks/bundle_serialization.py [--entries 200] [--rounds 200]
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import json
+import statistics
+import time
+import uuid
+
+from fastapi import APIRouter, FastAPI
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from app.api.responses import FastJSONResponse, FastJSONRoute, dumps
+from app.services.mapping.fhir_utils import bundle, fhir_meta
+
+
+def make_observation(i: int) -> dict:
+    pid = uuid.uuid4()
+    effective = dt.datetime(2026, 1, 1, tzinfo=dt.timezone.utc) + dt.timedelta(hours=i)
+    return {
+        "resourceType": "Observation",
+        "id": str(uuid.uuid4()),
+        "meta": fhir_meta(version=1 + i % 3, last_updated=effective),
+        "status": "final",
+        "subject": {"reference": f"Patient/{pid}"},
+        "encounter": {"reference": f"Encounter/{uuid.uuid4()}"},
+        "effectiveDateTime": effective.isoformat().replace("+00:00", "Z"),
+        "category": [{"coding": [{"code": "laboratory"}]}],
+        "code": {"coding": [{"system": "http://loinc.org", "code": "4548-4", "display": "Hemoglobin A1c/Hemoglobin.total in Blood"}]},
+        "valueQuantity": {"value": 5.0 + (i % 40) / 10, "unit": "%"},
+    }
+
+
+def timed(fn, rounds: int) -> dict:
+    wall: list[float] = []
+    cpu0 = time.process_time()
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        fn()
+        wall.append(time.perf_counter() - t0)
+    cpu = time.process_time() - cpu0
+    wall.sort()
+    return {
+        "p50_ms": round(statistics.median(wall) * 1000, 3),
+        "p95_ms": round(wall[int(len(wall) * 0.95) - 1] * 1000, 3),
+        "cpu_ms_per_op": round(cpu / rounds * 1000, 3),
+    }
+
+
+def render_benchmarks(entries: list[dict], rounds: int) -> dict:
+    b = bundle(entries=entries, total=len(entries))
+    pre = [dumps(e) for e in entries]
+    return {
+        "stdlib (jsonable_encoder + json)": timed(lambda: JSONResponse(jsonable_encoder(b)).body, rounds),
+        "orjson": timed(lambda: FastJSONResponse(b).body, rounds),
+        "orjson + spliced entries": timed(lambda: FastJSONResponse(bundle(entries=pre, total=len(pre))).body, rounds),
+    }
+
+
+def request_benchmarks(entries: list[dict], rounds: int) -> dict:
+    b = bundle(entries=entries, total=len(entries))
+    default_router = APIRouter()
+    fast_router = APIRouter(route_class=FastJSONRoute, default_response_class=FastJSONResponse)
+
+    @default_router.get("/bundle")
+    def default_bundle():
+        return b
+
+    @fast_router.get("/bundle")
+    def fast_bundle():
+        return b
+
+    app = FastAPI()
+    app.include_router(default_router, prefix="/default")
+    app.include_router(fast_router, prefix="/fast")
+    client = TestClient(app)
+    assert json.loads(client.get("/default/bundle").content) == json.loads(client.get("/fast/bundle").content)
+    return {
+        "default route": timed(lambda: client.get("/default/bundle"), rounds),
+        "FastJSONRoute": timed(lambda: client.get("/fast/bundle"), rounds),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    entries = [make_observation(i) for i in range(args.entries)]
+    results = {
+        "entries": args.entries,
+        "rounds": args.rounds,
+        "bodyBytes": len(dumps(bundle(entries=entries, total=len(entries)))),
+        "render": render_benchmarks(entries, args.rounds),
+        "request": request_benchmarks(entries, args.rounds),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+"""
+Microbenchmarks for the hot pure-Python paths, each at several input sizes:
+
+- fhir_meta
+- every mapper's _row_to_fhir (the read/search path into _to_fhir), on rows shaped like its _select_rows
+- payer evaluate_rules, by number of policies and supporting documents
+- snapshot_checksum (canonical JSON + sha256 in PreAuthService._create_snapshot), by supporting observations
+- observation_version_diffs (InternalService.observation_versions), by number of versions
+
+Each case is calibrated like pytest-benchmark (enough iterations per round to dwarf timer resolution, then rounds
+until --max-time) and reports min/median/mean/stddev per call, plus a tracemalloc pass: peak and retained bytes,
+allocated blocks and the top allocation sites. No database is needed.
+
+    PYTHONPATH=. python benchmarks/hot_paths.py [-k evaluate_rules] [--max-time 1.0] [--out results.json]
+        [--history benchmarks/results/hot_paths.jsonl]
+
+--history appends one line per run (tagged with the git commit) so trends can be tracked across commits.
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import uuid
+from collections import namedtuple
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Callable
+
+from sqlalchemy import ARRAY, Boolean, Date, DateTime, Integer, LargeBinary, Numeric
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+
+from app.services.internal import observation_version_diffs
+from app.services.mapping.fhir_dispatch import SUPPORTED_TYPES, _mapper
+from app.services.mapping.fhir_utils import fhir_meta
+from app.services.payer.evaluator import evaluate_rules
+from app.services.preauth.service import snapshot_checksum
+
+NOW = dt.datetime(2026, 1, 15, 12, 0, tzinfo=dt.timezone.utc)
+CPT = "http://www.ama-assn.org/go/cpt"
+SNOMED = "http://snomed.info/sct"
+
+
+@dataclass
+class Case:
+    group: str
+    name: str
+    size: int
+    fn: Callable[[], Any]
+
+    @property
+    def id(self) -> str:
+        return f"{self.group}[{self.name}]"
+
+
+# --- inputs ---
+
+# Text column values that steer _to_fhir down its fullest branch.
+_TEXT = {
+    "status": "final",
+    "category": "lab",
+    "value_type": "quantity",
+    "value_quantity_unit": "mg/dL",
+    "clinical_status": "active",
+    "intent": "order",
+    "priority": "routine",
+    "content_type": "application/pdf",
+    "binary_content_type": "application/pdf",
+    "channel_type": "rest-hook",
+    "criteria": "Observation?code=http://loinc.org|2345-7",
+}
+
+
+def _value(column) -> Any:
+    t = column.type
+    if isinstance(t, UUID):
+        return uuid.uuid4()
+    if isinstance(t, DateTime):
+        return NOW
+    if isinstance(t, Date):
+        return NOW.date()
+    if isinstance(t, (Integer, Boolean)):
+        return 3
+    if isinstance(t, Numeric):
+        return Decimal("96.5")
+    if isinstance(t, LargeBinary):
+        return b"%PDF-1.4 " + b"x" * 2048
+    if isinstance(t, ARRAY):
+        return [uuid.uuid4(), uuid.uuid4()]
+    if isinstance(t, JSONB):
+        return ["X-Test: 1"]
+    return _TEXT.get(column.name, f"{column.name}-value")
+
+
+def mapper_rows(resource_type: str, n: int) -> tuple[Any, list]:
+    """The mapper and `n` rows with the columns of its _select_rows, filled with plausible values."""
+    mapper = _mapper(None, resource_type)  # type: ignore[arg-type]
+    columns = list(mapper._select_rows().selected_columns)
+    Row = namedtuple("Row", [c.name for c in columns])
+    return mapper, [Row(*(_value(c) for c in columns)) for _ in range(n)]
+
+
+def payer_rules(policies: int) -> dict[str, Any]:
+    """`policies` policies where only the last matches the benchmark's service and diagnosis."""
+    out = []
+    for i in range(policies):
+        last = i == policies - 1
+        out.append(
+            {
+                "id": f"policy-{i}",
+                "services": {"codes": [{"system": CPT, "code": "73721" if last else str(70000 + i)}]},
+                "diagnosis": {"codes": [{"system": SNOMED, "code": "396275006" if last else str(100000 + i)}]},
+                "requiredDocuments": [
+                    {"code": "knee-xray-report", "display": "Knee X-ray report", "maxAgeDays": 30},
+                    {"code": "progress-note", "display": "Progress note", "maxAgeDays": 90},
+                ],
+                "outcome": "approved",
+            }
+        )
+    return {"schemaVersion": "1", "policies": out}
+
+
+def supporting_documents(n: int) -> list[dict[str, Any]]:
+    codes = ["lab-report", "discharge-summary", "progress-note", "knee-xray-report"]
+    return [
+        {"code": codes[i % len(codes)], "dateTime": (NOW - dt.timedelta(days=i)).isoformat().replace("+00:00", "Z")}
+        for i in range(n)
+    ]
+
+
+def snapshot(observations: int) -> dict[str, Any]:
+    def ref() -> dict[str, str]:
+        return {"id": str(uuid.uuid4())}
+
+    return {
+        "schemaVersion": "1",
+        "preAuthRequest": {**ref(), "status": "submitted", "priority": "routine", "payer": "Acme Payer"},
+        "patient": ref(),
+        "encounter": ref(),
+        "practitioner": ref(),
+        "organization": ref(),
+        "diagnosisCondition": ref(),
+        "serviceRequest": ref(),
+        "supportingObservations": [
+            {**ref(), "codeConceptId": str(uuid.uuid4()), "effectiveTime": NOW.isoformat(), "status": "final"}
+            for _ in range(observations)
+        ],
+        "supportingDocuments": [
+            {**ref(), "typeConceptId": str(uuid.uuid4()), "dateTime": NOW.isoformat(), "title": "X-ray", "role": "x"}
+            for _ in range(3)
+        ],
+    }
+
+
+def observation_versions(n: int) -> list[dict[str, Any]]:
+    """`n` versions in to_jsonb form, each correcting the value and every fourth also the status."""
+    oid = str(uuid.uuid4())
+    return [
+        {
+            "id": oid,
+            "version": v,
+            "updated_time": (NOW + dt.timedelta(minutes=v)).isoformat(),
+            "status": "amended" if v % 4 == 0 else "final",
+            "category": "lab",
+            "effective_time": NOW.isoformat(),
+            "value_type": "quantity",
+            "value_quantity_value": 90 + v,
+            "value_quantity_unit": "mg/dL",
+            "value_concept_id": None,
+        }
+        for v in range(1, n + 1)
+    ]
+
+
+# --- cases ---
+
+
+def cases() -> list[Case]:
+    out: list[Case] = []
+    for n in (1, 100, 1000):
+        times = [NOW + dt.timedelta(seconds=i) for i in range(n)]
+        out.append(Case("fhir_meta", f"n={n}", n, lambda t=times: [fhir_meta(version=3, last_updated=x) for x in t]))
+
+    for rt in sorted(SUPPORTED_TYPES):
+        for n in (1, 50, 500):
+            mapper, rows = mapper_rows(rt, n)
+            fn = lambda m=mapper, rs=rows: [m._row_to_fhir(r) for r in rs]  # noqa: E731
+            out.append(Case(f"mapper.{mapper.resource_type}", f"rows={n}", n, fn))
+
+    for policies in (1, 10, 100):
+        for docs in (0, 5, 50):
+            rules = payer_rules(policies)
+            documents = supporting_documents(docs)
+
+            def evaluate(rules=rules, documents=documents) -> dict[str, Any]:
+                return evaluate_rules(
+                    rules=rules,
+                    now=NOW,
+                    service_system=CPT,
+                    service_code="73721",
+                    service_text="MRI knee wo contrast",
+                    service_priority="routine",
+                    diagnosis_system=SNOMED,
+                    diagnosis_code="396275006",
+                    diagnosis_text="Osteoarthritis",
+                    preauth_priority="routine",
+                    supporting_documents=documents,
+                )
+
+            out.append(Case("evaluate_rules", f"policies={policies},docs={docs}", policies, evaluate))
+
+    for n in (1, 100, 1000):
+        snap = snapshot(n)
+        out.append(Case("snapshot_checksum", f"observations={n}", n, lambda s=snap: snapshot_checksum(s)))
+
+    for n in (2, 16, 128):
+        versions = observation_versions(n)
+        fn = lambda v=versions: observation_version_diffs(v)  # noqa: E731
+        out.append(Case("observation_version_diffs", f"versions={n}", n, fn))
+    return out
+
+
+# --- measurement ---
+
+
+def calibrate(fn: Callable[[], Any], min_round: float) -> int:
+    """Iterations per round so that a round takes at least `min_round` seconds."""
+    iterations = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_round:
+            return iterations
+        iterations = iterations * 10 if elapsed < min_round / 10 else iterations * 2
+
+
+def timing(fn: Callable[[], Any], *, max_time: float, min_rounds: int, min_round: float) -> dict[str, Any]:
+    iterations = calibrate(fn, min_round)
+    per_call: list[float] = []
+    started = time.perf_counter()
+    while len(per_call) < min_rounds or time.perf_counter() - started < max_time:
+        t0 = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        per_call.append((time.perf_counter() - t0) / iterations)
+    per_call.sort()
+    q1, _, q3 = statistics.quantiles(per_call, n=4) if len(per_call) > 1 else (per_call[0],) * 3
+    return {
+        "rounds": len(per_call),
+        "iterations": iterations,
+        "min_us": round(per_call[0] * 1e6, 3),
+        "median_us": round(statistics.median(per_call) * 1e6, 3),
+        "mean_us": round(statistics.fmean(per_call) * 1e6, 3),
+        "stddev_us": round(statistics.pstdev(per_call) * 1e6, 3),
+        "iqr_us": round((q3 - q1) * 1e6, 3),
+        "ops": round(1 / statistics.median(per_call), 1),
+    }
+
+
+def allocations(fn: Callable[[], Any], top: int) -> dict[str, Any]:
+    """One call under tracemalloc: peak and retained bytes, blocks allocated, and the largest allocation sites."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        result = fn()
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    del result
+    stats = after.compare_to(before, "lineno")
+    return {
+        "peak_bytes": peak - base,
+        "retained_bytes": current - base,
+        "blocks": sum(s.count_diff for s in stats if s.count_diff > 0),
+        "top": [
+            {
+                "site": f"{os.path.relpath(s.traceback[0].filename)}:{s.traceback[0].lineno}",
+                "bytes": s.size_diff,
+                "blocks": s.count_diff,
+            }
+            for s in sorted(stats, key=lambda s: s.size_diff, reverse=True)[:top]
+            if s.size_diff > 0
+        ],
+    }
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="filter", help="only cases whose id contains this")
+    parser.add_argument("--max-time", type=float, default=1.0, help="seconds of rounds per case")
+    parser.add_argument("--min-rounds", type=int, default=5)
+    parser.add_argument("--min-round", type=float, default=0.002, help="minimum seconds per round (calibration)")
+    parser.add_argument("--alloc-top", type=int, default=3, help="allocation sites reported per case")
+    parser.add_argument("--out", help="write the results JSON here")
+    parser.add_argument("--history", help="append the results as one JSON line to this file")
+    args = parser.parse_args()
+
+    results = []
+    for case in cases():
+        if args.filter and args.filter not in case.id:
+            continue
+        case.fn()  # warm up (imports, caches)
+        results.append(
+            {
+                "id": case.id,
+                "group": case.group,
+                "params": case.name,
+                "size": case.size,
+                **timing(case.fn, max_time=args.max_time, min_rounds=args.min_rounds, min_round=args.min_round),
+                "memory": allocations(case.fn, args.alloc_top),
+            }
+        )
+        r = results[-1]
+        print(
+            f"{case.id:<60} median {r['median_us']:>12.2f} us  ±{r['iqr_us']:<10.2f} "
+            f"peak {r['memory']['peak_bytes'] / 1024:>9.1f} KiB",
+            file=sys.stderr,
+        )
+
+    run = {
+        "commit": _commit(),
+        "timestamp": dt.datetime.now(dt.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(run, f, indent=2)
+    if args.history:
+        os.makedirs(os.path.dirname(args.history) or ".", exist_ok=True)
+        with open(args.history, "a") as f:
+            f.write(json.dumps(run) + "\n")
+    if not args.out:
+        print(json.dumps(run, indent=2))
+
+
+if __name__ == "__main__":
+    main()
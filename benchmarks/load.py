@@ -0,0 +1,408 @@
+"""
+End-to-end load test: replays a mixed FHIR / pre-auth / jobs workload against a running API and reports
+latency percentiles and throughput per operation, plus SQL statements and SQL time per request by route
+(from the API's /metrics). Results can be saved as a baseline and later runs compared with it.
+
+Needs a synthetic population (`python -m app.synthetic_population --patients 100000`); request inputs are
+sampled from it through DATABASE_URL. Jobs (pre-auth submission, bulk import) need a Celery worker.
+
+    PYTHONPATH=. python benchmarks/load.py [--base-url http://localhost:8000] [--duration 60] [--concurrency 16]
+        [--mix observation.search=40,preauth.workflow=5] [--out results.json]
+        [--save-baseline | --baseline benchmarks/baselines/load.json] [--tolerance 0.2]
+
+Exits with status 1 when a regression against the baseline is found: an operation's p95 latency or the
+overall throughput worse by more than --tolerance, more SQL statements per request on a route, or more errors.
+Latency baselines are only comparable on the same machine, population size and concurrency; statement counts
+are comparable anywhere. With several API worker processes, set METRICS_MULTIPROCESS_DIR so /metrics covers
+all of them.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+import httpx
+from sqlalchemy import text
+
+from app.db.session import engine
+from app.services.synthetic import IDENTIFIER_SYSTEM
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "load.json")
+
+# Operation -> relative weight; roughly a clinical UI's read-heavy traffic with a trickle of writes.
+MIX = {
+    "patient.read": 15,
+    "patient.search": 5,
+    "observation.search": 25,
+    "observation.search.code": 10,
+    "condition.search": 10,
+    "encounter.search": 5,
+    "preauth.read": 10,
+    "preauth.list": 2,
+    "preauth.workflow": 5,
+    "job.bulk_import": 1,
+}
+
+_SAMPLE = 2000
+
+
+@dataclass
+class Sample:
+    """Request inputs drawn from the synthetic population."""
+
+    population: int
+    patients: list[tuple[str, str]]  # (id, family name)
+    preauths: list[str]
+    orders: list[dict[str, str]]  # create-draft bodies without practitioner
+    practitioners: list[str]
+
+
+def load_sample() -> Sample:
+    with engine.connect() as conn:
+        population = conn.execute(
+            text("SELECT count(*) FROM som_patient WHERE identifier_system = :s"), {"s": IDENTIFIER_SYSTEM}
+        ).scalar_one()
+        patients = conn.execute(
+            text(
+                "SELECT id::text, name_family FROM som_patient WHERE identifier_system = :s ORDER BY random() LIMIT :n"
+            ),
+            {"s": IDENTIFIER_SYSTEM, "n": _SAMPLE},
+        ).all()
+        preauths = conn.execute(
+            text(
+                """
+                SELECT pr.id::text FROM som_preauth_request pr JOIN som_patient p ON p.id = pr.patient_id
+                WHERE p.identifier_system = :s ORDER BY random() LIMIT :n
+                """
+            ),
+            {"s": IDENTIFIER_SYSTEM, "n": _SAMPLE},
+        ).scalars().all()
+        orders = conn.execute(
+            text(
+                """
+                SELECT sr.patient_id::text, sr.id::text, r.condition_id::text, sr.encounter_id::text
+                FROM som_service_request sr
+                JOIN som_service_request_reason r ON r.service_request_id = sr.id
+                JOIN som_patient p ON p.id = sr.patient_id
+                WHERE p.identifier_system = :s ORDER BY random() LIMIT :n
+                """
+            ),
+            {"s": IDENTIFIER_SYSTEM, "n": _SAMPLE},
+        ).all()
+        practitioners = conn.execute(text("SELECT id::text FROM som_practitioner LIMIT 100")).scalars().all()
+    if not patients or not orders or not practitioners:
+        raise SystemExit("No synthetic population found; run `python -m app.synthetic_population` first.")
+    return Sample(
+        population=population,
+        patients=[(p, family) for p, family in patients],
+        preauths=list(preauths),
+        orders=[
+            {"patientId": p, "serviceRequestId": sr, "diagnosisConditionId": c, "encounterId": e}
+            for p, sr, c, e in orders
+        ],
+        practitioners=list(practitioners),
+    )
+
+
+@dataclass
+class Recorder:
+    latencies: dict[str, list[float]] = field(default_factory=dict)
+    errors: dict[str, int] = field(default_factory=dict)
+    enabled: bool = True
+
+    def add(self, name: str, seconds: float, ok: bool) -> None:
+        if not self.enabled:
+            return
+        self.latencies.setdefault(name, []).append(seconds)
+        if not ok:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+
+class Workload:
+    def __init__(self, client: httpx.AsyncClient, sample: Sample, recorder: Recorder, job_timeout: float):
+        self.client = client
+        self.sample = sample
+        self.recorder = recorder
+        self.job_timeout = job_timeout
+
+    async def request(self, name: str, method: str, url: str, **kw: Any) -> httpx.Response | None:
+        t0 = time.perf_counter()
+        try:
+            r = await self.client.request(method, url, **kw)
+        except httpx.HTTPError:
+            self.recorder.add(name, time.perf_counter() - t0, False)
+            return None
+        self.recorder.add(name, time.perf_counter() - t0, r.status_code < 400)
+        return r
+
+    async def wait_for_job(self, name: str, job_id: str, started: float) -> None:
+        """Poll the job until it finishes; records the enqueue-to-finish time as `name`."""
+        while time.perf_counter() - started < self.job_timeout:
+            r = await self.request("job.get", "GET", f"/jobs/{job_id}")
+            status = r.json().get("status") if r is not None and r.status_code == 200 else None
+            if status in ("succeeded", "failed"):
+                self.recorder.add(name, time.perf_counter() - started, status == "succeeded")
+                return
+            await asyncio.sleep(0.2)
+        self.recorder.add(name, time.perf_counter() - started, False)
+
+    async def patient_read(self, rng: random.Random) -> None:
+        await self.request("patient.read", "GET", f"/fhir/Patient/{rng.choice(self.sample.patients)[0]}")
+
+    async def patient_search(self, rng: random.Random) -> None:
+        family = rng.choice(self.sample.patients)[1]
+        await self.request("patient.search", "GET", "/fhir/Patient", params={"name": family, "_count": 20})
+
+    async def observation_search(self, rng: random.Random) -> None:
+        params = {"patient": rng.choice(self.sample.patients)[0], "_count": 50, "_sort": "-date"}
+        await self.request("observation.search", "GET", "/fhir/Observation", params=params)
+
+    async def observation_search_code(self, rng: random.Random) -> None:
+        params = {"patient": rng.choice(self.sample.patients)[0], "code": "http://loinc.org|8480-6"}
+        await self.request("observation.search.code", "GET", "/fhir/Observation", params=params)
+
+    async def condition_search(self, rng: random.Random) -> None:
+        params = {"patient": rng.choice(self.sample.patients)[0]}
+        await self.request("condition.search", "GET", "/fhir/Condition", params=params)
+
+    async def encounter_search(self, rng: random.Random) -> None:
+        params = {"patient": rng.choice(self.sample.patients)[0]}
+        await self.request("encounter.search", "GET", "/fhir/Encounter", params=params)
+
+    async def preauth_read(self, rng: random.Random) -> None:
+        if self.sample.preauths:
+            await self.request("preauth.read", "GET", f"/preauth/{rng.choice(self.sample.preauths)}")
+
+    async def preauth_list(self, rng: random.Random) -> None:
+        params = {"status": rng.choice(["submitted", "pending-info"]), "payer": "Acme Payer"}
+        await self.request("preauth.list", "GET", "/preauth", params=params)
+
+    async def preauth_workflow(self, rng: random.Random) -> None:
+        body = {**rng.choice(self.sample.orders), "practitionerId": rng.choice(self.sample.practitioners)}
+        r = await self.request("preauth.create", "POST", "/preauth", json={**body, "payer": "Acme Payer"})
+        if r is None or r.status_code >= 400:
+            return
+        started = time.perf_counter()
+        r = await self.request("preauth.submit", "POST", f"/preauth/{r.json()['id']}/submit")
+        if r is not None and r.status_code < 400:
+            await self.wait_for_job("preauth.decision", r.json()["jobId"], started)
+
+    async def job_bulk_import(self, rng: random.Random) -> None:
+        started = time.perf_counter()
+        parameters = {"patientId": rng.choice(self.sample.patients)[0], "count": 10}
+        body = {"type": "bulk_import_observations", "parameters": parameters}
+        r = await self.request("job.create", "POST", "/jobs", json=body)
+        if r is not None and r.status_code < 400:
+            await self.wait_for_job("job.bulk_import", r.json()["jobId"], started)
+
+    def operations(self) -> dict[str, Callable[[random.Random], Awaitable[None]]]:
+        return {name: getattr(self, name.replace(".", "_")) for name in MIX}
+
+
+# --- /metrics ---
+
+_SAMPLE_LINE = re.compile(r"^(\w+)(?:\{(.*)\})? (\S+)$")
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+async def scrape(client: httpx.AsyncClient) -> dict[tuple[str, str, str], float]:
+    """(metric, method, route) -> value for the per-request SQL histograms' _sum and _count samples."""
+    r = await client.get("/metrics")
+    if r.status_code != 200:
+        return {}
+    out: dict[tuple[str, str, str], float] = {}
+    for line in r.text.splitlines():
+        m = _SAMPLE_LINE.match(line)
+        if not m or not m.group(1).startswith(("http_request_db_queries_", "http_request_db_seconds_")):
+            continue
+        if not m.group(1).endswith(("_sum", "_count")):
+            continue
+        labels = dict(_LABEL.findall(m.group(2) or ""))
+        out[(m.group(1), labels.get("method", ""), labels.get("route", ""))] = float(m.group(3))
+    return out
+
+
+def db_by_route(before: dict, after: dict) -> dict[str, dict[str, float]]:
+    out: dict[str, dict[str, float]] = {}
+    for (metric, method, route), value in after.items():
+        if metric != "http_request_db_queries_count" or route in ("/metrics", "unmatched"):
+            continue
+        requests = value - before.get((metric, method, route), 0)
+        if requests <= 0:
+            continue
+
+        def delta(name: str) -> float:
+            return after.get((name, method, route), 0) - before.get((name, method, route), 0)
+
+        out[f"{method} {route}"] = {
+            "requests": int(requests),
+            "statementsPerRequest": round(delta("http_request_db_queries_sum") / requests, 2),
+            "dbMsPerRequest": round(delta("http_request_db_seconds_sum") / requests * 1000, 3),
+        }
+    return dict(sorted(out.items()))
+
+
+# --- run ---
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def summarize(recorder: Recorder, seconds: float) -> dict[str, Any]:
+    operations = {}
+    for name, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        operations[name] = {
+            "requests": len(values),
+            "errors": recorder.errors.get(name, 0),
+            "rps": round(len(values) / seconds, 2),
+            "p50_ms": round(statistics.median(values) * 1000, 2),
+            "p90_ms": round(percentile(values, 0.90) * 1000, 2),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2),
+        }
+    requests = sum(o["requests"] for o in operations.values())
+    return {
+        "requests": requests,
+        "errors": sum(o["errors"] for o in operations.values()),
+        "rps": round(requests / seconds, 2),
+        "operations": operations,
+    }
+
+
+async def run(args: argparse.Namespace, mix: dict[str, int], sample: Sample) -> dict[str, Any]:
+    recorder = Recorder(enabled=False)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        workload = Workload(client, sample, recorder, args.job_timeout)
+        ops = workload.operations()
+        names = list(mix)
+        weights = [mix[n] for n in names]
+        deadline = 0.0
+
+        async def worker(n: int) -> None:
+            rng = random.Random(f"{args.seed}:{n}")
+            while time.perf_counter() < deadline:
+                await ops[rng.choices(names, weights)[0]](rng)
+
+        deadline = time.perf_counter() + args.warmup
+        await asyncio.gather(*(worker(n) for n in range(args.concurrency)))
+
+        recorder.enabled = True
+        before = await scrape(client)
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(worker(args.concurrency + n) for n in range(args.concurrency)))
+        seconds = time.perf_counter() - started
+        after = await scrape(client)
+
+    return {
+        "config": {
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "mix": mix,
+            "population": sample.population,
+        },
+        "seconds": round(seconds, 1),
+        **summarize(recorder, seconds),
+        "db": db_by_route(before, after),
+    }
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any], tolerance: float) -> list[str]:
+    """Regressions of `current` against `baseline`, as readable lines."""
+    found = []
+    if current["rps"] < baseline["rps"] * (1 - tolerance):
+        found.append(f"throughput {current['rps']} rps < baseline {baseline['rps']} rps")
+    for name, op in current["operations"].items():
+        base = baseline["operations"].get(name)
+        if base is None:
+            continue
+        # A couple of milliseconds of slack keeps very fast operations from flagging on noise.
+        if op["p95_ms"] > base["p95_ms"] * (1 + tolerance) + 2:
+            found.append(f"{name}: p95 {op['p95_ms']} ms > baseline {base['p95_ms']} ms")
+        if op["errors"] / op["requests"] > base["errors"] / base["requests"] + 0.01:
+            found.append(
+                f"{name}: {op['errors']} errors in {op['requests']}, baseline {base['errors']} in {base['requests']}"
+            )
+    for route, db in current["db"].items():
+        base = baseline["db"].get(route)
+        if base is None:
+            continue
+        # Statement counts depend on the data only slightly (e.g. how many rows an N+1 loop visits).
+        if db["statementsPerRequest"] > base["statementsPerRequest"] * 1.1 + 0.5:
+            found.append(
+                f"{route}: {db['statementsPerRequest']} statements/request > baseline {base['statementsPerRequest']}"
+            )
+    return found
+
+
+def parse_mix(value: str | None) -> dict[str, int]:
+    mix = dict(MIX)
+    for part in (value or "").split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        if name.strip() not in MIX:
+            raise argparse.ArgumentTypeError(f"unknown operation {name!r}; one of {', '.join(MIX)}")
+        mix[name.strip()] = int(weight)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--duration", type=float, default=60, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=10, help="unmeasured seconds first")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent virtual users")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(None), help="weights, e.g. preauth.list=0")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--job-timeout", type=float, default=60)
+    parser.add_argument("--out", help="write the results JSON here")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args, args.mix, load_sample()))
+    print(json.dumps(results, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved to {args.baseline}", file=sys.stderr)
+        return
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; record one with --save-baseline", file=sys.stderr)
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline["config"] != results["config"]:
+        print("note: baseline was recorded with a different config", file=sys.stderr)
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    if regressions:
+        sys.exit(1)
+    print("no regressions against the baseline", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
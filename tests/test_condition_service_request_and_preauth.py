@@ -1,6 +1,12 @@
+import uuid
+
 from fastapi.testclient import TestClient
 
+from app.db import query_metrics
+from app.db.models import SomPreAuthRequest
+from app.db.session import session_scope
 from app.main import app
+from app.services.preauth.service import PreAuthService, snapshot_checksum
 
 
 def test_condition_service_request_normalization_and_provenance():
@@ -142,6 +148,8 @@ def test_preauth_submit_creates_snapshot_job_and_decision():
     job = client.get(f"/jobs/{submit['jobId']}").json()
     assert job["status"] == "succeeded"
     assert job["outputs"]["outcome"] in {"approved", "denied", "pending-info"}
+    assert set(job["metrics"]["phases"]) == {"assemble", "payer_review", "persist"}
+    assert job["metrics"]["phases"]["payer_review"]["seconds"] >= 1.0
 
     refreshed = client.get(f"/preauth/{draft['id']}").json()
     assert refreshed["latestSnapshot"] is not None
@@ -149,6 +157,96 @@ def test_preauth_submit_creates_snapshot_job_and_decision():
     # Osteoarthritis + MRI knee => pending-info
     assert refreshed["latestDecision"]["outcome"] == "pending-info"
 
+    # The decision was made on the snapshot, which carries the codes inline.
+    snapshot = refreshed["latestSnapshot"]["snapshot"]
+    assert snapshot["schemaVersion"] == "2"
+    assert snapshot["serviceRequest"]["code"] == {
+        "system": "http://www.ama-assn.org/go/cpt",
+        "code": "73721",
+        "display": "MRI knee wo contrast",
+    }
+    assert snapshot["diagnosisCondition"]["code"]["code"] == "396275006"
+    with session_scope() as db:
+        pr = db.get(SomPreAuthRequest, uuid.UUID(draft["id"]))
+        tally = query_metrics.QueryTally()
+        token = query_metrics.tally.set(tally)
+        try:
+            package = PreAuthService(db).package(pr, snapshot_id=submit["snapshotId"])
+        finally:
+            query_metrics.tally.reset(token)
+    assert tally.count == 1
+    assert package.service.code == "73721" and package.service_priority == "routine"
+    assert package.diagnosis.display == "Osteoarthritis"
+
+
+
+def test_snapshot_builder_is_set_based_and_deduplicated():
+    client = TestClient(app)
+    patient = client.post("/fhir/Patient", json={"resourceType": "Patient", "name": [{"family": "Bulk"}]}).json()
+    prac = client.post("/fhir/Practitioner", json={"resourceType": "Practitioner", "name": [{"text": "Dr. B"}]}).json()
+    cond = client.post(
+        "/fhir/Condition",
+        json={
+            "resourceType": "Condition",
+            "subject": {"reference": f"Patient/{patient['id']}"},
+            "code": {"coding": [{"system": "http://snomed.info/sct", "code": "396275006", "display": "Osteoarthritis"}]},
+        },
+    ).json()
+    sr = client.post(
+        "/fhir/ServiceRequest",
+        json={
+            "resourceType": "ServiceRequest",
+            "status": "active",
+            "intent": "order",
+            "subject": {"reference": f"Patient/{patient['id']}"},
+            "code": {"coding": [{"system": "http://www.ama-assn.org/go/cpt", "code": "73721"}]},
+        },
+    ).json()
+    job = {"type": "bulk_import_observations", "parameters": {"patientId": patient["id"], "count": 20}}
+    client.post("/jobs", json=job)
+    entries = client.get(f"/fhir/Observation?patient={patient['id']}&_count=50").json()["entry"]
+    obs_ids = [e["resource"]["id"] for e in entries]
+    assert len(obs_ids) == 20
+
+    def statements(pr_id: str) -> tuple[int, dict]:
+        with session_scope() as db:
+            pr = db.get(SomPreAuthRequest, uuid.UUID(pr_id))
+            tally = query_metrics.QueryTally()
+            token = query_metrics.tally.set(tally)
+            try:
+                snapshot = PreAuthService(db)._build_snapshot(pr)
+            finally:
+                query_metrics.tally.reset(token)
+        return tally.count, snapshot
+
+    drafts = [
+        client.post(
+            "/preauth",
+            json={
+                "patientId": patient["id"],
+                "practitionerId": prac["id"],
+                "diagnosisConditionId": cond["id"],
+                "serviceRequestId": sr["id"],
+                "supportingObservationIds": ids,
+            },
+        ).json()["id"]
+        for ids in (obs_ids[:1], obs_ids[::-1])
+    ]
+    (small, _), (large, snapshot) = statements(drafts[0]), statements(drafts[1])
+    assert small == large == 4
+    assert [o["id"] for o in snapshot["supportingObservations"]] == obs_ids[::-1]
+    assert snapshot["supportingObservations"][0]["code"] == {
+        "system": "http://loinc.org",
+        "code": "8867-4",
+        "display": "Heart rate",
+    }
+
+    with session_scope() as db:
+        pr = db.get(SomPreAuthRequest, uuid.UUID(drafts[1]))
+        first = PreAuthService(db)._create_snapshot(pr, correlation_id=None)
+        again = PreAuthService(db)._create_snapshot(pr, correlation_id=None)
+        assert again.id == first.id
+        assert first.checksum == snapshot_checksum(first.snapshot)
 
 def test_pending_info_resolved_by_xray_document():
     client = TestClient(app)
@@ -0,0 +1,153 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, select
+
+from app.db import session as db_session
+from app.db.models import SomResourceHistory
+from app.main import app
+from app.services.mapping.resources.base import BaseMapper
+
+
+def _patient(mrn: str, family: str, birth_date: str = "1970-05-06") -> dict:
+    return {
+        "resourceType": "Patient",
+        "identifier": [{"system": "urn:mrn", "value": mrn}],
+        "name": [{"family": family, "given": ["Cond"]}],
+        "birthDate": birth_date,
+    }
+
+
+def test_conditional_create_and_update_by_identifier():
+    client = TestClient(app)
+    criteria = "identifier=urn:mrn|COND-1"
+
+    r1 = client.post("/fhir/Patient", json=_patient("COND-1", "Conditional"), headers={"If-None-Exist": criteria})
+    assert r1.status_code == 201
+    r2 = client.post("/fhir/Patient", json=_patient("COND-1", "Ignored"), headers={"If-None-Exist": criteria})
+    assert r2.status_code == 200
+    assert r2.json()["id"] == r1.json()["id"]
+    assert r2.json()["name"][0]["family"] == "Conditional"
+
+    # The unique identifier index turns a plain duplicate into a conflict.
+    assert client.post("/fhir/Patient", json=_patient("COND-1", "Dup")).status_code == 409
+
+    up = client.put("/fhir/Patient?identifier=urn:mrn|COND-1", json=_patient("COND-1", "Upserted"))
+    assert up.status_code == 200
+    assert up.json()["id"] == r1.json()["id"]
+    assert up.json()["meta"]["versionId"] == "2"
+
+    new = client.put("/fhir/Patient?identifier=urn:mrn|COND-2", json=_patient("COND-2", "Upserted"))
+    assert new.status_code == 201
+    assert new.json()["id"] != r1.json()["id"]
+
+    # Criteria matching several resources are a failed precondition.
+    assert client.put("/fhir/Patient?family=Upserted", json=_patient("COND-3", "X")).status_code == 412
+    assert client.put("/fhir/Patient", json=_patient("COND-3", "X")).status_code == 400
+    assert client.put("/fhir/Patient?bogus=1", json=_patient("COND-3", "X")).status_code == 400
+
+
+def test_concurrent_conditional_creates_make_one_resource():
+    def create(i: int) -> str:
+        r = TestClient(app).post(
+            "/fhir/Patient",
+            json=_patient("COND-RACE", f"Racer{i}"),
+            headers={"If-None-Exist": "identifier=urn:mrn|COND-RACE", "X-Correlation-Id": f"t-cond-race-{i}"},
+        )
+        assert r.status_code in (200, 201)
+        return r.json()["id"]
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        ids = set(pool.map(create, range(8)))
+    assert len(ids) == 1
+    found = TestClient(app).get("/fhir/Patient?identifier=urn:mrn|COND-RACE").json()
+    assert found["total"] == 1
+
+
+def test_patch_history_holds_only_changed_columns():
+    client = TestClient(app)
+    pid = client.post("/fhir/Patient", json=_patient("PATCH-1", "Patchable")).json()["id"]
+
+    updates: list[str] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if "UPDATE som_patient" in statement:
+            updates.append(" ".join(statement.split()))
+
+    event.listen(db_session.engine, "before_cursor_execute", capture)
+    try:
+        r = client.patch(
+            f"/fhir/Patient/{pid}",
+            json=[
+                {"op": "test", "path": "/name/0/family", "value": "Patchable"},
+                {"op": "replace", "path": "/birthDate", "value": "1971-07-08"},
+            ],
+            headers={"Content-Type": "application/json-patch+json"},
+        )
+    finally:
+        event.remove(db_session.engine, "before_cursor_execute", capture)
+    assert r.status_code == 200
+    # Only the patched element's column is written.
+    assert len(updates) == 1
+    set_list = updates[0].split(" SET ", 1)[1].split(" WHERE ", 1)[0]
+    assert "birth_date=" in set_list
+    assert "name_family" not in set_list and "identifier_value" not in set_list
+    out = r.json()
+    assert out["meta"]["versionId"] == "2"
+    assert out["birthDate"] == "1971-07-08"
+    assert out["name"][0]["family"] == "Patchable"
+    assert out["identifier"][0]["value"] == "PATCH-1"
+
+    with db_session.SessionLocal() as db:
+        delta = db.execute(select(SomResourceHistory.data).where(SomResourceHistory.resource_id == pid)).scalar_one()
+    assert set(delta) - {"updated_time", "updated_provenance_id"} == {"birth_date", "version"}
+
+    fhirpath = {
+        "resourceType": "Parameters",
+        "parameter": [
+            {
+                "name": "operation",
+                "part": [
+                    {"name": "type", "valueCode": "replace"},
+                    {"name": "path", "valueString": "Patient.name[0].family"},
+                    {"name": "value", "valueString": "Repatched"},
+                ],
+            }
+        ],
+    }
+    r = client.patch(f"/fhir/Patient/{pid}", json=fhirpath, headers={"Content-Type": "application/fhir+json"})
+    assert r.status_code == 200
+    assert r.json()["name"][0]["family"] == "Repatched"
+    assert r.json()["meta"]["versionId"] == "3"
+
+    # A patch that changes nothing is not a new version.
+    noop = client.patch(f"/fhir/Patient/{pid}", json=[{"op": "test", "path": "/birthDate", "value": "1971-07-08"}])
+    assert noop.json()["meta"]["versionId"] == "3"
+
+    assert client.patch(f"/fhir/Patient/{pid}", json=[{"op": "test", "path": "/birthDate", "value": "x"}]).status_code == 400
+    assert client.patch(f"/fhir/Patient/{pid}", json=[{"op": "replace", "path": "/id", "value": "x"}]).status_code == 400
+    assert client.patch(f"/fhir/Patient/{pid}", json=[{"op": "remove", "path": "/nope"}]).status_code == 400
+    missing = "/fhir/Patient/00000000-0000-0000-0000-000000000000"
+    assert client.patch(missing, json=[{"op": "remove", "path": "/birthDate"}]).status_code == 404
+
+
+def test_scenario_with_a_reused_mrn_is_a_conflict():
+    client = TestClient(app)
+    body = {"templateId": "knee-oa-mri", "patient": {"mrn": "SCEN-1"}}
+    assert client.post("/internal/scenarios", json=body).status_code == 200
+    assert client.post("/internal/scenarios", json=body).status_code == 409
+    # Generated MRNs don't collide, however quickly scenarios are created.
+    for _ in range(2):
+        assert client.post("/internal/scenarios", json={"templateId": "knee-oa-mri"}).status_code == 200
+
+
+def test_patch_rejects_unversioned_resources():
+    class Unversioned(BaseMapper):
+        resource_type = "Basic"
+
+        def read(self, id):
+            return {"resourceType": "Basic", "id": id}
+
+    with pytest.raises(ValueError, match="not versioned"):
+        Unversioned(None).patch("b-1", [{"op": "add", "path": "/code", "value": {}}], correlation_id=None)
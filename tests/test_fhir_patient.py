@@ -36,3 +36,57 @@ def test_patient_create_read_search_idempotent():
     ids = [e["resource"]["id"] for e in bundle.get("entry", [])]
     assert p1["id"] in ids
 
+
+
+def test_patient_name_search_and_match():
+    client = TestClient(app)
+    pid = client.post(
+        "/fhir/Patient",
+        json={
+            "resourceType": "Patient",
+            "identifier": [{"system": "urn:mrn", "value": "MATCH-1"}],
+            "name": [{"family": "Zoë-Matchwell", "given": ["Ana  Lucia"]}],
+            "birthDate": "1984-09-30",
+        },
+        headers={"X-Correlation-Id": "t-match-p"},
+    ).json()["id"]
+    other = client.post(
+        "/fhir/Patient",
+        json={"resourceType": "Patient", "name": [{"family": "Matchwell", "given": ["Bo"]}], "birthDate": "1990-01-01"},
+        headers={"X-Correlation-Id": "t-match-o"},
+    ).json()["id"]
+
+    def names(q: str) -> set[str]:
+        return {e["resource"]["id"] for e in client.get(f"/fhir/Patient?name={q}").json()["entry"]}
+
+    # Case-, whitespace- and word-insensitive prefix match on the normalized name.
+    assert pid in names("ZOë-MATCH")
+    assert pid in names("lucia")
+    assert pid in names("ana lucia")
+    assert pid not in names("atchwell")
+
+    def match(resource: dict, **extra) -> dict:
+        params = [{"name": "resource", "resource": {"resourceType": "Patient", **resource}}]
+        params += [{"name": k, **v} for k, v in extra.items()]
+        r = client.post("/fhir/Patient/$match", json={"resourceType": "Parameters", "parameter": params})
+        assert r.status_code == 200, r.text
+        return r.json()
+
+    by_mrn = match({"identifier": [{"system": "urn:mrn", "value": "MATCH-1"}]})
+    assert by_mrn["entry"][0]["resource"]["id"] == pid
+    assert by_mrn["entry"][0]["search"]["extension"][0]["valueCode"] == "certain"
+
+    fuzzy = match({"name": [{"family": "Zoe-Matchwel", "given": ["Ana", "Lucia"]}], "birthDate": "1984-09-30"})
+    ranked = [e["resource"]["id"] for e in fuzzy["entry"]]
+    assert ranked[0] == pid and other not in ranked
+    scores = [e["search"]["score"] for e in fuzzy["entry"]]
+    assert scores == sorted(scores, reverse=True)
+
+    certain_only = match(
+        {"name": [{"family": "Matchwell", "given": ["Bo"]}], "birthDate": "1990-02-02"},
+        onlyCertainMatches={"valueBoolean": True},
+    )
+    assert certain_only["entry"] == []
+
+    bad = client.post("/fhir/Patient/$match", json={"resourceType": "Parameters", "parameter": []})
+    assert bad.status_code == 400
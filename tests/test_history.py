@@ -0,0 +1,95 @@
+import datetime as dt
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from app.db import session as db_session
+from app.db.models import SomResourceHistory
+from app.main import app
+
+
+def test_history_for_any_resource_with_delta_storage():
+    client = TestClient(app)
+    since = (dt.datetime.now(dt.timezone.utc) - dt.timedelta(seconds=1)).isoformat().replace("+00:00", "Z")
+
+    body = {
+        "resourceType": "Patient",
+        "identifier": [{"system": "urn:mrn", "value": "HIST-1"}],
+        "name": [{"family": "History_One", "given": ["Ann"]}],
+        "birthDate": "1980-02-03",
+    }
+    pid = client.post("/fhir/Patient", json=body, headers={"X-Correlation-Id": "t-hist-p1"}).json()["id"]
+    for i, family in enumerate(("History_Two", "History_Three", "History_Four"), start=2):
+        body["name"] = [{"family": family, "given": ["Ann"]}]
+        r = client.put(f"/fhir/Patient/{pid}", json=body, headers={"X-Correlation-Id": f"t-hist-p{i}"})
+        assert r.json()["meta"]["versionId"] == str(i)
+
+    hist = client.get(f"/fhir/Patient/{pid}/_history")
+    assert hist.status_code == 200
+    entries = hist.json()["entry"]
+    assert [e["resource"]["meta"]["versionId"] for e in entries] == ["4", "3", "2", "1"]
+    assert [e["resource"]["name"][0]["family"] for e in entries] == ["History_Four", "History_Three", "History_Two", "History_One"]
+    assert [e["request"]["method"] for e in entries] == ["PUT", "PUT", "PUT", "POST"]
+    assert all(e["resource"]["birthDate"] == "1980-02-03" for e in entries)
+
+    v2 = client.get(f"/fhir/Patient/{pid}/_history/2")
+    assert v2.status_code == 200
+    assert v2.json()["name"][0]["family"] == "History_Two"
+    assert v2.headers["etag"] == 'W/"2"'
+    assert client.get(f"/fhir/Patient/{pid}/_history/4").json()["name"][0]["family"] == "History_Four"
+    assert client.get(f"/fhir/Patient/{pid}/_history/9").status_code == 404
+    assert client.get(f"/fhir/Patient/{pid}/_history/x").status_code == 400
+    assert client.get("/fhir/Patient/00000000-0000-0000-0000-000000000000/_history").status_code == 404
+
+    # Prior versions keep only what changed, not full copies.
+    with db_session.SessionLocal() as db:
+        rows = db.execute(select(SomResourceHistory).where(SomResourceHistory.resource_id == pid)).scalars().all()
+    assert sorted(r.version for r in rows) == [1, 2, 3]
+    assert not any(r.checkpoint for r in rows)
+    for r in rows:
+        assert "identifier_value" not in r.data and "birth_date" not in r.data
+        assert {"name_family", "version"} <= set(r.data)
+
+    typed = client.get(f"/fhir/Patient/_history?_since={since}&_count=200")
+    assert typed.status_code == 200
+    mine = [e["resource"]["meta"]["versionId"] for e in typed.json()["entry"] if e["resource"]["id"] == pid]
+    assert mine == ["4", "3", "2", "1"]
+    assert client.get("/fhir/Patient/_history?_since=yesterday").status_code == 400
+
+
+def test_history_checkpoints_bound_reconstruction():
+    client = TestClient(app)
+    pid = client.post(
+        "/fhir/Patient",
+        json={"resourceType": "Patient", "name": [{"family": "History_Obs", "given": ["Bo"]}]},
+        headers={"X-Correlation-Id": "t-hist-cp-p"},
+    ).json()["id"]
+
+    def body(value: int) -> dict:
+        return {
+            "resourceType": "Observation",
+            "status": "final",
+            "code": {"coding": [{"system": "http://loinc.org", "code": "8867-4", "display": "Heart rate"}]},
+            "subject": {"reference": f"Patient/{pid}"},
+            "effectiveDateTime": "2026-02-01T10:00:00Z",
+            "valueQuantity": {"value": value, "unit": "beats/min"},
+        }
+
+    oid = client.post("/fhir/Observation", json=body(60), headers={"X-Correlation-Id": "t-hist-cp-o1"}).json()["id"]
+    for v in range(2, 20):
+        client.put(f"/fhir/Observation/{oid}", json=body(58 + v), headers={"X-Correlation-Id": f"t-hist-cp-o{v}"})
+
+    with db_session.SessionLocal() as db:
+        checkpoints = db.execute(
+            select(SomResourceHistory.version).where(SomResourceHistory.resource_id == oid, SomResourceHistory.checkpoint)
+        ).scalars().all()
+    assert checkpoints == [16]
+
+    for v in (1, 3, 15, 16, 17, 19):
+        r = client.get(f"/fhir/Observation/{oid}/_history/{v}").json()
+        assert r["meta"]["versionId"] == str(v)
+        assert r["valueQuantity"]["value"] == (60 if v == 1 else 58 + v)
+        assert r["code"]["coding"][0]["code"] == "8867-4"
+
+    hist = client.get(f"/fhir/Observation/{oid}/_history?_count=5").json()
+    assert [e["resource"]["meta"]["versionId"] for e in hist["entry"]] == ["19", "18", "17", "16", "15"]
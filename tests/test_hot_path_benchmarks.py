@@ -0,0 +1,25 @@
+from app.services.internal import observation_version_diffs
+from benchmarks.hot_paths import allocations, cases, observation_versions, timing
+
+
+def test_every_hot_path_case_runs():
+    all_cases = cases()
+    groups = {c.group for c in all_cases}
+    assert {"fhir_meta", "evaluate_rules", "snapshot_checksum", "observation_version_diffs"} <= groups
+    assert {"mapper.Observation", "mapper.Patient", "mapper.ServiceRequest"} <= groups
+    for case in all_cases:
+        case.fn()
+
+    case = next(c for c in all_cases if c.id == "evaluate_rules[policies=10,docs=5]")
+    assert case.fn()["outcome"] == "approved"
+    t = timing(case.fn, max_time=0.01, min_rounds=3, min_round=0.0005)
+    assert t["rounds"] >= 3 and 0 < t["min_us"] <= t["median_us"]
+    memory = allocations(case.fn, 2)
+    assert memory["peak_bytes"] > 0 and len(memory["top"]) <= 2
+
+
+def test_observation_version_diffs():
+    out = observation_version_diffs(observation_versions(4))
+    changed = [d["changed"] for d in out["diffs"]]
+    assert changed == [[], ["valueQuantity"], ["valueQuantity"], ["status", "valueQuantity"]]
+    assert out["versions"][0]["valueQuantity"] == {"value": 91.0, "unit": "mg/dL"}
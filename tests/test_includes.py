@@ -0,0 +1,88 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+
+def test_include_and_revinclude_in_one_request():
+    client = TestClient(app)
+    patient = client.post(
+        "/fhir/Patient",
+        json={
+            "resourceType": "Patient",
+            "identifier": [{"system": "urn:test:mrn", "value": "INC-1"}],
+            "name": [{"family": "Include", "given": ["I"]}],
+        },
+        headers={"X-Correlation-Id": "t-inc-p"},
+    ).json()
+    subject = {"reference": f"Patient/{patient['id']}"}
+    enc = client.post(
+        "/fhir/Encounter",
+        json={"resourceType": "Encounter", "status": "finished", "subject": subject, "period": {"start": "2026-01-01T09:00:00Z"}},
+        headers={"X-Correlation-Id": "t-inc-e"},
+    ).json()
+    conds = [
+        client.post(
+            "/fhir/Condition",
+            json={
+                "resourceType": "Condition",
+                "subject": subject,
+                "code": {"coding": [{"system": "http://snomed.info/sct", "code": code}]},
+            },
+            headers={"X-Correlation-Id": f"t-inc-c{code}"},
+        ).json()
+        for code in ("396275006", "239873007")
+    ]
+    for i in range(2):
+        sr = client.post(
+            "/fhir/ServiceRequest",
+            json={
+                "resourceType": "ServiceRequest",
+                "status": "active",
+                "intent": "order",
+                "subject": subject,
+                "encounter": {"reference": f"Encounter/{enc['id']}"},
+                "code": {"coding": [{"system": "http://www.ama-assn.org/go/cpt", "code": "73721"}]},
+                "reasonReference": [{"reference": f"Condition/{c['id']}"} for c in conds],
+            },
+            headers={"X-Correlation-Id": f"t-inc-sr{i}"},
+        ).json()
+        assert sr["reasonReference"] == [{"reference": f"Condition/{c['id']}"} for c in conds]
+    client.post(
+        "/fhir/Observation",
+        json={
+            "resourceType": "Observation",
+            "status": "final",
+            "subject": subject,
+            "code": {"coding": [{"system": "http://loinc.org", "code": "8867-4"}]},
+            "effectiveDateTime": "2026-01-01T10:00:00Z",
+            "valueQuantity": {"value": 72, "unit": "beats/min"},
+        },
+        headers={"X-Correlation-Id": "t-inc-o"},
+    )
+
+    b = client.get(
+        f"/fhir/ServiceRequest?patient={patient['id']}"
+        "&_include=ServiceRequest:patient&_include=ServiceRequest:encounter&_include=ServiceRequest:reason-reference"
+    ).json()
+    assert b["total"] == 2
+    modes = [(e["resource"]["resourceType"], e["search"]["mode"]) for e in b["entry"]]
+    assert modes.count(("ServiceRequest", "match")) == 2
+    included = sorted(t for t, m in modes if m == "include")
+    # Deduplicated across both service requests.
+    assert included == ["Condition", "Condition", "Encounter", "Patient"]
+
+    b = client.get("/fhir/Patient?identifier=urn:test:mrn|INC-1&_revinclude=Observation:patient&_revinclude=ServiceRequest:patient").json()
+    assert b["total"] == 1
+    assert sorted(e["resource"]["resourceType"] for e in b["entry"] if e["search"]["mode"] == "include") == [
+        "Observation",
+        "ServiceRequest",
+        "ServiceRequest",
+    ]
+
+    b = client.get(f"/fhir/Condition?patient={patient['id']}&_revinclude=ServiceRequest:reason-reference").json()
+    assert sum(1 for e in b["entry"] if e["search"]["mode"] == "include") == 2
+
+    assert client.get("/fhir/Patient?_include=Observation:patient").status_code == 400
+    assert client.get("/fhir/Patient?_revinclude=Observation:code").status_code == 400
+    # Without _include the bundle shape is unchanged.
+    assert "search" not in client.get(f"/fhir/Condition?patient={patient['id']}").json()["entry"][0]
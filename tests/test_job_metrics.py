@@ -0,0 +1,40 @@
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+
+def test_job_run_metrics_are_recorded_and_sortable():
+    client = TestClient(app)
+    pid = client.post("/fhir/Patient", json={"resourceType": "Patient", "name": [{"family": "Metered"}]}).json()["id"]
+    short_id, long_id = (
+        client.post(
+            "/jobs", json={"type": "bulk_import_observations", "parameters": {"patientId": pid, "count": count}}
+        ).json()["jobId"]
+        for count in (2, 25)
+    )
+
+    metrics = client.get(f"/jobs/{long_id}").json()["metrics"]
+    assert metrics["task"] == "jobs.bulk_import_observations"
+    assert metrics["state"] == "SUCCESS"
+    assert metrics["queueWaitSeconds"] == 0.0
+    assert set(metrics["phases"]) == {"prepare", "import", "persist"}
+    # Three batches with a 0.4s pause each.
+    assert metrics["phases"]["import"]["seconds"] >= 1.2
+    assert metrics["durationSeconds"] >= sum(p["seconds"] for p in metrics["phases"].values()) - 0.001
+    assert metrics["dbStatements"] > 3
+    assert metrics["dbStatements"] == sum(p["dbStatements"] for p in metrics["phases"].values())
+    assert metrics["memory"]["peakRssBytes"] > 0
+    assert metrics["memory"]["tracemallocPeakBytes"] >= metrics["memory"]["tracemallocDeltaBytes"]
+
+    ids = [j["id"] for j in client.get("/jobs?orderBy=duration").json()["jobs"]]
+    assert ids.index(long_id) < ids.index(short_id)
+    ids = [j["id"] for j in client.get("/jobs?minDuration=1.2").json()["jobs"]]
+    assert long_id in ids and short_id not in ids
+    ids = [j["id"] for j in client.get("/jobs?maxDuration=1.2&status=succeeded").json()["jobs"]]
+    assert short_id in ids and long_id not in ids
+    assert client.get("/jobs?orderBy=slowest").status_code == 400
+
+    text = client.get("/metrics").text
+    assert 'job_phase_duration_seconds_count{task="jobs.bulk_import_observations",phase="import"}' in text
+    assert 'job_db_statements_count{task="jobs.bulk_import_observations"}' in text
+    assert 'job_worker_peak_rss_bytes{task="jobs.bulk_import_observations"}' in text
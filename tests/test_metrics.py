@@ -0,0 +1,112 @@
+import json
+import os
+import re
+
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.metrics import registry
+from app.main import app
+
+
+def _samples(text: str) -> dict[str, float]:
+    out = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, _, value = line.rpartition(" ")
+            out[name] = float(value)
+    return out
+
+
+def _value(samples: dict[str, float], prefix: str, **labels: str) -> float:
+    """Sum of the samples of `prefix` whose labels include `labels`."""
+    total = 0.0
+    for name, value in samples.items():
+        m = re.fullmatch(r"([^{]+)(?:\{(.*)\})?", name)
+        if m.group(1) != prefix:
+            continue
+        have = dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', m.group(2) or ""))
+        if all(have.get(k) == v for k, v in labels.items()):
+            total += value
+    return total
+
+
+def test_metrics_cover_routes_sql_mappers_cache_and_tasks():
+    client = TestClient(app)
+    pid = client.post("/fhir/Patient", json={"resourceType": "Patient", "name": [{"family": "Metered"}]}).json()["id"]
+    before = _samples(client.get("/metrics").text)
+
+    client.get(f"/fhir/Patient/{pid}")
+    client.get(f"/fhir/Patient/{pid}")
+    client.get("/fhir/Patient?family=Metered")
+    client.get("/fhir/NotAType/123")
+    job = client.post(
+        "/jobs", json={"type": "bulk_import_observations", "parameters": {"patientId": pid, "count": 2}}
+    )
+    assert job.status_code == 200
+
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain; version=0.0.4")
+    after = _samples(r.text)
+
+    def delta(prefix: str, **labels: str) -> float:
+        return _value(after, prefix, **labels) - _value(before, prefix, **labels)
+
+    read_route = {"method": "GET", "route": "/fhir/{resource_type}/{id}"}
+    assert delta("http_request_duration_seconds_count", **read_route, resource_type="Patient", status="200") == 2
+    assert delta("http_request_duration_seconds_count", **read_route, resource_type="other") == 1
+    # Per-request SQL: the cold read queries Postgres, and the statements land in the request's histogram.
+    assert delta("http_request_db_queries_count", **read_route) == 3
+    assert delta("http_request_db_queries_sum", **read_route) >= 1
+    assert delta("db_query_duration_seconds_count", operation="SELECT", table="som_patient") >= 2
+    assert delta("fhir_mapper_duration_seconds_count", resource_type="Patient", operation="search") == 1
+    assert delta("fhir_mapper_duration_seconds_count", resource_type="Patient", operation="to_fhir") == 1
+    assert delta("read_cache_requests_total", resource_type="Patient", result="miss") == 1
+    assert delta("read_cache_requests_total", resource_type="Patient", result="local") == 1
+    assert delta("celery_task_duration_seconds_count", task="jobs.bulk_import_observations", state="SUCCESS") == 1
+    assert _value(after, "db_pool_connections", pool="api-primary", state="idle") >= 1
+
+    # Histograms are cumulative and end in +Inf == _count.
+    assert (
+        _value(after, "http_request_duration_seconds_bucket", **read_route, resource_type="Patient", le="+Inf")
+        == _value(after, "http_request_duration_seconds_count", **read_route, resource_type="Patient")
+    )
+
+
+def test_metrics_merge_other_processes(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "metrics_multiprocess_dir", str(tmp_path))
+    client = TestClient(app)
+    mine = _samples(client.get("/metrics").text)
+    labels = {"resource_type": "Patient", "result": "local"}
+
+    other = {
+        "read_cache_requests_total": {
+            "kind": "counter",
+            "help": "FHIR read cache lookups by outcome (local, redis, miss).",
+            "labels": ["resource_type", "result"],
+            "buckets": [],
+            "samples": [[["Patient", "local"], 5]],
+        },
+        "db_pool_connections": {
+            "kind": "gauge",
+            "help": "Pooled connections by state.",
+            "labels": ["pool", "state"],
+            "buckets": [],
+            "samples": [[["worker", "idle"], 2]],
+        },
+    }
+    path = tmp_path / "otherhost-1.json"
+    path.write_text(json.dumps(other))
+    merged = _samples(client.get("/metrics").text)
+    assert _value(merged, "read_cache_requests_total", **labels) == _value(mine, "read_cache_requests_total", **labels) + 5
+    assert _value(merged, "db_pool_connections", pool="worker") == 2
+
+    # A process that stopped flushing keeps its counters but not its gauges.
+    os.utime(path, (0, 0))
+    merged = _samples(client.get("/metrics").text)
+    assert _value(merged, "read_cache_requests_total", **labels) == _value(mine, "read_cache_requests_total", **labels) + 5
+    assert _value(merged, "db_pool_connections", pool="worker") == 0
+
+    registry.flush()
+    assert len(list(tmp_path.glob("*.json"))) == 2
@@ -135,3 +135,50 @@ def test_observation_history_lite():
     assert hist.json()["type"] == "history"
     assert hist.json()["total"] >= 2
 
+
+
+def test_value_quantity_search_across_units():
+    client = TestClient(app)
+    pid = client.post(
+        "/fhir/Patient",
+        json={"resourceType": "Patient", "name": [{"family": "Units", "given": ["Q"]}]},
+        headers={"X-Correlation-Id": "t-units-p"},
+    ).json()["id"]
+
+    def post(code: str, value: float, quantity: dict, cid: str) -> str:
+        return client.post(
+            "/fhir/Observation",
+            json={
+                "resourceType": "Observation",
+                "status": "final",
+                "code": {"coding": [{"system": "http://loinc.org", "code": code}]},
+                "subject": {"reference": f"Patient/{pid}"},
+                "effectiveDateTime": "2026-05-01T08:00:00Z",
+                "valueQuantity": {"value": value, **quantity},
+            },
+            headers={"X-Correlation-Id": cid},
+        ).json()["id"]
+
+    glucose_mg = post("2345-7", 140, {"unit": "mg/dL"}, "t-units-1")  # 7.77 mmol/L
+    glucose_mmol = post("2345-7", 6.1, {"unit": "mmol/L", "system": "http://unitsofmeasure.org", "code": "mmol/L"}, "t-units-2")
+    heart_rate = post("8867-4", 88, {"unit": "bpm"}, "t-units-3")
+
+    def search(q: str) -> set[str]:
+        r = client.get(f"/fhir/Observation?patient={pid}&value-quantity={q}")
+        assert r.status_code == 200, r.text
+        return {e["resource"]["id"] for e in r.json()["entry"]}
+
+    ucum = "http://unitsofmeasure.org"
+    assert search(f"gt7|{ucum}|mmol/L") == {glucose_mg}
+    assert search(f"lt7|{ucum}|mmol/L") == {glucose_mmol}
+    assert search(f"ge126|{ucum}|mg/dL") == {glucose_mg}
+    assert search("gt80||/min") == {heart_rate}
+    assert search("gt80||{beats}/min") == {heart_rate}
+    # Without a unit, the number is compared with the value as recorded, not the canonical one.
+    assert search("gt100") == {glucose_mg}
+    assert search("ge126") == {glucose_mg}
+    assert search("lt10") == {glucose_mmol}
+    weight = post("29463-7", 150, {"unit": "[lb_av]"}, "t-units-4")  # 68 kg
+    assert search("gt100") == {glucose_mg, weight}
+    # The stored resource keeps the unit it was written with.
+    assert client.get(f"/fhir/Observation/{glucose_mg}").json()["valueQuantity"] == {"value": 140.0, "unit": "mg/dL"}
@@ -0,0 +1,134 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, select
+
+from app.db import session as db_session
+from app.db.models import SomBinary, SomProvenance
+from app.main import app
+
+
+def _patient(family: str) -> dict:
+    return {
+        "resourceType": "Patient",
+        "identifier": [{"system": "urn:mrn", "value": "OCC-1"}],
+        "name": [{"family": family, "given": ["Opt"]}],
+        "birthDate": "1990-01-02",
+    }
+
+
+def test_if_match_update_is_a_single_compare_and_swap():
+    client = TestClient(app)
+    pid = client.post("/fhir/Patient", json=_patient("Optimistic")).json()["id"]
+
+    statements: list[str] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if "som_patient" in statement:
+            statements.append(" ".join(statement.split()))
+
+    event.listen(db_session.engine, "before_cursor_execute", capture)
+    try:
+        r = client.put(f"/fhir/Patient/{pid}", json=_patient("Swapped"), headers={"If-Match": 'W/"1"'})
+    finally:
+        event.remove(db_session.engine, "before_cursor_execute", capture)
+    assert r.status_code == 200
+    assert r.headers["etag"] == 'W/"2"'
+    assert r.json()["name"][0]["family"] == "Swapped"
+    # No read before the write: one UPDATE ... RETURNING, rendered in the same statement.
+    assert len(statements) == 1
+    assert statements[0].startswith("WITH updated AS (UPDATE som_patient")
+
+    stale = client.put(f"/fhir/Patient/{pid}", json=_patient("Lost"), headers={"If-Match": 'W/"1"'})
+    assert stale.status_code == 412
+    assert client.get(f"/fhir/Patient/{pid}").json()["name"][0]["family"] == "Swapped"
+
+    assert client.put(f"/fhir/Patient/{pid}", json=_patient("X"), headers={"If-Match": "abc"}).status_code == 400
+    missing = "/fhir/Patient/00000000-0000-0000-0000-000000000000"
+    assert client.put(missing, json=_patient("X"), headers={"If-Match": 'W/"1"'}).status_code == 404
+    # Without If-Match, updates still apply (last writer wins) and versions never repeat.
+    assert client.put(f"/fhir/Patient/{pid}", json=_patient("Unconditional")).json()["meta"]["versionId"] == "3"
+
+    def racer(i: int) -> int:
+        return TestClient(app).put(
+            f"/fhir/Patient/{pid}", json=_patient(f"Racer{i}"), headers={"If-Match": 'W/"3"'}
+        ).status_code
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        codes = list(pool.map(racer, range(8)))
+    assert sorted(codes) == [200] + [412] * 7
+    assert client.get(f"/fhir/Patient/{pid}").json()["meta"]["versionId"] == "4"
+
+
+def test_if_match_on_observation_and_patch():
+    client = TestClient(app)
+    pid = client.post(
+        "/fhir/Patient", json={"resourceType": "Patient", "name": [{"family": "Optimistic_Obs"}]}
+    ).json()["id"]
+    body = {
+        "resourceType": "Observation",
+        "status": "final",
+        "code": {"coding": [{"system": "http://loinc.org", "code": "8867-4"}]},
+        "subject": {"reference": f"Patient/{pid}"},
+        "effectiveDateTime": "2026-04-01T10:00:00Z",
+        "valueQuantity": {"value": 61, "unit": "beats/min"},
+    }
+    oid = client.post("/fhir/Observation", json=body).json()["id"]
+
+    body["valueQuantity"]["value"] = 62
+    ok = client.put(f"/fhir/Observation/{oid}", json=body, headers={"If-Match": 'W/"1"'})
+    assert ok.status_code == 200 and ok.headers["etag"] == 'W/"2"'
+    assert client.put(f"/fhir/Observation/{oid}", json=body, headers={"If-Match": 'W/"1"'}).status_code == 412
+
+    patch = [{"op": "replace", "path": "/status", "value": "amended"}]
+    assert client.patch(f"/fhir/Observation/{oid}", json=patch, headers={"If-Match": 'W/"1"'}).status_code == 412
+    r = client.patch(f"/fhir/Observation/{oid}", json=patch, headers={"If-Match": 'W/"2"'})
+    assert r.status_code == 200
+    assert r.json()["status"] == "amended"
+    assert r.headers["etag"] == 'W/"3"'
+
+
+def test_update_provenance_is_written_with_the_swap():
+    client = TestClient(app)
+    missing = "00000000-0000-0000-0000-0000000000aa"
+    org = {"resourceType": "Organization", "name": "Nowhere"}
+    assert client.put(f"/fhir/Organization/{missing}", json=org).status_code == 404
+    binary = {"resourceType": "Binary", "contentType": "text/plain", "data": "aGVsbG8="}
+    assert client.put(f"/fhir/Binary/{missing}", json=binary).status_code == 404
+
+    bid = client.post("/fhir/Binary", json=binary).json()["id"]
+    # The body leaves contentType out, so the stored one is kept.
+    update = {"resourceType": "Binary", "data": "d29ybGQ="}
+    r = client.put(f"/fhir/Binary/{bid}", json=update, headers={"If-Match": 'W/"1"'})
+    assert r.status_code == 200
+    assert r.json()["contentType"] == "text/plain"
+    assert r.json()["meta"]["versionId"] == "2"
+    assert "data" not in r.json()
+
+    with db_session.SessionLocal() as db:
+        targets = db.execute(
+            select(SomProvenance.target_som_id).where(
+                SomProvenance.activity == "update",
+                SomProvenance.target_som_id.in_([uuid.UUID(missing), uuid.UUID(bid)]),
+            )
+        ).scalars().all()
+        row = db.get(SomBinary, uuid.UUID(bid))
+        assert row.data == b"world"
+        assert db.get(SomProvenance, row.updated_provenance_id).target_resource_type == "Binary"
+    # Only the update that matched a row left a Provenance.
+    assert targets == [uuid.UUID(bid)]
+
+
+def test_provenance_is_not_updatable():
+    client = TestClient(app)
+    pid = client.post("/fhir/Patient", json={"resourceType": "Patient", "name": [{"family": "Provenanced"}]}).json()["id"]
+    with db_session.SessionLocal() as db:
+        prov_id = db.execute(
+            select(SomProvenance.id).where(SomProvenance.target_som_id == uuid.UUID(pid))
+        ).scalars().first()
+    body = {"resourceType": "Provenance", "id": str(prov_id)}
+    assert client.put(f"/fhir/Provenance/{prov_id}", json=body).status_code == 400
+    assert client.put(f"/fhir/Provenance/{prov_id}", json=body, headers={"If-Match": 'W/"1"'}).status_code == 400
+    patch = [{"op": "replace", "path": "/activity/text", "value": "forged"}]
+    assert client.patch(f"/fhir/Provenance/{prov_id}", json=patch).status_code == 400
@@ -0,0 +1,114 @@
+import datetime as dt
+import uuid
+
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+
+from app.db.models import SomPreAuthQueueLease, SomPreAuthRequest
+from app.db.session import session_scope
+from app.main import app
+from app.services.preauth.queue import PreAuthQueueService
+
+
+def _queued_preauths(client: TestClient, payer: str, priorities: list[str]) -> list[str]:
+    patient = client.post("/fhir/Patient", json={"resourceType": "Patient", "name": [{"family": "Queued"}]}).json()
+    prac = client.post("/fhir/Practitioner", json={"resourceType": "Practitioner", "name": [{"text": "Dr. Q"}]}).json()
+    cond = client.post(
+        "/fhir/Condition",
+        json={
+            "resourceType": "Condition",
+            "subject": {"reference": f"Patient/{patient['id']}"},
+            "code": {"coding": [{"system": "http://snomed.info/sct", "code": "396275006", "display": "Osteoarthritis"}]},
+        },
+    ).json()
+    sr = client.post(
+        "/fhir/ServiceRequest",
+        json={
+            "resourceType": "ServiceRequest",
+            "status": "active",
+            "intent": "order",
+            "subject": {"reference": f"Patient/{patient['id']}"},
+            "code": {"coding": [{"system": "http://www.ama-assn.org/go/cpt", "code": "73721"}]},
+        },
+    ).json()
+    ids = []
+    for priority in priorities:
+        draft = client.post(
+            "/preauth",
+            json={
+                "patientId": patient["id"],
+                "practitionerId": prac["id"],
+                "diagnosisConditionId": cond["id"],
+                "serviceRequestId": sr["id"],
+                "priority": priority,
+                "payer": payer,
+            },
+        ).json()
+        ids.append(draft["id"])
+    # Waiting on the payer; submitting through the API would have the (eager) worker decide them at once.
+    with session_scope() as db:
+        db.execute(
+            update(SomPreAuthRequest)
+            .where(SomPreAuthRequest.id.in_([uuid.UUID(i) for i in ids]))
+            .values(status="submitted")
+        )
+    return ids
+
+
+def test_claim_heartbeat_release_and_stats():
+    client = TestClient(app)
+    payer = "Queue Payer"
+    routine, stat, urgent, routine2 = _queued_preauths(client, payer, ["routine", "stat", "urgent", "routine"])
+
+    stats = client.get(f"/preauth/queue/stats?payer={payer}").json()
+    assert (stats["depth"], stats["claimed"], stats["available"]) == (4, 0, 4)
+    assert stats["byPriority"] == {"stat": 1, "asap": 0, "urgent": 1, "routine": 2}
+    assert stats["oldestAgeSeconds"] >= 0
+
+    first = client.post("/preauth/queue/claim", json={"reviewer": "ann", "limit": 2, "payer": payer}).json()
+    assert [i["id"] for i in first["items"]] == [stat, urgent]
+    second = client.post("/preauth/queue/claim", json={"reviewer": "bob", "limit": 5, "payer": payer}).json()
+    # Same priority: oldest first.
+    assert [i["id"] for i in second["items"]] == [routine, routine2]
+    empty = client.post("/preauth/queue/claim", json={"reviewer": "cy", "payer": payer}).json()
+    assert empty["items"] == [] and empty["leaseId"] is None
+    assert client.get(f"/preauth/queue/stats?payer={payer}").json()["available"] == 0
+
+    beat = client.post(f"/preauth/queue/leases/{first['leaseId']}/heartbeat", json={"leaseSeconds": 600}).json()
+    assert beat["preAuthIds"] == sorted([stat, urgent])
+    assert beat["expiresTime"] > first["expiresTime"]
+
+    released = client.post(f"/preauth/queue/leases/{first['leaseId']}/release", json={"preAuthIds": [urgent]}).json()
+    assert released["released"] == [urgent]
+    again = client.post("/preauth/queue/claim", json={"reviewer": "cy", "payer": payer}).json()
+    assert [i["id"] for i in again["items"]] == [urgent]
+
+    # An expired lease is claimable again and its old holder can no longer renew it.
+    with session_scope() as db:
+        db.execute(
+            update(SomPreAuthQueueLease)
+            .where(SomPreAuthQueueLease.lease_id == uuid.UUID(second["leaseId"]))
+            .values(expires_time=dt.datetime.now(dt.timezone.utc) - dt.timedelta(seconds=1))
+        )
+    taken = client.post("/preauth/queue/claim", json={"reviewer": "dee", "limit": 5, "payer": payer}).json()
+    assert [i["id"] for i in taken["items"]] == [routine, routine2]
+    assert client.post(f"/preauth/queue/leases/{second['leaseId']}/heartbeat").status_code == 409
+
+    # Decided items leave the queue.
+    with session_scope() as db:
+        db.execute(update(SomPreAuthRequest).where(SomPreAuthRequest.id == uuid.UUID(stat)).values(status="approved"))
+    assert client.get(f"/preauth/queue/stats?payer={payer}").json()["depth"] == 3
+    assert client.post("/preauth/queue/claim", json={"reviewer": "ann", "limit": 0}).status_code == 400
+
+
+def test_concurrent_claims_skip_locked_rows():
+    client = TestClient(app)
+    payer = "Concurrent Payer"
+    ids = _queued_preauths(client, payer, ["routine", "routine", "routine"])
+    with session_scope() as a, session_scope() as b:
+        # a's claim is still uncommitted (its rows locked) when b claims: b skips them instead of waiting.
+        got_a = PreAuthQueueService(a).claim(reviewer="a", limit=2, payer=payer)["items"]
+        got_b = PreAuthQueueService(b).claim(reviewer="b", limit=2, payer=payer)["items"]
+    claimed = [i["id"] for i in got_a + got_b]
+    assert len(claimed) == len(set(claimed)) == 3
+    assert set(claimed) == set(ids)
@@ -0,0 +1,57 @@
+import pstats
+
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+
+
+def test_profile_request_and_job(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "profiling_enabled", True)
+    monkeypatch.setattr(settings, "profile_dir", str(tmp_path))
+    client = TestClient(app)
+    pid = client.post("/fhir/Patient", json={"resourceType": "Patient", "name": [{"family": "Profiled"}]}).json()["id"]
+
+    assert "x-profile-id" not in client.get(f"/fhir/Patient/{pid}").headers
+
+    r = client.get(f"/internal/mapping-trace?resourceType=Patient&resourceId={pid}", headers={"X-Profile": "1"})
+    assert r.status_code == 200
+    profile_id = r.headers["x-profile-id"]
+
+    report = client.get(f"/internal/profiles/{profile_id}").json()
+    assert report["kind"] == "http"
+    assert report["route"] == "/internal/mapping-trace"
+    assert report["status"] == 200
+    assert report["wallMs"] > 0
+    assert any("mapping_trace" in f["function"] for f in report["functions"]["byCumulative"])
+    assert report["sql"]["count"] >= 1
+    assert any("som_audit_event" in s["statement"] for s in report["sql"]["statements"])
+
+    raw = client.get(f"/internal/profiles/{profile_id}?format=pstats")
+    assert raw.status_code == 200
+    (tmp_path / "copy.prof").write_bytes(raw.content)
+    assert pstats.Stats(str(tmp_path / "copy.prof")).total_calls > 0
+
+    job = client.post(
+        "/jobs",
+        json={"type": "bulk_import_observations", "parameters": {"patientId": pid, "count": 3, "profile": True}},
+    ).json()
+    profile_id = client.get(f"/jobs/{job['jobId']}").json()["profileId"]
+    report = client.get(f"/internal/profiles/{profile_id}").json()
+    assert report["kind"] == "celery"
+    assert report["name"] == "jobs.bulk_import_observations"
+    assert report["state"] == "SUCCESS"
+    assert any("bulk_import_observations" in f["function"] for f in report["functions"]["byCumulative"])
+    assert any(s["statement"].startswith("INSERT INTO som_observation") for s in report["sql"]["statements"])
+
+    listed = client.get("/internal/profiles").json()["profiles"]
+    assert [p["id"] for p in listed][:2] == [profile_id, r.headers["x-profile-id"]]
+    assert client.get("/internal/profiles/not-a-profile").status_code == 404
+    assert client.get("/internal/profiles/..%2F..%2Fetc%2Fpasswd").status_code == 404
+
+
+def test_profiling_is_opt_in():
+    client = TestClient(app)
+    assert not settings.profiling_enabled
+    r = client.get("/health", headers={"X-Profile": "1"})
+    assert "x-profile-id" not in r.headers
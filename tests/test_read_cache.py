@@ -0,0 +1,90 @@
+from fastapi.testclient import TestClient
+
+from app.db import session as db_session
+from app.db.models import SomPatient
+from app.main import app
+from app.services.mapping import read_cache
+
+
+def test_read_etag_304_and_write_invalidation():
+    client = TestClient(app)
+    p = client.post(
+        "/fhir/Patient",
+        json={"resourceType": "Patient", "name": [{"family": "Cache", "given": ["A"]}], "birthDate": "1970-01-01"},
+        headers={"X-Correlation-Id": "t-cache-p"},
+    ).json()
+    pid = p["id"]
+
+    r = client.get(f"/fhir/Patient/{pid}")
+    assert r.status_code == 200
+    assert r.headers["etag"] == 'W/"1"'
+    assert r.headers["last-modified"].endswith("GMT")
+    assert read_cache.local.get(("Patient", pid, 1)) is not None
+    assert client.get(f"/fhir/Patient/{pid}", headers={"If-None-Match": 'W/"1"'}).status_code == 304
+
+    # A mapper update bumps the version; the old ETag no longer matches.
+    client.put(
+        f"/fhir/Patient/{pid}",
+        json={"resourceType": "Patient", "name": [{"family": "Cache", "given": ["B"]}], "birthDate": "1970-01-01"},
+        headers={"X-Correlation-Id": "t-cache-u"},
+    )
+    r = client.get(f"/fhir/Patient/{pid}", headers={"If-None-Match": 'W/"1"'})
+    assert r.status_code == 200
+    assert r.headers["etag"] == 'W/"2"'
+    assert r.json()["name"][0]["given"] == ["B"]
+
+    # A write that doesn't bump `version` drops the cached body for that version.
+    with db_session.session_scope() as db:
+        db.get(SomPatient, read_cache.to_uuid(pid)).name_family = "Direct"
+    assert read_cache.local.get(("Patient", pid, 2)) is None
+    assert client.get(f"/fhir/Patient/{pid}").json()["name"][0]["family"] == "Direct"
+
+    # Non-canonical spellings of the id share the cache entries, so they see the update too.
+    assert client.get(f"/fhir/Patient/{pid.upper()}").headers["etag"] == 'W/"2"'
+    client.put(
+        f"/fhir/Patient/{pid}",
+        json={"resourceType": "Patient", "name": [{"family": "Cache", "given": ["C"]}], "birthDate": "1970-01-01"},
+        headers={"X-Correlation-Id": "t-cache-u2"},
+    )
+    r = client.get(f"/fhir/Patient/{pid.upper()}")
+    assert r.status_code == 200
+    assert r.headers["etag"] == 'W/"3"'
+    assert r.json()["name"][0]["given"] == ["C"]
+    assert read_cache.local.get(("Patient", pid, 3)) is not None
+
+    assert client.get("/fhir/Patient/not-a-uuid").status_code == 400
+    assert client.get("/fhir/Patient/00000000-0000-0000-0000-000000000000").status_code == 404
+
+
+def test_concept_display_change_refreshes_cached_bodies():
+    client = TestClient(app)
+    pid = client.post(
+        "/fhir/Patient",
+        json={"resourceType": "Patient", "name": [{"family": "Cache", "given": ["Concept"]}]},
+        headers={"X-Correlation-Id": "t-cache-cp"},
+    ).json()["id"]
+
+    def observation(coding: dict, cid: str) -> str:
+        return client.post(
+            "/fhir/Observation",
+            json={
+                "resourceType": "Observation",
+                "status": "final",
+                "code": {"coding": [coding]},
+                "subject": {"reference": f"Patient/{pid}"},
+                "effectiveDateTime": "2026-01-01T10:00:00Z",
+                "valueQuantity": {"value": 1, "unit": "1"},
+            },
+            headers={"X-Correlation-Id": cid},
+        ).json()["id"]
+
+    coding = {"system": "http://example.org/cache-codes", "code": "c-1"}
+    oid = observation(coding, "t-cache-o1")
+    assert client.get(f"/fhir/Observation/{oid}").json()["code"]["coding"][0]["display"] is None
+    assert read_cache.local.get(("Observation", oid, 1)) is not None
+
+    # Another write fills in the concept's display; the first Observation's row (and version) is untouched.
+    observation({**coding, "display": "Cache code one"}, "t-cache-o2")
+    r = client.get(f"/fhir/Observation/{oid}")
+    assert r.headers["etag"] == 'W/"1"'
+    assert r.json()["code"]["coding"][0]["display"] == "Cache code one"
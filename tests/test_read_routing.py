@@ -0,0 +1,89 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from app.core.config import settings
+from app.db import pool_metrics
+from app.db import session as db_session
+from app.main import app
+
+
+def test_read_sessions_are_read_only():
+    db = db_session.read_session_factory(None)()
+    try:
+        assert db.execute(text("SHOW transaction_read_only")).scalar() == "on"
+        with pytest.raises(DBAPIError):
+            db.execute(text("CREATE TEMP TABLE t_read_only_probe (id int)"))
+    finally:
+        db.close()
+
+    # Connections go back to the pool with the read-only characteristic reset.
+    with db_session.SessionLocal() as rw:
+        assert rw.execute(text("SHOW transaction_read_only")).scalar() == "off"
+
+
+def test_read_your_writes_pins_correlation_id_to_primary(monkeypatch):
+    client = TestClient(app)
+    r = client.post(
+        "/fhir/Patient",
+        json={"resourceType": "Patient", "name": [{"family": "Ryw", "given": ["A"]}]},
+        headers={"X-Correlation-Id": "t-ryw-1"},
+    )
+    assert r.status_code == 200
+    assert db_session.recent_writes.contains("t-ryw-1")
+    assert not db_session.recent_writes.contains("t-ryw-other")
+
+    # Pretend a separate, lagging replica is configured: the writer's correlation id still reads the primary,
+    # other readers fall back to the primary only while lag exceeds the tolerance.
+    monkeypatch.setattr(db_session, "replica_engine", object())
+    monkeypatch.setattr(db_session.replica_lag, "current", lambda: 0.0)
+    assert db_session.read_session_factory("t-ryw-1") is db_session.PrimaryReadSessionLocal
+    assert db_session.read_session_factory("t-ryw-other") is db_session.ReplicaReadSessionLocal
+    monkeypatch.setattr(db_session.replica_lag, "current", lambda: 3600.0)
+    assert db_session.read_session_factory("t-ryw-other") is db_session.PrimaryReadSessionLocal
+
+    got = client.get(f"/fhir/Patient/{r.json()['id']}", headers={"X-Correlation-Id": "t-ryw-1"})
+    assert got.status_code == 200
+
+
+def test_pool_metrics_endpoint():
+    client = TestClient(app)
+    client.get("/jobs")
+    pools = client.get("/internal/db/pool").json()["pools"]
+    api = pools["api-primary"]
+    assert api["checkouts"] >= 1
+    assert api["size"] >= 1
+    assert {"inUse", "overflow", "waitSecondsTotal", "waitBuckets"} <= set(api)
+
+
+def test_worker_pool_rebinds_every_session_factory(monkeypatch):
+    api_engine = db_session.engine
+    # Restored after the test, along with the factories' binds below.
+    monkeypatch.setattr(db_session, "engine", api_engine)
+    monkeypatch.setattr(db_session, "replica_engine", db_session.replica_engine)
+    try:
+        db_session.use_worker_pool()
+        worker = db_session.engine
+        assert worker is not api_engine
+        assert worker.pool.size() == settings.worker_db_pool_size
+        # The worker pool reports under its own name; the replaced API pool is no longer reported.
+        assert "worker-primary" in pool_metrics.pool_stats()
+        assert "api-primary" not in pool_metrics.pool_stats()
+        # No separate replica: reads still route to the primary, now through the worker pool.
+        assert db_session.replica_engine is worker
+        factory = db_session.read_session_factory(None)
+        assert factory is db_session.PrimaryReadSessionLocal
+        with factory() as db:
+            assert db.get_bind().pool is worker.pool
+            assert db.execute(text("SHOW transaction_read_only")).scalar() == "on"
+        with db_session.SessionLocal() as db:
+            assert db.get_bind() is worker
+    finally:
+        db_session.engine.dispose()
+        pool_metrics.unregister(db_session.engine.pool)
+        # Recreating the API engine's pool registers it again.
+        api_engine.dispose()
+        db_session.SessionLocal.configure(bind=api_engine)
+        db_session.PrimaryReadSessionLocal.configure(bind=api_engine.execution_options(postgresql_readonly=True))
+        db_session.ReplicaReadSessionLocal.configure(bind=api_engine.execution_options(postgresql_readonly=True))
@@ -0,0 +1,35 @@
+import json
+from decimal import Decimal
+
+from fastapi.testclient import TestClient
+
+from app.api.responses import FastJSONResponse, dumps
+from app.main import app
+from app.services.mapping.fhir_utils import bundle
+
+
+def test_fast_json_matches_default_encoding_and_splices_entries():
+    assert json.loads(FastJSONResponse({"a": Decimal("5"), "b": Decimal("5.5"), "c": {1, 2}}).body) in (
+        {"a": 5, "b": 5.5, "c": [1, 2]},
+        {"a": 5, "b": 5.5, "c": [2, 1]},
+    )
+    entries = [{"resourceType": "Patient", "id": str(i)} for i in range(3)]
+    spliced = bundle(entries=[dumps(e) for e in entries], total=3)
+    assert FastJSONResponse(spliced).body == FastJSONResponse(bundle(entries=entries, total=3)).body
+
+
+def test_large_search_responses_are_gzipped():
+    client = TestClient(app)
+    for i in range(12):
+        client.post(
+            "/fhir/Patient",
+            json={"resourceType": "Patient", "name": [{"family": "Gzip", "given": [f"G{i}"]}]},
+            headers={"X-Correlation-Id": f"t-gzip-{i}"},
+        )
+    r = client.get("/fhir/Patient", params={"name": "Gzip", "_count": 50}, headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.json()["total"] >= 12
+
+    small = client.get("/health", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
@@ -0,0 +1,91 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.db import session as db_session
+from app.main import app
+
+
+def _ids(bundle: dict) -> set[str]:
+    return {e["resource"]["id"] for e in bundle["entry"]}
+
+
+def test_search_parameter_prefixes_modifiers_and_errors():
+    client = TestClient(app)
+    pid = client.post(
+        "/fhir/Patient",
+        json={
+            "resourceType": "Patient",
+            "identifier": [{"system": "urn:mrn", "value": "SP-100"}],
+            "name": [{"family": "Params_Test", "given": ["Sam"]}],
+            "birthDate": "1971-06-15",
+        },
+        headers={"X-Correlation-Id": "t-sp-p"},
+    ).json()["id"]
+
+    obs = {}
+    for code, value, when in (("8867-4", 58, "2026-03-01T08:00:00Z"), ("8867-4", 72, "2026-03-02T08:00:00Z"), ("2708-6", 97, "2026-04-01T08:00:00Z")):
+        obs[(code, value)] = client.post(
+            "/fhir/Observation",
+            json={
+                "resourceType": "Observation",
+                "status": "final",
+                "subject": {"reference": f"Patient/{pid}"},
+                "code": {"coding": [{"system": "http://loinc.org", "code": code}]},
+                "effectiveDateTime": when,
+                "valueQuantity": {"value": value, "unit": "beats/min"},
+            },
+            headers={"X-Correlation-Id": f"t-sp-o{value}"},
+        ).json()["id"]
+    hr_low, hr_high, spo2 = obs[("8867-4", 58)], obs[("8867-4", 72)], obs[("2708-6", 97)]
+
+    def search(query: str) -> set[str]:
+        r = client.get(f"/fhir/Observation?patient=Patient/{pid}&{query}")
+        assert r.status_code == 200, r.text
+        return _ids(r.json())
+
+    # Dates: the value's precision is the range it stands for.
+    assert search("date=2026-03") == {hr_low, hr_high}
+    assert search("date=2026-03-02") == {hr_high}
+    assert search("date=ne2026-03") == {spo2}
+    assert search("date=gt2026-03-01") == {hr_high, spo2}
+    assert search("date=ge2026-03-01&date=lt2026-04") == {hr_low, hr_high}
+    # Tokens: comma means OR; system|code, |code and system| forms.
+    assert search("code=8867-4,2708-6") == {hr_low, hr_high, spo2}
+    assert search("code=http://loinc.org|2708-6") == {spo2}
+    assert search("code=http://loinc.org|") == {hr_low, hr_high, spo2}
+    # Quantities, with and without a unit.
+    assert search("value-quantity=gt60") == {hr_high, spo2}
+    assert search("value-quantity=le72||beats/min") == {hr_low, hr_high}
+    assert search("value-quantity=58||mg") == set()
+    assert search("encounter:missing=true") == {hr_low, hr_high, spo2}
+
+    def patients(query: str) -> set[str]:
+        return _ids(client.get(f"/fhir/Patient?{query}").json())
+
+    assert pid in patients("name=params_")
+    assert pid not in patients("name=arams")
+    assert pid in patients("name:contains=arams_t")
+    assert pid in patients("name:exact=Params_Test")
+    # `%` is a literal, not a LIKE wildcard.
+    assert pid not in patients("name=Params%25")
+    assert pid in patients("identifier=urn:mrn|SP-100,urn:mrn|nope")
+    assert pid in patients("birthdate=1971-06")
+    assert pid in patients(f"_id={pid}")
+
+    # OR lists bind one array parameter, so the statement text doesn't depend on how many values there are.
+    statements: list[str] = []
+    listener = lambda conn, cursor, statement, *a: statements.append(statement)  # noqa: E731
+    event.listen(db_session.engine, "before_cursor_execute", listener)
+    try:
+        client.get("/fhir/Patient?identifier=A,B")
+        client.get("/fhir/Patient?identifier=A,B,C,D")
+    finally:
+        event.remove(db_session.engine, "before_cursor_execute", listener)
+    assert statements[0] == statements[1]
+
+    r = client.get("/fhir/Observation?patinet=x")
+    assert r.status_code == 400 and "patinet" in r.json()["detail"]
+    assert client.get("/fhir/Observation?code:text=x").status_code == 400
+    assert client.get("/fhir/Observation?date=yesterday").status_code == 400
+    lenient = client.get(f"/fhir/Observation?patient={pid}&patinet=x", headers={"Prefer": "handling=lenient"})
+    assert lenient.status_code == 200 and len(lenient.json()["entry"]) == 3
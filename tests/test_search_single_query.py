@@ -0,0 +1,102 @@
+from contextlib import contextmanager
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.db import session as db_session
+from app.main import app
+from app.services.mapping.resources.condition import ConditionMapper
+from app.services.mapping.resources.document_reference import DocumentReferenceMapper
+from app.services.mapping.resources.observation import ObservationMapper
+from app.services.mapping.resources.service_request import ServiceRequestMapper
+
+
+@contextmanager
+def count_statements():
+    statements: list[str] = []
+
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db_session.engine, "before_cursor_execute", _count)
+    try:
+        yield statements
+    finally:
+        event.remove(db_session.engine, "before_cursor_execute", _count)
+
+
+def test_searches_issue_one_query_regardless_of_page_size():
+    client = TestClient(app)
+    pid = client.post(
+        "/fhir/Patient",
+        json={"resourceType": "Patient", "name": [{"family": "Columnar", "given": ["Q"]}]},
+        headers={"X-Correlation-Id": "t-col-p"},
+    ).json()["id"]
+    subject = {"reference": f"Patient/{pid}"}
+    cond_ids = []
+    for i in range(3):
+        cond_ids.append(
+            client.post(
+                "/fhir/Condition",
+                json={
+                    "resourceType": "Condition",
+                    "subject": subject,
+                    "code": {"coding": [{"system": "http://snomed.info/sct", "code": "396275006", "display": "Osteoarthritis"}]},
+                },
+                headers={"X-Correlation-Id": f"t-col-c{i}"},
+            ).json()["id"]
+        )
+        client.post(
+            "/fhir/Observation",
+            json={
+                "resourceType": "Observation",
+                "status": "final",
+                "subject": subject,
+                "code": {"coding": [{"system": "http://loinc.org", "code": "8867-4", "display": "Heart rate"}]},
+                "effectiveDateTime": f"2026-01-0{i + 1}T10:00:00Z",
+                "valueQuantity": {"value": 70 + i, "unit": "beats/min"},
+            },
+            headers={"X-Correlation-Id": f"t-col-o{i}"},
+        )
+        client.post(
+            "/fhir/DocumentReference",
+            json={
+                "resourceType": "DocumentReference",
+                "status": "current",
+                "subject": subject,
+                "type": {"coding": [{"system": "http://loinc.org", "code": "11506-3", "display": "Progress note"}]},
+                "date": f"2026-01-0{i + 1}T10:00:00Z",
+            },
+            headers={"X-Correlation-Id": f"t-col-d{i}"},
+        )
+    client.post(
+        "/fhir/ServiceRequest",
+        json={
+            "resourceType": "ServiceRequest",
+            "status": "active",
+            "intent": "order",
+            "subject": subject,
+            "code": {"coding": [{"system": "http://www.ama-assn.org/go/cpt", "code": "73721", "display": "MRI knee wo contrast"}]},
+            "reasonReference": [{"reference": f"Condition/{cid}"} for cid in reversed(cond_ids)],
+        },
+        headers={"X-Correlation-Id": "t-col-sr"},
+    )
+
+    params = {"patient": pid}
+    with db_session.SessionLocal() as db:
+        db.connection()  # checkout/BEGIN happen outside the measured block
+        for mapper, expected in (
+            (ObservationMapper(db), 3),
+            (ConditionMapper(db), 3),
+            (DocumentReferenceMapper(db), 3),
+            (ServiceRequestMapper(db), 1),
+        ):
+            with count_statements() as statements:
+                b = mapper.search(params=params, count=50, sort=None)
+            assert b["total"] == expected, mapper.resource_type
+            assert len(statements) == 1, (mapper.resource_type, statements)
+
+        sr = ServiceRequestMapper(db).search(params=params, count=50, sort=None)["entry"][0]["resource"]
+        assert [r["reference"] for r in sr["reasonReference"]] == [f"Condition/{cid}" for cid in reversed(cond_ids)]
+        obs = ObservationMapper(db).search(params=params, count=50, sort=None)["entry"][0]["resource"]
+        assert obs["code"]["coding"][0] == {"system": "http://loinc.org", "code": "8867-4", "display": "Heart rate"}
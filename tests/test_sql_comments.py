@@ -0,0 +1,71 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.core.config import settings
+from app.db import session as db_session
+from app.db.sqlcomment import comment, parse_comment
+from app.main import app
+
+
+def _capture(client: TestClient, method: str, url: str, **kw) -> tuple[object, list[str]]:
+    statements: list[str] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db_session.engine, "before_cursor_execute", capture)
+    try:
+        r = client.request(method, url, **kw)
+    finally:
+        event.remove(db_session.engine, "before_cursor_execute", capture)
+    return r, statements
+
+
+def test_statements_carry_route_action_and_task_tags(monkeypatch):
+    client = TestClient(app)
+    r, statements = _capture(
+        client, "POST", "/fhir/Patient", json={"resourceType": "Patient", "name": [{"family": "Commented"}]}
+    )
+    pid = r.json()["id"]
+    inserts = [parse_comment(s) for s in statements if s.startswith("INSERT INTO som_patient")]
+    assert inserts == [{"route": "/fhir/{resource_type}", "action": "Patient.create"}]
+    # Tags are low-cardinality: no ids, no correlation id unless asked for.
+    assert all(pid not in s for s in statements)
+
+    monkeypatch.setattr(settings, "sql_comment_correlation_id", True)
+    _, statements = _capture(
+        client,
+        "POST",
+        "/jobs",
+        json={"type": "bulk_import_observations", "parameters": {"patientId": pid, "count": 1}},
+        headers={"X-Correlation-Id": "t-sqlc-1 */ DROP"},
+    )
+    job_insert = next(parse_comment(s) for s in statements if s.startswith("INSERT INTO som_job"))
+    # Values are reduced to a safe character set, so a comment can't be closed early.
+    assert job_insert == {
+        "route": "/jobs",
+        "action": "JobService.create_and_enqueue",
+        "correlation_id": "t-sqlc-1__/_DROP",
+    }
+    # The (eager) task's statements name the task; the correlation id travels with it.
+    obs = next(parse_comment(s) for s in statements if s.startswith("INSERT INTO som_observation"))
+    assert obs["task"] == "jobs.bulk_import_observations"
+    assert obs["correlation_id"] == "t-sqlc-1__/_DROP"
+
+    assert comment({"b": "x'y", "a": "/p"}) == "/*a='/p',b='x_y'*/"
+
+
+def test_top_queries_groups_pg_stat_statements():
+    client = TestClient(app)
+    assert client.get("/internal/db/top-queries?groupBy=nope").status_code == 400
+    r = client.get("/internal/db/top-queries?groupBy=route&orderBy=calls&limit=5")
+    if r.status_code == 503:
+        # Postgres without pg_stat_statements (it is preloaded in docker-compose).
+        assert "pg_stat_statements" in r.json()["detail"]
+        return
+    assert r.status_code == 200
+    assert "first" in r.json()["attribution"]
+    groups = r.json()["groups"]
+    assert len(groups) <= 5
+    assert [g["calls"] for g in groups] == sorted((g["calls"] for g in groups), reverse=True)
+    assert all(set(g["tags"]) == {"route"} for g in groups)
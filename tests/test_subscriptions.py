@@ -0,0 +1,186 @@
+import json
+import socket
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from app.db import session as db_session
+from app.db.models import SomChangeEvent, SomSubscription
+from app.main import app
+from app.services.subscriptions.dispatcher import RestHookDispatcher
+from app.services.subscriptions.feed import head_cursor, read_events
+from app.services.subscriptions.websocket import websocket_hub
+
+
+class _Receiver(BaseHTTPRequestHandler):
+    received: list = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.received.append({"headers": dict(self.headers), "body": json.loads(body) if body else None})
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def _patient(client: TestClient, family: str) -> str:
+    body = {"resourceType": "Patient", "name": [{"family": family, "given": ["Sub"]}]}
+    return client.post("/fhir/Patient", json=body, headers={"X-Correlation-Id": f"t-sub-{family}"}).json()["id"]
+
+
+def _observation(client: TestClient, pid: str, code: str, cid: str) -> str:
+    body = {
+        "resourceType": "Observation",
+        "status": "final",
+        "code": {"coding": [{"system": "http://loinc.org", "code": code}]},
+        "subject": {"reference": f"Patient/{pid}"},
+        "effectiveDateTime": "2026-03-01T10:00:00Z",
+        "valueQuantity": {"value": 70, "unit": "beats/min"},
+    }
+    return client.post("/fhir/Observation", json=body, headers={"X-Correlation-Id": cid}).json()["id"]
+
+
+def test_rest_hook_delivers_matching_changes_as_a_batch():
+    client = TestClient(app)
+    server = HTTPServer(("127.0.0.1", 0), _Receiver)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    _Receiver.received = []
+    try:
+        pid = _patient(client, "Subscribed_One")
+        r = client.post(
+            "/fhir/Subscription",
+            json={
+                "resourceType": "Subscription",
+                "status": "requested",
+                "reason": "heart rate feed",
+                "criteria": f"Observation?code=8867-4&patient=Patient/{pid}",
+                "channel": {
+                    "type": "rest-hook",
+                    "endpoint": f"http://127.0.0.1:{server.server_port}/hook",
+                    "payload": "application/fhir+json",
+                    "header": ["Authorization: Bearer secret"],
+                },
+            },
+            headers={"X-Correlation-Id": "t-sub-create"},
+        )
+        assert r.status_code == 200
+        sub = r.json()
+        assert sub["status"] == "active"
+
+        o1 = _observation(client, pid, "8867-4", "t-sub-o1")
+        _observation(client, pid, "9279-1", "t-sub-o2")
+        o3 = _observation(client, pid, "8867-4", "t-sub-o3")
+
+        with db_session.SessionLocal() as db:
+            events = db.execute(select(SomChangeEvent).where(SomChangeEvent.resource_id == o1)).scalars().all()
+        assert [(e.resource_type, e.operation, e.version, e.correlation_id) for e in events] == [
+            ("Observation", "create", 1, "t-sub-o1")
+        ]
+
+        assert RestHookDispatcher().dispatch_once() == {"delivered": 2, "failed": 0}
+        assert len(_Receiver.received) == 1
+        delivery = _Receiver.received[0]
+        assert delivery["headers"]["Authorization"] == "Bearer secret"
+        assert delivery["body"]["type"] == "history"
+        assert [e["resource"]["id"] for e in delivery["body"]["entry"]] == [o1, o3]
+
+        # The cursor moved past everything it saw: nothing is sent twice.
+        assert RestHookDispatcher().dispatch_once() == {"delivered": 0, "failed": 0}
+        assert len(_Receiver.received) == 1
+
+        assert client.get("/fhir/Subscription?type=rest-hook&status=active").json()["total"] >= 1
+    finally:
+        server.shutdown()
+
+
+def test_rest_hook_failures_back_off_and_bad_subscriptions_are_rejected():
+    client = TestClient(app)
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        closed_port = s.getsockname()[1]
+    pid = _patient(client, "Subscribed_Two")
+    sid = client.post(
+        "/fhir/Subscription",
+        json={
+            "resourceType": "Subscription",
+            "criteria": f"Observation?patient=Patient/{pid}",
+            "channel": {"type": "rest-hook", "endpoint": f"http://127.0.0.1:{closed_port}/hook"},
+        },
+    ).json()["id"]
+    _observation(client, pid, "8867-4", "t-sub-fail-o1")
+
+    stats = RestHookDispatcher().dispatch_once()
+    assert stats["failed"] >= 1
+    with db_session.SessionLocal() as db:
+        sub = db.get(SomSubscription, sid)
+        assert sub.failure_count == 1 and sub.next_attempt_time is not None
+        assert sub.status == "active" and sub.error
+        assert sub.version == 1
+
+    bad = {"resourceType": "Subscription", "channel": {"type": "rest-hook", "endpoint": "http://x/hook"}}
+    assert client.post("/fhir/Subscription", json={**bad, "criteria": "Observation?nope=1"}).status_code == 400
+    assert client.post("/fhir/Subscription", json={**bad, "criteria": "Unknown?x=1"}).status_code == 400
+    assert (
+        client.post(
+            "/fhir/Subscription", json={**bad, "criteria": "Observation?code=1", "channel": {"type": "email"}}
+        ).status_code
+        == 400
+    )
+
+
+def test_change_feed_waits_for_transactions_still_in_flight():
+    client = TestClient(app)
+    with db_session.SessionLocal() as db:
+        head = head_cursor(db)
+
+    # A takes its event id first but commits after B.
+    slow = db_session.SessionLocal()
+    try:
+        slow.add(SomChangeEvent(resource_type="Patient", resource_id=uuid.uuid4(), version=1, operation="create"))
+        slow.flush()
+        pid = _patient(client, "Feed_Race")
+        with db_session.SessionLocal() as db:
+            assert read_events(db, after=head, limit=100) == []
+        slow.commit()
+    finally:
+        slow.close()
+
+    with db_session.SessionLocal() as db:
+        events = read_events(db, after=head, limit=100)
+    assert [e.resource_type for e in events] == ["Patient", "Patient"]
+    assert events[0].id < events[1].id and str(events[1].resource_id) == pid
+    assert events[0].xact_id < events[1].xact_id
+
+
+def test_websocket_binding_pings_on_matching_change():
+    client = TestClient(app)
+    pid = _patient(client, "Subscribed_Ws")
+    sid = client.post(
+        "/fhir/Subscription",
+        json={
+            "resourceType": "Subscription",
+            "criteria": f"Observation?patient=Patient/{pid}",
+            "channel": {"type": "websocket"},
+        },
+    ).json()["id"]
+
+    with client.websocket_connect("/fhir/$subscription-ws") as ws:
+        ws.send_text("bind 00000000-0000-0000-0000-000000000000")
+        assert ws.receive_text().startswith("error ")
+        ws.send_text(f"bind {sid}")
+        assert ws.receive_text() == f"bound {sid}"
+
+        _observation(client, pid, "8867-4", "t-sub-ws-o1")
+        with db_session.SessionLocal() as db:
+            assert websocket_hub.poll(db) == 1
+        assert ws.receive_text() == f"ping {sid}"
+
+        # Changes that don't match the criteria don't ping.
+        _patient(client, "Subscribed_Ws_Other")
+        with db_session.SessionLocal() as db:
+            assert websocket_hub.poll(db) == 0
@@ -0,0 +1,62 @@
+import base64
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.db import session as db_session
+from app.main import app
+
+
+def test_summary_and_elements_projections():
+    client = TestClient(app)
+    pid = client.post(
+        "/fhir/Patient",
+        json={"resourceType": "Patient", "name": [{"family": "Summary", "given": ["S"]}], "birthDate": "1960-02-02"},
+        headers={"X-Correlation-Id": "t-sum-p"},
+    ).json()["id"]
+    for i in range(3):
+        client.post(
+            "/fhir/Observation",
+            json={
+                "resourceType": "Observation",
+                "status": "final",
+                "subject": {"reference": f"Patient/{pid}"},
+                "code": {"coding": [{"system": "http://loinc.org", "code": "8867-4", "display": "Heart rate"}]},
+                "effectiveDateTime": f"2026-02-0{i + 1}T10:00:00Z",
+                "valueQuantity": {"value": 60 + i, "unit": "beats/min"},
+            },
+            headers={"X-Correlation-Id": f"t-sum-o{i}"},
+        )
+
+    statements: list[str] = []
+    listener = lambda conn, cursor, statement, *a: statements.append(statement)  # noqa: E731
+    event.listen(db_session.engine, "before_cursor_execute", listener)
+    try:
+        counted = client.get(f"/fhir/Observation?patient={pid}&_summary=count").json()
+        subset = client.get(f"/fhir/Observation?patient={pid}&_elements=code,valueQuantity").json()
+    finally:
+        event.remove(db_session.engine, "before_cursor_execute", listener)
+
+    assert counted["total"] == 3 and counted["entry"] == []
+    assert statements[0].lstrip().lower().startswith("select count(*)")
+    # Unrequested columns are not read.
+    assert "som_observation.effective_time" not in statements[1].split("FROM")[0]
+
+    res = subset["entry"][0]["resource"]
+    assert set(res) == {"resourceType", "id", "meta", "code", "valueQuantity"}
+    assert res["meta"]["tag"][0]["code"] == "SUBSETTED"
+
+    read = client.get(f"/fhir/Patient/{pid}?_elements=birthDate").json()
+    assert set(read) == {"resourceType", "id", "meta", "birthDate"}
+    assert client.get(f"/fhir/Patient/{pid}?_summary=bogus").status_code == 400
+
+    data = base64.b64encode(b"x" * 4096).decode()
+    bid = client.post(
+        "/fhir/Binary",
+        json={"resourceType": "Binary", "contentType": "application/pdf", "data": data},
+        headers={"X-Correlation-Id": "t-sum-b"},
+    ).json()["id"]
+    assert client.get(f"/fhir/Binary/{bid}").json()["data"] == data
+    assert "data" not in client.get(f"/fhir/Binary/{bid}?_summary=true").json()
+    listed = client.get("/fhir/Binary").json()["entry"]
+    assert listed and all("data" not in e["resource"] for e in listed)
@@ -0,0 +1,42 @@
+import datetime as dt
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from app.db.models import SomObservation, SomPatient, SomPreAuthPackageSnapshot
+from app.db.session import session_scope
+from app.main import app
+from app.services.preauth.service import snapshot_checksum
+from app.services.synthetic import IDENTIFIER_SYSTEM, SyntheticPopulation
+
+AS_OF = dt.date(2026, 1, 1)
+
+
+def test_population_is_reproducible_and_loads_with_copy():
+    with session_scope() as db:
+        refs = SyntheticPopulation(db, seed=7, as_of=AS_OF).prepare(60)
+    with session_scope() as db:
+        population = SyntheticPopulation(db, seed=7, as_of=AS_OF)
+        assert population.generate(refs, 1, 40, 60) == population.generate(refs, 1, 40, 60)
+        first = population.load_chunk(refs, 0, 40, 60)
+        second = population.load_chunk(refs, 1, 40, 60)
+    assert first.rows["som_patient"] == 40 and second.rows["som_patient"] == 20
+    assert first.rows["som_observation"] > first.rows["som_encounter"] > 0
+    with session_scope() as db:
+        # Re-running skips chunks that are already there.
+        assert SyntheticPopulation(db, seed=7, as_of=AS_OF).load_chunk(refs, 1, 40, 60).skipped
+
+    with session_scope() as db:
+        patients = db.execute(select(SomPatient).where(SomPatient.identifier_system == IDENTIFIER_SYSTEM)).scalars()
+        patient_id = max(
+            (p.id for p in patients),
+            key=lambda pid: len(db.execute(select(SomObservation.id).where(SomObservation.patient_id == pid)).all()),
+        )
+        snapshots = db.execute(select(SomPreAuthPackageSnapshot)).scalars().all()
+        assert all(s.checksum == snapshot_checksum(s.snapshot) for s in snapshots)
+
+    client = TestClient(app)
+    assert client.get(f"/fhir/Patient/{patient_id}").json()["identifier"][0]["value"].startswith("SYN7-")
+    entries = client.get(f"/fhir/Observation?patient={patient_id}&_count=200").json()["entry"]
+    assert all(e["resource"]["valueQuantity"]["value"] > 0 for e in entries)
+    assert max(e["resource"]["effectiveDateTime"] for e in entries) < "2026-01-02"
@@ -0,0 +1,123 @@
+import datetime as dt
+
+from fastapi.testclient import TestClient
+
+from app.db import session as db_session
+from app.main import app
+from app.services.payer.evaluator import evaluate_rules
+from app.services.terminology import TerminologyService
+from app.services.terminology_loader import TerminologyLoader
+
+SYSTEM = "http://example.org/test-hierarchy"
+
+
+def _ids(bundle: dict) -> set[str]:
+    return {e["resource"]["id"] for e in bundle["entry"]}
+
+
+def test_closure_backed_below_above_search_and_payer_hierarchy():
+    client = TestClient(app)
+    pid = client.post(
+        "/fhir/Patient",
+        json={"resourceType": "Patient", "name": [{"family": "Closure_Test", "given": ["Cy"]}]},
+        headers={"X-Correlation-Id": "t-cl-p"},
+    ).json()["id"]
+
+    def condition(code: str) -> str:
+        return client.post(
+            "/fhir/Condition",
+            json={
+                "resourceType": "Condition",
+                "subject": {"reference": f"Patient/{pid}"},
+                "code": {"coding": [{"system": SYSTEM, "code": code}]},
+                "clinicalStatus": {"coding": [{"code": "active"}]},
+            },
+            headers={"X-Correlation-Id": f"t-cl-c-{code}"},
+        ).json()["id"]
+
+    # Written before the load: the loader must reuse this concept row, not duplicate it.
+    knee = condition("knee-oa")
+    assert client.get(f"/fhir/Condition/{knee}").json()["code"]["coding"][0]["display"] is None
+
+    # arthropathy > osteoarthritis > knee-oa, osteoarthritis > hip-oa; fracture is unrelated.
+    with db_session.session_scope() as db:
+        result = TerminologyLoader(db).load(
+            system_uri=SYSTEM,
+            concepts=iter(
+                [
+                    ("arthropathy", "Arthropathy"),
+                    ("osteoarthritis", "Osteoarthritis"),
+                    ("knee-oa", "Osteoarthritis of knee"),
+                    ("hip-oa", "Osteoarthritis of hip"),
+                    ("fracture", "Fracture"),
+                ]
+            ),
+            edges=iter([("osteoarthritis", "arthropathy"), ("knee-oa", "osteoarthritis"), ("hip-oa", "osteoarthritis")]),
+            correlation_id="t-cl-load",
+        )
+    assert (result.concepts_read, result.concepts_inserted, result.edges_inserted) == (5, 4, 3)
+    # 5 reflexive + osteoarthritis(1) + knee-oa(2) + hip-oa(2)
+    assert result.closure_rows == 10
+    # The loader filled in the display; the cached body must not keep serving the coding without it.
+    assert client.get(f"/fhir/Condition/{knee}").json()["code"]["coding"][0]["display"] == "Osteoarthritis of knee"
+
+    hip = condition("hip-oa")
+    fracture = condition("fracture")
+    oa = condition("osteoarthritis")
+
+    def search(query: str) -> set[str]:
+        r = client.get(f"/fhir/Condition?patient=Patient/{pid}&{query}")
+        assert r.status_code == 200, r.text
+        return _ids(r.json())
+
+    assert search(f"code:below={SYSTEM}|osteoarthritis") == {oa, knee, hip}
+    assert search(f"code:below={SYSTEM}|arthropathy,{SYSTEM}|fracture") == {oa, knee, hip, fracture}
+    assert search(f"code:above={SYSTEM}|knee-oa") == {oa, knee}
+    assert search(f"code={SYSTEM}|osteoarthritis") == {oa}
+    assert client.get(f"/fhir/Condition?patient=Patient/{pid}&clinical-status:below=active").status_code == 400
+
+    # Reloading is idempotent.
+    with db_session.session_scope() as db:
+        again = TerminologyLoader(db).load(
+            system_uri=SYSTEM, concepts=iter([("knee-oa", "")]), edges=iter([("knee-oa", "osteoarthritis")])
+        )
+    assert (again.concepts_inserted, again.edges_inserted) == (0, 0)
+    assert search(f"code:below={SYSTEM}|arthropathy") == {oa, knee, hip}
+
+    rules = {
+        "schemaVersion": "1",
+        "policies": [
+            {
+                "services": {"codes": [{"system": "http://www.ama-assn.org/go/cpt", "code": "73721"}]},
+                "diagnosis": {"codes": [{"system": SYSTEM, "code": "osteoarthritis", "below": True}]},
+                "outcome": "approved",
+            }
+        ],
+    }
+
+    with db_session.session_scope() as db:
+        subsumes = TerminologyService(db).subsumes
+        assert subsumes(SYSTEM, "arthropathy", "knee-oa")
+        assert not subsumes(SYSTEM, "knee-oa", "arthropathy")
+
+        def outcome(code: str, **kw) -> str:
+            return evaluate_rules(
+                rules=rules,
+                now=dt.datetime.now(dt.timezone.utc),
+                service_system="http://www.ama-assn.org/go/cpt",
+                service_code="73721",
+                service_text=None,
+                service_priority=None,
+                diagnosis_system=SYSTEM,
+                diagnosis_code=code,
+                diagnosis_text=None,
+                preauth_priority=None,
+                supporting_documents=[],
+                **kw,
+            )["outcome"]
+
+        assert outcome("hip-oa", is_descendant=subsumes) == "approved"
+        assert outcome("fracture", is_descendant=subsumes) == "denied"
+        # Without a hierarchy lookup only exact codes match.
+        assert outcome("hip-oa") == "denied"
+        assert outcome("osteoarthritis") == "approved"
@@ -0,0 +1,132 @@
+import json
+import uuid
+
+from celery.worker.request import Request
+from fastapi.testclient import TestClient
+from kombu import serialization
+from kombu.message import Message
+
+from app.core import tracing
+from app.core.config import settings
+from app.main import app
+from app.worker import tasks
+from app.worker.celery_app import _after_publish, _before_publish, _task_finished, _task_started, celery_app
+
+
+def _spans(path) -> list[dict]:
+    out = []
+    for line in path.read_text().splitlines():
+        for rs in json.loads(line)["resourceSpans"]:
+            for ss in rs["scopeSpans"]:
+                out.extend(ss["spans"])
+    return out
+
+
+def _attrs(span: dict) -> dict:
+    return {a["key"]: next(iter(a["value"].values())) for a in span["attributes"]}
+
+
+def test_spans_cover_route_service_task_and_sql(tmp_path, monkeypatch):
+    trace_file = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(settings, "tracing_enabled", True)
+    monkeypatch.setattr(settings, "tracing_file", str(trace_file))
+    client = TestClient(app)
+
+    pid = client.post("/fhir/Patient", json={"resourceType": "Patient", "name": [{"family": "Traced"}]}).json()["id"]
+    trace_file.unlink()
+
+    trace_id, caller_span = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+    r = client.post(
+        "/jobs",
+        json={"type": "bulk_import_observations", "parameters": {"patientId": pid, "count": 2}},
+        headers={"traceparent": f"00-{trace_id}-{caller_span}-01", "X-Correlation-Id": "t-trace-1"},
+    )
+    assert r.status_code == 200
+
+    spans = _spans(trace_file)
+    assert {s["traceId"] for s in spans} == {trace_id}
+    assert all(_attrs(s).get("correlation.id") == "t-trace-1" for s in spans)
+    by_id = {s["spanId"]: s for s in spans}
+
+    (server,) = [s for s in spans if s["kind"] == tracing.SERVER]
+    assert server["name"] == "POST /jobs"
+    assert server["parentSpanId"] == caller_span
+    assert _attrs(server)["http.response.status_code"] == "200"
+
+    (service,) = [s for s in spans if s["name"] == "JobService.create_and_enqueue"]
+    assert service["parentSpanId"] == server["spanId"]
+    (task,) = [s for s in spans if s["kind"] == tracing.CONSUMER]
+    assert task["name"] == "run jobs.bulk_import_observations"
+    assert task["parentSpanId"] == service["spanId"]
+    assert _attrs(task)["celery.state"] == "SUCCESS"
+
+    sql = [s for s in spans if s["kind"] == tracing.CLIENT]
+    assert any(_attrs(s)["db.sql.table"] == "som_job" and s["parentSpanId"] == service["spanId"] for s in sql)
+    # The task's inserts are attributed to the task's span (or spans below it).
+    def under(span, ancestor):
+        while span.get("parentSpanId") in by_id:
+            span = by_id[span["parentSpanId"]]
+            if span is ancestor:
+                return True
+        return False
+
+    assert any(s["name"] == "INSERT som_observation" and under(s, task) for s in sql)
+
+
+def test_celery_headers_carry_trace_context(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "tracing_enabled", True)
+    monkeypatch.setattr(settings, "tracing_file", str(tmp_path / "traces.jsonl"))
+
+    token = tracing.set_correlation_id("t-trace-2")
+    try:
+        with tracing.span("caller") as caller:
+            headers = {"id": "task-1"}
+            _before_publish(sender="jobs.submit_preauth", headers=headers)
+            _after_publish(headers=headers)
+    finally:
+        tracing.reset_correlation_id(token)
+
+    assert headers["x_correlation_id"] == "t-trace-2"
+    assert "published_at" in headers
+    trace_id, parent = tracing.parse_traceparent(headers["traceparent"])
+    assert trace_id == caller.trace_id
+    (producer,) = [s for s in _spans(tmp_path / "traces.jsonl") if s["kind"] == tracing.PRODUCER]
+    assert producer["spanId"] == parent
+    assert producer["parentSpanId"] == caller.span_id
+
+    assert tracing.parse_traceparent("00-" + "0" * 32 + "-00f067aa0ba902b7-01") is None
+    assert tracing.parse_traceparent("garbage") is None
+
+
+def test_worker_request_keeps_the_api_correlation_id():
+    # A worker builds task.request from the message the way celery.worker.request does, including the AMQP
+    # properties (whose correlation_id is the task id), unlike eager runs.
+    task = tasks.submit_preauth
+    task_id = str(uuid.uuid4())
+    sent = celery_app.amqp.as_task_v2(task_id, task.name, args=("not-a-job",))
+    token = tracing.set_correlation_id("t-trace-3")
+    try:
+        _before_publish(sender=task.name, headers=sent.headers)
+    finally:
+        tracing.reset_correlation_id(token)
+    content_type, encoding, body = serialization.dumps(sent.body, "json")
+    message = Message(
+        body=body,
+        headers=sent.headers,
+        properties={**sent.properties, "correlation_id": task_id},
+        content_type=content_type,
+        content_encoding=encoding,
+    )
+    request = Request(message, app=celery_app, task=task)
+    assert request.request_dict["correlation_id"] == task_id
+
+    task.push_request(request.request_dict, called_directly=False)
+    try:
+        _task_started(task=task, task_id=task_id)
+        try:
+            assert tracing.correlation_id() == "t-trace-3"
+        finally:
+            _task_finished(task=task, state="SUCCESS", args=request.request_dict["args"])
+    finally:
+        task.pop_request()
+    assert tracing.correlation_id() is None
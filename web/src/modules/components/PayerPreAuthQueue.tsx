@@ -8,6 +8,9 @@ export function PayerPreAuthQueue() {
   const [status, setStatus] = useState<string>("pending-info");
   const [rows, setRows] = useState<any[]>([]);
   const [err, setErr] = useState<string | null>(null);
+  const [reviewer, setReviewer] = useState("reviewer-1");
+  const [stats, setStats] = useState<any>(null);
+  const [lease, setLease] = useState<any>(null);
 
   async function refresh() {
     setErr(null);
@@ -17,6 +20,37 @@ export function PayerPreAuthQueue() {
     try {
       const res = await apiFetch(`/preauth?${qp.toString()}`);
       setRows(res.preauth ?? []);
+      setStats(await apiFetch(`/preauth/queue/stats?${payer ? new URLSearchParams({ payer }).toString() : ""}`));
+    } catch (e: any) {
+      setErr(e.message);
+    }
+  }
+
+  async function claim() {
+    setErr(null);
+    try {
+      const res = await apiFetch("/preauth/queue/claim", {
+        method: "POST",
+        body: JSON.stringify({ reviewer, limit: 5, payer: payer || undefined }),
+      });
+      setLease(res.leaseId ? res : null);
+      if (!res.leaseId) setErr("Nothing left to claim.");
+      refresh();
+    } catch (e: any) {
+      setErr(e.message);
+    }
+  }
+
+  async function release(preAuthIds?: string[]) {
+    if (!lease) return;
+    try {
+      await apiFetch(`/preauth/queue/leases/${lease.leaseId}/release`, {
+        method: "POST",
+        body: JSON.stringify(preAuthIds ? { preAuthIds } : {}),
+      });
+      const items = preAuthIds ? lease.items.filter((i: any) => !preAuthIds.includes(i.id)) : [];
+      setLease(items.length ? { ...lease, items } : null);
+      refresh();
     } catch (e: any) {
       setErr(e.message);
     }
@@ -26,6 +60,21 @@ export function PayerPreAuthQueue() {
     refresh();
   }, []);
 
+  // Keep the claim alive while it is shown.
+  useEffect(() => {
+    if (!lease) return;
+    const t = setInterval(async () => {
+      try {
+        const r = await apiFetch(`/preauth/queue/leases/${lease.leaseId}/heartbeat`, { method: "POST" });
+        setLease((l: any) => (l ? { ...l, expiresTime: r.expiresTime } : l));
+      } catch (e: any) {
+        setErr(e.message);
+        setLease(null);
+      }
+    }, 60000);
+    return () => clearInterval(t);
+  }, [lease?.leaseId]);
+
   return (
     <div>
       <div className="row" style={{ marginBottom: 8 }}>
@@ -42,6 +91,42 @@ export function PayerPreAuthQueue() {
         </select>
         <button onClick={() => refresh()}>Refresh</button>
       </div>
+      <div className="row" style={{ marginBottom: 8 }}>
+        <span className="muted">Reviewer</span>
+        <input value={reviewer} onChange={(e) => setReviewer(e.target.value)} style={{ width: 160 }} />
+        <button onClick={() => claim()} disabled={!reviewer || !!lease}>
+          Claim next 5
+        </button>
+        {lease && <button onClick={() => release()}>Release all</button>}
+        {stats && (
+          <span className="muted">
+            queue: {stats.depth} ({stats.available} available)
+            {stats.oldestAgeSeconds != null && `, oldest ${Math.round(stats.oldestAgeSeconds / 60)} min`}
+          </span>
+        )}
+      </div>
+      {lease && (
+        <div className="card" style={{ marginBottom: 8 }}>
+          <div className="muted">
+            Claimed by {lease.claimedBy} until {lease.expiresTime}
+          </div>
+          {lease.items.map((p: any) => (
+            <div key={p.id} className="row">
+              <strong>{p.priority}</strong>
+              <span className="muted">{p.id}</span>
+              <button
+                onClick={() => {
+                  dispatch({ type: "setPatient", patientId: p.patientId });
+                  dispatch({ type: "setPreAuth", preAuthId: p.id });
+                }}
+              >
+                Load in App Context
+              </button>
+              <button onClick={() => release([p.id])}>Release</button>
+            </div>
+          ))}
+        </div>
+      )}
       {err && <div className="muted">{err}</div>}
       <div style={{ display: "grid", gap: 8 }}>
         {rows.map((p) => (